@@ -1,16 +1,15 @@
 #!/usr/bin/env python3
 import re
 
-with open('frontend/public/index.html', 'r') as f:
-    content = f.read()
+from patchkit import Patch, PatchEngine
+
+TARGET = 'frontend/public/index.html'
 
 # 1. Add state for available roles after other useState declarations
 state_pattern = r"(const \[showCSVUploadModal, setShowCSVUploadModal\] = useState\(false\);)"
 state_addition = r"""\1
 const [availableRoles, setAvailableRoles] = useState([]);"""
 
-content = re.sub(state_pattern, state_addition, content)
-
 # 2. Add fetchAvailableRoles function after fetchData function
 fetch_pattern = r"(const fetchData = async \(\) => \{[^}]+\};)"
 fetch_addition = r"""\1
@@ -24,8 +23,6 @@ const fetchAvailableRoles = async () => {
     }
 };"""
 
-content = re.sub(fetch_pattern, fetch_addition, content, flags=re.DOTALL)
-
 # 3. Add useEffect to fetch roles when logged in
 effect_pattern = r"(useEffect\(\(\) => \{\s*if \(isLoggedIn\) \{\s*fetchData\(\);\s*\}\s*\}, \[isLoggedIn\]\);)"
 effect_addition = r"""\1
@@ -36,8 +33,6 @@ useEffect(() => {
     }
 }, [isLoggedIn]);"""
 
-content = re.sub(effect_pattern, effect_addition, content)
-
 # 4. Update hasPermission to use user.permissions
 permission_pattern = r"const hasPermission = \(module, action\) => \{[^}]+\};"
 permission_replacement = r"""const hasPermission = (module, action) => {
@@ -45,8 +40,6 @@ permission_replacement = r"""const hasPermission = (module, action) => {
     return user.permissions[module]?.[action] || false;
 };"""
 
-content = re.sub(permission_pattern, permission_replacement, content, flags=re.DOTALL)
-
 # 5. Add Role Management to sidebar (this is tricky, let's find the right spot)
 # Look for the Users button in sidebar and add after it
 sidebar_pattern = r"(\{user && hasPermission\('users', 'read'\)[^}]+Users[^)]+\)\s*\})"
@@ -73,10 +66,16 @@ sidebar_addition = r"""\1,
                     )
                 )}"""
 
-content = re.sub(sidebar_pattern, sidebar_addition, content, flags=re.DOTALL)
-
-# Save the updated content
-with open('frontend/public/index.html', 'w') as f:
-    f.write(content)
+PATCHES = [
+    Patch('available-roles-state', state_pattern, state_addition, unless='const [availableRoles, setAvailableRoles]'),
+    Patch('fetch-available-roles', fetch_pattern, fetch_addition, flags=re.DOTALL,
+          unless='const fetchAvailableRoles'),
+    Patch('fetch-roles-effect', effect_pattern, effect_addition, unless='fetchAvailableRoles();'),
+    Patch('has-permission-from-user', permission_pattern, permission_replacement, flags=re.DOTALL),
+    Patch('role-management-sidebar', sidebar_pattern, sidebar_addition, flags=re.DOTALL,
+          unless="setActiveTab('roles')"),
+]
 
-print("Added Role Management frontend components!")
+if __name__ == '__main__':
+    PatchEngine(TARGET).register(*PATCHES).run()
+    print("Added Role Management frontend components!")
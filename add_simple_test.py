@@ -1,18 +1,9 @@
-# Read the file
-with open('frontend/public/index.html', 'r') as f:
-    content = f.read()
+from patchkit import Patch, PatchEngine
 
-# Add a simple test mode indicator right after the header
-if 'TEST MODE INDICATOR' not in content:
-    print("Adding simple test mode indicator...")
-    
-    # Find the header closing
-    pattern = r"(</header>)"
-    match = re.search(pattern, content)
-    
-    if match:
-        insert_pos = match.start()
-        indicator = """
+TARGET = 'frontend/public/index.html'
+
+# Add a simple test mode indicator right before the header closes
+indicator = """
             {testMode && React.createElement('div', {
                 style: {
                     backgroundColor: '#dc2626',
@@ -24,12 +15,13 @@ if 'TEST MODE INDICATOR' not in content:
                 }
             }, '🧪 TEST MODE IS ACTIVE - TEST MODE INDICATOR')}
             """
-        
-        content = content[:insert_pos] + indicator + content[insert_pos:]
-        
-        with open('frontend/public/index.html', 'w') as f:
-            f.write(content)
-        
-        print("✅ Added test mode indicator")
 
-print("\nIf test mode is ON, you should see a red bar saying 'TEST MODE IS ACTIVE'")
+PATCHES = [
+    Patch.insert_before('test-mode-indicator', r"(</header>)", indicator,
+                        unless='TEST MODE INDICATOR'),
+]
+
+if __name__ == '__main__':
+    print("Adding simple test mode indicator...")
+    PatchEngine(TARGET).register(*PATCHES).run()
+    print("\nIf test mode is ON, you should see a red bar saying 'TEST MODE IS ACTIVE'")
@@ -1,21 +1,13 @@
 import re
 
-# Read the current index.html
-with open('frontend/public/index.html', 'r') as f:
-    content = f.read()
+from patchkit import Patch, PatchEngine
 
-print("Adding test mode features cleanly...")
+TARGET = 'frontend/public/index.html'
 
-# 1. First, let's add the Delete All buttons for Leads
-# Find the "Add New Lead" button and add delete button after it
+# 1. Delete All button for Leads, right after the "Add New Lead" button
 lead_button_pattern = r"(React\.createElement\('button',\s*\{\s*onClick:\s*\(\)\s*=>\s*setShowAddForm\(true\)[^}]+\},\s*'Add New Lead'\))"
-lead_match = re.search(lead_button_pattern, content, re.DOTALL)
 
-if lead_match:
-    print("Found Add New Lead button, adding Delete All Leads button...")
-    insert_pos = lead_match.end()
-    
-    delete_lead_button = """,
+delete_lead_button = """,
                     testMode && user.role === 'super_admin' && React.createElement('button', {
                         className: 'bg-red-600 hover:bg-red-700 text-white px-4 py-2 rounded ml-2',
                         onClick: async () => {
@@ -44,19 +36,11 @@ if lead_match:
                             }
                         }
                     }, '🗑️ Delete All Leads')"""
-    
-    content = content[:insert_pos] + delete_lead_button + content[insert_pos:]
-    print("✅ Added Delete All Leads button")
 
-# 2. Add Delete All button for Inventory
+# 2. Delete All button for Inventory, right after the "Add New Item" button
 inv_button_pattern = r"(React\.createElement\('button',\s*\{\s*onClick:\s*\(\)\s*=>\s*setShowAddInventoryForm\(true\)[^}]+\},\s*'Add New Item'\))"
-inv_match = re.search(inv_button_pattern, content, re.DOTALL)
 
-if inv_match:
-    print("Found Add New Item button, adding Delete All Inventory button...")
-    insert_pos = inv_match.end()
-    
-    delete_inv_button = """,
+delete_inv_button = """,
                     testMode && user.role === 'super_admin' && React.createElement('button', {
                         className: 'bg-red-600 hover:bg-red-700 text-white px-4 py-2 rounded ml-2',
                         onClick: async () => {
@@ -85,22 +69,11 @@ if inv_match:
                             }
                         }
                     }, '🗑️ Delete All Inventory')"""
-    
-    content = content[:insert_pos] + delete_inv_button + content[insert_pos:]
-    print("✅ Added Delete All Inventory button")
 
-# 3. Add Fill Test Data button in Lead form
-# Find the submit button in the lead form
+# 3. Fill Test Data button in the Lead form (first submit button is the add lead form)
 lead_form_pattern = r"(React\.createElement\('button',\s*\{\s*type:\s*'submit'[^}]+\},\s*loading\s*\?\s*'Saving\.\.\.'\s*:\s*'Submit'\))"
-lead_form_matches = list(re.finditer(lead_form_pattern, content, re.DOTALL))
 
-if lead_form_matches:
-    # Use the first match (should be the add lead form)
-    match = lead_form_matches[0]
-    print("Found Lead form submit button, adding Fill Test Data button...")
-    insert_pos = match.end()
-    
-    fill_data_button = """,
+fill_data_button = """,
                         testMode && React.createElement('button', {
                             type: 'button',
                             className: 'bg-yellow-500 text-white px-6 py-3 rounded-md hover:bg-yellow-600 font-medium ml-2',
@@ -117,19 +90,11 @@ if lead_form_matches:
                                 setFormData(testData);
                             }
                         }, '🧪 Fill Test Data')"""
-    
-    content = content[:insert_pos] + fill_data_button + content[insert_pos:]
-    print("✅ Added Fill Test Data button in Lead form")
 
-# 4. Add Fill Test Data button in Inventory form
+# 4. Fill Test Data button in the Inventory form
 inv_form_pattern = r"(React\.createElement\('button',\s*\{\s*type:\s*'submit'[^}]+\},\s*loading\s*\?\s*'Saving\.\.\.'\s*:\s*'Add Item'\))"
-inv_form_match = re.search(inv_form_pattern, content, re.DOTALL)
 
-if inv_form_match:
-    print("Found Inventory form submit button, adding Fill Test Data button...")
-    insert_pos = inv_form_match.end()
-    
-    fill_inv_button = """,
+fill_inv_button = """,
                         testMode && React.createElement('button', {
                             type: 'button',
                             className: 'bg-yellow-500 text-white px-6 py-3 rounded-md hover:bg-yellow-600 font-medium ml-2',
@@ -147,31 +112,31 @@ if inv_form_match:
                                 setInventoryFormData(testData);
                             }
                         }, '🧪 Fill Test Data')"""
-    
-    content = content[:insert_pos] + fill_inv_button + content[insert_pos:]
-    print("✅ Added Fill Test Data button in Inventory form")
 
-# 5. Add Test Mode Active banner
-# Find where to add the banner (after the main element starts)
+# 5. Test Mode Active banner, right after the main element starts
 banner_pattern = r"(React\.createElement\('main',\s*\{\s*className:\s*'flex-1 overflow-y-auto p-6'\s*\},)"
-banner_match = re.search(banner_pattern, content, re.DOTALL)
 
-if banner_match:
-    print("Adding Test Mode Active banner...")
-    insert_pos = banner_match.end()
-    
-    test_banner = """
+test_banner = """
                 testMode && user.role === 'super_admin' && React.createElement('div', {
                     className: 'bg-red-100 border-2 border-red-500 text-red-700 p-4 rounded-lg mb-4 text-center font-bold animate-pulse'
                 }, 
                     '⚠️ TEST MODE ACTIVE - Delete buttons and test data fills are enabled!'
                 ),"""
-    
-    content = content[:insert_pos] + test_banner + content[insert_pos:]
-    print("✅ Added Test Mode Active banner")
 
-# Write the updated content
-with open('frontend/public/index.html', 'w') as f:
-    f.write(content)
+PATCHES = [
+    Patch.insert_after('delete-all-leads-button', lead_button_pattern, delete_lead_button,
+                       flags=re.DOTALL, unless='🗑️ Delete All Leads'),
+    Patch.insert_after('delete-all-inventory-button', inv_button_pattern, delete_inv_button,
+                       flags=re.DOTALL, unless='🗑️ Delete All Inventory'),
+    Patch.insert_after('lead-form-fill-test-data', lead_form_pattern, fill_data_button,
+                       flags=re.DOTALL, unless="setFormData(testData)"),
+    Patch.insert_after('inventory-form-fill-test-data', inv_form_pattern, fill_inv_button,
+                       flags=re.DOTALL, unless="setInventoryFormData(testData)"),
+    Patch.insert_after('test-mode-banner', banner_pattern, test_banner,
+                       flags=re.DOTALL, unless='TEST MODE ACTIVE'),
+]
 
-print("\n✅ All test mode features added successfully!")
+if __name__ == '__main__':
+    print("Adding test mode features cleanly...")
+    PatchEngine(TARGET).register(*PATCHES).run()
+    print("\n✅ All test mode features added successfully!")
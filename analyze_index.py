@@ -1,44 +1,47 @@
-import re
+from patchkit.probes import Probe, ProbeRunner
 
-with open('frontend/public/index.html', 'r') as f:
-    content = f.read()
-    lines = content.split('\n')
+INDEX = 'frontend/public/index.html'
 
-print(f"Total lines in index.html: {len(lines)}")
-print("\nAnalyzing delivery-related code...")
+# All probes run in the same pass; bump a probe's version when its logic changes
+PROBES = [
+    # Find the addDelivery function
+    Probe('add_delivery', 'const addDelivery = async', first_only=True),
+    # Find where deliveries are created
+    Probe('delivery_id', "id: `DEL-${Date.now()}`"),
+    # Find the deleteDelivery function
+    Probe('delete_delivery', 'const deleteDelivery = async'),
+    # Check how deliveries are fetched
+    Probe('delivery_fetch', "apiCall('/deliveries')", version=2, context=2,
+          check=lambda lines, i: any('setDeliveries' in line for line in lines[i:i + 3])),
+    # Find where delivery response is handled
+    Probe('response_id', 'response.data.id',
+          check=lambda lines, i: 'delivery' in lines[i].lower()),
+]
 
-# Find the addDelivery function
-add_delivery_start = None
-for i, line in enumerate(lines):
-    if 'const addDelivery = async' in line:
-        add_delivery_start = i
-        print(f"\n✓ Found addDelivery function at line {i+1}")
-        break
+if __name__ == '__main__':
+    runner = ProbeRunner(PROBES)
+    results = runner.run(INDEX)
+    with open(INDEX, 'r') as f:
+        lines = f.read().split('\n')
+
+    print(f"Total lines in index.html: {len(lines)}")
+    print("\nAnalyzing delivery-related code...")
 
-# Find where deliveries are created
-for i, line in enumerate(lines):
-    if "id: `DEL-${Date.now()}`" in line:
+    for i in results['add_delivery']:
+        print(f"\n✓ Found addDelivery function at line {i+1}")
+    for i in results['delivery_id']:
         print(f"✓ Found delivery ID generation at line {i+1}")
-        print(f"  Current: {line.strip()}")
-        
-# Find the deleteDelivery function
-delete_delivery_start = None
-for i, line in enumerate(lines):
-    if 'const deleteDelivery = async' in line:
-        delete_delivery_start = i
+        print(f"  Current: {lines[i].strip()}")
+    for i in results['delete_delivery']:
         print(f"\n✓ Found deleteDelivery function at line {i+1}")
-        
-# Check how deliveries are fetched
-for i, line in enumerate(lines):
-    if "apiCall('/deliveries')" in line and "setDeliveries" in lines[i:i+3]:
+    for i in results['delivery_fetch']:
         print(f"\n✓ Found delivery fetch at line {i+1}")
-
-# Find where delivery response is handled
-for i, line in enumerate(lines):
-    if "response.data.id" in line and "delivery" in line.lower():
+    for i in results['response_id']:
         print(f"✓ Found response handling at line {i+1}")
-        print(f"  Context: {line.strip()}")
+        print(f"  Context: {lines[i].strip()}")
 
-print("\n" + "="*50)
-print("ANALYSIS COMPLETE")
-print("="*50)
+    stats = runner.stats
+    source = 'cache' if stats['cached'] else f"{stats['scanned']} chunks scanned, {stats['reused']} reused"
+    print("\n" + "="*50)
+    print(f"ANALYSIS COMPLETE ({source}, {stats['elapsed'] * 1000:.1f} ms)")
+    print("="*50)
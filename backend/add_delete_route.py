@@ -1,3 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from patchkit.jsindex import JSIndex
+
 # Read the deliveries.js file
 with open('src/routes/deliveries.js', 'r') as f:
     content = f.read()
@@ -6,23 +12,11 @@ with open('src/routes/deliveries.js', 'r') as f:
 if 'router.delete' in content:
     print("DELETE route already exists!")
 else:
-    # Find where to insert the DELETE route (after the PUT route)
-    lines = content.split('\n')
-    insert_index = None
-    
-    for i, line in enumerate(lines):
-        if 'router.put' in line and '/:id' in line:
-            # Find the closing of the PUT route
-            brace_count = 0
-            for j in range(i, len(lines)):
-                brace_count += lines[j].count('{')
-                brace_count -= lines[j].count('}')
-                if brace_count == 0 and j > i:
-                    insert_index = j + 1
-                    break
-            break
+    # Insert the DELETE route right after the PUT /:id handler
+    index = JSIndex(content)
+    put_route = index.handler('put', '/:id')
     
-    if insert_index:
+    if put_route:
         # Add the DELETE route
         delete_route = '''
 // DELETE delivery
@@ -48,8 +42,8 @@ router.delete('/:id', authenticateToken, async (req, res) => {
   }
 });'''
         
-        lines.insert(insert_index, delete_route)
-        content = '\n'.join(lines)
+        index.insert_after(put_route, '\n' + delete_route)
+        content = index.text
         
         # Write the updated content
         with open('src/routes/deliveries.js', 'w') as f:
@@ -1,17 +1,17 @@
 import os
+import re
+import sys
 
-# Fix leads.js
-print("Fixing leads.js DELETE route...")
-with open('src/routes/leads.js', 'r') as f:
-    content = f.read()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from patchkit import Patch
+from patchkit.batch import BatchPatcher, PatchSet, before_exports
 
-# Replace the existing DELETE route with a more robust one
-if "router.delete('/'," in content:
-    # Find and replace the bulk delete route
-    import re
-    pattern = r"router\.delete\('/',.*?\}\);(?=\n\n|\nmodule\.exports)"
-    
-    new_route = '''router.delete('/', authenticateToken, async (req, res) => {
+ROUTES_DIR = 'src/routes'
+
+# Replace the existing bulk DELETE route in leads.js with a more robust one
+# that deletes in batches of 500. Only the text near each router.delete('/',
+# anchor is matched instead of scanning the whole file.
+new_route = '''router.delete('/', authenticateToken, async (req, res) => {
   try {
     console.log('DELETE /leads - Bulk delete request');
     console.log('Headers:', req.headers);
@@ -73,16 +73,9 @@ if "router.delete('/'," in content:
     });
   }
 });'''
-    
-    content = re.sub(pattern, new_route, content, flags=re.DOTALL)
-    
-    with open('src/routes/leads.js', 'w') as f:
-        f.write(content)
-    print("✅ Fixed leads.js DELETE route")
-else:
-    print("Need to add DELETE route to leads.js")
-    # Add it before module.exports
-    content = content.replace('module.exports = router;', '''
+
+# Added before module.exports when leads.js has no bulk DELETE route yet
+added_route = '''
 // DELETE all leads (bulk delete for test mode)
 router.delete('/', authenticateToken, async (req, res) => {
   try {
@@ -141,12 +134,17 @@ router.delete('/', authenticateToken, async (req, res) => {
   }
 });
 
-module.exports = router;''')
-    
-    with open('src/routes/leads.js', 'w') as f:
-        f.write(content)
-    print("✅ Added DELETE route to leads.js")
+'''
+
+PATCH_SET = PatchSet('leads-delete-route-fix', version=1).add(
+    'leads.js',
+    Patch('replace-leads-bulk-delete', r"router\.delete\('/',.*?\}\);(?=\n\n|\nmodule\.exports)",
+          lambda m: new_route, flags=re.DOTALL, anchored=True),
+    before_exports('add-leads-bulk-delete', added_route, unless="router.delete('/',"),
+)
 
-# Do the same for inventory.js
-print("\nFixing inventory.js...")
 # Similar fix for inventory.js...
+
+if __name__ == '__main__':
+    print("Fixing leads.js DELETE route...")
+    BatchPatcher([__file__], root=ROUTES_DIR).run()
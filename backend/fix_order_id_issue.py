@@ -1,28 +1,28 @@
 #!/usr/bin/env python3
-import re
+import os
+import sys
 
-with open('index.html', 'r') as f:
-    content = f.read()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from patchkit import Patch, PatchEngine
 
-# Fix 1: Ensure orderId is converted to string in handleOrderApproval
-pattern = r"const handleOrderApproval = async \(orderId, action\) => {"
-replacement = r"""const handleOrderApproval = async (orderId, action) => {
-        // Ensure orderId is a string
-        orderId = String(orderId);"""
-
-content = re.sub(pattern, replacement, content)
-
-# Fix 2: Also fix in the apiCall URL
-pattern = r"await apiCall\(`/orders/\${orderId}`,"
-replacement = r"await apiCall(`/orders/${String(orderId)}`,"
-content = re.sub(pattern, replacement, content)
+TARGET = 'index.html'
 
-# Fix 3: When creating new orders, ensure ID is string
-pattern = r"id: Date\.now\(\),"
-replacement = r"id: String(Date.now()),"
-content = re.sub(pattern, replacement, content)
-
-with open('index.html', 'w') as f:
-    f.write(content)
+PATCHES = [
+    # Fix 1: Ensure orderId is converted to string in handleOrderApproval
+    Patch('order-approval-string-id',
+          r"const handleOrderApproval = async \(orderId, action\) => {",
+          r"""const handleOrderApproval = async (orderId, action) => {
+        // Ensure orderId is a string
+        orderId = String(orderId);""",
+          unless='// Ensure orderId is a string'),
+    # Fix 2: Also fix in the apiCall URL
+    Patch('order-api-url-string-id',
+          r"await apiCall\(`/orders/\${orderId}`,",
+          r"await apiCall(`/orders/${String(orderId)}`,"),
+    # Fix 3: When creating new orders, ensure ID is string
+    Patch('new-order-string-id', r"id: Date\.now\(\),", r"id: String(Date.now()),"),
+]
 
-print("✅ Fixed order ID type issues")
+if __name__ == '__main__':
+    PatchEngine(TARGET).register(*PATCHES).run()
+    print("✅ Fixed order ID type issues")
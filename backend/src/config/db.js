@@ -52,4 +52,12 @@ const collections = {
   roles: 'crm_roles'
 };
 
+// Count reads, writes and query shapes per request for /metrics
+// (REQUEST_METRICS=off to disable), and profile them when
+// FIRESTORE_PROFILER=warn|error
+if (process.env.REQUEST_METRICS !== 'off') {
+  require('../services/firestoreTracker').instrument(db);
+  require('../services/firestoreProfiler').start();
+}
+
 module.exports = { db, collections };
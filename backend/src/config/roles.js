@@ -0,0 +1,135 @@
+// backend/src/config/roles.js
+
+// The built-in roles. POST /roles/initialize writes these to crm_roles, and
+// the permission matrix falls back to them for any role crm_roles doesn't
+// define, so checkPermission can be enforced before roles are initialized.
+// Grants mirror frontend/public/constants/user-roles.js, which the UI uses
+// until crm_roles has been loaded
+const DEFAULT_ROLES = [
+  {
+    name: 'super_admin',
+    label: 'Super Admin',
+    description: 'Full system access',
+    permissions: {
+      dashboard: { read: true, write: true, delete: true, manage_users: true },
+      leads: { read: true, write: true, delete: true, assign: true, progress: true },
+      inventory: { read: true, write: true, delete: true, allocate: true },
+      orders: { read: true, write: true, delete: true, approve: true, assign: true },
+      finance: { read: true, write: true, delete: true, approve: true },
+      delivery: { read: true, write: true, delete: true },
+      users: { read: true, write: true, delete: true, manage_roles: true },
+      stadiums: { read: true, write: true, delete: true }
+    },
+    is_system: true
+  },
+  {
+    name: 'admin',
+    label: 'Admin',
+    description: 'Administrative access without role management',
+    permissions: {
+      dashboard: { read: true, write: true, delete: true, manage_users: false },
+      leads: { read: true, write: true, delete: true, assign: true, progress: true },
+      inventory: { read: true, write: true, delete: true, allocate: true },
+      orders: { read: true, write: true, delete: true, approve: false, assign: true },
+      finance: { read: true, write: false, delete: false, approve: false },
+      delivery: { read: true, write: true, delete: true },
+      users: { read: true, write: false, delete: false, manage_roles: false },
+      stadiums: { read: true, write: true, delete: true }
+    },
+    is_system: true
+  },
+  {
+    name: 'sales_manager',
+    label: 'Sales Manager',
+    description: 'Manages sales team and leads',
+    permissions: {
+      dashboard: { read: true, write: false, delete: false, manage_users: false },
+      leads: { read: true, write: true, delete: false, assign: true, progress: true },
+      inventory: { read: true, write: false, delete: false, allocate: false },
+      orders: { read: true, write: false, delete: false, approve: false, assign: false },
+      finance: { read: true, write: false, delete: false, approve: false },
+      delivery: { read: true, write: false, delete: false },
+      users: { read: false, write: false, delete: false, manage_roles: false }
+    },
+    is_system: true
+  },
+  {
+    name: 'sales_executive',
+    label: 'Sales Executive',
+    description: 'Creates and manages leads',
+    permissions: {
+      dashboard: { read: true, write: false, delete: false, manage_users: false },
+      leads: { read: true, write: true, delete: true, assign: false, progress: true },
+      inventory: { read: true, write: false, delete: false, allocate: false },
+      orders: { read: true, write: true, delete: false, approve: false, assign: false },
+      finance: { read: false, write: false, delete: false, approve: false },
+      delivery: { read: true, write: false, delete: false },
+      users: { read: false, write: false, delete: false, manage_roles: false }
+    },
+    is_system: true
+  },
+  {
+    name: 'supply_sales_service_manager',
+    label: 'Supply Sales Service Manager',
+    description: 'Manages inventory and deliveries',
+    permissions: {
+      dashboard: { read: true, write: true, delete: true, manage_users: false },
+      leads: { read: true, write: true, delete: true, assign: true, progress: true },
+      inventory: { read: true, write: true, delete: true, allocate: true },
+      orders: { read: true, write: true, delete: true, approve: true, assign: true },
+      finance: { read: true, write: true, delete: true, approve: true },
+      delivery: { read: true, write: true, delete: true },
+      stadiums: { read: true, write: true, delete: true },
+      'sales-performance': { read: true, write: true, delete: true },
+      users: { read: false, write: false, delete: false, manage_roles: false }
+    },
+    is_system: true
+  },
+  {
+    name: 'supply_service_manager',
+    label: 'Supply & Service Manager',
+    description: 'Manages supply chain and service operations',
+    permissions: {
+      dashboard: { read: true, write: true, delete: true, manage_users: false },
+      leads: { read: true, write: true, delete: true, assign: true, progress: true },
+      inventory: { read: true, write: true, delete: true, allocate: true },
+      orders: { read: true, write: true, delete: true, approve: true, assign: true },
+      finance: { read: true, write: true, delete: true, approve: true },
+      delivery: { read: true, write: true, delete: true },
+      users: { read: true, write: true, delete: false, manage_roles: false }
+    },
+    is_system: true
+  },
+  {
+    name: 'finance_manager',
+    label: 'Finance Manager',
+    description: 'Manages financial operations',
+    permissions: {
+      dashboard: { read: true, write: false, delete: false, manage_users: false },
+      leads: { read: true, write: false, delete: false, assign: false, progress: false },
+      inventory: { read: true, write: false, delete: false, allocate: false },
+      orders: { read: true, write: false, delete: false, approve: true, assign: false },
+      finance: { read: true, write: true, delete: true, approve: true },
+      delivery: { read: true, write: false, delete: false },
+      users: { read: false, write: false, delete: false, manage_roles: false }
+    },
+    is_system: true
+  },
+  {
+    name: 'viewer',
+    label: 'Viewer',
+    description: 'Read-only access',
+    permissions: {
+      dashboard: { read: true, write: false, delete: false, manage_users: false },
+      leads: { read: true, write: false, delete: false, assign: false, progress: false },
+      inventory: { read: true, write: false, delete: false, allocate: false },
+      orders: { read: true, write: false, delete: false, approve: false, assign: false },
+      finance: { read: true, write: false, delete: false, approve: false },
+      delivery: { read: true, write: false, delete: false },
+      users: { read: false, write: false, delete: false, manage_roles: false }
+    },
+    is_system: true
+  }
+];
+
+module.exports = { DEFAULT_ROLES };
@@ -1,29 +1,202 @@
+const crypto = require('crypto');
 const jwt = require('jsonwebtoken');
+const permissionMatrix = require('../services/permissionMatrix');
+
+// Verified tokens, keyed by SHA-256 of the token, most recently used last.
+// An entry never outlives the token's exp, nor TOKEN_CACHE_MAX_MS.
+const TOKEN_CACHE_SIZE = parseInt(process.env.AUTH_TOKEN_CACHE_SIZE || '1000');
+const TOKEN_CACHE_MAX_MS = parseInt(process.env.AUTH_TOKEN_CACHE_MAX_MS || String(15 * 60 * 1000));
+
+// 'enforce' (the default) answers 403 when a role lacks a permission;
+// 'report' only logs it, for trying out changes to crm_roles. Role-only
+// checks such as checkPermission('super_admin') are enforced either way
+const PERMISSION_MODE = process.env.AUTH_PERMISSION_MODE || 'enforce';
+
+// Route permissions that name something crm_roles doesn't define: actions
+// and modules are also accepted under these names
+const ACTION_ALIASES = { create: 'write' };
+const MODULE_ALIASES = { events: 'inventory' };
+// Modules that stand for a role rather than a permission
+const ROLE_MODULES = { admin: ['admin'] };
+
+const tokenCache = new Map();
+const stats = {
+  tokenHits: 0,
+  tokenMisses: 0,
+  tokenExpired: 0,
+  tokenRejected: 0,
+  evictions: 0,
+  allowed: 0,
+  denied: 0,
+  unknownRoles: 0,
+  requests: 0,
+  timedSteps: 0,
+  totalMs: 0,
+  maxMs: 0
+};
+
+function tokenKey(token) {
+  return crypto.createHash('sha256').update(token).digest('hex');
+}
+
+function rememberToken(key, user) {
+  const maxExpiry = Date.now() + TOKEN_CACHE_MAX_MS;
+  const expiresAt = user.exp ? Math.min(user.exp * 1000, maxExpiry) : maxExpiry;
+  tokenCache.set(key, { user, expiresAt });
+  while (tokenCache.size > TOKEN_CACHE_SIZE) {
+    tokenCache.delete(tokenCache.keys().next().value);
+    stats.evictions++;
+  }
+}
+
+/**
+ * Add this step's time to the request's auth overhead and to the
+ * Server-Timing header
+ */
+function recordTiming(req, res, name, startTime, description) {
+  const ms = Number(process.hrtime.bigint() - startTime) / 1e6;
+  req.authMs = (req.authMs || 0) + ms;
+  stats.timedSteps++;
+  stats.totalMs += ms;
+  stats.maxMs = Math.max(stats.maxMs, ms);
+
+  const metric = `${name};dur=${ms.toFixed(3)};desc="${description}"`;
+  const existing = res.getHeader('Server-Timing');
+  res.setHeader('Server-Timing', existing ? `${existing}, ${metric}` : metric);
+}
 
 const authenticateToken = (req, res, next) => {
+  const startTime = process.hrtime.bigint();
+  stats.requests++;
   const authHeader = req.headers['authorization'];
   const token = authHeader && authHeader.split(' ')[1];
-  
+
   if (!token) {
     return res.status(401).json({ error: 'Access token required' });
   }
-  
+
+  const key = tokenKey(token);
+  const cached = tokenCache.get(key);
+  if (cached && cached.expiresAt > Date.now()) {
+    tokenCache.delete(key);
+    tokenCache.set(key, cached);
+    stats.tokenHits++;
+    req.user = { ...cached.user };
+    recordTiming(req, res, 'auth', startTime, 'cached');
+    return next();
+  }
+  if (cached) {
+    tokenCache.delete(key);
+    stats.tokenExpired++;
+  }
+  stats.tokenMisses++;
+
   jwt.verify(token, process.env.JWT_SECRET || 'your-secret-key-change-this', (err, user) => {
     if (err) {
+      stats.tokenRejected++;
       return res.status(403).json({ error: 'Invalid or expired token' });
     }
-    req.user = user;
+    rememberToken(key, user);
+    req.user = { ...user };
+    recordTiming(req, res, 'auth', startTime, 'verified');
     next();
   });
 };
 
+/**
+ * What a checkPermission(module, action) call requires: { roles } for
+ * role-only checks such as checkPermission('super_admin'), otherwise
+ * { keys }, any of which grants access
+ */
+function requirementFor(module, action) {
+  if (!action) return { roles: [module] };
+  if (ROLE_MODULES[module]) return { roles: ROLE_MODULES[module] };
+
+  const modules = [module, MODULE_ALIASES[module]].filter(Boolean);
+  const actions = [action, ACTION_ALIASES[action]].filter(Boolean);
+  const keys = [];
+  modules.forEach(m => actions.forEach(a => keys.push(`${m}.${a}`)));
+  return { keys };
+}
+
 const checkPermission = (module, action) => {
-  return (req, res, next) => {
-    // Implementation based on v4working ROLES object
-    // This would check req.user.role against the permission required
-    next();
+  // Resolved once per route, so each request is a set lookup
+  const requirement = requirementFor(module, action);
+  const required = action ? `${module}.${action}` : module;
+
+  return async (req, res, next) => {
+    const startTime = process.hrtime.bigint();
+    try {
+      const role = req.user && req.user.role;
+      let allowed;
+      if (role === 'super_admin') {
+        allowed = true;
+      } else if (!role) {
+        allowed = false;
+      } else if (requirement.roles) {
+        allowed = requirement.roles.includes(role);
+      } else {
+        if (!permissionMatrix.ready) await permissionMatrix.load();
+        allowed = permissionMatrix.allows(role, requirement.keys);
+        if (allowed === null) {
+          stats.unknownRoles++;
+          allowed = false;
+        }
+      }
+      recordTiming(req, res, 'perm', startTime, required);
+
+      if (allowed) {
+        stats.allowed++;
+        return next();
+      }
+
+      stats.denied++;
+      if (PERMISSION_MODE !== 'enforce' && !requirement.roles) {
+        console.warn(`⚠️ Permission ${required} missing for ${req.user?.email} (${role}) on ${req.method} ${req.originalUrl} - allowed in report mode`);
+        return next();
+      }
+      console.warn(`🚫 Permission ${required} denied for ${req.user?.email} (${role}) on ${req.method} ${req.originalUrl}`);
+      // The code tells the frontend this isn't an expired session
+      return res.status(403).json({ error: 'Insufficient permissions', code: 'PERMISSION_DENIED', required });
+    } catch (error) {
+      // Roles could not be loaded; don't guess
+      console.error('❌ Permission check failed:', error.message);
+      return res.status(503).json({ error: 'Permission check unavailable' });
+    }
   };
 };
 
+/**
+ * Token cache, permission and timing counters for the admin health check
+ */
+function authStatus() {
+  const lookups = stats.tokenHits + stats.tokenMisses;
+  return {
+    tokenCache: {
+      size: tokenCache.size,
+      maxSize: TOKEN_CACHE_SIZE,
+      maxAgeSeconds: TOKEN_CACHE_MAX_MS / 1000,
+      hits: stats.tokenHits,
+      misses: stats.tokenMisses,
+      expired: stats.tokenExpired,
+      rejected: stats.tokenRejected,
+      evictions: stats.evictions,
+      hitRate: lookups > 0 ? Math.round((stats.tokenHits / lookups) * 1000) / 10 : null
+    },
+    permissions: {
+      mode: PERMISSION_MODE,
+      allowed: stats.allowed,
+      denied: stats.denied,
+      unknownRoles: stats.unknownRoles,
+      matrix: permissionMatrix.status()
+    },
+    timing: {
+      authenticatedRequests: stats.requests,
+      // Per token verification or permission check
+      avgMs: stats.timedSteps > 0 ? Math.round((stats.totalMs / stats.timedSteps) * 1000) / 1000 : null,
+      maxMs: Math.round(stats.maxMs * 1000) / 1000
+    }
+  };
+}
 
-module.exports = { authenticateToken, checkPermission };
+module.exports = { authenticateToken, checkPermission, authStatus };
@@ -0,0 +1,286 @@
+const crypto = require('crypto');
+const firestoreTracker = require('../services/firestoreTracker');
+
+/**
+ * Request instrumentation
+ * Per-route latency and response size histograms, status codes and the
+ * Firestore reads, writes and calls each request made (counted by
+ * services/firestoreTracker), served in Prometheus text format by
+ * metricsHandler at GET /metrics to callers presenting METRICS_TOKEN
+ * (METRICS_AUTH=off serves them to anyone, for local use).
+ *
+ * Each response also gets a total Server-Timing entry next to the auth ones
+ * set by middleware/auth. The db entry (time in Firestore calls, with read
+ * and write counts) is only added for callers sending the token in
+ * X-Metrics-Token, or everyone when METRICS_AUTH=off or NODE_ENV is
+ * development. Requests slower than SLOW_REQUEST_MS are logged with their
+ * most expensive Firestore calls.
+ *
+ * Routes are labelled by their Express pattern (/api/leads/:id), so the
+ * number of series stays bounded; requests no route matched share one label.
+ *
+ * Routes can declare how many documents they expect to read with
+ * readBudget(n); services/firestoreProfiler checks it when enabled.
+ */
+
+const SLOW_REQUEST_MS = parseFloat(process.env.SLOW_REQUEST_MS || '0');
+const SLOW_REQUEST_TOP_CALLS = parseInt(process.env.SLOW_REQUEST_TOP_CALLS || '5');
+const METRICS_TOKEN = process.env.METRICS_TOKEN || '';
+const METRICS_PUBLIC = process.env.METRICS_AUTH === 'off';
+const DB_TIMING_PUBLIC = METRICS_PUBLIC || process.env.NODE_ENV === 'development';
+
+const LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30];
+const SIZE_BUCKETS = [100, 1000, 10000, 100000, 1000000, 10000000];
+const READ_BUCKETS = [0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000];
+
+function escapeLabel(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+function labelString(names, values) {
+  if (names.length === 0) return '';
+  return `{${names.map((name, i) => `${name}="${escapeLabel(values[i])}"`).join(',')}}`;
+}
+
+class Counter {
+  constructor(name, help, labelNames = []) {
+    this.name = name;
+    this.help = help;
+    this.labelNames = labelNames;
+    this.series = new Map();
+  }
+
+  inc(labels, value = 1) {
+    const key = JSON.stringify(labels);
+    this.series.set(key, (this.series.get(key) || 0) + value);
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} counter`];
+    this.series.forEach((value, key) => {
+      lines.push(`${this.name}${labelString(this.labelNames, JSON.parse(key))} ${value}`);
+    });
+    return lines.join('\n');
+  }
+}
+
+class Histogram {
+  constructor(name, help, labelNames, buckets) {
+    this.name = name;
+    this.help = help;
+    this.labelNames = labelNames;
+    this.buckets = buckets;
+    this.series = new Map();
+  }
+
+  observe(labels, value) {
+    const key = JSON.stringify(labels);
+    let series = this.series.get(key);
+    if (!series) {
+      series = { counts: this.buckets.map(() => 0), sum: 0, count: 0 };
+      this.series.set(key, series);
+    }
+    this.buckets.forEach((bound, i) => {
+      if (value <= bound) series.counts[i]++;
+    });
+    series.sum += value;
+    series.count++;
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+    const names = [...this.labelNames, 'le'];
+    this.series.forEach((series, key) => {
+      const labels = JSON.parse(key);
+      this.buckets.forEach((bound, i) => {
+        lines.push(`${this.name}_bucket${labelString(names, [...labels, bound])} ${series.counts[i]}`);
+      });
+      lines.push(`${this.name}_bucket${labelString(names, [...labels, '+Inf'])} ${series.count}`);
+      lines.push(`${this.name}_sum${labelString(this.labelNames, labels)} ${series.sum}`);
+      lines.push(`${this.name}_count${labelString(this.labelNames, labels)} ${series.count}`);
+    });
+    return lines.join('\n');
+  }
+}
+
+const metrics = {
+  requests: new Counter('http_requests_total', 'Requests by route and status code', ['method', 'route', 'status']),
+  duration: new Histogram('http_request_duration_seconds', 'Request latency', ['method', 'route'], LATENCY_BUCKETS),
+  responseSize: new Histogram('http_response_size_bytes', 'Response body size', ['method', 'route'], SIZE_BUCKETS),
+  authSeconds: new Counter('http_auth_seconds_total', 'Time spent verifying tokens and permissions', ['method', 'route']),
+  requestReads: new Histogram('http_request_firestore_reads', 'Firestore documents read per request', ['method', 'route'], READ_BUCKETS),
+  reads: new Counter('firestore_documents_read_total', 'Firestore documents read, by route', ['route']),
+  writes: new Counter('firestore_documents_written_total', 'Firestore documents written, by route', ['route']),
+  calls: new Counter('firestore_calls_total', 'Firestore calls, by route', ['route']),
+  slowRequests: new Counter('http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS', ['method', 'route'])
+};
+
+/**
+ * Route pattern a request matched: /api/leads/:id
+ */
+function routeLabel(req) {
+  if (req.route && req.route.path !== undefined) {
+    return `${req.baseUrl || ''}${req.route.path}`;
+  }
+  if (req.method === 'OPTIONS') return 'preflight';
+  return 'unmatched';
+}
+
+function isMetricsToken(value) {
+  if (!METRICS_TOKEN || typeof value !== 'string') return false;
+  const given = crypto.createHash('sha256').update(value).digest();
+  const expected = crypto.createHash('sha256').update(METRICS_TOKEN).digest();
+  return crypto.timingSafeEqual(given, expected);
+}
+
+function appendServerTiming(res, metric) {
+  const existing = res.getHeader('Server-Timing');
+  res.setHeader('Server-Timing', existing ? `${existing}, ${metric}` : metric);
+}
+
+/**
+ * Middleware measuring every request; mount it before everything else
+ */
+function requestMetrics(req, res, next) {
+  const startTime = process.hrtime.bigint();
+  const elapsed = () => Number(process.hrtime.bigint() - startTime) / 1e6;
+
+  firestoreTracker.runWithContext(null, context => {
+    context.method = req.method;
+    context.request = `${req.method} ${req.originalUrl}`;
+    let bytes = 0;
+    const write = res.write;
+    const end = res.end;
+    res.write = function (chunk, encoding, ...rest) {
+      if (chunk) bytes += Buffer.isBuffer(chunk) ? chunk.length : Buffer.byteLength(chunk, typeof encoding === 'string' ? encoding : undefined);
+      return write.call(this, chunk, encoding, ...rest);
+    };
+    res.end = function (chunk, encoding, ...rest) {
+      if (chunk && typeof chunk !== 'function') bytes += Buffer.isBuffer(chunk) ? chunk.length : Buffer.byteLength(chunk, typeof encoding === 'string' ? encoding : undefined);
+      return end.call(this, chunk, encoding, ...rest);
+    };
+
+    // Headers go out with the first byte of the body, so the timings are
+    // added then. Read and write counts are for metrics callers only
+    const showDb = DB_TIMING_PUBLIC || isMetricsToken(req.headers['x-metrics-token']);
+    const writeHead = res.writeHead;
+    res.writeHead = function (...args) {
+      if (!res.headersSent) {
+        if (showDb) {
+          appendServerTiming(res, `db;dur=${context.ms.toFixed(1)};desc="${context.reads} reads, ${context.writes} writes, ${context.calls} calls"`);
+        }
+        appendServerTiming(res, `total;dur=${elapsed().toFixed(1)}`);
+      }
+      return writeHead.apply(this, args);
+    };
+
+    res.on('finish', () => {
+      const ms = elapsed();
+      const route = routeLabel(req);
+      const method = req.method;
+      context.route = route;
+
+      metrics.requests.inc([method, route, res.statusCode]);
+      metrics.duration.observe([method, route], ms / 1000);
+      metrics.responseSize.observe([method, route], bytes);
+      metrics.requestReads.observe([method, route], context.reads);
+      if (req.authMs) metrics.authSeconds.inc([method, route], req.authMs / 1000);
+      metrics.reads.inc([route], context.reads);
+      metrics.writes.inc([route], context.writes);
+      metrics.calls.inc([route], context.calls);
+
+      if (SLOW_REQUEST_MS > 0 && ms > SLOW_REQUEST_MS) {
+        metrics.slowRequests.inc([method, route]);
+        console.warn(`🐢 Slow request ${method} ${req.originalUrl} (${route}) ${res.statusCode} in ${Math.round(ms)}ms: ` +
+          `${context.reads} reads, ${context.writes} writes, ${context.calls} Firestore calls (${Math.round(context.ms)}ms), ` +
+          `auth ${Math.round(req.authMs || 0)}ms, ${bytes} bytes`);
+        firestoreTracker.topCalls(context, SLOW_REQUEST_TOP_CALLS).forEach(call => {
+          console.warn(`   ${call.op} ${call.shape}: ${call.count}x, ${call.reads} reads, ${call.writes} writes, ${call.ms}ms`);
+        });
+      }
+
+      firestoreTracker.finish(context);
+    });
+
+    next();
+  });
+}
+
+/**
+ * Route middleware declaring the most documents a request should read:
+ * router.get('/stats', authenticateToken, readBudget(100), handler)
+ */
+function readBudget(limit) {
+  return (req, res, next) => {
+    const context = firestoreTracker.currentContext();
+    if (context) {
+      context.readBudget = limit;
+      context.budgetRoute = `${req.method} ${routeLabel(req)}`;
+    }
+    next();
+  };
+}
+
+/**
+ * Firestore totals by call shape, and for work outside requests
+ */
+function renderFirestoreTotals() {
+  const byShape = {
+    calls: new Counter('firestore_shape_calls_total', 'Firestore calls by operation and query shape', ['op', 'shape']),
+    reads: new Counter('firestore_shape_documents_read_total', 'Firestore documents read by operation and query shape', ['op', 'shape']),
+    writes: new Counter('firestore_shape_documents_written_total', 'Firestore documents written by collection and write type', ['op', 'shape']),
+    seconds: new Counter('firestore_shape_seconds_total', 'Time in Firestore calls by operation and query shape', ['op', 'shape'])
+  };
+  firestoreTracker.totals.forEach(total => {
+    const labels = [total.op, total.shape];
+    byShape.calls.inc(labels, total.count);
+    if (total.reads) byShape.reads.inc(labels, total.reads);
+    if (total.writes) byShape.writes.inc(labels, total.writes);
+    if (total.ms) byShape.seconds.inc(labels, total.ms / 1000);
+  });
+
+  const background = firestoreTracker.background;
+  const outside = new Counter('firestore_background_documents_total', 'Firestore documents read and written outside requests (listeners, timers, startup)', ['kind']);
+  outside.inc(['read'], background.reads);
+  outside.inc(['written'], background.writes);
+
+  return [...Object.values(byShape), outside].map(metric => metric.render()).join('\n');
+}
+
+/**
+ * GET /metrics in Prometheus text format. Needs `Authorization: Bearer
+ * METRICS_TOKEN` unless METRICS_AUTH=off; without a token it is not served.
+ */
+function metricsHandler(req, res) {
+  if (!METRICS_PUBLIC) {
+    if (!METRICS_TOKEN) {
+      return res.status(404).json({ error: 'Metrics are not enabled; set METRICS_TOKEN' });
+    }
+    const authHeader = req.headers['authorization'] || '';
+    if (!authHeader.startsWith('Bearer ') || !isMetricsToken(authHeader.slice(7))) {
+      return res.status(401).json({ error: 'Metrics token required' });
+    }
+  }
+
+  const memory = process.memoryUsage();
+  const processMetrics = [
+    '# HELP process_resident_memory_bytes Resident memory size',
+    '# TYPE process_resident_memory_bytes gauge',
+    `process_resident_memory_bytes ${memory.rss}`,
+    '# HELP nodejs_heap_used_bytes V8 heap in use',
+    '# TYPE nodejs_heap_used_bytes gauge',
+    `nodejs_heap_used_bytes ${memory.heapUsed}`,
+    '# HELP process_uptime_seconds Time since the process started',
+    '# TYPE process_uptime_seconds gauge',
+    `process_uptime_seconds ${process.uptime()}`
+  ].join('\n');
+
+  res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+  res.send([
+    ...Object.values(metrics).map(metric => metric.render()),
+    renderFirestoreTotals(),
+    processMetrics
+  ].join('\n') + '\n');
+}
+
+module.exports = { requestMetrics, metricsHandler, readBudget };
@@ -126,31 +126,44 @@ class AssignmentRule {
   static async testAssignment(leadData) {
     try {
       const rules = await AssignmentRule.getActive();
+      const match = AssignmentRule.matchRules(leadData, rules);
       
-      for (const rule of rules) {
-        if (AssignmentRule.evaluateConditions(leadData, rule.conditions, rule.condition_logic)) {
-          const assignedTo = AssignmentRule.selectAssignee(rule);
-          
-          if (assignedTo) {
-            // Update the last assignment index for round robin
-            await AssignmentRule.updateLastAssignmentIndex(rule.id, rule.last_assignment_index);
-            
-            return {
+      if (match) {
+        // Update the last assignment index for round robin
+        await AssignmentRule.updateLastAssignmentIndex(match.rule.id, match.rule.last_assignment_index);
+        return match.assignment;
+      }
+      
+      return null; // No rule matched
+    } catch (error) {
+      console.error('Error testing assignment rules:', error);
+      throw error;
+    }
+  }
+
+  // First rule (in priority order) that matches the lead and has an assignee.
+  // Advances the rule's round robin index in memory only, so a caller
+  // assigning many leads against one getActive() result saves it once.
+  static matchRules(leadData, rules) {
+    for (const rule of rules) {
+      if (AssignmentRule.evaluateConditions(leadData, rule.conditions, rule.condition_logic)) {
+        const assignedTo = AssignmentRule.selectAssignee(rule);
+        
+        if (assignedTo) {
+          return {
+            rule,
+            assignment: {
               assigned_to: assignedTo,
               rule_matched: rule.name,
               rule_id: rule.id,
               assignment_reason: rule.description || `Matched rule: ${rule.name}`,
               auto_assigned: true
-            };
-          }
+            }
+          };
         }
       }
-      
-      return null; // No rule matched
-    } catch (error) {
-      console.error('Error testing assignment rules:', error);
-      throw error;
     }
+    return null;
   }
 
   // Evaluate if lead matches rule conditions
@@ -1,5 +1,7 @@
 const { db, collections } = require('../config/db');
-const { convertToIST } = require('../utils/dateHelpers');
+const { convertToIST, leadTimestamps, toEpochMs } = require('../utils/dateHelpers');
+const leadSearchIndex = require('../services/leadSearchIndex');
+const dashboardCounters = require('../services/dashboardCounters');
 
 class Lead {
   constructor(data) {
@@ -105,12 +107,15 @@ class Lead {
       query = query.where('assigned_to', '==', filters.assigned_to);
     }
     
-    const snapshot = await query.orderBy('created_date', 'desc').get();
+    // Sorted here rather than with orderBy('created_date'): Firestore orders
+    // its ISO strings and Timestamps by type first
+    const snapshot = await query.get();
     const leads = [];
     snapshot.forEach(doc => {
-      leads.push({ id: doc.id, ...doc.data() });
+      const data = doc.data();
+      leads.push({ lead: { id: doc.id, ...data }, key: data.created_ts ?? toEpochMs(data.created_date) ?? 0 });
     });
-    return leads;
+    return leads.sort((a, b) => b.key - a.key).map(entry => entry.lead);
   }
 
   static async getById(id) {
@@ -119,18 +124,25 @@ class Lead {
     return { id: doc.id, ...doc.data() };
   }
 
+  // Document data for Firestore, without undefined values (Firestore rejects
+  // them), plus the numeric created_ts/enquiry_ts/updated_ts
+  toFirestore() {
+    const cleanData = {};
+    for (const [key, value] of Object.entries(this)) {
+      if (value !== undefined) {
+        cleanData[key] = value;
+      }
+    }
+    return { ...cleanData, ...leadTimestamps(cleanData) };
+  }
+
   async save() {
     try {
-      // Filter out undefined values to prevent Firestore errors
-      const cleanData = {};
-      for (const [key, value] of Object.entries(this)) {
-        if (value !== undefined) {
-          cleanData[key] = value;
-        }
-      }
+      const cleanData = this.toFirestore();
       
       const docRef = await db.collection(collections.leads).add(cleanData);
       const savedLead = { id: docRef.id, ...cleanData };
+      await dashboardCounters.recordChange('leads', null, cleanData);
       
       console.log(`✅ Lead saved successfully: ${docRef.id}`);
       return savedLead;
@@ -159,8 +171,18 @@ class Lead {
         updateData.number_of_people = Lead.prototype.parseNumber(updateData.number_of_people, 1);
       }
 
+      // Keep the numeric timestamps in step with the dates being written
+      Object.assign(updateData, leadTimestamps(updateData, { partial: true }));
+
+      // Previous status, for the dashboard counters
+      const before = dashboardCounters.touches('leads', updateData) ? await Lead.getById(id) : null;
+
       await db.collection(collections.leads).doc(id).update(updateData);
-      return await Lead.getById(id);
+      const updatedLead = await Lead.getById(id);
+      if (before) {
+        await dashboardCounters.recordChange('leads', before, updatedLead);
+      }
+      return updatedLead;
     } catch (error) {
       console.error('Error updating lead:', error);
       throw error;
@@ -169,7 +191,9 @@ class Lead {
 
   static async delete(id) {
     try {
+      const before = await Lead.getById(id);
       await db.collection(collections.leads).doc(id).delete();
+      await dashboardCounters.recordChange('leads', before, null);
       return true;
     } catch (error) {
       console.error('Error deleting lead:', error);
@@ -185,116 +209,63 @@ class Lead {
     try {
       console.log(`🔍 Backend: Searching for phone: ${phone}`);
       
-      // Normalize the search phone number
-      const normalizedSearchPhone = phone.replace(/[\s\-\+]/g, '').replace(/^91/, '');
-      
-      console.log(`🔍 Backend: Normalized search phone: ${normalizedSearchPhone}`);
-      
-      // Search with multiple phone number formats
-      const phoneVariations = [
-        phone,                              // Original input
-        normalizedSearchPhone,              // Normalized (remove +91, spaces, etc.)
-        `+91${normalizedSearchPhone}`,      // With +91 prefix
-        `91${normalizedSearchPhone}`,       // With 91 prefix
-        `0${normalizedSearchPhone}`,        // With 0 prefix
-      ];
+      let leads = [];
+      let searchPhone = null;
+
+      if (leadSearchIndex.ready) {
+        // One E.164 lookup in the warm index covers every stored format
+        const ids = leadSearchIndex.findByPhone(phone).slice(0, 50);
+        if (ids.length > 0) {
+          const docs = await db.getAll(...ids.map(id => db.collection(collections.leads).doc(id)));
+          leads = docs.filter(doc => doc.exists).map(doc => ({ id: doc.id, ...doc.data() }));
+        }
+        if (leads.length === 0) {
+          console.log(`❌ Backend: No leads in search index for phone: ${phone}`);
+          return null;
+        }
+        searchPhone = leads[0].phone;
+      } else {
+        const phoneVariations = Lead.phoneVariations(phone);
       
-      console.log(`🔍 Backend: Checking phone variations:`, phoneVariations);
+        console.log(`🔍 Backend: Checking phone variations:`, phoneVariations);
       
-      let snapshot = null;
-      let searchPhone = null;
+        let snapshot = null;
       
-      // Try each phone variation until we find a match
-      for (const phoneVar of phoneVariations) {
-        console.log(`🔍 Backend: Trying phone format: ${phoneVar}`);
+        // Try each phone variation until we find a match
+        for (const phoneVar of phoneVariations) {
+          console.log(`🔍 Backend: Trying phone format: ${phoneVar}`);
         
-        const tempSnapshot = await db.collection(collections.leads)
-          .where('phone', '==', phoneVar)
-          .limit(50)
-          .get();
+          const tempSnapshot = await db.collection(collections.leads)
+            .where('phone', '==', phoneVar)
+            .limit(50)
+            .get();
         
-        if (!tempSnapshot.empty) {
-          snapshot = tempSnapshot;
-          searchPhone = phoneVar;
-          console.log(`✅ Backend: Found match with phone format: ${phoneVar}`);
-          break;
+          if (!tempSnapshot.empty) {
+            snapshot = tempSnapshot;
+            searchPhone = phoneVar;
+            console.log(`✅ Backend: Found match with phone format: ${phoneVar}`);
+            break;
+          }
         }
-      }
 
-      if (!snapshot || snapshot.empty) {
-        console.log(`❌ Backend: No leads found for any phone variation of: ${phone}`);
-        return null;
-      }
+        if (!snapshot || snapshot.empty) {
+          console.log(`❌ Backend: No leads found for any phone variation of: ${phone}`);
+          return null;
+        }
 
-      const leads = [];
-      snapshot.forEach(doc => {
-        leads.push({ id: doc.id, ...doc.data() });
-      });
+        snapshot.forEach(doc => {
+          leads.push({ id: doc.id, ...doc.data() });
+        });
+      }
 
       console.log(`📞 Backend: Found ${leads.length} leads for phone: ${searchPhone}`);
       leads.forEach(lead => {
         console.log(`   - ${lead.name} assigned to: ${lead.assigned_to || 'unassigned'}`);
       });
 
-      // Find primary lead or use first one
-      const primaryLead = leads.find(l => l.is_primary_lead) || leads[0];
-      
-      // FIXED: Calculate aggregated data with proper number handling
-      const totalValue = leads.reduce((sum, lead) => {
-        const value = parseFloat(lead.potential_value) || 0;
-        // console.log(`   Adding value: ${value} (from ${lead.potential_value})`);
-        return sum + value;
-      }, 0);
-      
-      console.log(`📊 Backend: Total calculated value: ${totalValue}`);
-      
-      const events = [...new Set(leads.map(l => l.lead_for_event).filter(Boolean))];
-      
-      // Get the most common assigned_to person
-      const assignedToCounts = {};
-      leads.forEach(lead => {
-        if (lead.assigned_to) {
-          assignedToCounts[lead.assigned_to] = (assignedToCounts[lead.assigned_to] || 0) + 1;
-        }
-      });
-      
-      const primaryAssignedTo = Object.keys(assignedToCounts).length > 0 
-        ? Object.keys(assignedToCounts).reduce((a, b) => assignedToCounts[a] > assignedToCounts[b] ? a : b)
-        : null;
-
-      const result = {
-        client_id: primaryLead.client_id || primaryLead.id,
-        phone: searchPhone,
-        name: primaryLead.name,
-        email: primaryLead.email,
-        primary_assigned_to: primaryAssignedTo,
-        total_leads: leads.length,
-        total_value: totalValue, // This is now guaranteed to be a number
-        leads: leads.map(l => ({
-          id: l.id,
-          name: l.name,
-          email: l.email,
-          phone: l.phone,
-          company: l.company,
-          assigned_to: l.assigned_to,
-          status: l.status,
-          lead_for_event: l.lead_for_event,
-          created_date: l.created_date,
-          city_of_residence: l.city_of_residence,
-          country_of_residence: l.country_of_residence,
-          business_type: l.business_type,
-          annual_income_bracket: l.annual_income_bracket,
-          // Include campaign fields in client history
-          form_name: l.form_name,
-          campaign_name: l.campaign_name,
-          adset_name: l.adset_name,
-          ad_name: l.ad_name
-        })),
-        events: events,
-        first_contact: primaryLead.created_date
-      };
+      const result = Lead.summarizeClient(leads, searchPhone);
 
-      console.log(`✅ Backend: Client data prepared for: ${primaryLead.name}`, {
+      console.log(`✅ Backend: Client data prepared for: ${result.name}`, {
         primary_assigned_to: result.primary_assigned_to,
         total_leads: result.total_leads,
         total_value: result.total_value
@@ -308,6 +279,124 @@ class Lead {
     }
   }
 
+  // Phone formats a stored lead may use for the same number
+  static phoneVariations(phone) {
+    const normalizedSearchPhone = String(phone).replace(/[\s\-\+]/g, '').replace(/^91/, '');
+    return [
+      String(phone),                      // Original input
+      normalizedSearchPhone,              // Normalized (remove +91, spaces, etc.)
+      `+91${normalizedSearchPhone}`,      // With +91 prefix
+      `91${normalizedSearchPhone}`,       // With 91 prefix
+      `0${normalizedSearchPhone}`,        // With 0 prefix
+    ];
+  }
+
+  // Client record for the leads sharing a phone number
+  static summarizeClient(leads, searchPhone) {
+    // Find primary lead or use first one
+    const primaryLead = leads.find(l => l.is_primary_lead) || leads[0];
+    
+    // FIXED: Calculate aggregated data with proper number handling
+    const totalValue = leads.reduce((sum, lead) => {
+      const value = parseFloat(lead.potential_value) || 0;
+      return sum + value;
+    }, 0);
+    
+    const events = [...new Set(leads.map(l => l.lead_for_event).filter(Boolean))];
+    
+    // Get the most common assigned_to person
+    const assignedToCounts = {};
+    leads.forEach(lead => {
+      if (lead.assigned_to) {
+        assignedToCounts[lead.assigned_to] = (assignedToCounts[lead.assigned_to] || 0) + 1;
+      }
+    });
+    
+    const primaryAssignedTo = Object.keys(assignedToCounts).length > 0 
+      ? Object.keys(assignedToCounts).reduce((a, b) => assignedToCounts[a] > assignedToCounts[b] ? a : b)
+      : null;
+
+    return {
+      client_id: primaryLead.client_id || primaryLead.id,
+      phone: searchPhone,
+      name: primaryLead.name,
+      email: primaryLead.email,
+      primary_assigned_to: primaryAssignedTo,
+      total_leads: leads.length,
+      total_value: totalValue, // This is now guaranteed to be a number
+      leads: leads.map(l => ({
+        id: l.id,
+        name: l.name,
+        email: l.email,
+        phone: l.phone,
+        company: l.company,
+        assigned_to: l.assigned_to,
+        status: l.status,
+        lead_for_event: l.lead_for_event,
+        created_date: l.created_date,
+        city_of_residence: l.city_of_residence,
+        country_of_residence: l.country_of_residence,
+        business_type: l.business_type,
+        annual_income_bracket: l.annual_income_bracket,
+        // Include campaign fields in client history
+        form_name: l.form_name,
+        campaign_name: l.campaign_name,
+        adset_name: l.adset_name,
+        ad_name: l.ad_name
+      })),
+      events: events,
+      first_contact: primaryLead.created_date
+    };
+  }
+
+  /**
+   * Existing leads for many phone numbers at once, as Map(phone -> leads),
+   * matching what getClientByPhone would find for each of them. Uses the
+   * search index when it is warm, otherwise `in` queries over the phone
+   * variations, 30 per query.
+   */
+  static async findLeadsByPhones(phones) {
+    const result = new Map();
+    const uniquePhones = [...new Set(phones.filter(Boolean).map(String))];
+    if (uniquePhones.length === 0) return result;
+
+    if (leadSearchIndex.ready) {
+      const idsByPhone = new Map(uniquePhones.map(phone => [phone, leadSearchIndex.findByPhone(phone).slice(0, 50)]));
+      const ids = [...new Set([...idsByPhone.values()].flat())];
+      const leadsById = new Map();
+      for (let i = 0; i < ids.length; i += 300) {
+        const docs = await db.getAll(...ids.slice(i, i + 300).map(id => db.collection(collections.leads).doc(id)));
+        docs.forEach(doc => {
+          if (doc.exists) leadsById.set(doc.id, { id: doc.id, ...doc.data() });
+        });
+      }
+      idsByPhone.forEach((leadIds, phone) => {
+        result.set(phone, leadIds.map(id => leadsById.get(id)).filter(Boolean));
+      });
+      return result;
+    }
+
+    const variationsByPhone = new Map(uniquePhones.map(phone => [phone, Lead.phoneVariations(phone)]));
+    const variations = [...new Set([...variationsByPhone.values()].flat())];
+    const leadsByStoredPhone = new Map();
+    for (let i = 0; i < variations.length; i += 30) {
+      const snapshot = await db.collection(collections.leads)
+        .where('phone', 'in', variations.slice(i, i + 30))
+        .get();
+      snapshot.forEach(doc => {
+        const lead = { id: doc.id, ...doc.data() };
+        if (!leadsByStoredPhone.has(lead.phone)) leadsByStoredPhone.set(lead.phone, []);
+        leadsByStoredPhone.get(lead.phone).push(lead);
+      });
+    }
+    variationsByPhone.forEach((phoneVariations, phone) => {
+      // Like getClientByPhone, the first variation with matches wins
+      const match = phoneVariations.find(variation => leadsByStoredPhone.has(variation));
+      result.set(phone, match ? leadsByStoredPhone.get(match).slice(0, 50) : []);
+    });
+    return result;
+  }
+
   static async getAllClients() {
     try {
       console.log('🔍 Getting all leads to group into clients...');
@@ -1,13 +1,13 @@
 const express = require('express');
 const router = express.Router();
 const admin = require('../config/firebase');
-const { authenticateToken, checkPermission } = require('../middleware/auth');
+const { authenticateToken, checkPermission, authStatus } = require('../middleware/auth');
 
 const db = admin.firestore();
 
 // Admin health check
 router.get('/health', authenticateToken, checkPermission('admin', 'read'), async (req, res) => {
-    res.json({ status: 'OK', admin: true });
+    res.json({ status: 'OK', admin: true, auth: authStatus() });
 });
 
 router.post('/update-supply-manager-role', authenticateToken, async (req, res) => {
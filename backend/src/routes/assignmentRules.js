@@ -3,6 +3,7 @@ const router = express.Router();
 const AssignmentRule = require('../models/AssignmentRule');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
 const { db, collections } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
 
 // GET all assignment rules
 router.get('/', authenticateToken, checkPermission('leads', 'read'), async (req, res) => {
@@ -264,6 +265,7 @@ router.post('/run-assignment', authenticateToken, checkPermission('leads', 'assi
             };
             
             await db.collection(collections.leads).doc(leadDoc.id).update(updateData);
+            await dashboardCounters.recordChange('leads', leadData, { ...leadData, ...updateData });
             
             results.push({
               leadId: leadDoc.id,
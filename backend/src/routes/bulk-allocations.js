@@ -3,6 +3,9 @@ const router = express.Router();
 const multer = require('multer');
 const csv = require('csv-parse');
 const { db } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
+const inventoryIndex = require('../services/inventoryIndex');
+const salesMarginService = require('../services/salesMarginService');
 const admin = require('../config/firebase');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
 
@@ -96,7 +99,10 @@ router.post('/preview', authenticateToken, upload.single('file'), async (req, re
 
       // Look up inventory
       let inventory = inventoryCache.get(record.event_name);
-      if (!inventory) {
+      if (!inventory && inventoryIndex.ready) {
+        inventory = inventoryIndex.findByEventName(record.event_name);
+        if (inventory) inventoryCache.set(record.event_name, inventory);
+      } else if (!inventory) {
         const inventorySnapshot = await db.collection('crm_inventory')
           .where('event_name', '==', record.event_name)
           .limit(1)
@@ -449,9 +455,19 @@ router.post('/process', authenticateToken, upload.single('file'), async (req, re
         enrichedData: {}
       };
 
-      // Look up inventory
+      // Look up inventory. The index finds it, but the document is read
+      // fresh since availability is written back from it below
       let inventory = inventoryCache.get(record.event_name);
-      if (!inventory) {
+      if (!inventory && inventoryIndex.ready) {
+        const indexed = inventoryIndex.findByEventName(record.event_name);
+        if (indexed) {
+          const doc = await db.collection('crm_inventory').doc(indexed.id).get();
+          if (doc.exists && doc.data().isDeleted !== true) {
+            inventory = { id: doc.id, ...doc.data() };
+            inventoryCache.set(record.event_name, inventory);
+          }
+        }
+      } else if (!inventory) {
         const inventorySnapshot = await db.collection('crm_inventory')
           .where('event_name', '==', record.event_name)
           .limit(1)
@@ -615,6 +631,9 @@ router.post('/process', authenticateToken, upload.single('file'), async (req, re
     
     console.log(`Found ${validRows.length} valid rows out of ${validationResults.length} total validation results`);
     
+    // Tickets leaving availability, for the dashboard counters
+    const allocatedSlices = [];
+
     // Process each valid row
     for (const row of validRows) {
       const { inventory, lead, category, tickets_to_allocate, notes, order, price_override } = row.enrichedData;
@@ -686,6 +705,12 @@ router.post('/process', authenticateToken, upload.single('file'), async (req, re
         console.log(`Found category at index: ${categoryIndex}`);
         
         if (categoryIndex >= 0) {
+          const allocatedCategory = updatedCategories[categoryIndex];
+          allocatedSlices.push([{
+            available_tickets: tickets_to_allocate,
+            selling_price_inr: allocatedCategory.selling_price_inr,
+            selling_price: allocatedCategory.selling_price
+          }, null]);
           updatedCategories[categoryIndex].available_tickets -= tickets_to_allocate;
           batch.update(inventoryRef, {
             categories: updatedCategories,
@@ -696,6 +721,11 @@ router.post('/process', authenticateToken, upload.single('file'), async (req, re
       } else {
         // Update general availability
         console.log(`Updating general availability by -${tickets_to_allocate}`);
+        allocatedSlices.push([{
+          available_tickets: tickets_to_allocate,
+          selling_price_inr: inventory.selling_price_inr,
+          selling_price: inventory.selling_price
+        }, null]);
         batch.update(inventoryRef, {
           available_tickets: admin.firestore.FieldValue.increment(-tickets_to_allocate)
         });
@@ -722,6 +752,8 @@ router.post('/process', authenticateToken, upload.single('file'), async (req, re
     console.log(`Committing batch with ${processedAllocations.length} allocations`);
     await batch.commit();
     console.log('Batch committed successfully');
+    await dashboardCounters.recordChanges('inventory', allocatedSlices);
+    await salesMarginService.invalidate('bulk allocation upload');
 
     res.json({
       success: true,
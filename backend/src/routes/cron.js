@@ -1,8 +1,26 @@
 const express = require('express');
 const router = express.Router();
 const statsAggregationService = require('../services/statsAggregationService');
+const dashboardCounters = require('../services/dashboardCounters');
+const metaWebhookQueue = require('../services/metaWebhookQueue');
+const marketingRollups = require('../services/marketingRollups');
+const leadTimestampMigration = require('../services/leadTimestampMigration');
+const { getISTDateString } = require('../utils/dateHelpers');
 const { db } = require('../config/db');
 
+// Modes POST /update-stats accepts
+const STATS_MODES = ['incremental', 'full'];
+
+// Requests from Cloud Scheduler carry CRON_TOKEN; GitHub Actions runs are let
+// through when it isn't configured for them
+function isAuthorizedCron(req) {
+  const cronToken = req.headers['x-cloudscheduler-token'];
+  const expectedToken = process.env.CRON_TOKEN;
+  const isGitHubActions = req.body?.source === 'github-actions';
+  const shouldCheckToken = expectedToken && !isGitHubActions;
+  return !shouldCheckToken || cronToken === expectedToken;
+}
+
 /**
  * Cron endpoint for Google Cloud Scheduler
  * This endpoint will be called every 2 hours to update stats
@@ -23,16 +41,22 @@ router.post('/update-stats', async (req, res) => {
     });
     
     // Skip token check for github-actions if CRON_TOKEN is not set in production
-    const isGitHubActions = source === 'github-actions';
-    const shouldCheckToken = expectedToken && !isGitHubActions;
-    
-    if (shouldCheckToken && cronToken !== expectedToken) {
+    if (!isAuthorizedCron(req)) {
       return res.status(403).json({
         success: false,
         error: 'Unauthorized - Invalid cron token'
       });
     }
     
+    // Incremental unless the request or STATS_AGGREGATION_MODE says otherwise
+    const mode = req.body?.mode || process.env.STATS_AGGREGATION_MODE || 'incremental';
+    if (!STATS_MODES.includes(mode)) {
+      return res.status(400).json({
+        success: false,
+        error: `Invalid mode '${mode}'; expected one of ${STATS_MODES.join(', ')}`
+      });
+    }
+    
     console.log('⏰ Cron job triggered for stats aggregation');
     
     // Check if aggregation is already running
@@ -54,7 +78,7 @@ router.post('/update-stats', async (req, res) => {
     
     // Run aggregation
     const startTime = Date.now();
-    const stats = await statsAggregationService.aggregateAllStats();
+    const stats = await statsAggregationService.aggregateAllStats({ mode });
     
     // Mark as completed
     await db.collection('crm_performance_stats').doc('running').set({
@@ -66,6 +90,7 @@ router.post('/update-stats', async (req, res) => {
     res.json({
       success: true,
       message: 'Stats aggregation completed',
+      mode: stats.metadata.mode,
       processingTimeMs: Date.now() - startTime,
       timestamp: stats.timestamp
     });
@@ -87,6 +112,153 @@ router.post('/update-stats', async (req, res) => {
   }
 });
 
+/**
+ * Recompute the dashboard counters from the collections and correct drift.
+ * Also runs on a timer in the server; the counters' lease keeps the two from
+ * overlapping.
+ */
+router.post('/reconcile-dashboard', async (req, res) => {
+  try {
+    if (!isAuthorizedCron(req)) {
+      return res.status(403).json({
+        success: false,
+        error: 'Unauthorized - Invalid cron token'
+      });
+    }
+    
+    const result = await dashboardCounters.reconcile();
+    if (!result) {
+      return res.json({
+        success: true,
+        message: 'Reconcile already running, skipped'
+      });
+    }
+    
+    res.json({
+      success: true,
+      reconciledAt: result.reconciledAt,
+      processingTimeMs: result.processingTimeMs,
+      drift: result.drift
+    });
+    
+  } catch (error) {
+    console.error('❌ Dashboard reconcile error:', error);
+    res.status(500).json({
+      success: false,
+      error: error.message
+    });
+  }
+});
+
+/**
+ * Drain the Meta webhook queue. Instances drain it themselves, but Cloud Run
+ * may throttle their CPU between requests, so a scheduler job can call this
+ * to keep the processing lag bounded.
+ */
+router.post('/drain-meta-webhooks', async (req, res) => {
+  try {
+    if (!isAuthorizedCron(req)) {
+      return res.status(403).json({
+        success: false,
+        error: 'Unauthorized - Invalid cron token'
+      });
+    }
+    
+    const startTime = Date.now();
+    await metaWebhookQueue.drain();
+    
+    res.json({
+      success: true,
+      processingTimeMs: Date.now() - startTime,
+      queue: await metaWebhookQueue.status()
+    });
+    
+  } catch (error) {
+    console.error('❌ Meta webhook drain error:', error);
+    res.status(500).json({
+      success: false,
+      error: error.message
+    });
+  }
+});
+
+/**
+ * Rebuild the marketing rollups from the leads. With no body this covers all
+ * history (the initial backfill); { days: N } rebuilds the last N IST days
+ * and { from, to } a range of days, to correct drift cheaply on a schedule.
+ */
+router.post('/rebuild-marketing-rollups', async (req, res) => {
+  try {
+    if (!isAuthorizedCron(req)) {
+      return res.status(403).json({
+        success: false,
+        error: 'Unauthorized - Invalid cron token'
+      });
+    }
+    
+    let { from = null, to = null, days } = req.body || {};
+    if (days) {
+      const dayMs = 24 * 60 * 60 * 1000;
+      from = getISTDateString(new Date(Date.now() - (parseInt(days) - 1) * dayMs));
+      to = getISTDateString(new Date());
+    }
+    
+    // A full rebuild takes the same lease as the scheduled one
+    const result = from || to
+      ? await marketingRollups.rebuild({ from, to })
+      : await marketingRollups.reconcile();
+    if (!result) {
+      return res.json({
+        success: true,
+        message: 'Rebuild already running, skipped'
+      });
+    }
+    res.json({
+      success: true,
+      ...result
+    });
+    
+  } catch (error) {
+    console.error('❌ Marketing rollup rebuild error:', error);
+    res.status(500).json({
+      success: false,
+      error: error.message
+    });
+  }
+});
+
+/**
+ * Backfill numeric lead timestamps, a few pages per call; repeated calls
+ * carry on from the saved cursor. Body: { pages, restart }
+ */
+router.post('/migrate-lead-timestamps', async (req, res) => {
+  try {
+    if (!isAuthorizedCron(req)) {
+      return res.status(403).json({
+        success: false,
+        error: 'Unauthorized - Invalid cron token'
+      });
+    }
+    
+    const { pages = 20, restart = false } = req.body || {};
+    const result = await leadTimestampMigration.run({
+      maxPages: parseInt(pages) || 20,
+      restart: restart === true || restart === 'true'
+    });
+    res.json({
+      success: true,
+      ...result
+    });
+    
+  } catch (error) {
+    console.error('❌ Lead timestamp migration error:', error);
+    res.status(500).json({
+      success: false,
+      error: error.message
+    });
+  }
+});
+
 // Health check endpoint for monitoring
 router.get('/health', async (req, res) => {
   try {
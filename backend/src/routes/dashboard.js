@@ -2,89 +2,16 @@ const express = require('express');
 const router = express.Router();
 const { db, collections } = require('../config/db');
 const { authenticateToken } = require('../middleware/auth');
+const dashboardCounters = require('../services/dashboardCounters');
 
 // GET dashboard stats with currency support
+// Served from the materialized counters (see services/dashboardCounters.js)
 router.get('/stats', authenticateToken, async (req, res) => {
   try {
-    // Get counts from all collections
-    const [leads, inventory, orders, receivables] = await Promise.all([
-      db.collection(collections.leads).get(),
-      db.collection(collections.inventory).get(),
-      db.collection(collections.orders).get(),
-      db.collection(collections.receivables).get()
-    ]);
-    
-    // Calculate revenue using INR fields
-    let totalRevenue = 0;
-    let thisMonthRevenue = 0;
-    const currentMonth = new Date().getMonth();
-    const currentYear = new Date().getFullYear();
-    
-    orders.docs.forEach(doc => {
-      const data = doc.data();
-      // Use INR fields for calculation, fallback to regular fields if not available
-      const amount = data.final_amount_inr || data.final_amount || 0;
-      
-      if (data.status === 'approved' || data.status === 'completed') {
-        totalRevenue += amount;
-        
-        // Check if order is from current month
-        const orderDate = new Date(data.created_date);
-        if (orderDate.getMonth() === currentMonth && orderDate.getFullYear() === currentYear) {
-          thisMonthRevenue += amount;
-        }
-      }
-    });
-    
-    // Calculate inventory value using INR fields
-    let totalInventoryValue = 0;
-    let availableInventoryCount = 0;
-    
-    inventory.docs.forEach(doc => {
-      const data = doc.data();
-      
-      if (data.categories && Array.isArray(data.categories)) {
-        // Multi-category inventory
-        data.categories.forEach(cat => {
-          const sellingPrice = cat.selling_price_inr || cat.selling_price || 0;
-          const availableTickets = parseInt(cat.available_tickets) || 0;
-          totalInventoryValue += sellingPrice * availableTickets;
-          availableInventoryCount += availableTickets;
-        });
-      } else {
-        // Legacy single-category inventory
-        const sellingPrice = data.selling_price_inr || data.selling_price || 0;
-        const availableTickets = parseInt(data.available_tickets) || 0;
-        totalInventoryValue += sellingPrice * availableTickets;
-        availableInventoryCount += availableTickets;
-      }
-    });
-    
-    // Qualified statuses - matching marketing performance logic
-    const qualifiedStatuses = ['qualified', 'hot', 'warm', 'cold', 'pickup_later', 
-      'quote_requested', 'quote_received', 'converted', 'invoiced', 
-      'payment_received', 'payment_post_service', 'dropped'];
-    
-    // Calculate stats
-    console.log(`📊 Dashboard Stats - Total leads: ${leads.size}`);
-    const stats = {
-      totalLeads: leads.size,
-      activeDeals: leads.docs.filter(doc => 
-        qualifiedStatuses.includes(doc.data().status)
-      ).length,
-      totalInventory: availableInventoryCount,
-      totalInventoryValue: totalInventoryValue,
-      pendingOrders: orders.docs.filter(doc => 
-        doc.data().status === 'pending_approval'
-      ).length,
-      totalReceivables: receivables.docs.reduce((sum, doc) => 
-        sum + (doc.data().amount || 0), 0
-      ),
-      thisMonthRevenue: thisMonthRevenue,
-      totalRevenue: totalRevenue,
-      currency: 'INR' // Always report in INR
-    };
+    const startTime = Date.now();
+    const stats = await dashboardCounters.getStats();
     
+    console.log(`📊 Dashboard Stats - Total leads: ${stats.totalLeads} (${Date.now() - startTime}ms)`);
     res.json({ data: stats });
   } catch (error) {
     res.status(500).json({ error: error.message });
@@ -2,6 +2,9 @@ const express = require('express');
 const router = express.Router();
 const { db, collections } = require('../config/db');
 const admin = require('../config/firebase');
+const dashboardCounters = require('../services/dashboardCounters');
+const inventoryIndex = require('../services/inventoryIndex');
+const salesMarginService = require('../services/salesMarginService');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
 // Don't import Inventory model since we're using direct database access
 
@@ -233,6 +236,7 @@ router.post('/', authenticateToken, checkPermission('inventory', 'create'), asyn
     // Verify saved data
     const savedDoc = await db.collection('crm_inventory').doc(docRef.id).get();
     const savedData = savedDoc.data();
+    await dashboardCounters.recordChange('inventory', null, savedData);
     
     console.log('✅ Inventory saved with payment fields:');
     console.log('  paymentStatus:', savedData.paymentStatus);
@@ -479,6 +483,7 @@ if (req.body.form_ids !== undefined) {
     
     // Update inventory first
     await db.collection('crm_inventory').doc(id).update(updateData);
+    await dashboardCounters.recordChange('inventory', oldData, { ...oldData, ...updateData });
     
     // Update related payables if payment info changed
     if (updateData.paymentStatus !== undefined || 
@@ -760,6 +765,10 @@ const verifyDoc = await db.collection('crm_inventory').doc(id).get();
 const verifyData = verifyDoc.data();
 console.log('✅ After update - form_ids:', verifyData.form_ids);
 
+if (['categories', 'buying_price', 'buying_price_inr', 'price_currency', 'exchange_rate', 'event_name', 'isDeleted'].some(field => updateData[field] !== undefined)) {
+  await salesMarginService.invalidate(`inventory ${id} updated`);
+}
+
 res.json({ 
   data: { id, ...updateData },
   message: updateData.categories ? 'Inventory updated successfully with categories' : 'Inventory updated successfully'
@@ -874,6 +883,8 @@ router.post('/:id/allocate', authenticateToken, checkPermission('inventory', 'wr
     
     // Update inventory
     await db.collection('crm_inventory').doc(id).update(updateData);
+    // inventoryData was changed in place; data() decodes the original again
+    await dashboardCounters.recordChange('inventory', inventoryDoc.data(), { ...inventoryDoc.data(), ...updateData });
     
     // Get buying price for allocation
     let buyingPricePerTicket = 0;
@@ -958,7 +969,8 @@ router.post('/:id/allocate', authenticateToken, checkPermission('inventory', 'wr
         if (linkedOrderIds.length > 0) {
           await db.collection('crm_allocations').doc(allocationRef.id).update({
             order_ids: linkedOrderIds,
-            primary_order_id: linkedOrderIds[0] // First order as primary
+            primary_order_id: linkedOrderIds[0], // First order as primary
+            updated_date: new Date().toISOString()
           });
         }
       } else {
@@ -971,6 +983,8 @@ router.post('/:id/allocate', authenticateToken, checkPermission('inventory', 'wr
     
     console.log(`Successfully allocated ${allocatedTickets} tickets to lead ${leadData.name}`);
     
+    await salesMarginService.invalidate(`allocation ${allocationRef.id} created`);
+
     res.json({ 
       success: true, 
       message: `Successfully allocated ${allocatedTickets} tickets to ${leadData.name}`,
@@ -1121,12 +1135,15 @@ router.delete('/:id/allocations/:allocationId', authenticateToken, checkPermissi
     
     // Update inventory (add tickets back)
     await db.collection('crm_inventory').doc(id).update(updateData);
+    await dashboardCounters.recordChange('inventory', inventoryDoc.data(), { ...inventoryDoc.data(), ...updateData });
     
     // Delete allocation record
     await db.collection('crm_allocations').doc(allocationId).delete();
     
     console.log(`Unallocated ${ticketsToReturn} tickets from inventory ${id}`);
     
+    await salesMarginService.invalidate(`allocation ${allocationId} deleted`);
+
     res.json({ 
       success: true, 
       message: `Successfully unallocated ${ticketsToReturn} tickets`,
@@ -1160,7 +1177,10 @@ router.delete('/:id', authenticateToken, checkPermission('inventory', 'delete'),
     }
     
     // Delete inventory item
+    const inventoryDoc = await db.collection('crm_inventory').doc(id).get();
     await db.collection('crm_inventory').doc(id).delete();
+    await dashboardCounters.recordChange('inventory', inventoryDoc.data() || null, null);
+    await salesMarginService.invalidate(`inventory ${id} deleted`);
     
     res.json({ data: { message: 'Inventory and related payables deleted successfully' } });
   } catch (error) {
@@ -1414,7 +1434,9 @@ router.get('/debug/forms', authenticateToken, async (req, res) => {
     res.json({
       total_inventories: inventories.size,
       inventories_with_forms: results.length,
-      data: results
+      data: results,
+      // In-memory form ID index: readiness, lookups and unmatched form IDs
+      index: inventoryIndex.status()
     });
   } catch (error) {
     res.status(500).json({ error: error.message });
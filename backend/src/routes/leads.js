@@ -4,9 +4,13 @@ const router = express.Router();
 const Lead = require('../models/Lead');
 const AssignmentRule = require('../models/AssignmentRule');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
+const { readBudget } = require('../middleware/instrumentation');
 const Communication = require('../models/Communication');
 const { Storage } = require('@google-cloud/storage');
 const LeadStatusTriggers = require('../services/leadStatusTriggers');
+const leadQueryService = require('../services/leadQueryService');
+const leadSearchIndex = require('../services/leadSearchIndex');
+const dashboardCounters = require('../services/dashboardCounters');
 const multer = require('multer');
 
 // Initialize the triggers service
@@ -14,7 +18,7 @@ const statusTriggers = new LeadStatusTriggers();
 
 // Import db for bulk operations (you already had this)
 const { db, collections } = require('../config/db');
-const { convertToIST, formatDateForQuery } = require('../utils/dateHelpers');
+const { convertToIST, formatDateForQuery, toEpochMs } = require('../utils/dateHelpers');
 
 // Initialize Google Cloud Storage for PDF downloads
 const storage = new Storage({
@@ -256,6 +260,17 @@ async function updateRuleLastAssignment(ruleId, currentIndex) {
   }
 }
 
+// Convert Firestore timestamps on a lead to ISO strings for the frontend
+function normalizeLeadDates(lead) {
+  ['created_date', 'updated_date', 'date_of_enquiry'].forEach(field => {
+    const value = lead[field];
+    if (value && typeof value === 'object' && value._seconds) {
+      lead[field] = new Date(value._seconds * 1000).toISOString();
+    }
+  });
+  return lead;
+}
+
 // ============================================
 // SPECIFIC ROUTES (NO PARAMETERS) - MUST BE FIRST
 // ============================================
@@ -278,7 +293,12 @@ router.get('/paginated', authenticateToken, async (req, res) => {
       
       // Sort params
       sort_by = 'created_date',
-      sort_order = 'desc'
+      sort_order = 'desc',
+
+      // Opaque cursor from the previous page's pagination.nextCursor;
+      // mode=scan forces the in-memory path
+      cursor = '',
+      mode = ''
     } = req.query;
 
     const pageNum = parseInt(page);
@@ -287,7 +307,63 @@ router.get('/paginated', authenticateToken, async (req, res) => {
     console.log(`📄 Fetching paginated leads - Page: ${pageNum}, Limit: ${limitNum}`);
     console.log(`🔍 Filters: status=${status}, source=${source}, business_type=${business_type}, event=${event}, assigned_to=${assigned_to}`);
 
-    // Fetch all leads first (we'll optimize this later with proper indexes)
+    // Search goes through the warm in-memory index; only this page's
+    // documents are read
+    if (search && mode !== 'scan' && leadSearchIndex.ready) {
+      const ids = leadSearchIndex.search(search, {
+        filters: {
+          status: status && status !== 'all' ? status.split(',').map(s => s.trim()) : [],
+          source: source !== 'all' ? source : '',
+          business_type: business_type !== 'all' ? business_type : '',
+          event: event !== 'all' ? event : '',
+          assigned_to: assigned_to !== 'all' ? assigned_to : ''
+        },
+        sortBy: sort_by,
+        sortOrder: sort_order
+      });
+      const offset = (pageNum - 1) * limitNum;
+      const pageIds = ids.slice(offset, offset + limitNum);
+      const docs = pageIds.length > 0
+        ? await db.getAll(...pageIds.map(id => db.collection(collections.leads).doc(id)))
+        : [];
+      const totalPages = Math.ceil(ids.length / limitNum);
+
+      console.log(`✅ Search "${search}": ${ids.length} matches in ${leadSearchIndex.stats.lastSearchMs}ms, ${docs.length} reads`);
+
+      return res.json({
+        success: true,
+        data: docs.filter(doc => doc.exists).map(doc => normalizeLeadDates({ id: doc.id, ...doc.data() })),
+        pagination: {
+          page: pageNum,
+          limit: limitNum,
+          total: ids.length,
+          totalPages: totalPages,
+          hasNext: pageNum < totalPages,
+          hasPrev: pageNum > 1,
+          mode: 'search'
+        }
+      });
+    }
+
+    // Indexed query when Firestore can do the filtering and sorting itself
+    const queryParams = { search, status, source, business_type, event, assigned_to, sort_by, sort_order };
+    const unsupported = mode === 'scan' ? 'mode=scan' : await leadQueryService.unsupportedReason(queryParams);
+    if (!unsupported) {
+      const { leads, pagination } = await leadQueryService.fetchPage({
+        ...queryParams,
+        page: pageNum,
+        limit: limitNum,
+        cursor
+      });
+      return res.json({
+        success: true,
+        data: leads.map(normalizeLeadDates),
+        pagination
+      });
+    }
+    console.log(`📄 Full-scan pagination (${unsupported})`);
+
+    // Fetch all leads and filter/sort in memory
     const snapshot = await db.collection(collections.leads).get();
     let allLeads = [];
 
@@ -346,56 +422,29 @@ router.get('/paginated', authenticateToken, async (req, res) => {
       );
     }
 
-    // Sort the results
-    filteredLeads.sort((a, b) => {
-      let aValue, bValue;
-      
+    // Sort the results. Keys are worked out once per lead, from the numeric
+    // timestamps where the lead has them
+    const sortKey = lead => {
       switch (sort_by) {
-        case 'created_date':
-          // Handle Firestore timestamp objects from Instagram leads
-          if (a.created_date && typeof a.created_date === 'object' && a.created_date._seconds) {
-            aValue = a.created_date._seconds * 1000 + (a.created_date._nanoseconds || 0) / 1000000;
-          } else {
-            aValue = a.created_date ? new Date(a.created_date).getTime() : 0;
-          }
-          
-          if (b.created_date && typeof b.created_date === 'object' && b.created_date._seconds) {
-            bValue = b.created_date._seconds * 1000 + (b.created_date._nanoseconds || 0) / 1000000;
-          } else {
-            bValue = b.created_date ? new Date(b.created_date).getTime() : 0;
-          }
-          break;
         case 'date_of_enquiry':
-          aValue = a.date_of_enquiry ? new Date(a.date_of_enquiry).getTime() : 0;
-          bValue = b.date_of_enquiry ? new Date(b.date_of_enquiry).getTime() : 0;
-          break;
+          return lead.enquiry_ts ?? toEpochMs(lead.date_of_enquiry) ?? 0;
+        case 'updated_date':
+          // updated_ts can lag updated_date, which many routes write directly
+          return toEpochMs(lead.updated_date) ?? 0;
         case 'name':
-          aValue = (a.name || '').toLowerCase();
-          bValue = (b.name || '').toLowerCase();
-          break;
+          return (lead.name || '').toLowerCase();
         case 'potential_value':
-          aValue = parseFloat(a.potential_value) || 0;
-          bValue = parseFloat(b.potential_value) || 0;
-          break;
+          return parseFloat(lead.potential_value) || 0;
         case 'company':
-          aValue = (a.company || '').toLowerCase();
-          bValue = (b.company || '').toLowerCase();
-          break;
+          return (lead.company || '').toLowerCase();
         default:
-          // Handle Firestore timestamp objects from Instagram leads
-          if (a.created_date && typeof a.created_date === 'object' && a.created_date._seconds) {
-            aValue = a.created_date._seconds * 1000 + (a.created_date._nanoseconds || 0) / 1000000;
-          } else {
-            aValue = a.created_date ? new Date(a.created_date).getTime() : 0;
-          }
-          
-          if (b.created_date && typeof b.created_date === 'object' && b.created_date._seconds) {
-            bValue = b.created_date._seconds * 1000 + (b.created_date._nanoseconds || 0) / 1000000;
-          } else {
-            bValue = b.created_date ? new Date(b.created_date).getTime() : 0;
-          }
+          return lead.created_ts ?? toEpochMs(lead.created_date) ?? 0;
       }
-      
+    };
+    const sortKeys = new Map(filteredLeads.map(lead => [lead, sortKey(lead)]));
+    filteredLeads.sort((a, b) => {
+      const aValue = sortKeys.get(a);
+      const bValue = sortKeys.get(b);
       if (sort_order === 'asc') {
         return aValue > bValue ? 1 : -1;
       } else {
@@ -412,21 +461,7 @@ router.get('/paginated', authenticateToken, async (req, res) => {
     console.log(`✅ Returning ${paginatedLeads.length} of ${totalCount} total leads`);
 
     // Convert any Firestore timestamps to ISO strings for frontend compatibility
-    const normalizedLeads = paginatedLeads.map(lead => {
-      if (lead.created_date && typeof lead.created_date === 'object' && lead.created_date._seconds) {
-        const timestamp = lead.created_date._seconds * 1000;
-        lead.created_date = new Date(timestamp).toISOString();
-      }
-      if (lead.updated_date && typeof lead.updated_date === 'object' && lead.updated_date._seconds) {
-        const timestamp = lead.updated_date._seconds * 1000;
-        lead.updated_date = new Date(timestamp).toISOString();
-      }
-      if (lead.date_of_enquiry && typeof lead.date_of_enquiry === 'object' && lead.date_of_enquiry._seconds) {
-        const timestamp = lead.date_of_enquiry._seconds * 1000;
-        lead.date_of_enquiry = new Date(timestamp).toISOString();
-      }
-      return lead;
-    });
+    const normalizedLeads = paginatedLeads.map(normalizeLeadDates);
 
     res.json({
       success: true,
@@ -437,7 +472,8 @@ router.get('/paginated', authenticateToken, async (req, res) => {
         total: totalCount,
         totalPages: totalPages,
         hasNext: pageNum < totalPages,
-        hasPrev: pageNum > 1
+        hasPrev: pageNum > 1,
+        mode: 'scan'
       }
     });
 
@@ -874,6 +910,7 @@ router.delete('/', authenticateToken, async (req, res) => {
       });
       
       await batch.commit();
+      await dashboardCounters.recordChanges('leads', currentBatch.map(doc => [doc.data(), null]));
       deleted += currentBatch.length;
       console.log(`Deleted batch: ${currentBatch.length} docs (total: ${deleted})`);
     }
@@ -968,7 +1005,7 @@ router.put('/bulk/status', authenticateToken, async (req, res) => {
 // ============================================
 
 // GET single lead - SAME AS YOUR ORIGINAL
-router.get('/:id', authenticateToken, async (req, res) => {
+router.get('/:id', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const lead = await Lead.getById(req.params.id);
     if (!lead) {
@@ -1207,6 +1244,7 @@ router.delete('/bulk-delete', authenticateToken, checkPermission('leads', 'delet
     if (count % 500 !== 0) {
       await batch.commit();
     }
+    await dashboardCounters.recordChanges('leads', snapshot.docs.map(doc => [doc.data(), null]));
 
     console.log(`BULK HARD DELETE SUCCESS: Permanently deleted ${count} leads with event="${event}" by ${req.user.email}`);
 
@@ -1508,6 +1546,7 @@ router.post('/:id/quote/upload', authenticateToken, upload.single('quote_pdf'),
     // Get updated lead data
     const updatedLeadDoc = await db.collection('crm_leads').doc(id).get();
     const updatedLead = { id, ...updatedLeadDoc.data() };
+    await dashboardCounters.recordChange('leads', leadData, updatedLead);
     
     console.log(`✅ Quote upload completed for lead: ${id}`);
     
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const { db, collections } = require('../config/db');
+const { leadTimestamps } = require('../utils/dateHelpers');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
 
 // Fix missing created_date fields
@@ -72,11 +73,12 @@ router.post('/fix-created-dates', authenticateToken, checkPermission('admin', 'w
           dateSource = 'current_date';
         }
         
-        batch.update(docRef, {
+        const fix = {
           created_date: dateToUse,
           updated_date: new Date().toISOString(),
           updated_by: 'system_fix_maintenance'
-        });
+        };
+        batch.update(docRef, { ...fix, ...leadTimestamps(fix, { partial: true }) });
         
         updateResults.push({
           id: lead.id,
@@ -2,45 +2,56 @@
 const express = require('express');
 const router = express.Router();
 const { authenticateToken, checkPermission } = require('../middleware/auth');
-const { db, collections } = require('../config/db');
 const facebookInsights = require('../services/facebookInsightsService');
-const { formatDateForQuery } = require('../utils/dateHelpers');
+const marketingRollups = require('../services/marketingRollups');
+const { aggregate, summarize } = marketingRollups;
 
-// Define touch-based statuses
-const touchBasedStatuses = [
-  'contacted', 'attempt_1', 'attempt_2', 'attempt_3',
-  'qualified', 'unqualified', 'junk', 'warm', 'hot', 'cold',
-  'interested', 'not_interested', 'on_hold', 'dropped',
-  'converted', 'invoiced', 'payment_received', 'payment_post_service',
-  'pickup_later', 'quote_requested', 'quote_received'
-];
+// Whether a lead, or a rollup of leads, passes the event / source / ad set filters
+function matchesFilters(item, { event, source, sources, ad_set }) {
+  if (event && event !== 'all' && item.lead_for_event !== event && item.event_name !== event) {
+    return false;
+  }
+  // Handle multi-select sources
+  if (sources) {
+    // Parse comma-separated sources
+    const sourcesArray = sources.split(',').map(s => s.trim());
+    if (sourcesArray.length > 0 && !sourcesArray.includes(item.source)) {
+      return false;
+    }
+  } else if (source && source !== 'all' && item.source !== source) {
+    // Fallback to single source for backward compatibility
+    return false;
+  }
+  if (ad_set && ad_set !== 'all' && item.ad_set !== ad_set && item.adset_name !== ad_set) {
+    return false;
+  }
+  return true;
+}
+
+/**
+ * Rollup rows for the date range: from the daily rollups when they can
+ * answer it, otherwise aggregated from the leads. drilldown reads the leads
+ * either way and returns them too.
+ */
+async function marketingRows(date_from, date_to, drilldown) {
+  const rows = drilldown ? null : await marketingRollups.rowsForRange(date_from, date_to);
+  if (rows) {
+    return { rows, leads: null, dataSource: 'rollups' };
+  }
+  const leads = await marketingRollups.leadsForRange(date_from, date_to);
+  return { rows: Array.from(aggregate(leads).values()), leads, dataSource: 'leads' };
+}
 
 // Comprehensive marketing performance endpoint - everything in one call
 router.get('/performance', authenticateToken, checkPermission('finance', 'read'), async (req, res) => {
   try {
     const { date_from, date_to, event, source, sources, ad_set } = req.query;
+    const drilldown = req.query.drilldown === 'true';
     
-    console.log('📊 Fetching marketing performance:', { date_from, date_to, event, source, sources, ad_set });
+    console.log('📊 Fetching marketing performance:', { date_from, date_to, event, source, sources, ad_set, drilldown });
     
-    // Build query for leads - simplified to avoid Firestore index issues
-    let query = db.collection(collections.leads);
-    
-    // Only apply date filters to avoid compound index requirements
-    // Handle both date-only strings and ISO timestamps with IST conversion
-    if (date_from) {
-      const fromDate = formatDateForQuery(date_from, 'start');
-      query = query.where('date_of_enquiry', '>=', fromDate);
-    }
-    if (date_to) {
-      const toDate = formatDateForQuery(date_to, 'end');
-      query = query.where('date_of_enquiry', '<=', toDate);
-    }
-    
-    const leadsSnapshot = await query.get();
-    let allLeadsData = [];
-    leadsSnapshot.forEach(doc => {
-      allLeadsData.push({ id: doc.id, ...doc.data() });
-    });
+    // Whole-day ranges come from the daily rollups; each row stands for row.leads leads
+    const { rows, leads: allLeadsData, dataSource } = await marketingRows(date_from, date_to, drilldown);
     
     // IMPORTANT: Collect all filter options BEFORE filtering
     const allEvents = new Set();
@@ -49,17 +60,17 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
     const uniqueAdSetNames = new Set(); // For fetching from Facebook
     
     // Collect ALL available options from ALL leads (before filtering)
-    allLeadsData.forEach(lead => {
-      if (lead.lead_for_event || lead.event_name) {
-        allEvents.add(lead.lead_for_event || lead.event_name);
+    rows.forEach(row => {
+      if (row.lead_for_event || row.event_name) {
+        allEvents.add(row.lead_for_event || row.event_name);
       }
-      if (lead.source) {
-        allSources.add(lead.source);
+      if (row.source) {
+        allSources.add(row.source);
       }
-      if (lead.ad_set || lead.adset_name) {
-        const adSetName = lead.ad_set || lead.adset_name;
+      if (row.ad_set || row.adset_name) {
+        const adSetName = row.ad_set || row.adset_name;
         allAdSets.add(adSetName);
-        if (lead.source === 'Facebook' || lead.source === 'Instagram') {
+        if (row.source === 'Facebook' || row.source === 'Instagram') {
           uniqueAdSetNames.add(adSetName);
         }
       }
@@ -76,7 +87,7 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
     try {
       console.log('📊 Attempting to fetch Facebook impressions...');
       
-      // Test connection first
+      // Test connection first (the result is reused for a few minutes)
       const connectionTest = await facebookInsights.testConnection();
       if (!connectionTest.success) {
         throw new Error(`Connection test failed: ${connectionTest.error?.message || 'Unknown error'}`);
@@ -140,32 +151,11 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
     }
     
     // Now apply filters to get the subset of leads for display
-    let leads = [...allLeadsData]; // Create a copy for filtering
+    const filters = { event, source, sources, ad_set };
+    const filteredRows = rows.filter(row => matchesFilters(row, filters));
     
-    if (event && event !== 'all') {
-      leads = leads.filter(lead => 
-        lead.lead_for_event === event || lead.event_name === event
-      );
-    }
-    // Handle multi-select sources
-    if (sources) {
-      // Parse comma-separated sources
-      const sourcesArray = sources.split(',').map(s => s.trim());
-      if (sourcesArray.length > 0) {
-        leads = leads.filter(lead => sourcesArray.includes(lead.source));
-        console.log(`Filtering by multiple sources: ${sourcesArray.join(', ')}`);
-      }
-    } else if (source && source !== 'all') {
-      // Fallback to single source for backward compatibility
-      leads = leads.filter(lead => lead.source === source);
-    }
-    if (ad_set && ad_set !== 'all') {
-      leads = leads.filter(lead => 
-        lead.ad_set === ad_set || lead.adset_name === ad_set
-      );
-    }
-    
-    console.log(`Found ${leads.length} leads for marketing performance (from ${allLeadsData.length} total)`);
+    const countLeads = list => list.reduce((sum, row) => sum + row.leads, 0);
+    console.log(`Found ${countLeads(filteredRows)} leads for marketing performance (from ${countLeads(rows)} total, ${dataSource})`);
     
     // Determine grouping logic
     const groupBy = ad_set && ad_set !== 'all' ? 'ad_set' :
@@ -176,15 +166,15 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
     // Group and calculate metrics (only for filtered leads)
     const grouped = {};
     
-    leads.forEach(lead => {
+    filteredRows.forEach(row => {
       // Determine grouping key
       let key = 'Unknown';
       if (groupBy === 'event') {
-        key = lead.lead_for_event || lead.event_name || 'Unknown';
+        key = row.lead_for_event || row.event_name || 'Unknown';
       } else if (groupBy === 'ad_set') {
-        key = lead.ad_set || lead.adset_name || 'Unknown';
+        key = row.ad_set || row.adset_name || 'Unknown';
       } else {
-        key = lead.source || 'Unknown';
+        key = row.source || 'Unknown';
       }
       
       // Initialize group if not exists
@@ -202,31 +192,17 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
         };
       }
       
-      // Count metrics
-      grouped[key].totalLeads++;
-      
-      if (touchBasedStatuses.includes(lead.status)) {
-        grouped[key].touchBased++;
-        
-        // Updated qualified logic - includes qualified, temperature statuses, quote statuses, converted, and dropped
-        if (['qualified', 'hot', 'warm', 'cold', 'pickup_later', 'quote_requested', 'quote_received', 'converted', 'invoiced', 'payment_received', 'payment_post_service', 'dropped'].includes(lead.status)) {
-          grouped[key].qualified++;
-        } else if (lead.status === 'junk') {
-          grouped[key].junk++;
-        }
-        
-        // Count dropped separately (even though it's also in qualified)
-        if (lead.status === 'dropped') {
-          grouped[key].dropped++;
-        }
-        
-        // Converted includes only actual conversions
-        if (['converted', 'invoiced', 'payment_received', 'payment_post_service'].includes(lead.status)) {
-          grouped[key].converted++;
-        }
-      } else {
-        grouped[key].notTouchBased++;
-      }
+      // Count metrics. Qualified includes qualified, temperature statuses,
+      // quote statuses, converted and dropped; dropped is also counted
+      // separately; converted includes only actual conversions
+      const counts = summarize(row.statuses);
+      grouped[key].totalLeads += row.leads;
+      grouped[key].touchBased += counts.touchBased;
+      grouped[key].notTouchBased += counts.notTouchBased;
+      grouped[key].qualified += counts.qualified;
+      grouped[key].junk += counts.junk;
+      grouped[key].dropped += counts.dropped;
+      grouped[key].converted += counts.converted;
     });
     
     // First, ensure we have entries for both Facebook and Instagram if we're grouping by source
@@ -271,16 +247,16 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
           clicks = metrics.clicks || 0;
         }
       } else if (groupBy === 'event') {
-        // For events, sum metrics from all ad sets associated with this event
-        leads.filter(lead => {
-          const leadEvent = lead.lead_for_event || lead.event_name;
+        // For events, sum metrics from all ad sets associated with this event, once per lead
+        filteredRows.filter(row => {
+          const leadEvent = row.lead_for_event || row.event_name;
           return leadEvent === key;
-        }).forEach(lead => {
-          const adSetName = lead.ad_set || lead.adset_name;
+        }).forEach(row => {
+          const adSetName = row.ad_set || row.adset_name;
           if (adSetName && facebookMetrics[adSetName]) {
-            impressions += facebookMetrics[adSetName].impressions || 0;
-            spend += facebookMetrics[adSetName].spend || 0;
-            clicks += facebookMetrics[adSetName].clicks || 0;
+            impressions += (facebookMetrics[adSetName].impressions || 0) * row.leads;
+            spend += (facebookMetrics[adSetName].spend || 0) * row.leads;
+            clicks += (facebookMetrics[adSetName].clicks || 0) * row.leads;
           }
         });
       }
@@ -397,6 +373,9 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
         },
         filterOptions,
         groupBy,
+        dataSource,
+        // Raw leads, only with drilldown=true
+        leads: drilldown ? allLeadsData.filter(lead => matchesFilters(lead, filters)) : undefined,
         appliedFilters: {
           date_from,
           date_to,
@@ -433,10 +412,12 @@ router.get('/performance', authenticateToken, checkPermission('finance', 'read')
 // Force refresh Facebook insights cache
 router.post('/refresh-insights', authenticateToken, checkPermission('finance', 'read'), async (req, res) => {
   try {
-    facebookInsights.clearCache();
+    // Closed days don't change; ?stored=true drops them too
+    const stored = req.query.stored === 'true';
+    await facebookInsights.clearCache({ stored });
     res.json({
       success: true,
-      message: 'Facebook insights cache cleared. Next request will fetch fresh data.'
+      message: `Facebook insights cache cleared${stored ? ', including stored days' : ''}. Next request will fetch fresh data.`
     });
   } catch (error) {
     res.status(500).json({
@@ -494,68 +475,31 @@ router.get('/performance-timeseries', authenticateToken, checkPermission('financ
     
     console.log('📊 Fetching marketing time-series data:', { date_from, date_to, event, source, sources, ad_set, granularity });
     
-    // Build query for leads
-    let query = db.collection(collections.leads);
-    
-    // Apply date filters
-    if (date_from) {
-      const fromDate = formatDateForQuery(date_from, 'start');
-      query = query.where('date_of_enquiry', '>=', fromDate);
-    }
-    if (date_to) {
-      const toDate = formatDateForQuery(date_to, 'end');
-      query = query.where('date_of_enquiry', '<=', toDate);
-    }
-    
-    const leadsSnapshot = await query.get();
-    let allLeads = [];
-    leadsSnapshot.forEach(doc => {
-      allLeads.push({ id: doc.id, ...doc.data() });
-    });
-    
-    // Apply additional filters
-    if (event && event !== 'all') {
-      allLeads = allLeads.filter(lead => 
-        lead.lead_for_event === event || lead.event_name === event
-      );
-    }
-    // Handle multi-select sources
-    if (sources) {
-      // Parse comma-separated sources
-      const sourcesArray = sources.split(',').map(s => s.trim());
-      if (sourcesArray.length > 0) {
-        allLeads = allLeads.filter(lead => sourcesArray.includes(lead.source));
-      }
-    } else if (source && source !== 'all') {
-      // Fallback to single source for backward compatibility
-      allLeads = allLeads.filter(lead => lead.source === source);
-    }
-    if (ad_set && ad_set !== 'all') {
-      allLeads = allLeads.filter(lead => 
-        lead.ad_set === ad_set || lead.adset_name === ad_set
-      );
-    }
+    const drilldown = req.query.drilldown === 'true';
+    const { rows, leads, dataSource } = await marketingRows(date_from, date_to, drilldown);
     
-    // Filter for Facebook and Instagram leads only
-    const metaLeads = allLeads.filter(lead => 
-      lead.source === 'Facebook' || lead.source === 'Instagram'
+    // Apply additional filters, then keep Facebook and Instagram leads only
+    const filters = { event, source, sources, ad_set };
+    const metaRows = rows.filter(row => 
+      matchesFilters(row, filters) && (row.source === 'Facebook' || row.source === 'Instagram')
     );
     
-    // Group leads by date and source
+    // Group leads by IST enquiry date and source
     const timeSeriesData = {};
     
-    metaLeads.forEach(lead => {
-      const leadDate = new Date(lead.date_of_enquiry);
+    metaRows.forEach(row => {
+      // Leads without an enquiry date can't be placed on the chart
+      if (!/^\d{4}-\d{2}-\d{2}$/.test(row.day)) return;
       let dateKey;
       
       if (granularity === 'weekly') {
         // Get start of week (Sunday)
-        const weekStart = new Date(leadDate);
-        weekStart.setDate(leadDate.getDate() - leadDate.getDay());
+        const weekStart = new Date(`${row.day}T00:00:00Z`);
+        weekStart.setUTCDate(weekStart.getUTCDate() - weekStart.getUTCDay());
         dateKey = weekStart.toISOString().split('T')[0];
       } else {
         // Daily granularity
-        dateKey = leadDate.toISOString().split('T')[0];
+        dateKey = row.day;
       }
       
       if (!timeSeriesData[dateKey]) {
@@ -588,34 +532,14 @@ router.get('/performance-timeseries', authenticateToken, checkPermission('financ
         };
       }
       
-      const source = lead.source;
-      const sourceData = timeSeriesData[dateKey][source];
-      const totalData = timeSeriesData[dateKey].total;
-      
-      if (sourceData) {
-        sourceData.leads++;
-        totalData.leads++;
-        
-        if (touchBasedStatuses.includes(lead.status)) {
-          sourceData.touchBased++;
-          totalData.touchBased++;
-          
-          if (['qualified', 'hot', 'warm', 'cold', 'pickup_later', 'quote_requested', 'quote_received', 'converted', 'invoiced', 'payment_received', 'payment_post_service', 'dropped'].includes(lead.status)) {
-            sourceData.qualified++;
-            totalData.qualified++;
-          }
-          
-          if (['converted', 'invoiced', 'payment_received', 'payment_post_service'].includes(lead.status)) {
-            sourceData.converted++;
-            totalData.converted++;
-          }
-          
-          if (lead.status === 'junk') {
-            sourceData.junk++;
-            totalData.junk++;
-          }
-        }
-      }
+      const counts = summarize(row.statuses);
+      [timeSeriesData[dateKey][row.source], timeSeriesData[dateKey].total].forEach(bucket => {
+        bucket.leads += row.leads;
+        bucket.touchBased += counts.touchBased;
+        bucket.qualified += counts.qualified;
+        bucket.converted += counts.converted;
+        bucket.junk += counts.junk;
+      });
     });
     
     // Convert to array and sort by date
@@ -749,15 +673,20 @@ router.get('/performance-timeseries', authenticateToken, checkPermission('financ
       data: {
         series: changes,
         summary: {
-          totalLeads: metaLeads.length,
-          facebookLeads: metaLeads.filter(l => l.source === 'Facebook').length,
-          instagramLeads: metaLeads.filter(l => l.source === 'Instagram').length,
+          totalLeads: metaRows.reduce((sum, row) => sum + row.leads, 0),
+          facebookLeads: metaRows.filter(row => row.source === 'Facebook').reduce((sum, row) => sum + row.leads, 0),
+          instagramLeads: metaRows.filter(row => row.source === 'Instagram').reduce((sum, row) => sum + row.leads, 0),
           dateRange: {
             from: date_from,
             to: date_to
           },
-          granularity
-        }
+          granularity,
+          dataSource
+        },
+        // Raw leads, only with drilldown=true
+        leads: drilldown
+          ? leads.filter(lead => matchesFilters(lead, filters) && (lead.source === 'Facebook' || lead.source === 'Instagram'))
+          : undefined
       }
     });
     
@@ -777,7 +706,7 @@ router.get('/test-facebook-connection', authenticateToken, checkPermission('fina
     console.log('🧪 Testing Facebook API connection...');
     
     // Test basic connection
-    const connectionTest = await facebookInsights.testConnection();
+    const connectionTest = await facebookInsights.testConnection({ force: true });
     
     // Try to get ad account
     let adAccountTest = { success: false, error: 'Not tested' };
@@ -803,6 +732,7 @@ router.get('/test-facebook-connection', authenticateToken, checkPermission('fina
         connection: connectionTest,
         adAccount: adAccountTest,
         insights: insightsTest,
+        cache: facebookInsights.status(),
         environment: {
           hasAccessToken: !!process.env.META_PAGE_ACCESS_TOKEN,
           hasAppId: !!process.env.FACEBOOK_APP_ID,
@@ -1,6 +1,9 @@
 const express = require('express');
 const router = express.Router();
 const { db, collections } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
+const salesPerformanceCache = require('../services/salesPerformanceCache');
+const salesMarginService = require('../services/salesMarginService');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
 
 /**
@@ -337,6 +340,8 @@ router.post('/', authenticateToken, async (req, res) => {
     // Fetch the created document to ensure we have all fields
     const createdDoc = await docRef.get();
     const createdOrder = { id: docRef.id, ...createdDoc.data() };
+    await dashboardCounters.recordChange('orders', null, createdDoc.data());
+    await salesPerformanceCache.invalidateOrders([[null, createdDoc.data()]], 'order created');
     
     // Link existing allocations to this new order
     try {
@@ -363,7 +368,8 @@ router.post('/', authenticateToken, async (req, res) => {
               // Update allocation with new order reference
               await db.collection('crm_allocations').doc(allocationDoc.id).update({
                 order_ids: existingOrderIds,
-                primary_order_id: allocationData.primary_order_id || docRef.id
+                primary_order_id: allocationData.primary_order_id || docRef.id,
+                updated_date: new Date().toISOString()
               });
             }
             
@@ -414,6 +420,7 @@ router.post('/', authenticateToken, async (req, res) => {
         };
         
         await db.collection(collections.receivables).add(receivableData);
+        await dashboardCounters.recordChange('receivables', null, receivableData);
         console.log('Receivable created for amount (INR):', receivableAmount);
       }
     }
@@ -529,11 +536,27 @@ router.put('/:id', authenticateToken, async (req, res) => {
     
     console.log('Updating order with customer_type:', updates.customer_type);
     
+    // Previous values, for the dashboard counters and sales performance cache
+    const touchesSalesPerformance = salesPerformanceCache.touchesOrder(updates);
+    const previousOrderDoc = dashboardCounters.touches('orders', updates) || touchesSalesPerformance
+      ? await db.collection(collections.orders).doc(req.params.id).get()
+      : null;
+    
     await db.collection(collections.orders).doc(req.params.id).update(updates);
     
     // Fetch the updated document to return the complete data
     const updatedDoc = await db.collection(collections.orders).doc(req.params.id).get();
     const updatedData = { id: req.params.id, ...updatedDoc.data() };
+    if (previousOrderDoc && previousOrderDoc.exists) {
+      await dashboardCounters.recordChange('orders', previousOrderDoc.data(), updatedDoc.data());
+      if (touchesSalesPerformance) {
+        await salesPerformanceCache.invalidateOrders([[previousOrderDoc.data(), updatedDoc.data()]]);
+      }
+    }
+    // Margins follow sales performance bumps, but also use fields it doesn't
+    if (!touchesSalesPerformance && salesMarginService.touchesOrder(updates)) {
+      await salesMarginService.invalidate(`order ${req.params.id} updated`);
+    }
     
     res.json({ data: updatedData });
   } catch (error) {
@@ -572,6 +595,7 @@ router.put('/:id/sales-person', authenticateToken, async (req, res) => {
     };
     
     await db.collection(collections.orders).doc(req.params.id).update(updateData);
+    await salesPerformanceCache.invalidateOrders([[currentOrder, null]], 'order sales person change');
     
     // Log the change
     console.log(`Sales person updated for order ${req.params.id}: ${currentOrder.sales_person || 'none'} → ${sales_person} by ${req.user.email}`);
@@ -626,6 +650,8 @@ router.post('/:id/split', authenticateToken, async (req, res) => {
       const splitOrderRef = await db.collection(collections.orders).add(splitOrderData);
       createdOrders.push({ id: splitOrderRef.id, ...splitOrderData });
     }
+    await dashboardCounters.recordChanges('orders', createdOrders.map(order => [null, order]));
+    await salesPerformanceCache.invalidateOrders([[originalOrder, null]], 'order split');
     
     // Mark original order as split
     await db.collection(collections.orders).doc(id).update({
@@ -660,6 +686,7 @@ router.put('/allocations/:allocationId/reassign', authenticateToken, async (req,
     
     const allocationData = allocationDoc.data();
     let orderIds = allocationData.order_ids || [];
+    const changedOrders = [];
     
     // Remove from old order if specified
     if (removeFromOrderId) {
@@ -669,6 +696,7 @@ router.put('/allocations/:allocationId/reassign', authenticateToken, async (req,
       const oldOrderDoc = await db.collection(collections.orders).doc(removeFromOrderId).get();
       if (oldOrderDoc.exists) {
         const oldOrderData = oldOrderDoc.data();
+        changedOrders.push(oldOrderData);
         const updatedAllocationIds = (oldOrderData.allocation_ids || []).filter(id => id !== allocationId);
         const newBuyingPrice = (parseFloat(oldOrderData.buying_price) || 0) - (parseFloat(allocationData.total_buying_price) || 0);
         const newAllocatedTickets = (parseInt(oldOrderData.total_allocated_tickets) || 0) - (parseInt(allocationData.tickets_allocated) || 0);
@@ -689,6 +717,7 @@ router.put('/allocations/:allocationId/reassign', authenticateToken, async (req,
       const newOrderDoc = await db.collection(collections.orders).doc(newOrderId).get();
       if (newOrderDoc.exists) {
         const newOrderData = newOrderDoc.data();
+        changedOrders.push(newOrderData);
         const updatedAllocationIds = newOrderData.allocation_ids || [];
         if (!updatedAllocationIds.includes(allocationId)) {
           updatedAllocationIds.push(allocationId);
@@ -704,12 +733,16 @@ router.put('/allocations/:allocationId/reassign', authenticateToken, async (req,
       }
     }
     
+    // Buying prices moved between orders, so both orders' margins changed
+    await salesPerformanceCache.invalidateOrders(changedOrders.map(order => [order, null]), 'allocation reassigned');
+    
     // Update allocation
     await db.collection('crm_allocations').doc(allocationId).update({
       order_ids: orderIds,
       primary_order_id: orderIds.length > 0 ? orderIds[0] : null,
       last_reassigned: new Date().toISOString(),
-      last_reassigned_by: req.user.email
+      last_reassigned_by: req.user.email,
+      updated_date: new Date().toISOString()
     });
     
     res.json({
@@ -845,6 +878,8 @@ router.delete('/bulk-delete', authenticateToken, checkPermission('orders', 'dele
     if (count % 500 !== 0) {
       await batch.commit();
     }
+    await dashboardCounters.recordChanges('orders', snapshot.docs.map(doc => [doc.data(), null]));
+    await salesPerformanceCache.invalidateOrders(snapshot.docs.map(doc => [doc.data(), null]), 'orders bulk deleted');
 
     console.log(`BULK HARD DELETE SUCCESS: Permanently deleted ${count} orders with event="${event}" by ${req.user.email}`);
 
@@ -874,6 +909,8 @@ router.delete('/:id', authenticateToken, async (req, res) => {
     
     // Delete the order
     await db.collection(collections.orders).doc(req.params.id).delete();
+    await dashboardCounters.recordChange('orders', orderDoc.data(), null);
+    await salesPerformanceCache.invalidateOrders([[orderDoc.data(), null]], 'order deleted');
     
     res.json({ data: { message: 'Order deleted successfully' } });
   } catch (error) {
@@ -2,6 +2,7 @@ const express = require('express');
 const router = express.Router();
 const { db } = require('../config/db');
 const { authenticateToken } = require('../middleware/auth');
+const { readBudget } = require('../middleware/instrumentation');
 const statsAggregationService = require('../services/statsAggregationService');
 
 /**
@@ -11,7 +12,7 @@ const statsAggregationService = require('../services/statsAggregationService');
  */
 
 // Get financials for all periods (replaces sales-performance/all-periods for financials)
-router.get('/financials', authenticateToken, async (req, res) => {
+router.get('/financials', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const statsDoc = await db.collection('crm_performance_stats').doc('latest').get();
     
@@ -43,7 +44,7 @@ router.get('/financials', authenticateToken, async (req, res) => {
 });
 
 // Get sales performance data (replaces sales-performance endpoint)
-router.get('/sales-performance', authenticateToken, async (req, res) => {
+router.get('/sales-performance', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const { period = 'lifetime' } = req.query;
     
@@ -96,7 +97,7 @@ router.get('/sales-performance', authenticateToken, async (req, res) => {
 });
 
 // Get retail tracker data (replaces sales-performance/retail-tracker)
-router.get('/retail-tracker', authenticateToken, async (req, res) => {
+router.get('/retail-tracker', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const statsDoc = await db.collection('crm_performance_stats').doc('latest').get();
     
@@ -129,7 +130,7 @@ router.get('/retail-tracker', authenticateToken, async (req, res) => {
 });
 
 // Get marketing performance data
-router.get('/marketing-performance', authenticateToken, async (req, res) => {
+router.get('/marketing-performance', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const statsDoc = await db.collection('crm_performance_stats').doc('latest').get();
     
@@ -159,7 +160,7 @@ router.get('/marketing-performance', authenticateToken, async (req, res) => {
 });
 
 // Get all stats metadata
-router.get('/metadata', authenticateToken, async (req, res) => {
+router.get('/metadata', authenticateToken, readBudget(5), async (req, res) => {
   try {
     const statsDoc = await db.collection('crm_performance_stats').doc('latest').get();
     
@@ -198,6 +199,15 @@ router.post('/aggregate', authenticateToken, async (req, res) => {
       });
     }
     
+    // full (default), incremental or rebuild
+    const mode = req.body?.mode || 'full';
+    if (!['full', 'incremental', 'rebuild'].includes(mode)) {
+      return res.status(400).json({
+        success: false,
+        error: `Unknown aggregation mode: ${mode}`
+      });
+    }
+    
     // Check if aggregation is already running
     const runningDoc = await db.collection('crm_performance_stats').doc('running').get();
     if (runningDoc.exists && runningDoc.data().isRunning) {
@@ -215,7 +225,7 @@ router.post('/aggregate', authenticateToken, async (req, res) => {
     });
     
     // Run aggregation
-    statsAggregationService.aggregateAllStats()
+    statsAggregationService.aggregateAllStats({ mode })
       .then(async () => {
         // Mark as completed
         await db.collection('crm_performance_stats').doc('running').set({
@@ -235,7 +245,7 @@ router.post('/aggregate', authenticateToken, async (req, res) => {
     
     res.json({
       success: true,
-      message: 'Aggregation started in background'
+      message: `Aggregation (${mode}) started in background`
     });
     
   } catch (error) {
@@ -244,6 +254,46 @@ router.post('/aggregate', authenticateToken, async (req, res) => {
   }
 });
 
+// Diff an incremental aggregation against a full recomputation (admin only)
+router.post('/aggregate/verify', authenticateToken, async (req, res) => {
+  try {
+    if (req.user.role !== 'super_admin') {
+      return res.status(403).json({
+        success: false,
+        error: 'Only super admin can verify aggregation'
+      });
+    }
+    
+    const runningDoc = await db.collection('crm_performance_stats').doc('running').get();
+    if (runningDoc.exists && runningDoc.data().isRunning) {
+      return res.status(409).json({
+        success: false,
+        error: 'Aggregation is already running'
+      });
+    }
+    
+    await db.collection('crm_performance_stats').doc('running').set({
+      isRunning: true,
+      startedAt: new Date().toISOString(),
+      startedBy: req.user.email
+    });
+    
+    try {
+      const result = await statsAggregationService.verifyIncrementalStats();
+      res.json({ success: true, ...result });
+    } finally {
+      await db.collection('crm_performance_stats').doc('running').set({
+        isRunning: false,
+        completedAt: new Date().toISOString()
+      });
+    }
+    
+  } catch (error) {
+    console.error('Error verifying aggregation:', error);
+    res.status(500).json({ success: false, error: error.message });
+  }
+});
+
 // Helper function to calculate next update time
 function getNextUpdateTime(lastUpdateTimestamp) {
   const lastUpdate = new Date(lastUpdateTimestamp);
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const { db, collections } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
 const { authenticateToken } = require('../middleware/auth');
 
 // GET all receivables with currency support
@@ -88,6 +89,7 @@ router.post('/', authenticateToken, async (req, res) => {
     });
     
     const docRef = await db.collection(collections.receivables).add(receivableData);
+    await dashboardCounters.recordChange('receivables', null, receivableData);
     res.status(201).json({ data: { id: docRef.id, ...receivableData } });
   } catch (error) {
     console.error('Error creating receivable:', error);
@@ -177,14 +179,19 @@ router.put('/record-payment/:id', authenticateToken, async (req, res) => {
         }
         
         await receivableRef.update(updateData);
+        await dashboardCounters.recordChange('receivables', data, { ...data, ...updateData });
         
         // Update the related order if exists
         if (data.order_id) {
-            await db.collection('crm_orders').doc(data.order_id).update({
+            const orderRef = db.collection('crm_orders').doc(data.order_id);
+            const orderDoc = await orderRef.get();
+            const orderUpdate = {
                 payment_status: 'paid',
                 status: 'completed',
                 payment_date: updateData.payment_date
-            });
+            };
+            await orderRef.update(orderUpdate);
+            await dashboardCounters.recordChange('orders', orderDoc.data(), { ...orderDoc.data(), ...orderUpdate });
         }
         
         // Return complete updated data with currency info
@@ -310,6 +317,7 @@ router.put('/:id', authenticateToken, async (req, res) => {
     }
     
     await receivableRef.update(updateData);
+    await dashboardCounters.recordChange('receivables', existingData, { ...existingData, ...updateData });
     
     // Return updated receivable with all fields
     const responseData = {
@@ -353,6 +361,7 @@ router.delete('/:id', authenticateToken, async (req, res) => {
     }
     
     await receivableRef.delete();
+    await dashboardCounters.recordChange('receivables', receivable.data(), null);
     console.log(`Successfully deleted receivable: ${id}`);
     
     res.json({ message: 'Receivable deleted successfully', id });
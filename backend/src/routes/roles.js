@@ -2,11 +2,13 @@ const express = require('express');
 const router = express.Router();
 const admin = require('../config/firebase');
 const { authenticateToken, checkPermission } = require('../middleware/auth');
+const { DEFAULT_ROLES } = require('../config/roles');
 
 const db = admin.firestore();
 
-// Get all roles
-router.get('/', authenticateToken, checkPermission('users', 'manage_roles'), async (req, res) => {
+// Get all roles - every signed-in user loads these to work out their own
+// permissions, so only authentication is required
+router.get('/', authenticateToken, async (req, res) => {
     try {
         const snapshot = await db.collection('crm_roles').get();
         const roles = [];
@@ -266,133 +268,9 @@ router.delete('/:id', authenticateToken, checkPermission('users', 'manage_roles'
 // Initialize default roles
 router.post('/initialize', authenticateToken, checkPermission('users', 'manage_roles'), async (req, res) => {
     try {
-        const defaultRoles = [
-            {
-                name: 'super_admin',
-                label: 'Super Admin',
-                description: 'Full system access',
-                permissions: {
-                    dashboard: { read: true, write: true, delete: true },
-                    leads: { read: true, write: true, delete: true },
-                    inventory: { read: true, write: true, delete: true },
-                    orders: { read: true, write: true, delete: true },
-                    finance: { read: true, write: true, delete: true },
-                    delivery: { read: true, write: true, delete: true },
-                    users: { read: true, write: true, delete: true, manage_roles: true }
-                },
-                is_system: true
-            },
-            {
-                name: 'admin',
-                label: 'Admin',
-                description: 'Administrative access without role management',
-                permissions: {
-                    dashboard: { read: true, write: true, delete: true },
-                    leads: { read: true, write: true, delete: true },
-                    inventory: { read: true, write: true, delete: true },
-                    orders: { read: true, write: true, delete: true },
-                    finance: { read: true, write: true, delete: true },
-                    delivery: { read: true, write: true, delete: true },
-                    users: { read: true, write: true, delete: true, manage_roles: false }
-                },
-                is_system: true
-            },
-            {
-                name: 'sales_manager',
-                label: 'Sales Manager',
-                description: 'Manages sales team and leads',
-                permissions: {
-                    dashboard: { read: true },
-                    leads: { read: true, write: true, delete: true, assign: true },
-                    inventory: { read: true },
-                    orders: { read: true, write: true },
-                    finance: { read: false },
-                    delivery: { read: true },
-                    users: { read: true }
-                },
-                is_system: true
-            },
-            {
-                name: 'sales_executive',
-                label: 'Sales Executive',
-                description: 'Creates and manages leads',
-                permissions: {
-                    dashboard: { read: true },
-                    leads: { read: true, write: true, progress: true },
-                    inventory: { read: true },
-                    orders: { read: true, write: true },
-                    finance: { read: false },
-                    delivery: { read: true },
-                    users: { read: false }
-                },
-                is_system: true
-            },
-            {
-                name: 'supply_sales_service_manager',
-                label: 'Supply Sales Service Manager',
-                description: 'Manages inventory and deliveries',
-                permissions: {
-                    dashboard: { read: true },
-                    leads: { read: true },
-                    inventory: { read: true, write: true, delete: true, allocate: true },
-                    orders: { read: true },
-                    finance: { read: false },
-                    delivery: { read: true, write: true, delete: true },
-                    stadiums: { read: true, write: true, delete: true },
-                    users: { read: false }
-                },
-                is_system: true
-            },
-            {
-                name: 'supply_service_manager',
-                label: 'Supply & Service Manager',
-                description: 'Manages supply chain and service operations',
-                permissions: {
-                    dashboard: { read: true, write: true, delete: true, manage_users: false },
-                    leads: { read: true, write: true, delete: true, assign: true, progress: true },
-                    inventory: { read: true, write: true, delete: true, allocate: true },
-                    orders: { read: true, write: true, delete: true, approve: true, assign: true },
-                    finance: { read: true, write: true, delete: true, approve: true },
-                    delivery: { read: true, write: true, delete: true },
-                    users: { read: true, write: true, delete: false, manage_roles: false }
-                },
-                is_system: true
-            },
-            {
-                name: 'finance_manager',
-                label: 'Finance Manager',
-                description: 'Manages financial operations',
-                permissions: {
-                    dashboard: { read: true },
-                    leads: { read: true },
-                    inventory: { read: true },
-                    orders: { read: true, approve: true },
-                    finance: { read: true, write: true, delete: true, approve: true },
-                    delivery: { read: true },
-                    users: { read: false }
-                },
-                is_system: true
-            },
-            {
-                name: 'viewer',
-                label: 'Viewer',
-                description: 'Read-only access',
-                permissions: {
-                    dashboard: { read: true },
-                    leads: { read: true },
-                    inventory: { read: true },
-                    orders: { read: true },
-                    finance: { read: true },
-                    delivery: { read: true },
-                    users: { read: false }
-                },
-                is_system: true
-            }
-        ];
-
         const batch = db.batch();
         
-        for (const role of defaultRoles) {
+        for (const role of DEFAULT_ROLES) {
             const docRef = db.collection('crm_roles').doc(role.name);
             batch.set(docRef, {
                 ...role,
@@ -405,7 +283,7 @@ router.post('/initialize', authenticateToken, checkPermission('users', 'manage_r
         res.json({ 
             success: true, 
             message: 'Default roles initialized successfully',
-            data: defaultRoles
+            data: DEFAULT_ROLES
         });
     } catch (error) {
         console.error('Error initializing roles:', error);
@@ -3,6 +3,8 @@ const router = express.Router();
 const { db, collections } = require('../config/db');
 const { authenticateToken } = require('../middleware/auth');
 const { convertToIST } = require('../utils/dateHelpers');
+const { SALES_PERIODS, getDateRange } = require('../utils/salesPeriods');
+const salesPerformanceCache = require('../services/salesPerformanceCache');
 
 // Define touch-based statuses - same as marketing performance
 const touchBasedStatuses = [
@@ -13,19 +15,9 @@ const touchBasedStatuses = [
   'pickup_later', 'quote_requested', 'quote_received'
 ];
 
-// Cache structure for sales performance data
-const performanceCache = {
-  salesData: null,
-  salesDataTimestamp: null,
-  retailData: new Map(), // Map to store different date ranges
-  CACHE_DURATION: 6 * 60 * 60 * 1000, // 6 hours in milliseconds for sales data
-  RETAIL_CACHE_DURATION: 1 * 60 * 60 * 1000 // 1 hour in milliseconds for retail data
-};
-
-// Helper function to check if cache is valid
-function isCacheValid(timestamp, duration = performanceCache.CACHE_DURATION) {
-  if (!timestamp) return false;
-  return (Date.now() - timestamp) < duration;
+// Helper function to format a cache entry's age
+function formatCacheAge(ageMs) {
+  return Math.round(ageMs / 1000 / 60) + ' minutes';
 }
 
 // Helper function to generate cache key for retail data
@@ -33,69 +25,6 @@ function getRetailCacheKey(start_date, end_date) {
   return `${start_date || 'all'}_${end_date || 'all'}`;
 }
 
-// Helper function to get date range based on period
-function getDateRange(period) {
-  const now = new Date();
-  let startDate = null;
-  let endDate = null;
-  
-  switch(period) {
-    case 'current_fy':
-      // Indian FY: April 1 to March 31
-      const currentMonth = now.getMonth();
-      const currentYear = now.getFullYear();
-      const fyYear = currentMonth >= 3 ? currentYear : currentYear - 1;
-      startDate = new Date(fyYear, 3, 1); // April 1
-      break;
-      
-    case 'previous_fy':
-      const prevMonth = now.getMonth();
-      const prevYear = now.getFullYear();
-      const prevFyYear = prevMonth >= 3 ? prevYear - 1 : prevYear - 2;
-      startDate = new Date(prevFyYear, 3, 1);
-      endDate = new Date(prevFyYear + 1, 2, 31); // March 31
-      break;
-      
-    case 'current_quarter':
-      const quarter = Math.floor(now.getMonth() / 3);
-      startDate = new Date(now.getFullYear(), quarter * 3, 1);
-      break;
-      
-    case 'previous_quarter':
-      const prevQuarter = Math.floor(now.getMonth() / 3) - 1;
-      const year = prevQuarter < 0 ? now.getFullYear() - 1 : now.getFullYear();
-      const actualQuarter = prevQuarter < 0 ? 3 : prevQuarter;
-      startDate = new Date(year, actualQuarter * 3, 1);
-      endDate = new Date(year, (actualQuarter + 1) * 3, 0);
-      break;
-      
-    case 'last_3_months':
-      startDate = new Date();
-      startDate.setMonth(startDate.getMonth() - 3);
-      break;
-      
-    case 'last_6_months':
-      startDate = new Date();
-      startDate.setMonth(startDate.getMonth() - 6);
-      break;
-      
-    case 'current_month':
-      startDate = new Date(now.getFullYear(), now.getMonth(), 1);
-      break;
-      
-    case 'last_month':
-      startDate = new Date(now.getFullYear(), now.getMonth() - 1, 1);
-      endDate = new Date(now.getFullYear(), now.getMonth(), 0); // Last day of previous month
-      break;
-      
-    case 'lifetime':
-    default:
-      return { startDate: null, endDate: null };
-  }
-  
-  return { startDate, endDate: endDate || now };
-}
-
 // GET debug margin data for troubleshooting
 router.get('/debug-margin', authenticateToken, async (req, res) => {
   try {
@@ -165,17 +94,19 @@ router.get('/', authenticateToken, async (req, res) => {
   try {
     const period = req.query.period || 'lifetime'; // Default to lifetime
     const forceRefresh = req.query.force === 'true'; // Force refresh parameter
-    const cacheKey = `sales_${period}`;
+    // Unknown periods are computed as lifetime, so they share its entry
+    const cacheKey = SALES_PERIODS.includes(period) ? period : 'lifetime';
     
-    // Check if we have valid cached data for this period (and not currently clearing cache or forcing refresh)
-    if (!forceRefresh && !performanceCache.clearingInProgress && performanceCache[cacheKey] && isCacheValid(performanceCache[`${cacheKey}_timestamp`])) {
+    // Check if we have valid cached data for this period (unless forcing refresh)
+    const cached = await salesPerformanceCache.get('sales', cacheKey, { bypass: forceRefresh });
+    if (cached.hit) {
       // console.log(`📊 Returning cached sales performance data for period: ${period}`);
       return res.json({
         success: true,
-        salesTeam: performanceCache[cacheKey],
+        salesTeam: cached.value,
         period: period,
         cached: true,
-        cacheAge: Math.round((Date.now() - performanceCache[`${cacheKey}_timestamp`]) / 1000 / 60) + ' minutes'
+        cacheAge: formatCacheAge(cached.ageMs)
       });
     }
 
@@ -513,8 +444,7 @@ router.get('/', authenticateToken, async (req, res) => {
     console.log('This is why margin equals sales for many users!\n');
     
     // Update cache for this period
-    performanceCache[cacheKey] = salesTeam;
-    performanceCache[`${cacheKey}_timestamp`] = Date.now();
+    salesPerformanceCache.set('sales', cacheKey, salesTeam, cached.version);
     
     res.json({
       success: true,
@@ -542,23 +472,19 @@ router.get('/all-periods', authenticateToken, async (req, res) => {
     const results = {};
     
     // Check if all periods are cached
-    let allCached = true;
+    const cachedPeriods = {};
     for (const period of periods) {
-      const cacheKey = `sales_${period}`;
-      if (!performanceCache[cacheKey] || !isCacheValid(performanceCache[`${cacheKey}_timestamp`]) || forceRefresh) {
-        allCached = false;
-        break;
-      }
+      cachedPeriods[period] = await salesPerformanceCache.get('sales', period, { bypass: forceRefresh });
     }
+    const allCached = periods.every(period => cachedPeriods[period].hit);
     
     // If all cached, return immediately
-    if (allCached && !forceRefresh && !performanceCache.clearingInProgress) {
+    if (allCached) {
       for (const period of periods) {
-        const cacheKey = `sales_${period}`;
         results[period] = {
-          salesTeam: performanceCache[cacheKey],
+          salesTeam: cachedPeriods[period].value,
           cached: true,
-          cacheAge: Math.round((Date.now() - performanceCache[`${cacheKey}_timestamp`]) / 1000 / 60) + ' minutes'
+          cacheAge: formatCacheAge(cachedPeriods[period].ageMs)
         };
       }
       
@@ -603,14 +529,13 @@ router.get('/all-periods', authenticateToken, async (req, res) => {
     
     // Process each period
     for (const period of periods) {
-      const cacheKey = `sales_${period}`;
-      
       // Check cache for this specific period
-      if (!forceRefresh && performanceCache[cacheKey] && isCacheValid(performanceCache[`${cacheKey}_timestamp`])) {
+      const cached = cachedPeriods[period];
+      if (cached.hit) {
         results[period] = {
-          salesTeam: performanceCache[cacheKey],
+          salesTeam: cached.value,
           cached: true,
-          cacheAge: Math.round((Date.now() - performanceCache[`${cacheKey}_timestamp`]) / 1000 / 60) + ' minutes'
+          cacheAge: formatCacheAge(cached.ageMs)
         };
         continue;
       }
@@ -790,8 +715,7 @@ router.get('/all-periods', authenticateToken, async (req, res) => {
       salesTeam.sort((a, b) => b.totalSales - a.totalSales);
       
       // Cache the result
-      performanceCache[cacheKey] = salesTeam;
-      performanceCache[`${cacheKey}_timestamp`] = Date.now();
+      salesPerformanceCache.set('sales', period, salesTeam, cached.version);
       
       results[period] = {
         salesTeam: salesTeam,
@@ -824,9 +748,10 @@ router.get('/retail-tracker', authenticateToken, async (req, res) => {
     
     // Check cache for this specific date range
     const cacheKey = getRetailCacheKey(start_date, end_date);
-    const cachedEntry = performanceCache.retailData.get(cacheKey);
+    const cached = await salesPerformanceCache.get('retail', cacheKey);
     
-    if (cachedEntry && isCacheValid(cachedEntry.timestamp, performanceCache.RETAIL_CACHE_DURATION)) {
+    if (cached.hit) {
+      const cachedEntry = cached.value;
       // console.log('📊 Returning cached retail tracker data for range:', cacheKey);
       return res.json({
         success: true,
@@ -834,7 +759,7 @@ router.get('/retail-tracker', authenticateToken, async (req, res) => {
         totalSystemLeads: cachedEntry.totalSystemLeads || 0,
         totalSystemLeadsInDateRange: cachedEntry.totalSystemLeadsInDateRange || 0,
         cached: true,
-        cacheAge: Math.round((Date.now() - cachedEntry.timestamp) / 1000 / 60) + ' minutes'
+        cacheAge: formatCacheAge(cached.ageMs)
       });
     }
     
@@ -975,19 +900,12 @@ router.get('/retail-tracker', authenticateToken, async (req, res) => {
     const endTime = Date.now();
     console.log(`Retail tracker API took ${endTime - startTime}ms`);
     
-    // Update cache for this date range
-    performanceCache.retailData.set(cacheKey, {
+    // Update cache for this date range (the cache keeps the 10 most recently used ranges)
+    salesPerformanceCache.set('retail', cacheKey, {
       data: retailData,
       totalSystemLeads: totalSystemLeads,
-      totalSystemLeadsInDateRange: start_date && end_date ? totalSystemLeadsInDateRange : totalSystemLeads,
-      timestamp: Date.now()
-    });
-    
-    // Clean up old cache entries (keep max 10 different date ranges)
-    if (performanceCache.retailData.size > 10) {
-      const oldestKey = performanceCache.retailData.keys().next().value;
-      performanceCache.retailData.delete(oldestKey);
-    }
+      totalSystemLeadsInDateRange: start_date && end_date ? totalSystemLeadsInDateRange : totalSystemLeads
+    }, cached.version);
     
     res.json({
       success: true,
@@ -1098,9 +1016,8 @@ router.put('/target/:userId', authenticateToken, async (req, res) => {
       // Ignore error if user doesn't have this field
     });
     
-    // Invalidate cache when targets are updated
-    performanceCache.salesData = null;
-    performanceCache.salesDataTimestamp = null;
+    // Invalidate cache when targets are updated (targets apply to every period)
+    await salesPerformanceCache.bump(['sales'], `target update for ${userId}`);
     
     res.json({ success: true });
     
@@ -1128,8 +1045,7 @@ router.post('/add-member', authenticateToken, async (req, res) => {
       });
       
       // Invalidate sales cache
-      performanceCache.salesData = null;
-      performanceCache.salesDataTimestamp = null;
+      await salesPerformanceCache.bump(['sales'], `sales member ${userId} added`);
     } else if (type === 'retail') {
       // Add to retail_tracker_members collection
       await db.collection('retail_tracker_members').doc(userId).set({
@@ -1140,7 +1056,7 @@ router.post('/add-member', authenticateToken, async (req, res) => {
       });
       
       // Invalidate retail cache
-      performanceCache.retailData.clear();
+      await salesPerformanceCache.bump(['retail'], `retail member ${userId} added`);
     }
     
     res.json({ success: true });
@@ -1163,13 +1079,12 @@ router.delete('/remove-member/:userId/:type', authenticateToken, async (req, res
       await db.collection('sales_performance_members').doc(userId).delete();
       
       // Invalidate sales cache
-      performanceCache.salesData = null;
-      performanceCache.salesDataTimestamp = null;
+      await salesPerformanceCache.bump(['sales'], `sales member ${userId} removed`);
     } else if (type === 'retail') {
       await db.collection('retail_tracker_members').doc(userId).delete();
       
       // Invalidate retail cache
-      performanceCache.retailData.clear();
+      await salesPerformanceCache.bump(['retail'], `retail member ${userId} removed`);
     }
     
     res.json({ success: true });
@@ -1190,9 +1105,9 @@ router.post('/clear-cache', authenticateToken, async (req, res) => {
       return res.status(403).json({ error: 'Only super admins can clear cache' });
     }
     
-    performanceCache.salesData = null;
-    performanceCache.salesDataTimestamp = null;
-    performanceCache.retailData.clear();
+    // Clears the cache on every instance, not just this one
+    await salesPerformanceCache.bump(['sales', 'retail'], `cleared by ${req.user.email}`);
+    salesPerformanceCache.clear();
     
     console.log('🧹 Sales performance cache cleared');
     
@@ -1208,21 +1123,7 @@ router.post('/clear-cache', authenticateToken, async (req, res) => {
 // Get cache status endpoint
 router.get('/cache-status', authenticateToken, async (req, res) => {
   try {
-    const salesCacheAge = performanceCache.salesDataTimestamp 
-      ? Math.round((Date.now() - performanceCache.salesDataTimestamp) / 1000 / 60)
-      : null;
-    
-    res.json({
-      salesData: {
-        cached: isCacheValid(performanceCache.salesDataTimestamp),
-        age: salesCacheAge ? `${salesCacheAge} minutes` : 'Not cached',
-        expiresIn: salesCacheAge ? `${360 - salesCacheAge} minutes` : 'N/A'
-      },
-      retailData: {
-        entries: performanceCache.retailData.size,
-        ranges: Array.from(performanceCache.retailData.keys())
-      }
-    });
+    res.json(salesPerformanceCache.status());
   } catch (error) {
     res.status(500).json({ error: error.message });
   }
@@ -1269,6 +1170,10 @@ router.post('/update-sales-person-field', authenticateToken, async (req, res) =>
       }
     }
     
+    if (updated > 0) {
+      await salesPerformanceCache.bump(['sales'], 'sales_person backfill');
+    }
+    
     res.json({
       success: true,
       message: `Updated ${updated} orders, skipped ${skipped}`,
@@ -1311,85 +1216,4 @@ router.get('/periods', authenticateToken, async (req, res) => {
   }
 });
 
-// Clear cache endpoint - for super admin only
-router.post('/clear-cache', authenticateToken, async (req, res) => {
-  try {
-    // Check if user is super admin
-    const token = req.headers.authorization?.replace('Bearer ', '');
-    if (!token) {
-      return res.status(401).json({ success: false, error: 'No token provided' });
-    }
-
-    // Decode token to get user info
-    const jwt = require('jsonwebtoken');
-    const decoded = jwt.decode(token);
-    const userEmail = decoded?.email;
-
-    if (!userEmail) {
-      return res.status(401).json({ success: false, error: 'Invalid token' });
-    }
-
-    // Check if user is super admin
-    const userDoc = await db.collection('crm_users').where('email', '==', userEmail).get();
-    if (userDoc.empty) {
-      return res.status(403).json({ success: false, error: 'User not found' });
-    }
-
-    const userData = userDoc.docs[0].data();
-    if (userData.role !== 'super_admin') {
-      return res.status(403).json({ success: false, error: 'Access denied. Super admin role required.' });
-    }
-
-    // Clear all cache data
-    const clearedCaches = [];
-    
-    // Get all current cache keys before clearing
-    const cacheKeysBefore = Object.keys(performanceCache);
-    console.log('📊 Cache keys before clearing:', cacheKeysBefore);
-    
-    // Clear ALL sales performance caches (more aggressive)
-    Object.keys(performanceCache).forEach(key => {
-      if (key.startsWith('sales_') || key === 'salesData' || key === 'salesDataTimestamp') {
-        const oldValue = performanceCache[key];
-        delete performanceCache[key];
-        if (oldValue) {
-          clearedCaches.push(key);
-        }
-      }
-    });
-    
-    // Force clear legacy cache
-    performanceCache.salesData = null;
-    performanceCache.salesDataTimestamp = null;
-    
-    // Clear retail data cache
-    const retailSize = performanceCache.retailData.size;
-    performanceCache.retailData.clear();
-    if (retailSize > 0) {
-      clearedCaches.push(`retailData(${retailSize} entries)`);
-    }
-    
-    // Add a cache invalidation flag to prevent immediate repopulation
-    performanceCache.clearingInProgress = true;
-    setTimeout(() => {
-      delete performanceCache.clearingInProgress;
-    }, 2000); // 2 second delay to prevent immediate cache repopulation
-    
-    console.log(`🧹 Cache cleared by super admin: ${userEmail}`);
-    console.log(`🧹 Cleared cache keys: ${clearedCaches.join(', ')}`);
-
-    res.json({
-      success: true,
-      message: 'All sales performance caches cleared successfully',
-      clearedCaches: clearedCaches,
-      clearedBy: userEmail,
-      timestamp: new Date().toISOString()
-    });
-    
-  } catch (error) {
-    console.error('Error clearing cache:', error);
-    res.status(500).json({ success: false, error: error.message });
-  }
-});
-
 module.exports = router;
@@ -1,14 +1,18 @@
 const express = require('express');
+const fs = require('fs');
+const os = require('os');
 const router = express.Router();
 const multer = require('multer');
 const { Storage } = require('@google-cloud/storage');
 const { db, collections } = require('../config/db');
 const { authenticateToken } = require('../middleware/auth');
-const { convertToIST } = require('../utils/dateHelpers');
+const { convertToIST, parseImportDate } = require('../utils/dateHelpers');
 const csv = require('csv-parser');
 const { Readable } = require('stream');
 const Lead = require('../models/Lead');
 const Inventory = require('../models/Inventory');
+const dashboardCounters = require('../services/dashboardCounters');
+const leadImportService = require('../services/leadImportService');
 const User = require('../models/User');
 const XLSX = require('xlsx'); // EXCEL SUPPORT
 
@@ -32,124 +36,39 @@ fileFilter: (req, file, cb) => {
 }
 });
 
+// Accept CSV and Excel files only
+const spreadsheetFileFilter = (req, file, cb) => {
+  const allowedTypes = [
+    'text/csv',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+  ];
+  const isCSV = file.mimetype === 'text/csv' || file.originalname.endsWith('.csv');
+  const isExcel = allowedTypes.includes(file.mimetype) || 
+                 file.originalname.endsWith('.xlsx') || 
+                 file.originalname.endsWith('.xls');
+  
+  if (isCSV || isExcel) {
+    cb(null, true);
+  } else {
+    cb(new Error('Only CSV and Excel files are allowed'));
+  }
+};
+
 // Enhanced multer configuration for CSV and Excel files
 const csvUpload = multer({
   limits: { fileSize: 5 * 1024 * 1024 }, // 5MB limit
-  fileFilter: (req, file, cb) => {
-    const allowedTypes = [
-      'text/csv',
-      'application/vnd.ms-excel',
-      'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    ];
-    const isCSV = file.mimetype === 'text/csv' || file.originalname.endsWith('.csv');
-    const isExcel = allowedTypes.includes(file.mimetype) || 
-                   file.originalname.endsWith('.xlsx') || 
-                   file.originalname.endsWith('.xls');
-    
-    if (isCSV || isExcel) {
-      cb(null, true);
-    } else {
-      cb(new Error('Only CSV and Excel files are allowed'));
-    }
-  }
+  fileFilter: spreadsheetFileFilter
 });
 
-// ENHANCED: Helper function to properly parse dates from Excel/CSV
-const parseDate = (dateValue) => {
-  console.log('🗓️ Parsing date value:', dateValue, 'Type:', typeof dateValue);
-  
-  if (!dateValue || dateValue === '' || dateValue === null || dateValue === undefined) {
-    console.log('⚠️ No date value provided, using current IST date');
-    return convertToIST(new Date());
-  }
-
-    // Add handling for DD/MM/YY format
-  if (typeof dateValue === 'string' && dateValue.match(/^\d{1,2}\/\d{1,2}\/\d{2}$/)) {
-    const [day, month, year] = dateValue.split('/');
-    const fullYear = year.length === 2 ? '20' + year : year;
-    const isoDate = `${fullYear}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`;
-    return convertToIST(isoDate);
-  }
-  
-  // If it's already a Date object, convert to IST
-  if (dateValue instanceof Date) {
-    console.log('✅ Date object found, converting to IST');
-    return convertToIST(dateValue);
-  }
-  
-  // If it's a string, try to parse it
-  if (typeof dateValue === 'string') {
-    const trimmedValue = dateValue.trim();
-    
-    if (trimmedValue === '') {
-      console.log('⚠️ Empty string date, using current IST date');
-      return convertToIST(new Date());
-    }
-    
-    // Handle YYYY-MM-DD format (most common CSV format)
-    if (trimmedValue.match(/^\d{4}-\d{2}-\d{2}$/)) {
-      console.log('✅ YYYY-MM-DD format detected');
-      return convertToIST(trimmedValue);
-    }
-    
-    // Handle DD/MM/YYYY format
-    if (trimmedValue.match(/^\d{1,2}\/\d{1,2}\/\d{4}$/)) {
-      console.log('✅ DD/MM/YYYY format detected');
-      const [day, month, year] = trimmedValue.split('/');
-      const formattedDate = `${year}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`;
-      console.log('✅ Converted to:', formattedDate);
-      return convertToIST(formattedDate);
-    }
-    
-    // Handle MM/DD/YYYY format (American style)
-    if (trimmedValue.match(/^\d{1,2}\/\d{1,2}\/\d{4}$/) && trimmedValue.indexOf('/') !== -1) {
-      console.log('✅ Attempting MM/DD/YYYY format');
-      const [month, day, year] = trimmedValue.split('/');
-      const formattedDate = `${year}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`;
-      console.log('✅ Converted to:', formattedDate);
-      return convertToIST(formattedDate);
-    }
-    
-    // Handle DD-MM-YYYY format
-    if (trimmedValue.match(/^\d{1,2}-\d{1,2}-\d{4}$/)) {
-      console.log('✅ DD-MM-YYYY format detected');
-      const [day, month, year] = trimmedValue.split('-');
-      const formattedDate = `${year}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`;
-      console.log('✅ Converted to:', formattedDate);
-      return convertToIST(formattedDate);
-    }
-    
-    // Handle ISO format with time
-    if (trimmedValue.includes('T') || trimmedValue.includes('Z')) {
-      console.log('✅ ISO format detected');
-      return convertToIST(trimmedValue);
-    }
-    
-    // Try general Date parsing as fallback
-    const parsed = new Date(trimmedValue);
-    if (!isNaN(parsed.getTime())) {
-      console.log('✅ Successfully parsed with Date constructor');
-      return convertToIST(parsed);
-    }
-    
-    console.log('⚠️ String date parsing failed for:', trimmedValue, 'using current IST date');
-  }
-  
-  // If it's a number (Excel serial date), convert it
-  if (typeof dateValue === 'number' && dateValue > 0) {
-    console.log('✅ Excel serial number detected:', dateValue);
-    // Excel date serial number (days since 1900-01-01)
-    const excelEpoch = new Date(1900, 0, 1);
-    const msPerDay = 24 * 60 * 60 * 1000;
-    const date = new Date(excelEpoch.getTime() + (dateValue - 2) * msPerDay);
-    console.log('✅ Excel date converted to IST:', convertToIST(date));
-    return convertToIST(date);
-  }
-  
-  // Default to current IST date if parsing fails
-  console.log('⚠️ All parsing methods failed, using current IST date');
-  return convertToIST(new Date());
-};
+// Lead imports are read from disk by a background job instead of held in memory
+const LEAD_IMPORT_MAX_MB = parseInt(process.env.LEAD_IMPORT_MAX_MB || '50');
+const LEAD_IMPORT_WAIT_MS = parseInt(process.env.LEAD_IMPORT_WAIT_MS || '20000');
+const leadImportUpload = multer({
+  storage: multer.diskStorage({ destination: os.tmpdir() }),
+  limits: { fileSize: LEAD_IMPORT_MAX_MB * 1024 * 1024 },
+  fileFilter: spreadsheetFileFilter
+});
 
 // Helper function to parse both CSV and Excel files
 const parseUploadedFile = (fileBuffer, filename) => {
@@ -352,311 +271,63 @@ router.post('/leads/csv/preview', authenticateToken, csvUpload.single('file'), a
 });
 
 // 🚀 **ENHANCED: POST bulk upload leads with SMART CLIENT DETECTION**
-router.post('/leads/csv', authenticateToken, csvUpload.single('file'), async (req, res) => {
+router.post('/leads/csv', authenticateToken, leadImportUpload.single('file'), async (req, res) => {
+  let job = null;
   try {
     if (!req.file) {
       return res.status(400).json({ error: 'No file uploaded' });
     }
 
-    console.log('📁 File received:', req.file.originalname, 'Type:', req.file.mimetype);
-
-    // Parse the file (CSV or Excel)
-    const results = await parseUploadedFile(req.file.buffer, req.file.originalname);
-    console.log('📊 Parsed rows:', results.length);
-
-    const errors = [];
-    let successCount = 0;
-    let errorCount = 0;
-    let clientDetectionCount = 0;
-    let autoAssignmentCount = 0;
-    let clientAssignmentCount = 0;
-    const uploadedLeads = [];
-    const clientDetectionResults = [];
-
-    for (const [index, row] of results.entries()) {
-      try {
-        // Get the assigned_to value and handle empty/invalid assignments
-        const assignedToValue = row.assigned_to || row['Assigned To'] || '';
-        
-        // Enhanced date parsing (existing logic)
-        const rawDateValue = row.date_of_enquiry || 
-                            row['Date of Enquiry'] || 
-                            row['date_of_enquiry'] || 
-                            row['Date of enquiry'] ||
-                            row['DATE OF ENQUIRY'] ||
-                            row['enquiry_date'] ||
-                            row['Enquiry Date'];
-
-        console.log(`🔍 Processing lead ${index + 1}: ${row.name || row.Name}`);
-        
-        const parsedDate = parseDate(rawDateValue);
-        
-        // Map columns to lead fields (existing logic enhanced)
-        let leadData = {
-          name: row.name || row.Name || row.NAME || '',
-          email: row.email || row.Email || row.EMAIL || '',
-          phone: String(row.phone || row.Phone || row.PHONE || ''),
-          company: row.company || row.Company || row.COMPANY || '',
-          business_type: row.business_type || row['Business Type'] || 'B2C',
-          source: row.source || row.Source || 'Bulk Upload',
-          date_of_enquiry: parsedDate,
-          first_touch_base_done_by: row.first_touch_base_done_by || 
-                                   row['First Touch Base Done By'] || 'Bulk Import',
-          city_of_residence: row.city_of_residence || 
-                            row['City of Residence'] || '',
-          country_of_residence: row.country_of_residence || 
-                               row['Country of Residence'] || 'India',
-          lead_for_event: row.lead_for_event || row['Lead for Event'] || '',
-          number_of_people: parseInt(row.number_of_people || 
-                                   row['Number of People'] || '1'),
-          has_valid_passport: row.has_valid_passport || 
-                             row['Has Valid Passport'] || 'Not Sure',
-          visa_available: row.visa_available || row['Visa Available'] || 'Not Sure',
-          attended_sporting_event_before: row.attended_sporting_event_before || 
-                                         row['Attended Sporting Event Before'] || 'Not Sure',
-          annual_income_bracket: row.annual_income_bracket || 
-                                row['Annual Income Bracket'] || '',
-          potential_value: parseFloat(row.potential_value || 
-                                     row['Potential Value'] || '0'),
-          status: assignedToValue.trim() === '' || assignedToValue === '0' ? 
-                 'unassigned' : 'assigned',
-          assigned_to: assignedToValue.trim() === '' || assignedToValue === '0' ? '' : assignedToValue,
-          last_quoted_price: parseFloat(row.last_quoted_price || 
-                                       row['Last Quoted Price'] || '0'),
-          notes: row.notes || row.Notes || row.NOTES || '',
-          
-          // Bulk upload metadata
-          bulk_upload: true,
-          bulk_upload_date: convertToIST(new Date()),
-          bulk_upload_user: req.user.email,
-          created_date: convertToIST(new Date()),
-          updated_date: convertToIST(new Date())
-        };
-
-        // Validate required fields
-        if (!leadData.name || !leadData.email || !leadData.phone) {
-          errors.push({
-            row: index + 2,
-            error: 'Missing required fields (name, email, or phone)',
-            data: leadData
-          });
-          errorCount++;
-          continue;
-        }
-
-        // Validate email format for assigned_to
-        if (leadData.assigned_to && leadData.assigned_to !== '' && !leadData.assigned_to.includes('@')) {
-          errors.push({
-            row: index + 2,
-            error: 'Assigned To must be a valid email address',
-            data: leadData
-          });
-          errorCount++;
-          continue;
-        }
-
-        // 🎯 **ENHANCED: Auto-Assignment Logic (before client detection)**
-        if (!leadData.assigned_to || leadData.assigned_to === '') {
-          console.log(`🎯 Row ${index + 1}: No assignment provided - attempting auto-assignment...`);
-          
-          try {
-            const assignment = await AssignmentRule.testAssignment(leadData);
-            
-            if (assignment && assignment.assigned_to) {
-              leadData.assigned_to = assignment.assigned_to;
-              leadData.assignment_rule_used = assignment.rule_matched;
-              leadData.assignment_reason = assignment.assignment_reason;
-              leadData.auto_assigned = assignment.auto_assigned;
-              leadData.assignment_rule_id = assignment.rule_id;
-              leadData.status = 'assigned';
-              autoAssignmentCount++;
-              
-              console.log(`✅ Row ${index + 1}: Auto-assignment successful: ${assignment.assigned_to}`);
-            } else {
-              console.log(`⚠️ Row ${index + 1}: No assignment rules matched`);
-            }
-          } catch (assignmentError) {
-            console.error(`❌ Row ${index + 1}: Auto-assignment failed:`, assignmentError);
-            // Continue with lead creation even if auto-assignment fails
-          }
-        }
+    console.log('📁 File received:', req.file.originalname, 'Type:', req.file.mimetype, 'Size:', req.file.size);
 
-        // 🔍 **NEW: SMART CLIENT DETECTION LOGIC**
-        let clientDetectionResult = null;
-        if (leadData.phone) {
-          console.log(`🔍 Row ${index + 1}: Running smart client detection for phone: ${leadData.phone}`);
-          
-          try {
-            const clientInfo = await Lead.getClientByPhone(leadData.phone);
-            
-            if (clientInfo) {
-              console.log(`📞 Row ${index + 1}: Existing client found with ${clientInfo.total_leads} leads`);
-              clientDetectionCount++;
-              
-              // Store client detection result for reporting
-              clientDetectionResult = {
-                phone: leadData.phone,
-                client_id: clientInfo.client_id,
-                total_existing_leads: clientInfo.total_leads,
-                primary_assigned_to: clientInfo.primary_assigned_to,
-                existing_events: clientInfo.events || [],
-                first_contact: clientInfo.first_contact
-              };
-              
-              // Apply smart client detection logic
-              const originalAssignment = leadData.assigned_to;
-              
-              if (clientInfo.primary_assigned_to && (!originalAssignment || leadData.auto_assigned)) {
-                // Override auto-assignment with client's preferred assignee
-                leadData.assigned_to = clientInfo.primary_assigned_to;
-                leadData.status = 'assigned';
-                leadData.assignment_reason = `Smart client detection: Previous leads assigned to ${clientInfo.primary_assigned_to}`;
-                leadData.auto_assigned = false; // This is client-based, not rule-based
-                clientAssignmentCount++;
-                console.log(`📋 Row ${index + 1}: Smart client assignment: ${clientInfo.primary_assigned_to}`);
-              } else if (originalAssignment && originalAssignment !== clientInfo.primary_assigned_to) {
-                leadData.manual_assignment_override = true;
-                console.log(`🔄 Row ${index + 1}: Manual assignment differs from client history`);
-              }
-              
-              // Add client metadata
-              leadData.client_id = clientInfo.client_id;
-              leadData.is_primary_lead = false; // Bulk uploads are typically not primary
-              leadData.client_total_leads = clientInfo.total_leads + 1;
-              
-              // Merge events arrays safely
-              const existingEvents = clientInfo.events || [];
-              const newEvent = leadData.lead_for_event;
-              leadData.client_events = newEvent && !existingEvents.includes(newEvent) 
-                ? [...existingEvents, newEvent] 
-                : existingEvents;
-                
-              leadData.client_first_contact = clientInfo.first_contact;
-              leadData.client_last_activity = convertToIST(new Date());
-              
-              console.log(`✅ Row ${index + 1}: Smart client metadata applied`);
-              
-            } else {
-              console.log(`👤 Row ${index + 1}: New client - creating primary lead`);
-              
-              // New client - set as primary if it's the first lead for this phone in the batch
-              const isFirstInBatch = !uploadedLeads.some(uploaded => uploaded.phone === leadData.phone);
-              leadData.is_primary_lead = isFirstInBatch;
-              leadData.client_total_leads = 1;
-              if (leadData.lead_for_event) {
-                leadData.client_events = [leadData.lead_for_event];
-              }
-              leadData.client_first_contact = leadData.date_of_enquiry || convertToIST(new Date());
-            }
-            
-          } catch (clientError) {
-            console.log(`⚠️ Row ${index + 1}: Smart client detection failed (non-critical):`, clientError.message);
-            // Continue with regular lead creation if client detection fails
-          }
-        }
+    job = await leadImportService.start({
+      filePath: req.file.path,
+      fileName: req.file.originalname,
+      uploadedBy: req.user.email
+    });
 
-        // Create the lead
-        const lead = new Lead(leadData);
-        const savedLead = await lead.save();
-        
-        console.log(`✅ Row ${index + 1}: Successfully saved lead: ${leadData.name}`);
-        
-        // Update existing client metadata if this was an existing client
-        if (clientDetectionResult) {
-          try {
-            await Lead.updateClientMetadata(clientDetectionResult.client_id, {
-              client_total_leads: clientDetectionResult.total_existing_leads + 1,
-              client_events: leadData.client_events,
-              client_last_activity: convertToIST(new Date())
-            });
-            console.log(`✅ Row ${index + 1}: Updated existing client metadata`);
-          } catch (updateError) {
-            console.log(`⚠️ Row ${index + 1}: Failed to update client metadata:`, updateError.message);
-          }
-        }
-        
-        // Store for reporting
-        uploadedLeads.push({
-          id: savedLead.id,
-          name: leadData.name,
-          email: leadData.email,
-          phone: leadData.phone,
-          company: leadData.company,
-          source: leadData.source,
-          date_of_enquiry: leadData.date_of_enquiry,
-          status: leadData.status,
-          assigned_to: leadData.assigned_to,
-          business_type: leadData.business_type,
-          auto_assigned: leadData.auto_assigned || false,
-          assignment_reason: leadData.assignment_reason || '',
-          client_detected: !!clientDetectionResult,
-          client_id: leadData.client_id || null,
-          is_primary_lead: leadData.is_primary_lead || false
-        });
-        
-        // Store client detection results for reporting
-        if (clientDetectionResult) {
-          clientDetectionResults.push({
-            row: index + 2,
-            lead_name: leadData.name,
-            phone: leadData.phone,
-            ...clientDetectionResult,
-            assigned_to_from_detection: leadData.assigned_to
-          });
-        }
-        
-        successCount++;
-        
-      } catch (error) {
-        console.error(`❌ Error processing row ${index + 2}:`, error);
-        errors.push({
-          row: index + 2,
-          error: error.message,
-          data: row
-        });
-        errorCount++;
-      }
+    // Small files finish while we wait and get the full result as before;
+    // larger ones are polled through the job endpoint
+    const result = await leadImportService.waitFor(job, LEAD_IMPORT_WAIT_MS);
+    if (result) {
+      return res.json(result);
     }
 
-    // Enhanced response with smart client detection statistics
-    console.log(`📊 Bulk upload completed: ${successCount} successful, ${errorCount} failed`);
-    console.log(`🔍 Smart client detection: ${clientDetectionCount} existing clients found`);
-    console.log(`🎯 Auto-assignments: ${autoAssignmentCount} rules applied`);
-    console.log(`📞 Client-based assignments: ${clientAssignmentCount} applied`);
-
-    const summary = {
-      new_clients: successCount - clientDetectionCount,
-      existing_clients: clientDetectionCount,
-      auto_assigned: autoAssignmentCount,
-      client_assigned: clientAssignmentCount,
-      manually_assigned: uploadedLeads.filter(lead => 
-        lead.assigned_to && !lead.auto_assigned && !lead.client_detected).length,
-      unassigned: uploadedLeads.filter(lead => !lead.assigned_to).length
-    };
-
-    res.json({
+    res.status(202).json({
       success: true,
-      message: `Import completed. ${successCount} leads imported successfully, ${errorCount} failed.`,
-      totalProcessed: results.length,
-      successCount,
-      errorCount,
-      autoAssignmentCount,
-      clientDetectionCount,
-      clientAssignmentCount,
-      uploadedLeads: uploadedLeads,
-      clientDetectionResults: clientDetectionResults.slice(0, 10), // Limit for response size
-      errors: errors.slice(0, 10), // Limit error reporting
-      summary,
-      uploadSessionId: `upload_${Date.now()}_${req.user.email}`,
+      jobId: job.id,
+      status: 'running',
+      message: 'Import is running in the background',
+      progressUrl: `/api/upload/leads/csv/jobs/${job.id}`,
       fileName: req.file.originalname
     });
     
   } catch (error) {
+    if (req.file && !job) {
+      fs.unlink(req.file.path, () => {});
+    }
     console.error('❌ Bulk upload error:', error);
     res.status(500).json({ error: error.message });
   }
 });
 
+// GET lead import job progress (and its result once completed)
+router.get('/leads/csv/jobs/:jobId', authenticateToken, async (req, res) => {
+  try {
+    const job = await leadImportService.getJob(req.params.jobId);
+    if (!job) {
+      return res.status(404).json({ error: 'Import job not found' });
+    }
+    if (job.uploadedBy !== req.user.email && !['super_admin', 'admin'].includes(req.user.role)) {
+      return res.status(403).json({ error: 'Access denied' });
+    }
+    res.json(job);
+  } catch (error) {
+    console.error('❌ Import job status error:', error);
+    res.status(500).json({ error: error.message });
+  }
+});
+
 // POST bulk upload inventory from CSV/Excel - ENHANCED VERSION (unchanged from your original)
 // In backend/src/routes/upload.js
 // Replace the inventory CSV upload endpoint with this updated version:
@@ -695,7 +366,7 @@ router.post('/inventory/csv', authenticateToken, csvUpload.single('file'), async
         groupedEvents[eventKey] = {
           eventInfo: {
             event_name: row.event_name || '',
-            event_date: parseDate(row.event_date || ''),
+            event_date: parseImportDate(row.event_date || ''),
             event_type: row.event_type || '',
             sports: row.sports || '',
             venue: row.venue || '',
@@ -785,6 +456,7 @@ router.post('/inventory/csv', authenticateToken, csvUpload.single('file'), async
         // Save to database
         const docRef = await db.collection('crm_inventory').add(inventoryData);
         createdInventoryIds.push(docRef.id);
+        await dashboardCounters.recordChange('inventory', null, inventoryData);
         
         // Create payable if needed
         if ((inventoryData.paymentStatus === 'pending' || inventoryData.paymentStatus === 'partial') && 
@@ -3,6 +3,7 @@ const router = express.Router();
 const bcrypt = require('bcryptjs');
 const { db, collections } = require('../config/db');
 const { authenticateToken } = require('../middleware/auth');
+const salesMarginService = require('../services/salesMarginService');
 
 // GET all users
 router.get('/', authenticateToken, async (req, res) => {
@@ -49,6 +50,7 @@ router.post('/', authenticateToken, async (req, res) => {
     };
     
     const docRef = await db.collection(collections.users).add(userData);
+    await salesMarginService.invalidate(`user ${docRef.id} created`);
     
     // Return user without password
     delete userData.password;
@@ -71,6 +73,9 @@ router.put('/:id', authenticateToken, async (req, res) => {
     updates.updated_date = new Date().toISOString();
     
     await db.collection(collections.users).doc(req.params.id).update(updates);
+    if (salesMarginService.touchesUser(updates)) {
+      await salesMarginService.invalidate(`user ${req.params.id} updated`);
+    }
     
     // Return updated user without password
     delete updates.password;
@@ -84,6 +89,7 @@ router.put('/:id', authenticateToken, async (req, res) => {
 router.delete('/:id', authenticateToken, async (req, res) => {
   try {
     await db.collection(collections.users).doc(req.params.id).delete();
+    await salesMarginService.invalidate(`user ${req.params.id} deleted`);
     res.json({ data: { message: 'User deleted successfully' } });
   } catch (error) {
     res.status(500).json({ error: error.message });
@@ -3,14 +3,23 @@ const express = require('express');
 const router = express.Router();
 const crypto = require('crypto');
 const { db } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
+const metaWebhookQueue = require('../services/metaWebhookQueue');
+const { authenticateToken } = require('../middleware/auth');
 const fetch = require('node-fetch');
 const { getInventoryByFormId } = require('../utils/inventoryLookup');
-const { convertToIST, getISTDateString } = require('../utils/dateHelpers');
+const { convertToIST, getISTDateString, leadTimestamps } = require('../utils/dateHelpers');
 
 // Meta webhook verification token and app secret - store these securely
 const VERIFY_TOKEN = process.env.META_VERIFY_TOKEN || 'your-unique-verify-token-here';
 const APP_SECRET = process.env.META_APP_SECRET || 'your-app-secret-here';
 const PAGE_ACCESS_TOKEN = process.env.META_PAGE_ACCESS_TOKEN || 'your-page-access-token';
+// Point at a stub Graph server for local runs (with FIRESTORE_EMULATOR_HOST)
+const GRAPH_API_URL = process.env.META_GRAPH_API_URL || 'https://graph.facebook.com/v18.0';
+
+// 'inline' processes leads before answering Meta; 'queue' stores the events
+// and acknowledges at once, see services/metaWebhookQueue.js
+const WEBHOOK_MODE = process.env.META_WEBHOOK_MODE || 'inline';
 
 // Helper function to detect platform source (Facebook vs Instagram)
 async function detectPlatformSource(leadDetails, inventory) {
@@ -347,7 +356,8 @@ router.post('/meta-leads', async (req, res) => {
       return res.sendStatus(400);
     }
 
-    // Process each entry
+    // Collect the leadgen events from every entry
+    const leadgenEvents = [];
     for (const pageEntry of entry) {
       const { changes } = pageEntry;
       
@@ -358,28 +368,48 @@ router.post('/meta-leads', async (req, res) => {
       
       for (const change of changes) {
         if (change.field === 'leadgen') {
-          console.log('🎯 Processing leadgen event');
-          const leadData = change.value;
-          
-          try {
-            // Get lead details from Meta API
-            const leadDetails = await getLeadDetails(
-              leadData.leadgen_id,
-              leadData.page_id
-            );
-            
-            // Transform and save lead
-            const savedLeadId = await saveLeadToDatabase(leadDetails, leadData);
-            console.log('✅ Lead processed successfully:', savedLeadId);
-            
-          } catch (leadError) {
-            console.error('❌ Error processing individual lead:', leadError);
-            // Continue processing other leads even if one fails
-          }
+          leadgenEvents.push(change.value);
         }
       }
     }
 
+    if (WEBHOOK_MODE === 'queue') {
+      // Persist and acknowledge; the queue workers do the rest
+      const queueable = leadgenEvents.filter(event => event && event.leadgen_id);
+      try {
+        const { enqueued, duplicates } = await metaWebhookQueue.enqueue(queueable);
+        console.log(`📥 Queued ${enqueued} leadgen event(s)${duplicates ? `, ${duplicates} already queued` : ''}`);
+      } catch (queueError) {
+        // Not stored - let Meta deliver it again
+        console.error('❌ Failed to queue leadgen events:', queueError);
+        return res.sendStatus(503);
+      }
+      res.sendStatus(200);
+      setImmediate(() => metaWebhookQueue.drain());
+      return;
+    }
+
+    // Process each lead inline
+    for (const leadData of leadgenEvents) {
+      console.log('🎯 Processing leadgen event');
+      
+      try {
+        // Get lead details from Meta API
+        const leadDetails = await getLeadDetails(
+          leadData.leadgen_id,
+          leadData.page_id
+        );
+        
+        // Transform and save lead
+        const savedLeadId = await saveLeadToDatabase(leadDetails, leadData);
+        console.log('✅ Lead processed successfully:', savedLeadId);
+        
+      } catch (leadError) {
+        console.error('❌ Error processing individual lead:', leadError);
+        // Continue processing other leads even if one fails
+      }
+    }
+
     // Always send 200 OK to acknowledge receipt
     res.sendStatus(200);
     
@@ -405,7 +435,7 @@ async function getLeadDetails(leadgenId, pageId) {
     const fields = 'id,created_time,field_data,form_id,is_organic,campaign_id,campaign_name,adset_id,adset_name,ad_id,ad_name';
     
     const response = await fetch(
-      `https://graph.facebook.com/v18.0/${leadgenId}?fields=${fields}&access_token=${PAGE_ACCESS_TOKEN}`,
+      `${GRAPH_API_URL}/${leadgenId}?fields=${fields}&access_token=${PAGE_ACCESS_TOKEN}`,
       { method: 'GET' }
     );
     
@@ -427,7 +457,7 @@ async function getLeadDetails(leadgenId, pageId) {
       
       try {
         const formResponse = await fetch(
-          `https://graph.facebook.com/v18.0/${data.form_id}?fields=name,leads_retrieval_method,questions,page&access_token=${PAGE_ACCESS_TOKEN}`,
+          `${GRAPH_API_URL}/${data.form_id}?fields=name,leads_retrieval_method,questions,page&access_token=${PAGE_ACCESS_TOKEN}`,
           { method: 'GET' }
         );
         
@@ -450,7 +480,7 @@ async function getLeadDetails(leadgenId, pageId) {
       try {
         // Try to get more details about the lead including ad context
         const contextResponse = await fetch(
-          `https://graph.facebook.com/v18.0/${leadgenId}?fields=id,created_time,field_data,form{id,name},campaign_id,campaign_name,adset_id,adset_name,ad_id,ad_name,retailer_item_id&access_token=${PAGE_ACCESS_TOKEN}`,
+          `${GRAPH_API_URL}/${leadgenId}?fields=id,created_time,field_data,form{id,name},campaign_id,campaign_name,adset_id,adset_name,ad_id,ad_name,retailer_item_id&access_token=${PAGE_ACCESS_TOKEN}`,
           { method: 'GET' }
         );
         
@@ -591,6 +621,8 @@ async function saveLeadToDatabase(leadDetails, webhookData) {
       }
     };
 
+    Object.assign(leadRecord, leadTimestamps(leadRecord));
+
     // Check for duplicate leads by email
     if (leadRecord.email) {
       const existingLeads = await db.collection('crm_leads')
@@ -607,6 +639,7 @@ async function saveLeadToDatabase(leadDetails, webhookData) {
 
     // Save to Firestore
     const docRef = await db.collection('crm_leads').add(leadRecord);
+    await dashboardCounters.recordChange('leads', null, leadRecord);
     
     console.log('✅ Lead saved successfully:', {
       id: docRef.id,
@@ -764,6 +797,43 @@ async function triggerAutoAssignment(leadId, leadData) {
   }
 }
 
+// ===============================================
+// QUEUED LEADGEN PROCESSING
+// ===============================================
+// A queued event may already have produced a lead: Meta redelivered it
+// while inline mode was on, or a worker died after saving it
+async function processQueuedLeadgen(leadData) {
+  const existing = await db.collection('crm_leads')
+    .where('meta_lead_id', '==', String(leadData.leadgen_id))
+    .limit(1)
+    .get();
+  if (!existing.empty) {
+    console.log(`ℹ️ Lead for leadgen ${leadData.leadgen_id} already saved: ${existing.docs[0].id}`);
+    return existing.docs[0].id;
+  }
+
+  const leadDetails = await getLeadDetails(leadData.leadgen_id, leadData.page_id);
+  const savedLeadId = await saveLeadToDatabase(leadDetails, leadData);
+  console.log('✅ Queued lead processed successfully:', savedLeadId);
+  return savedLeadId;
+}
+
+metaWebhookQueue.setHandler(processQueuedLeadgen);
+
+// Queue depth, processing lag and worker counters
+router.get('/meta-leads/queue', authenticateToken, async (req, res) => {
+  try {
+    res.json({
+      success: true,
+      mode: WEBHOOK_MODE,
+      ...(await metaWebhookQueue.status())
+    });
+  } catch (error) {
+    console.error('❌ Meta webhook queue status error:', error);
+    res.status(500).json({ error: error.message });
+  }
+});
+
 // ===============================================
 // TEST ENDPOINT (for debugging)
 // ===============================================
@@ -774,6 +844,7 @@ router.get('/meta-leads/test', (req, res) => {
     verify_token_configured: !!VERIFY_TOKEN && VERIFY_TOKEN !== 'your-unique-verify-token-here',
     app_secret_configured: !!APP_SECRET && APP_SECRET !== 'your-app-secret-here',
     page_token_configured: !!PAGE_ACCESS_TOKEN && PAGE_ACCESS_TOKEN !== 'your-page-access-token',
+    mode: WEBHOOK_MODE,
     timestamp: new Date().toISOString()
   });
 });
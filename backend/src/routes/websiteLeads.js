@@ -6,6 +6,7 @@ const { authenticateToken, checkPermission } = require('../middleware/auth');  /
 const websiteApiService = require('../services/websiteApiService');
 const leadMappingService = require('../services/leadMappingService');
 const { db, collections } = require('../config/db');
+const dashboardCounters = require('../services/dashboardCounters');
 
 // Update the preview endpoint to better handle saved mappings
 router.get('/preview', authenticateToken, checkPermission('leads', 'create'), async (req, res) => {
@@ -171,6 +172,7 @@ router.post('/import', authenticateToken, checkPermission('leads', 'create'), as
       }
     }
     
+    await dashboardCounters.recordChanges('leads', createdLeads.map(lead => [null, lead]));
     console.log(`✅ Import complete: ${imported.total} leads imported`);
     
     res.json({
@@ -485,6 +487,7 @@ router.post('/import', authenticateToken, checkPermission('leads', 'create'), as
       }
     }
     
+    await dashboardCounters.recordChanges('leads', createdLeads.map(lead => [null, lead]));
     console.log(`✅ Import complete: ${imported.total} leads imported`);
     
     res.json({
@@ -1,107 +1,42 @@
-// Script to fix missing created_date fields in leads
-const { db, collections } = require('../config/db');
+// Script to fix missing created_date fields in leads and backfill the
+// numeric created_ts / enquiry_ts / updated_ts fields.
+//
+// Usage: node src/scripts/fix-missing-created-dates.js [--restart] [--pages N]
+// Resumable: it carries on from where the last run stopped unless --restart
+// is given. --pages limits a run to N pages of 500 leads.
+require('dotenv').config();
+const leadTimestampMigration = require('../services/leadTimestampMigration');
+
+const args = process.argv.slice(2);
+const restart = args.includes('--restart');
+const pagesIndex = args.indexOf('--pages');
+const maxPages = pagesIndex >= 0 ? parseInt(args[pagesIndex + 1]) : Infinity;
 
 async function fixMissingCreatedDates() {
-  console.log('🔍 Starting to fix missing created_date fields...');
-  
+  console.log('🔍 Starting to fix missing created_date and numeric timestamp fields...');
+
   try {
-    // Get all leads
-    const leadsSnapshot = await db.collection(collections.leads).get();
-    console.log(`📊 Total leads in system: ${leadsSnapshot.size}`);
-    
-    let leadsWithoutDate = [];
-    let leadsWithDate = 0;
-    
-    // Check each lead
-    leadsSnapshot.forEach(doc => {
-      const lead = doc.data();
-      if (!lead.created_date) {
-        leadsWithoutDate.push({
-          id: doc.id,
-          name: lead.name || 'Unknown',
-          email: lead.email || 'No email',
-          date_of_enquiry: lead.date_of_enquiry
-        });
-      } else {
-        leadsWithDate++;
-      }
-    });
-    
-    console.log(`✅ Leads with created_date: ${leadsWithDate}`);
-    console.log(`❌ Leads without created_date: ${leadsWithoutDate.length}`);
-    
-    if (leadsWithoutDate.length === 0) {
-      console.log('🎉 All leads already have created_date!');
-      return;
-    }
-    
-    console.log('\n📋 Leads missing created_date:');
-    leadsWithoutDate.forEach((lead, index) => {
-      console.log(`${index + 1}. ${lead.name} (${lead.email}) - date_of_enquiry: ${lead.date_of_enquiry || 'None'}`);
-    });
-    
-    // Ask for confirmation
-    console.log('\n⚠️  WARNING: This will update all leads without created_date.');
-    console.log('The script will use date_of_enquiry if available, otherwise current date.');
+    console.log('\n⚠️  WARNING: This will update leads whose created_date or timestamps are missing or out of date.');
+    console.log('Leads without created_date get date_of_enquiry if available, otherwise the current date.');
     console.log('Press Ctrl+C to cancel, or wait 5 seconds to continue...\n');
-    
+
     await new Promise(resolve => setTimeout(resolve, 5000));
-    
-    // Update leads in batches
-    const batchSize = 500;
-    let updatedCount = 0;
-    
-    for (let i = 0; i < leadsWithoutDate.length; i += batchSize) {
-      const batch = db.batch();
-      const batchLeads = leadsWithoutDate.slice(i, i + batchSize);
-      
-      for (const lead of batchLeads) {
-        const docRef = db.collection(collections.leads).doc(lead.id);
-        
-        // Determine what date to use
-        let dateToUse;
-        if (lead.date_of_enquiry) {
-          // Use date_of_enquiry if available
-          dateToUse = lead.date_of_enquiry;
-        } else {
-          // Use current date as fallback
-          dateToUse = new Date().toISOString();
-        }
-        
-        batch.update(docRef, {
-          created_date: dateToUse,
-          updated_date: new Date().toISOString(),
-          updated_by: 'system_fix_script'
-        });
-        
-        updatedCount++;
-      }
-      
-      await batch.commit();
-      console.log(`✅ Updated ${updatedCount}/${leadsWithoutDate.length} leads...`);
-    }
-    
-    console.log('\n🎉 Successfully updated all leads with missing created_date!');
-    
-    // Verify the fix
-    console.log('\n🔍 Verifying the fix...');
-    const verifySnapshot = await db.collection(collections.leads).get();
-    let stillMissing = 0;
-    
-    verifySnapshot.forEach(doc => {
-      if (!doc.data().created_date) {
-        stillMissing++;
-      }
-    });
-    
-    if (stillMissing === 0) {
-      console.log('✅ Verification complete: All leads now have created_date!');
+
+    const result = await leadTimestampMigration.run({ restart, maxPages });
+
+    console.log('\n📊 Migration run:');
+    console.log(`- Leads scanned: ${result.scanned}`);
+    console.log(`- Leads updated: ${result.updated}`);
+    console.log(`- Processing time: ${result.processingTimeMs}ms`);
+
+    if (result.done) {
+      console.log('🎉 All leads now have created_date and numeric timestamps!');
     } else {
-      console.log(`⚠️  Warning: ${stillMissing} leads still missing created_date`);
+      console.log(`⏸️  Stopped after ${result.pages} pages; run again to continue from lead ${result.cursor}`);
     }
-    
+
     process.exit(0);
-    
+
   } catch (error) {
     console.error('❌ Error:', error);
     process.exit(1);
@@ -109,4 +44,4 @@ async function fixMissingCreatedDates() {
 }
 
 // Run the script
-fixMissingCreatedDates();
\ No newline at end of file
+fixMissingCreatedDates();
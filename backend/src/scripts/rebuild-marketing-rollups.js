@@ -0,0 +1,25 @@
+require('dotenv').config();
+const marketingRollups = require('../services/marketingRollups');
+
+// Usage: node src/scripts/rebuild-marketing-rollups.js [from YYYY-MM-DD] [to YYYY-MM-DD]
+// With no dates every lead is re-counted; this is the initial backfill.
+const [from = null, to = null] = process.argv.slice(2);
+
+async function rebuildRollups() {
+  console.log(`🚀 Rebuilding marketing rollups${from || to ? ` for ${from || '…'} to ${to || '…'}` : ' from all leads'}...`);
+  
+  try {
+    const result = await marketingRollups.rebuild({ from, to });
+    console.log('✅ Marketing rollups rebuilt:');
+    console.log(`- Leads counted: ${result.leads}`);
+    console.log(`- Rollups written: ${result.rollups}`);
+    console.log(`- Stale rollups removed: ${result.deleted}`);
+    console.log(`- Processing time: ${result.processingTimeMs}ms`);
+    process.exit(0);
+  } catch (error) {
+    console.error('❌ Rebuild failed:', error);
+    process.exit(1);
+  }
+}
+
+rebuildRollups();
@@ -1,11 +1,27 @@
 require('dotenv').config();
 const statsAggregationService = require('../services/statsAggregationService');
 
+// Usage: node src/scripts/run-stats-aggregation.js [full|incremental|rebuild|verify]
+const mode = process.argv[2] || 'full';
+
+async function verifyAggregation() {
+  console.log('🔍 Comparing incremental stats with a full rebuild...');
+  
+  try {
+    const result = await statsAggregationService.verifyIncrementalStats();
+    console.log(result.ok ? '✅ No differences' : `❌ ${result.differenceCount} differences`);
+    process.exit(result.ok ? 0 : 1);
+  } catch (error) {
+    console.error('❌ Verification failed:', error);
+    process.exit(1);
+  }
+}
+
 async function runAggregation() {
-  console.log('🚀 Running stats aggregation manually...');
+  console.log(`🚀 Running stats aggregation manually (${mode})...`);
   
   try {
-    const stats = await statsAggregationService.aggregateAllStats();
+    const stats = await statsAggregationService.aggregateAllStats({ mode });
     console.log('✅ Stats aggregation completed successfully!');
     console.log('📊 Summary:');
     console.log(`- Financials calculated for ${Object.keys(stats.financials).length} periods`);
@@ -20,4 +36,8 @@ async function runAggregation() {
   }
 }
 
-runAggregation();
\ No newline at end of file
+if (mode === 'verify') {
+  verifyAggregation();
+} else {
+  runAggregation();
+}
\ No newline at end of file
@@ -11,6 +11,16 @@ require('dotenv').config();
 const app = express();
 const PORT = process.env.PORT || 8080;
 const leadRoutes = require('./routes/leads');
+const { requestMetrics, metricsHandler } = require('./middleware/instrumentation');
+
+// Latency, response size and Firestore usage per route, served at /metrics
+// to callers with METRICS_TOKEN (REQUEST_METRICS=off to disable,
+// METRICS_AUTH=off to serve them without a token locally). First, so every
+// request is measured
+if (process.env.REQUEST_METRICS !== 'off') {
+  app.use(requestMetrics);
+  app.get('/metrics', metricsHandler);
+}
 
 // ✅ FIXED: Updated allowedOrigins to include Cloud Workstations
 const allowedOrigins = [
@@ -280,6 +290,35 @@ app.listen(PORT, '0.0.0.0', () => {
   console.log(`📁 Routes loaded successfully`);
   console.log(`📡 Webhook endpoint: https://fantopark-backend-150582227311.us-central1.run.app/webhooks/meta-leads`);
   console.log(`🔐 Webhook verify token: ${process.env.META_VERIFY_TOKEN ? 'Set ✓' : 'Not set ⚠️'}`);
+
+  // Warm the lead search index (LEAD_SEARCH_INDEX=off to disable)
+  if (process.env.LEAD_SEARCH_INDEX !== 'off') {
+    require('./services/leadSearchIndex').start();
+  }
+
+  // Warm the inventory index behind form ID and event name lookups
+  // (INVENTORY_INDEX=off to disable)
+  if (process.env.INVENTORY_INDEX !== 'off') {
+    require('./services/inventoryIndex').start();
+  }
+
+  // Correct drift in the dashboard counters (DASHBOARD_RECONCILE_MINUTES=0 to disable)
+  const reconcileMinutes = parseFloat(process.env.DASHBOARD_RECONCILE_MINUTES || '60');
+  if (reconcileMinutes > 0) {
+    require('./services/dashboardCounters').startReconciler(reconcileMinutes * 60 * 1000);
+  }
+
+  // Rebuild the marketing rollups from the leads (MARKETING_RECONCILE_MINUTES=0 to disable)
+  const rollupMinutes = parseFloat(process.env.MARKETING_RECONCILE_MINUTES || '360');
+  if (rollupMinutes > 0 && process.env.MARKETING_ROLLUPS !== 'off') {
+    require('./services/marketingRollups').startReconciler(rollupMinutes * 60 * 1000);
+  }
+
+  // Drain queued Meta leadgen events (META_WEBHOOK_MODE=queue)
+  if (process.env.META_WEBHOOK_MODE === 'queue') {
+    const drainSeconds = parseFloat(process.env.META_WEBHOOK_DRAIN_SECONDS || '30');
+    require('./services/metaWebhookQueue').startWorker(drainSeconds * 1000);
+  }
 });
 
 module.exports = app;
@@ -0,0 +1,404 @@
+const zlib = require('zlib');
+const { once } = require('events');
+const { pipeline } = require('stream');
+const { Parser } = require('json2csv');
+const { FieldPath } = require('@google-cloud/firestore');
+const { db, collections } = require('../config/db');
+const { createCsvTransform } = require('../utils/csvStream');
+
+/**
+ * Audit Export Service
+ * Rows for GET /api/audit-export: one per order allocation (or one per order
+ * without allocations) with selling price, buying price and margin.
+ *
+ * Orders are read a page at a time and each page's leads with one multi-get,
+ * so leads and orders are never held in memory as whole collections. Only
+ * the small collections (users, inventory, allocations) are kept, as
+ * ID-keyed maps of the fields the rows use.
+ *
+ * streamCsv() writes rows to the response as each page is processed (chunked,
+ * gzipped when the client accepts it), so memory stays flat as the data
+ * grows. collectRows() returns them all, sorted, for the JSON view and the
+ * legacy CSV download.
+ */
+
+const PAGE_SIZE = parseInt(process.env.AUDIT_EXPORT_PAGE_SIZE || '500');
+
+const USER_FIELDS = ['name', 'email'];
+const LEAD_FIELDS = ['name', 'company_name', 'lead_for_event'];
+const INVENTORY_FIELDS = ['categories', 'buying_price', 'category', 'stand'];
+const ALLOCATION_FIELDS = [
+  'order_id', 'order_number', 'order_ids', 'inventory_id',
+  'category_name', 'category', 'category_section', 'stand_section', 'stand',
+  'tickets_allocated', 'quantity', 'unit_price', 'price'
+];
+
+// CSV columns - using base_amount logic for selling_price, without the
+// inr_equivalent and total_amount columns
+const CSV_FIELDS = [
+  { label: 'lead_name', value: 'lead_name' },
+  { label: 'lead_for_event', value: 'lead_for_event' },
+  { label: 'allocation_category', value: 'allocation_category' },
+  { label: 'allocation_stand', value: 'allocation_stand' },
+  { label: 'allocation_qty', value: 'allocation_qty' },
+  { label: 'order_id', value: 'order_id' },
+  { label: 'sales_person', value: 'sales_person_name' },
+  { label: 'currency', value: 'payment_currency' },
+  { label: 'selling_price', value: 'selling_price_inr' },
+  { label: 'buying_price', value: 'total_buying_price' },
+  { label: 'margin', value: 'margin' }
+];
+
+function pick(data, fields) {
+  const picked = {};
+  fields.forEach(field => {
+    if (data[field] !== undefined) picked[field] = data[field];
+  });
+  return picked;
+}
+
+function addTo(map, key, value) {
+  if (key === undefined || key === null || key === '') return;
+  if (!map.has(key)) map.set(key, []);
+  map.get(key).push(value);
+}
+
+/**
+ * Documents of a collection in pages of PAGE_SIZE, ordered by document id
+ */
+async function* pagedDocs(collectionName, fields = null) {
+  let query = db.collection(collectionName).orderBy(FieldPath.documentId()).limit(PAGE_SIZE);
+  if (fields) query = query.select(...fields);
+
+  let lastDoc = null;
+  while (true) {
+    const snapshot = await (lastDoc ? query.startAfter(lastDoc) : query).get();
+    if (snapshot.empty) return;
+    yield snapshot.docs;
+    if (snapshot.size < PAGE_SIZE) return;
+    lastDoc = snapshot.docs[snapshot.docs.length - 1];
+  }
+}
+
+/**
+ * Compact lookups over the small collections
+ */
+async function loadLookups() {
+  const nameToEmail = new Map();
+  const emailToName = new Map();
+  for await (const docs of pagedDocs(collections.users, USER_FIELDS)) {
+    docs.forEach(doc => {
+      const user = doc.data();
+      nameToEmail.set(user.name, user.email);
+      emailToName.set(user.email, user.name);
+    });
+  }
+
+  const inventoryById = new Map();
+  for await (const docs of pagedDocs(collections.inventory, INVENTORY_FIELDS)) {
+    docs.forEach(doc => {
+      const inv = pick(doc.data(), INVENTORY_FIELDS);
+      if (Array.isArray(inv.categories)) {
+        inv.categories = inv.categories.map(cat => ({ name: cat.name, section: cat.section, buying_price: cat.buying_price }));
+      }
+      inventoryById.set(doc.id, inv);
+    });
+  }
+
+  // Allocations by id and by every order reference they carry, in
+  // collection order so an order's rows come out in the same order
+  const allocationsById = new Map();
+  const allocationsByOrderRef = new Map();
+  const allocationsByOrderIdsEntry = new Map();
+  let seq = 0;
+  for await (const docs of pagedDocs(collections.allocations, ALLOCATION_FIELDS)) {
+    docs.forEach(doc => {
+      const allocation = { id: doc.id, seq: seq++, ...pick(doc.data(), ALLOCATION_FIELDS) };
+      allocationsById.set(doc.id, allocation);
+      addTo(allocationsByOrderRef, allocation.order_id, allocation);
+      if (allocation.order_number !== allocation.order_id) {
+        addTo(allocationsByOrderRef, allocation.order_number, allocation);
+      }
+      if (Array.isArray(allocation.order_ids)) {
+        new Set(allocation.order_ids).forEach(orderId => addTo(allocationsByOrderIdsEntry, orderId, allocation));
+      }
+      delete allocation.order_ids;
+    });
+  }
+
+  return { nameToEmail, emailToName, inventoryById, allocationsById, allocationsByOrderRef, allocationsByOrderIdsEntry };
+}
+
+/**
+ * Allocations that belong to an order: matched on order_id/order_number
+ * either way round, the allocation's order_ids or the order's allocation_ids
+ */
+function allocationsForOrder(order, lookups) {
+  const matched = new Map();
+  const add = allocations => (allocations || []).forEach(allocation => matched.set(allocation.id, allocation));
+  add(lookups.allocationsByOrderRef.get(order.id));
+  if (order.order_number) add(lookups.allocationsByOrderRef.get(order.order_number));
+  add(lookups.allocationsByOrderIdsEntry.get(order.id));
+  if (Array.isArray(order.allocation_ids)) {
+    add(order.allocation_ids.map(id => lookups.allocationsById.get(id)).filter(Boolean));
+  }
+  return [...matched.values()].sort((a, b) => a.seq - b.seq);
+}
+
+/**
+ * { name, email } of the order's sales person, or null if the order has
+ * none or names someone who isn't a user
+ */
+function salesPersonOf(order, lookups) {
+  const salesPersonField = order.sales_person || order.sales_person_email;
+  if (!salesPersonField) return null;
+
+  if (!salesPersonField.includes('@')) {
+    // It's a name, convert to email
+    const email = lookups.nameToEmail.get(salesPersonField);
+    return email ? { name: salesPersonField, email } : null;
+  }
+  // It's an email, get the name
+  return { name: lookups.emailToName.get(salesPersonField) || salesPersonField, email: salesPersonField };
+}
+
+/**
+ * Buying price per ticket for an allocation, from the matching inventory
+ * category (name and section, then name only) or the legacy inventory field
+ */
+function buyingPricePerTicket(allocation, inv) {
+  if (inv.categories && Array.isArray(inv.categories)) {
+    const categoryName = allocation.category_name || allocation.category || '';
+    const categorySection = allocation.category_section || allocation.stand_section || '';
+
+    // Match both category name AND section for accurate buying price
+    let category = inv.categories.find(cat =>
+      cat.name === categoryName &&
+      cat.section === categorySection
+    );
+    // Fallback: if no exact match found, match by name only (original logic)
+    if (!category) {
+      category = inv.categories.find(cat => cat.name === categoryName);
+    }
+    return category ? (parseFloat(category.buying_price) || 0) : 0;
+  }
+  if (inv.buying_price) {
+    // Fallback to legacy inventory structure
+    return parseFloat(inv.buying_price) || 0;
+  }
+  return 0;
+}
+
+/**
+ * Audit rows for one order
+ */
+function auditRowsForOrder(order, salesPerson, lead, orderAllocations, lookups, now) {
+  const leadName = lead.name || lead.company_name || order.client_name || order.customer_name || 'Unknown';
+  const leadEvent = order.event_name || lead.lead_for_event || 'Unknown';
+
+  // Use base_amount logic for sales value (same as sales-performance API)
+  const sellingPrice = order.payment_currency === 'INR'
+    ? parseFloat(order.base_amount || order.total_amount || 0)
+    : parseFloat(order.base_amount || 0) * parseFloat(order.exchange_rate || 1);
+
+  // Don't use order buying price - will get from allocations
+  const buyingPriceInclusions = parseFloat(order.buying_price_inclusions || 0);
+
+  // Check if actualized (event date has passed)
+  const isActualized = order.event_date ? new Date(order.event_date) < now : false;
+
+  const orderFields = {
+    order_id: order.order_number || order.id,
+    order_date: order.created_date || order.updated_date || '',
+    sales_person_name: salesPerson.name,
+    sales_person_email: salesPerson.email,
+    client_name: order.client_name || order.customer_name || leadName,
+    event_name: order.event_name || leadEvent,
+    event_date: order.event_date || '',
+    is_actualized: isActualized,
+    payment_currency: order.payment_currency || 'INR',
+    exchange_rate: order.exchange_rate || 1,
+    base_amount: order.base_amount || order.total_amount || 0,
+    total_amount: order.total_amount || 0,
+    inr_equivalent: order.inr_equivalent || 0,
+    selling_price_inr: sellingPrice
+  };
+  const statusFields = {
+    payment_status: order.payment_status || 'pending',
+    order_status: order.status || 'unknown',
+    number_of_people: order.number_of_people || 0
+  };
+
+  // If no allocations, still include the order with basic info
+  if (orderAllocations.length === 0) {
+    // No allocations = no buying price from allocations
+    const totalBuyingPrice = buyingPriceInclusions;
+    const margin = sellingPrice - totalBuyingPrice;
+    const marginPercentage = sellingPrice > 0 ? (margin / sellingPrice * 100) : 0;
+    return [{
+      lead_name: leadName,
+      lead_for_event: leadEvent,
+      allocation_category: 'No Allocation',
+      allocation_stand: 'No Allocation',
+      ...orderFields,
+      buying_price_tickets: 0,
+      buying_price_inclusions: buyingPriceInclusions,
+      total_buying_price: totalBuyingPrice,
+      margin: margin,
+      margin_percentage: marginPercentage.toFixed(2),
+      ...statusFields
+    }];
+  }
+
+  return orderAllocations.map(allocation => {
+    const inv = lookups.inventoryById.get(allocation.inventory_id) || {};
+    const allocatedQty = allocation.tickets_allocated || allocation.quantity || 0;
+    const allocationBuyingPrice = buyingPricePerTicket(allocation, inv) * allocatedQty;
+    const totalBuyingPrice = allocationBuyingPrice + buyingPriceInclusions;
+    const margin = sellingPrice - totalBuyingPrice;
+    const marginPercentage = sellingPrice > 0 ? (margin / sellingPrice * 100) : 0;
+
+    return {
+      lead_name: leadName,
+      lead_for_event: leadEvent,
+      allocation_category: allocation.category_name || allocation.category || inv.category || 'Unknown',
+      allocation_stand: allocation.stand_section || allocation.stand || inv.stand || 'Unknown',
+      allocation_qty: allocatedQty,
+      allocation_unit_price: allocation.unit_price || allocation.price || 0,
+      ...orderFields,
+      buying_price_tickets: allocationBuyingPrice,
+      buying_price_inclusions: buyingPriceInclusions,
+      total_buying_price: totalBuyingPrice,
+      margin: margin,
+      margin_percentage: marginPercentage.toFixed(2),
+      ...statusFields
+    };
+  });
+}
+
+class AuditExportService {
+  /**
+   * Audit rows a page of orders at a time. stats collects counts and the
+   * peak heap seen between pages.
+   */
+  async *rowPages(stats = {}) {
+    Object.assign(stats, { pages: 0, orders: 0, rows: 0, ordersWithoutAllocations: 0, peakHeapMb: 0 });
+    const lookups = await loadLookups();
+    const now = new Date();
+
+    for await (const docs of pagedDocs(collections.orders)) {
+      const orders = [];
+      docs.forEach(doc => {
+        const order = { id: doc.id, ...doc.data() };
+        const salesPerson = salesPersonOf(order, lookups);
+        if (salesPerson) orders.push({ order, salesPerson });
+      });
+
+      // This page's leads in one multi-get, only the fields the rows use
+      const leadIds = [...new Set(orders.map(({ order }) => order.lead_id).filter(Boolean))];
+      const leadsById = new Map();
+      if (leadIds.length > 0) {
+        const leadDocs = await db.getAll(
+          ...leadIds.map(id => db.collection(collections.leads).doc(id)),
+          { fieldMask: LEAD_FIELDS }
+        );
+        leadDocs.forEach(doc => {
+          if (doc.exists) leadsById.set(doc.id, doc.data());
+        });
+      }
+
+      const rows = [];
+      orders.forEach(({ order, salesPerson }) => {
+        const orderAllocations = allocationsForOrder(order, lookups);
+        if (orderAllocations.length === 0) stats.ordersWithoutAllocations++;
+        rows.push(...auditRowsForOrder(order, salesPerson, leadsById.get(order.lead_id) || {}, orderAllocations, lookups, now));
+      });
+
+      stats.pages++;
+      stats.orders += docs.length;
+      stats.rows += rows.length;
+      stats.peakHeapMb = Math.max(stats.peakHeapMb, Math.round(process.memoryUsage().heapUsed / 1048576));
+      yield rows;
+    }
+  }
+
+  /**
+   * Every audit row, sorted by sales person and then newest order first
+   */
+  async collectRows() {
+    const stats = {};
+    const auditData = [];
+    for await (const rows of this.rowPages(stats)) {
+      auditData.push(...rows);
+    }
+
+    // Sort by sales person and order date
+    auditData.sort((a, b) => {
+      if (a.sales_person_name !== b.sales_person_name) {
+        return a.sales_person_name.localeCompare(b.sales_person_name);
+      }
+      return new Date(b.order_date) - new Date(a.order_date);
+    });
+
+    console.log('Audit processing complete:', stats);
+    return auditData;
+  }
+
+  /**
+   * The whole CSV as one string
+   */
+  toCsv(auditData) {
+    return new Parser({ fields: CSV_FIELDS }).parse(auditData);
+  }
+
+  /**
+   * Write the CSV to the response as it is produced. Rows come in order
+   * document order rather than sorted. Lookups are loaded before any header
+   * is sent, so a failure there can still be answered with a 500; a failure
+   * after that aborts the response instead of ending it as if complete.
+   */
+  async streamCsv(req, res) {
+    const startTime = Date.now();
+    const stats = {};
+    const pages = this.rowPages(stats);
+    // Runs loadLookups and reads the first page of orders
+    let page = await pages.next();
+
+    const gzip = req.query.gzip !== 'false' && req.acceptsEncodings('gzip') === 'gzip';
+    res.setHeader('Content-Type', 'text/csv');
+    res.setHeader('Content-Disposition', `attachment; filename=audit_export_${new Date().toISOString().split('T')[0]}.csv`);
+    res.setHeader('Vary', 'Accept-Encoding');
+    if (gzip) res.setHeader('Content-Encoding', 'gzip');
+
+    const csv = createCsvTransform(CSV_FIELDS);
+    const finished = new Promise((resolve, reject) => {
+      const streams = gzip ? [csv, zlib.createGzip(), res] : [csv, res];
+      pipeline(...streams, error => (error ? reject(error) : resolve()));
+    });
+    // Surfaced through finished; keeps an early abort from being unhandled
+    finished.catch(() => {});
+
+    try {
+      while (!page.done) {
+        for (const row of page.value) {
+          if (!csv.write(row)) await once(csv, 'drain');
+        }
+        if (res.destroyed) {
+          console.log('⚠️ Audit export: client disconnected, stopping');
+          await pages.return();
+          return;
+        }
+        page = await pages.next();
+      }
+      csv.end();
+      await finished;
+      console.log(`✅ Audit export streamed in ${Date.now() - startTime}ms${gzip ? ' (gzip)' : ''}:`, stats);
+    } catch (error) {
+      console.error('❌ Audit export stream failed:', error);
+      csv.destroy(error);
+      res.destroy(error);
+    }
+  }
+}
+
+module.exports = new AuditExportService();
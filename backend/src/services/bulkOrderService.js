@@ -3,6 +3,27 @@ const admin = require('../config/firebase');
 const db = admin.firestore();
 const moment = require('moment-timezone');
 const { v4: uuidv4 } = require('uuid');
+const dashboardCounters = require('./dashboardCounters');
+const salesPerformanceCache = require('./salesPerformanceCache');
+const inventoryIndex = require('./inventoryIndex');
+
+/**
+ * Bulk Order Service
+ * Creates orders from a CSV upload. Every row gets an order, an invoice and
+ * a lead moved to payment_received.
+ *
+ * Rows are validated first, then the referenced leads are read with
+ * multi-gets and missing event dates looked up in inventory by event name,
+ * so no row waits on its own reads. The writes go out ROWS_PER_BATCH rows to
+ * a batch, with up to WRITE_CONCURRENCY batches in flight. A failed batch
+ * fails only its own rows, each reported with its row number.
+ */
+
+// Three writes per row (order, invoice, lead), under the 500-write batch limit
+const ROWS_PER_BATCH = 150;
+const WRITE_CONCURRENCY = parseInt(process.env.BULK_ORDER_WRITE_CONCURRENCY || '4');
+const GET_ALL_CHUNK = 300;
+const IN_QUERY_LIMIT = 30;
 
 class BulkOrderService {
   // Get a finance team member for assignment
@@ -14,6 +35,7 @@ class BulkOrderService {
   }
   async processBulkOrders(csvBuffer, uploadedBy) {
     console.log('📋 Starting bulk order processing...');
+    const startTime = Date.now();
     
     const results = {
       summary: {
@@ -39,39 +61,89 @@ class BulkOrderService {
       console.log(`📊 Found ${records.length} records to process`);
       results.summary.total = records.length;
 
-      // Process each record
-      for (let i = 0; i < records.length; i++) {
-        const record = records[i];
+      // 1. Validate every row up front
+      const validRows = [];
+      records.forEach((record, i) => {
         const row = i + 2; // Account for header row
+        const errors = this.validateOrderRecord(record);
+        if (errors.length > 0) {
+          this.addFailure(results, { record, row }, errors);
+        } else {
+          validRows.push({ record, row });
+        }
+      });
 
+      // 2. Prefetch the referenced leads and, where needed, event dates
+      const leads = await this.prefetchLeads(validRows.map(({ record }) => record.lead_id));
+      const eventNames = validRows
+        .filter(({ record }) => {
+          const lead = leads.get(record.lead_id);
+          return lead && !(record.event_date || lead.data.event_date || lead.data.event_start_date);
+        })
+        .map(({ record }) => record.event_name);
+      const eventDates = await this.prefetchEventDates(eventNames);
+
+      // 3. Build the order, invoice and lead update for each row
+      const prepared = [];
+      validRows.forEach(item => {
+        const { record, row } = item;
+        const lead = leads.get(record.lead_id);
+        if (!lead) {
+          this.addFailure(results, item, [`Lead with ID ${record.lead_id} not found`]);
+          return;
+        }
         try {
-          const result = await this.processOrderRecord(record, row, uploadedBy);
-          
-          if (result.success) {
-            results.summary.success++;
-            results.summary.ordersCreated++;
-            results.summary.totalAmount += result.totalAmount;
-            results.details.push(result);
-          } else {
-            results.summary.failed++;
-            results.failed.push({
-              row,
-              lead_id: record.lead_id,
-              errors: result.errors
-            });
-          }
+          const eventDate = record.event_date || lead.data.event_date || lead.data.event_start_date ||
+            eventDates.get(record.event_name);
+          const orderRef = db.collection('crm_orders').doc();
+          const { orderData, invoiceData } = this.buildOrder(record, row, lead.data, eventDate, uploadedBy, orderRef.id);
+          // Rows for the same lead see the status the previous row left it in
+          const leadBefore = lead.data;
+          lead.data = { ...lead.data, status: 'payment_received' };
+          prepared.push({
+            ...item,
+            orderRef,
+            orderData,
+            invoiceRef: db.collection('crm_invoices').doc(),
+            invoiceData,
+            leadRef: lead.ref,
+            leadBefore,
+            leadAfter: lead.data
+          });
         } catch (error) {
           console.error(`❌ Error processing row ${row}:`, error);
-          results.summary.failed++;
-          results.failed.push({
-            row,
-            lead_id: record.lead_id,
-            errors: [error.message]
-          });
+          this.addFailure(results, item, [error.message]);
+        }
+      });
+
+      // 4. Write in batches, keeping at most WRITE_CONCURRENCY in flight
+      const pending = new Set();
+      for (let i = 0; i < prepared.length; i += ROWS_PER_BATCH) {
+        const chunk = prepared.slice(i, i + ROWS_PER_BATCH);
+        while (pending.size >= WRITE_CONCURRENCY) {
+          await Promise.race(pending);
         }
+        const write = this.writeChunk(chunk, uploadedBy)
+          .then(() => this.recordWritten(results, chunk))
+          .catch(error => {
+            console.error(`❌ Bulk orders: batch of ${chunk.length} orders failed:`, error.message);
+            chunk.forEach(item => this.addFailure(results, item, [`Write failed: ${error.message}`]));
+          })
+          .finally(() => pending.delete(write));
+        pending.add(write);
+      }
+      await Promise.all(pending);
+
+      // Batches finish out of order; report rows in file order
+      results.details.sort((a, b) => a.row - b.row);
+      results.failed.sort((a, b) => a.row - b.row);
+
+      // One invalidation for the whole upload rather than one per order
+      if (results.summary.ordersCreated > 0) {
+        await salesPerformanceCache.bump(['sales'], 'bulk order upload');
       }
 
-      console.log('✅ Bulk order processing completed:', results.summary);
+      console.log(`✅ Bulk order processing completed in ${Date.now() - startTime}ms:`, results.summary);
       return results;
     } catch (error) {
       console.error('❌ Fatal error in bulk order processing:', error);
@@ -79,7 +151,7 @@ class BulkOrderService {
     }
   }
 
-  async processOrderRecord(record, row, uploadedBy) {
+  validateOrderRecord(record) {
     const errors = [];
     
     // Validate required fields
@@ -98,345 +170,378 @@ class BulkOrderService {
     if (!record.quantity || isNaN(parseInt(record.quantity))) {
       errors.push('Valid quantity is required');
     }
+    return errors;
+  }
+
+  addFailure(results, { record, row }, errors) {
+    results.summary.failed++;
+    results.failed.push({
+      row,
+      lead_id: record.lead_id,
+      errors
+    });
+  }
 
-    if (errors.length > 0) {
-      return { success: false, errors };
+  /**
+   * Referenced leads as a Map of id -> { ref, data }, read with multi-gets
+   * instead of one read per row
+   */
+  async prefetchLeads(leadIds) {
+    const leads = new Map();
+    const ids = [...new Set(leadIds)];
+    for (let i = 0; i < ids.length; i += GET_ALL_CHUNK) {
+      const refs = ids.slice(i, i + GET_ALL_CHUNK).map(id => db.collection('crm_leads').doc(id));
+      const docs = await db.getAll(...refs);
+      docs.forEach(doc => {
+        if (doc.exists) leads.set(doc.id, { ref: doc.ref, data: doc.data() });
+      });
     }
+    return leads;
+  }
 
-    try {
-      // Get lead data
-      const leadRef = db.collection('crm_leads').doc(record.lead_id);
-      const leadDoc = await leadRef.get();
-      
-      if (!leadDoc.exists) {
-        return { 
-          success: false, 
-          errors: [`Lead with ID ${record.lead_id} not found`] 
-        };
-      }
+  /**
+   * Event dates from inventory by event name, for rows where neither the CSV
+   * nor the lead has one. The first inventory item found for a name wins.
+   * Served from the inventory index when it is built.
+   */
+  async prefetchEventDates(eventNames) {
+    const eventDates = new Map();
+    const names = [...new Set(eventNames.filter(Boolean))];
+    if (inventoryIndex.ready) {
+      names.forEach(name => {
+        const inventoryData = inventoryIndex.findByEventName(name, { includeDeleted: true });
+        const eventDate = inventoryData && (inventoryData.event_date || inventoryData.event_start_date);
+        if (eventDate) eventDates.set(name, eventDate);
+      });
+      return eventDates;
+    }
 
-      const leadData = leadDoc.data();
+    const seen = new Set();
+    for (let i = 0; i < names.length; i += IN_QUERY_LIMIT) {
+      const snapshot = await db.collection('crm_inventory')
+        .where('event_name', 'in', names.slice(i, i + IN_QUERY_LIMIT))
+        .get();
+      snapshot.forEach(doc => {
+        const inventoryData = doc.data();
+        if (seen.has(inventoryData.event_name)) return;
+        seen.add(inventoryData.event_name);
+        const eventDate = inventoryData.event_date || inventoryData.event_start_date;
+        if (eventDate) eventDates.set(inventoryData.event_name, eventDate);
+      });
+    }
+    if (names.length > 0) {
+      console.log(`📅 Found event dates in inventory for ${eventDates.size} of ${names.length} events`);
+    }
+    return eventDates;
+  }
 
-      // Get event date from inventory based on event_name
-      let eventDate = record.event_date || leadData.event_date || leadData.event_start_date;
-      
-      if (!eventDate && record.event_name) {
-        // Try to find the event in inventory
-        const inventorySnapshot = await db.collection('crm_inventory')
-          .where('event_name', '==', record.event_name)
-          .limit(1)
-          .get();
-        
-        if (!inventorySnapshot.empty) {
-          const inventoryData = inventorySnapshot.docs[0].data();
-          eventDate = inventoryData.event_date || inventoryData.event_start_date;
-          console.log(`📅 Found event date from inventory: ${eventDate} for ${record.event_name}`);
-        }
+  /**
+   * Order and invoice documents for one CSV row: { orderData, invoiceData }
+   */
+  buildOrder(record, row, leadData, eventDate, uploadedBy, orderId) {
+    // Parse amounts
+    const rate = parseFloat(record.rate) || 0;
+    const quantity = parseInt(record.quantity) || 1;
+    const invoiceTotal = rate * quantity;
+    const serviceFeeAmount = parseFloat(record.service_fee_amount) || 0;
+    const advanceAmount = parseFloat(record.advance_amount) || 0;
+    const inclusionsCost = parseFloat(record.inclusions_cost) || 0;
+    const gstRate = parseFloat(record.gst_rate) || 18;
+
+    // Check location and customer type for GST calculation
+    const isOutsideIndia = record.is_outside_india === 'true' || record.is_outside_india === 'TRUE' || record.is_outside_india === true || record.event_location === 'outside_india';
+    const isIndian = record.customer_type === 'indian';
+    const isINRPayment = record.payment_currency === 'INR';
+    
+    // Determine if GST applies based on business rules
+    let gstApplicable = false;
+    if (isIndian) {
+      // Indian customers always get GST regardless of location
+      gstApplicable = true;
+    } else if (!isOutsideIndia) {
+      // Event in India = GST applicable
+      gstApplicable = true;
+    } else if (isOutsideIndia && isINRPayment) {
+      // Event outside India but paying in INR = GST applicable
+      gstApplicable = true;
+    }
+    
+    const effectiveGstRate = gstApplicable ? gstRate : 0;
+    
+    // Calculate GST based on type of sale
+    let taxableAmount = 0;
+    let gstAmount = 0;
+    
+    if (record.type_of_sale === 'Service Fee') {
+      // For Service Fee: GST only on service fee amount
+      taxableAmount = serviceFeeAmount;
+      gstAmount = (serviceFeeAmount * effectiveGstRate) / 100;
+    } else {
+      // For other types (Tour Package, Ticket Sale): GST on total
+      taxableAmount = invoiceTotal + serviceFeeAmount;
+      gstAmount = (taxableAmount * effectiveGstRate) / 100;
+    }
+    
+    // Determine if intra-state (CGST/SGST) or inter-state (IGST)
+    const isIntraState = record.state_location === 'Haryana' && !isOutsideIndia;
+    const cgst = gstAmount > 0 && isIntraState ? gstAmount / 2 : 0;
+    const sgst = gstAmount > 0 && isIntraState ? gstAmount / 2 : 0;
+    const igst = gstAmount > 0 && !isIntraState ? gstAmount : 0;
+
+    // Calculate TCS if applicable
+    const isCorporate = record.category_of_sale === 'corporate' || record.category_of_sale === 'Corporate';
+    let tcsApplicable = false;
+    let tcsRate = parseFloat(record.tcs_rate) || 5;
+    
+    // B2B clients NEVER get TCS
+    if (!isCorporate && isOutsideIndia) {
+      // Only B2C (Retail) clients can get TCS for events outside India
+      if (isIndian || isINRPayment) {
+        tcsApplicable = true;
       }
-
-      // Parse amounts
-      const rate = parseFloat(record.rate) || 0;
-      const quantity = parseInt(record.quantity) || 1;
-      const invoiceTotal = rate * quantity;
-      const serviceFeeAmount = parseFloat(record.service_fee_amount) || 0;
-      const advanceAmount = parseFloat(record.advance_amount) || 0;
-      const inclusionsCost = parseFloat(record.inclusions_cost) || 0;
-      const gstRate = parseFloat(record.gst_rate) || 18;
-
-      // Check location and customer type for GST calculation
-      const isOutsideIndia = record.is_outside_india === 'true' || record.is_outside_india === 'TRUE' || record.is_outside_india === true || record.event_location === 'outside_india';
-      const isIndian = record.customer_type === 'indian';
-      const isINRPayment = record.payment_currency === 'INR';
+    }
+    
+    const tcsAmount = tcsApplicable ? ((invoiceTotal + serviceFeeAmount + gstAmount) * tcsRate) / 100 : 0;
+    
+    // Calculate final amount
+    const totalBeforeTax = invoiceTotal + serviceFeeAmount;
+    const finalAmount = invoiceTotal + serviceFeeAmount + gstAmount + tcsAmount;
+
+    // Prepare order data
+    const orderData = {
+      // Lead information
+      lead_id: record.lead_id,
+      lead_name: record.lead_name || leadData.lead_name || record.client_name,
+      lead_phone: record.client_phone || leadData.lead_phone,
+      lead_email: record.client_email || leadData.lead_email,
       
-      // Determine if GST applies based on business rules
-      let gstApplicable = false;
-      if (isIndian) {
-        // Indian customers always get GST regardless of location
-        gstApplicable = true;
-      } else if (!isOutsideIndia) {
-        // Event in India = GST applicable
-        gstApplicable = true;
-      } else if (isOutsideIndia && isINRPayment) {
-        // Event outside India but paying in INR = GST applicable
-        gstApplicable = true;
-      }
+      // Client information
+      client_name: record.client_name,
+      client_email: record.client_email || leadData.lead_email,
+      client_phone: record.client_phone || leadData.lead_phone,
       
-      const effectiveGstRate = gstApplicable ? gstRate : 0;
+      // Customer classification
+      customer_type: record.customer_type || 'indian',
+      event_location: record.event_location || 'india',
+      payment_currency: record.payment_currency || 'INR',
       
-      // Calculate GST based on type of sale
-      let taxableAmount = 0;
-      let gstAmount = 0;
+      // Event details
+      event_name: record.event_name || leadData.event_name || 'Event',
+      event_date: eventDate || null,
       
-      if (record.type_of_sale === 'Service Fee') {
-        // For Service Fee: GST only on service fee amount
-        taxableAmount = serviceFeeAmount;
-        gstAmount = (serviceFeeAmount * effectiveGstRate) / 100;
-      } else {
-        // For other types (Tour Package, Ticket Sale): GST on total
-        taxableAmount = invoiceTotal + serviceFeeAmount;
-        gstAmount = (taxableAmount * effectiveGstRate) / 100;
-      }
+      // Ticket details
+      quantity: quantity,
+      tickets_allocated: quantity,
+      ticket_category: record.category_of_sale || 'Corporate',
       
-      // Determine if intra-state (CGST/SGST) or inter-state (IGST)
-      const isIntraState = record.state_location === 'Haryana' && !isOutsideIndia;
-      const cgst = gstAmount > 0 && isIntraState ? gstAmount / 2 : 0;
-      const sgst = gstAmount > 0 && isIntraState ? gstAmount / 2 : 0;
-      const igst = gstAmount > 0 && !isIntraState ? gstAmount : 0;
-
-      // Calculate TCS if applicable
-      const isCorporate = record.category_of_sale === 'corporate' || record.category_of_sale === 'Corporate';
-      let tcsApplicable = false;
-      let tcsRate = parseFloat(record.tcs_rate) || 5;
+      // GST & Legal details
+      gstin: record.gstin || '',
+      legal_name: record.legal_name || record.client_name,
+      category_of_sale: record.category_of_sale || 'corporate',
+      type_of_sale: record.type_of_sale || 'Service Fee',
+      gst_rate: gstRate,
+      registered_address: record.registered_address || '',
+      state_location: record.state_location || '',
+      indian_state: record.state_location || '',  // Payment form expects this field
+      is_outside_india: record.is_outside_india === 'true' || record.is_outside_india === 'TRUE' || record.is_outside_india === true,
       
-      // B2B clients NEVER get TCS
-      if (!isCorporate && isOutsideIndia) {
-        // Only B2C (Retail) clients can get TCS for events outside India
-        if (isIndian || isINRPayment) {
-          tcsApplicable = true;
-        }
-      }
+      // Invoice items (payment form expects 'invoice_items' not 'items')
+      invoice_items: [{
+        description: record.event_description || record.event_name,
+        quantity: quantity,
+        rate: rate,
+        amount: invoiceTotal,
+        additional_info: record.additional_info || ''
+      }],
+      // Keep items for backward compatibility
+      items: [{
+        description: record.event_description || record.event_name,
+        quantity: quantity,
+        rate: rate,
+        amount: invoiceTotal,
+        additional_info: record.additional_info || ''
+      }],
       
-      const tcsAmount = tcsApplicable ? ((invoiceTotal + serviceFeeAmount + gstAmount) * tcsRate) / 100 : 0;
+      // Amounts
+      invoice_subtotal: invoiceTotal,
+      service_fee_amount: serviceFeeAmount,
+      cgst_amount: cgst,
+      sgst_amount: sgst,
+      igst_amount: igst,
+      gst_amount: gstAmount,
+      tcs_rate: tcsRate,
+      tcs_amount: tcsAmount,
+      total_amount_before_tax: totalBeforeTax,
+      base_amount: totalBeforeTax, // Some views expect base_amount
+      final_amount: finalAmount,
+      advance_amount: advanceAmount,
+      balance_due: finalAmount - advanceAmount,
       
-      // Calculate final amount
-      const totalBeforeTax = invoiceTotal + serviceFeeAmount;
-      const finalAmount = invoiceTotal + serviceFeeAmount + gstAmount + tcsAmount;
-
-      // Prepare order data
-      const orderData = {
-        // Lead information
-        lead_id: record.lead_id,
-        lead_name: record.lead_name || leadData.lead_name || record.client_name,
-        lead_phone: record.client_phone || leadData.lead_phone,
-        lead_email: record.client_email || leadData.lead_email,
-        
-        // Client information
-        client_name: record.client_name,
-        client_email: record.client_email || leadData.lead_email,
-        client_phone: record.client_phone || leadData.lead_phone,
-        
-        // Customer classification
-        customer_type: record.customer_type || 'indian',
-        event_location: record.event_location || 'india',
-        payment_currency: record.payment_currency || 'INR',
-        
-        // Event details
-        event_name: record.event_name || leadData.event_name || 'Event',
-        event_date: eventDate || null,
-        
-        // Ticket details
-        quantity: quantity,
-        tickets_allocated: quantity,
-        ticket_category: record.category_of_sale || 'Corporate',
-        
-        // GST & Legal details
-        gstin: record.gstin || '',
-        legal_name: record.legal_name || record.client_name,
-        category_of_sale: record.category_of_sale || 'corporate',
+      // Inclusions
+      inclusions_cost: inclusionsCost,
+      inclusions_description: record.inclusions_description || '',
+      
+      // Payment details
+      payment_method: record.payment_method || 'Bank Transfer',
+      transaction_id: record.transaction_id || '',
+      payment_date: record.payment_date ? moment(record.payment_date, ['DD/MM/YY', 'DD/MM/YYYY', 'YYYY-MM-DD']).format('YYYY-MM-DD') : moment().tz('Asia/Kolkata').format('YYYY-MM-DD'),
+      
+      // Metadata
+      order_number: `ORD-${Date.now()}-${row}`,
+      status: 'pending_approval', // Always pending_approval for bulk uploads
+      created_by: uploadedBy,
+      created_date: moment().tz('Asia/Kolkata').toISOString(),
+      created_at: moment().tz('Asia/Kolkata').toISOString(), // Some views expect created_at
+      created_via: 'bulk_upload',
+      notes: record.notes || '',
+      
+      // Assignment fields - auto-assign to finance team
+      assigned_team: 'finance',
+      assigned_to: this.getFinanceTeamMember(),
+      assignment_date: moment().tz('Asia/Kolkata').toISOString(),
+      assignment_notes: 'Auto-assigned to finance team via bulk upload',
+      
+      // Additional fields for compatibility with payment form
+      advance_amount_inr: advanceAmount,
+      final_amount_inr: finalAmount,
+      exchange_rate: record.exchange_rate || 1,
+      sales_person: uploadedBy,
+      
+      // Fields expected by payment form
+      invoice_total: invoiceTotal,
+      service_fee: serviceFeeAmount,
+      service_fee_amount: serviceFeeAmount,
+      total_before_tax: totalBeforeTax,
+      tax_amount: gstAmount,
+      tour_package: record.type_of_sale === 'Tour Package',
+      type_of_sale: record.type_of_sale || 'Service Fee',
+      
+      // Payment status - always 'paid' for bulk uploads
+      payment_status: 'paid',
+      
+      // Total amount field
+      total_amount: finalAmount,
+      amount: finalAmount.toString(), // Some views expect 'amount' as string
+      
+      // Currency fields
+      currency: record.payment_currency || 'INR',
+      
+      // GST calculation object (expected by payment form)
+      gst_calculation: {
+        rate: effectiveGstRate,
+        amount: gstAmount,
+        cgst: cgst,
+        sgst: sgst,
+        igst: igst,
+        total: gstAmount,
+        applicable: gstApplicable,
+        taxable_amount: taxableAmount,
         type_of_sale: record.type_of_sale || 'Service Fee',
-        gst_rate: gstRate,
-        registered_address: record.registered_address || '',
-        state_location: record.state_location || '',
-        indian_state: record.state_location || '',  // Payment form expects this field
-        is_outside_india: record.is_outside_india === 'true' || record.is_outside_india === 'TRUE' || record.is_outside_india === true,
-        
-        // Invoice items (payment form expects 'invoice_items' not 'items')
-        invoice_items: [{
-          description: record.event_description || record.event_name,
-          quantity: quantity,
-          rate: rate,
-          amount: invoiceTotal,
-          additional_info: record.additional_info || ''
-        }],
-        // Keep items for backward compatibility
-        items: [{
-          description: record.event_description || record.event_name,
-          quantity: quantity,
-          rate: rate,
-          amount: invoiceTotal,
-          additional_info: record.additional_info || ''
-        }],
-        
-        // Amounts
-        invoice_subtotal: invoiceTotal,
-        service_fee_amount: serviceFeeAmount,
-        cgst_amount: cgst,
-        sgst_amount: sgst,
-        igst_amount: igst,
-        gst_amount: gstAmount,
         tcs_rate: tcsRate,
         tcs_amount: tcsAmount,
-        total_amount_before_tax: totalBeforeTax,
-        base_amount: totalBeforeTax, // Some views expect base_amount
-        final_amount: finalAmount,
-        advance_amount: advanceAmount,
-        balance_due: finalAmount - advanceAmount,
-        
-        // Inclusions
-        inclusions_cost: inclusionsCost,
-        inclusions_description: record.inclusions_description || '',
-        
-        // Payment details
-        payment_method: record.payment_method || 'Bank Transfer',
-        transaction_id: record.transaction_id || '',
-        payment_date: record.payment_date ? moment(record.payment_date, ['DD/MM/YY', 'DD/MM/YYYY', 'YYYY-MM-DD']).format('YYYY-MM-DD') : moment().tz('Asia/Kolkata').format('YYYY-MM-DD'),
-        
-        // Metadata
-        order_number: `ORD-${Date.now()}-${row}`,
-        status: 'pending_approval', // Always pending_approval for bulk uploads
-        created_by: uploadedBy,
-        created_date: moment().tz('Asia/Kolkata').toISOString(),
-        created_at: moment().tz('Asia/Kolkata').toISOString(), // Some views expect created_at
-        created_via: 'bulk_upload',
-        notes: record.notes || '',
-        
-        // Assignment fields - auto-assign to finance team
-        assigned_team: 'finance',
-        assigned_to: this.getFinanceTeamMember(),
-        assignment_date: moment().tz('Asia/Kolkata').toISOString(),
-        assignment_notes: 'Auto-assigned to finance team via bulk upload',
-        
-        // Additional fields for compatibility with payment form
-        advance_amount_inr: advanceAmount,
-        final_amount_inr: finalAmount,
-        exchange_rate: record.exchange_rate || 1,
-        sales_person: uploadedBy,
-        
-        // Fields expected by payment form
-        invoice_total: invoiceTotal,
-        service_fee: serviceFeeAmount,
-        service_fee_amount: serviceFeeAmount,
-        total_before_tax: totalBeforeTax,
-        tax_amount: gstAmount,
-        tour_package: record.type_of_sale === 'Tour Package',
-        type_of_sale: record.type_of_sale || 'Service Fee',
-        
-        // Payment status - always 'paid' for bulk uploads
-        payment_status: 'paid',
-        
-        // Total amount field
-        total_amount: finalAmount,
-        amount: finalAmount.toString(), // Some views expect 'amount' as string
-        
-        // Currency fields
-        currency: record.payment_currency || 'INR',
-        
-        // GST calculation object (expected by payment form)
-        gst_calculation: {
-          rate: effectiveGstRate,
-          amount: gstAmount,
-          cgst: cgst,
-          sgst: sgst,
-          igst: igst,
-          total: gstAmount,
-          applicable: gstApplicable,
-          taxable_amount: taxableAmount,
-          type_of_sale: record.type_of_sale || 'Service Fee',
-          tcs_rate: tcsRate,
-          tcs_amount: tcsAmount,
-          tcs_applicable: tcsApplicable
-        },
-        
-        // Approval tracking
-        approval_status: 'pending',
-        approved_by: null,
-        approved_date: null
-      };
-
-      // Remove any undefined values to prevent Firestore errors
-      const cleanedOrderData = Object.entries(orderData).reduce((acc, [key, value]) => {
-        if (value !== undefined) {
-          acc[key] = value;
-        }
-        return acc;
-      }, {});
-
-      // Debug log
-      console.log('📝 Creating order with data:', {
-        type_of_sale: cleanedOrderData.type_of_sale,
-        payment_status: cleanedOrderData.payment_status,
-        total_amount: cleanedOrderData.total_amount,
-        currency: cleanedOrderData.currency,
-        is_outside_india: cleanedOrderData.is_outside_india,
-        event_location: cleanedOrderData.event_location
-      });
+        tcs_applicable: tcsApplicable
+      },
+      
+      // Approval tracking
+      approval_status: 'pending',
+      approved_by: null,
+      approved_date: null
+    };
 
-      // Create the order
-      const orderRef = await db.collection('crm_orders').add(cleanedOrderData);
-      console.log(`✅ Order created: ${orderRef.id} for lead ${record.lead_id}`);
+    // Remove any undefined values to prevent Firestore errors
+    const cleanedOrderData = Object.entries(orderData).reduce((acc, [key, value]) => {
+      if (value !== undefined) {
+        acc[key] = value;
+      }
+      return acc;
+    }, {});
+
+    // Generate invoice
+    const invoiceData = {
+      order_id: orderId,
+      order_number: orderData.order_number,
+      invoice_number: `INV-${Date.now()}-${row}`,
+      invoice_date: moment().tz('Asia/Kolkata').format('YYYY-MM-DD'),
+      
+      // Copy relevant fields from order
+      client_name: orderData.client_name,
+      client_email: orderData.client_email,
+      client_phone: orderData.client_phone,
+      gstin: orderData.gstin,
+      legal_name: orderData.legal_name,
+      registered_address: orderData.registered_address,
+      
+      // Amounts
+      subtotal: invoiceTotal,
+      service_fee: serviceFeeAmount,
+      cgst: cgst,
+      sgst: sgst,
+      total: finalAmount,
+      
+      // Items
+      items: orderData.items,
+      
+      // Metadata
+      created_date: moment().tz('Asia/Kolkata').toISOString(),
+      created_by: uploadedBy,
+      status: 'generated'
+    };
 
-      // Generate invoice
-      const invoiceData = {
-        order_id: orderRef.id,
-        order_number: orderData.order_number,
-        invoice_number: `INV-${Date.now()}-${row}`,
-        invoice_date: moment().tz('Asia/Kolkata').format('YYYY-MM-DD'),
-        
-        // Copy relevant fields from order
-        client_name: orderData.client_name,
-        client_email: orderData.client_email,
-        client_phone: orderData.client_phone,
-        gstin: orderData.gstin,
-        legal_name: orderData.legal_name,
-        registered_address: orderData.registered_address,
-        
-        // Amounts
-        subtotal: invoiceTotal,
-        service_fee: serviceFeeAmount,
-        cgst: cgst,
-        sgst: sgst,
-        total: finalAmount,
-        
-        // Items
-        items: orderData.items,
-        
-        // Metadata
-        created_date: moment().tz('Asia/Kolkata').toISOString(),
-        created_by: uploadedBy,
-        status: 'generated'
-      };
-
-      // Remove undefined values from invoice data
-      const cleanedInvoiceData = Object.entries(invoiceData).reduce((acc, [key, value]) => {
-        if (value !== undefined) {
-          acc[key] = value;
-        }
-        return acc;
-      }, {});
+    // Remove undefined values from invoice data
+    const cleanedInvoiceData = Object.entries(invoiceData).reduce((acc, [key, value]) => {
+      if (value !== undefined) {
+        acc[key] = value;
+      }
+      return acc;
+    }, {});
 
-      const invoiceRef = await db.collection('crm_invoices').add(cleanedInvoiceData);
-      console.log(`✅ Invoice created: ${invoiceRef.id}`);
+    return { orderData: cleanedOrderData, invoiceData: cleanedInvoiceData };
+  }
 
+  /**
+   * Create the orders and invoices of a chunk and move its leads to
+   * payment_received, as one batch
+   */
+  async writeChunk(chunk, uploadedBy) {
+    const batch = db.batch();
+    const now = moment().tz('Asia/Kolkata').toISOString();
+    chunk.forEach(item => {
+      batch.set(item.orderRef, item.orderData);
+      batch.set(item.invoiceRef, item.invoiceData);
       // Update lead status to payment_received for bulk uploads
-      await leadRef.update({
+      batch.update(item.leadRef, {
         status: 'payment_received',
         'journey.payment_received': {
-          timestamp: moment().tz('Asia/Kolkata').toISOString(),
+          timestamp: now,
           updated_by: uploadedBy,
-          notes: `Payment received via bulk upload - Order ${orderData.order_number}`
+          notes: `Payment received via bulk upload - Order ${item.orderData.order_number}`
         },
-        updated_date: moment().tz('Asia/Kolkata').toISOString()
+        updated_date: now
       });
-      console.log(`✅ Lead ${record.lead_id} status updated to payment_received`);
+    });
+    await batch.commit();
+    console.log(`✅ Bulk orders: ${chunk.length} orders, invoices and lead updates written (rows ${chunk[0].row}-${chunk[chunk.length - 1].row})`);
+  }
 
-      return {
+  async recordWritten(results, chunk) {
+    chunk.forEach(item => {
+      results.summary.success++;
+      results.summary.ordersCreated++;
+      results.summary.totalAmount += item.orderData.final_amount;
+      results.details.push({
         success: true,
-        order_id: orderRef.id,
-        order_number: orderData.order_number,
-        invoice_id: invoiceRef.id,
-        invoice_number: invoiceData.invoice_number,
-        lead_id: record.lead_id,
-        totalAmount: finalAmount,
-        status: orderData.status
-      };
-
-    } catch (error) {
-      console.error(`❌ Error processing order for lead ${record.lead_id}:`, error);
-      return {
-        success: false,
-        errors: [error.message]
-      };
-    }
+        row: item.row,
+        order_id: item.orderRef.id,
+        order_number: item.orderData.order_number,
+        invoice_id: item.invoiceRef.id,
+        invoice_number: item.invoiceData.invoice_number,
+        lead_id: item.record.lead_id,
+        totalAmount: item.orderData.final_amount,
+        status: item.orderData.status
+      });
+    });
+    await dashboardCounters.recordChanges('orders', chunk.map(item => [null, item.orderData]));
+    await dashboardCounters.recordChanges('leads', chunk.map(item => [item.leadBefore, item.leadAfter]));
   }
 
   async validateBulkOrdersCsv(csvBuffer) {
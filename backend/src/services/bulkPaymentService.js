@@ -2,6 +2,8 @@ const admin = require('../config/firebase');
 const csv = require('csv-parser');
 const { Readable } = require('stream');
 const moment = require('moment-timezone');
+const dashboardCounters = require('./dashboardCounters');
+const salesPerformanceCache = require('./salesPerformanceCache');
 
 class BulkPaymentService {
   constructor() {
@@ -173,6 +175,7 @@ class BulkPaymentService {
         
         const orderRef = await this.db.collection('crm_orders').add(orderData);
         orderId = orderRef.id;
+        await dashboardCounters.recordChange('orders', null, orderData);
         this.results.summary.ordersCreated++;
         
       } else {
@@ -208,6 +211,7 @@ class BulkPaymentService {
         updated_at: admin.firestore.FieldValue.serverTimestamp(),
         updated_by: uploadedBy
       });
+      await dashboardCounters.recordChange('leads', leadData, { ...leadData, status: 'payment_received' });
       
       // 8. Create activity log
       await this.db.collection('crm_activity_logs').add({
@@ -301,6 +305,11 @@ class BulkPaymentService {
         }
       }
       
+      // One invalidation for the whole upload rather than one per order
+      if (this.results.summary.ordersCreated > 0) {
+        await salesPerformanceCache.bump(['sales'], 'bulk payment upload');
+      }
+      
       return this.results;
       
     } catch (error) {
@@ -0,0 +1,357 @@
+const crypto = require('crypto');
+const { FieldValue } = require('@google-cloud/firestore');
+const { db, collections } = require('../config/db');
+const marketingRollups = require('./marketingRollups');
+
+/**
+ * Dashboard Counters
+ * Materialized totals behind GET /api/dashboard/stats, so a dashboard load
+ * reads SHARD_COUNT + 1 small documents instead of four whole collections.
+ *
+ * Write paths that create, change or delete leads, orders, inventory or
+ * receivables call recordChange(kind, before, after). The difference between
+ * the document's contribution before and after is added to one randomly
+ * picked shard with FieldValue.increment, so concurrent writers rarely hit
+ * the same counter document.
+ *
+ * reconcile() recomputes the totals from the collections and adds any drift
+ * (from write paths that don't report, or failed counter writes) to a shard.
+ * It runs on a timer in every instance, but a lease document lets only one
+ * of them do the work, and from POST /api/cron/reconcile-dashboard.
+ *
+ * Lead changes are passed on to the marketing rollups as well, so the lead
+ * write paths report to one place.
+ */
+
+const COUNTERS_COLLECTION = 'crm_dashboard_counters';
+const SHARD_COUNT = 10;
+const META_DOC = 'meta';
+const LEASE_DOC = 'reconcile_lease';
+const LEASE_MS = 10 * 60 * 1000;
+
+const COUNTERS = [
+  'totalLeads',
+  'activeDeals',
+  'totalInventory',
+  'totalInventoryValue',
+  'pendingOrders',
+  'totalReceivables',
+  'totalRevenue'
+];
+
+// Qualified statuses - matching marketing performance logic
+const QUALIFIED_STATUSES = ['qualified', 'hot', 'warm', 'cold', 'pickup_later',
+  'quote_requested', 'quote_received', 'converted', 'invoiced',
+  'payment_received', 'payment_post_service', 'dropped'];
+
+const REVENUE_STATUSES = ['approved', 'completed'];
+
+// Fields that can move a counter (or, for leads, a marketing rollup). Updates
+// that touch none of them don't need the previous document
+const COUNTED_FIELDS = {
+  leads: ['status', 'date_of_enquiry', 'source', 'lead_for_event', 'event_name', 'ad_set', 'adset_name'],
+  orders: ['status', 'final_amount_inr', 'final_amount', 'created_date'],
+  inventory: ['categories', 'available_tickets', 'selling_price_inr', 'selling_price'],
+  receivables: ['amount']
+};
+
+function toNumber(value) {
+  const number = parseFloat(value);
+  return isNaN(number) ? 0 : number;
+}
+
+function monthKey(date) {
+  return `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}`;
+}
+
+/**
+ * What one document adds to the counters: { counts, months } where months
+ * holds revenue by the month the order was created
+ */
+function contribution(kind, data) {
+  const counts = {};
+  const months = {};
+  if (!data) return { counts, months };
+
+  switch (kind) {
+    case 'leads':
+      counts.totalLeads = 1;
+      counts.activeDeals = QUALIFIED_STATUSES.includes(data.status) ? 1 : 0;
+      break;
+
+    case 'orders':
+      counts.pendingOrders = data.status === 'pending_approval' ? 1 : 0;
+      if (REVENUE_STATUSES.includes(data.status)) {
+        // INR fields, falling back to the order currency fields
+        const amount = toNumber(data.final_amount_inr || data.final_amount);
+        counts.totalRevenue = amount;
+        const created = new Date(data.created_date);
+        if (!isNaN(created.getTime())) {
+          months[monthKey(created)] = amount;
+        }
+      }
+      break;
+
+    case 'inventory': {
+      // Multi-category inventory, or the legacy single category
+      const categories = Array.isArray(data.categories) ? data.categories : [data];
+      counts.totalInventory = 0;
+      counts.totalInventoryValue = 0;
+      categories.forEach(cat => {
+        const availableTickets = parseInt(cat.available_tickets) || 0;
+        counts.totalInventory += availableTickets;
+        counts.totalInventoryValue += toNumber(cat.selling_price_inr || cat.selling_price) * availableTickets;
+      });
+      break;
+    }
+
+    case 'receivables':
+      counts.totalReceivables = toNumber(data.amount);
+      break;
+
+    default:
+      throw new Error(`Unknown counter kind: ${kind}`);
+  }
+  return { counts, months };
+}
+
+/**
+ * a - b for { counts, months } pairs, keeping only non-zero entries
+ */
+function difference(a, b) {
+  const counts = {};
+  const months = {};
+  new Set([...Object.keys(a.counts), ...Object.keys(b.counts)]).forEach(field => {
+    const value = (a.counts[field] || 0) - (b.counts[field] || 0);
+    if (Math.abs(value) > 1e-6) counts[field] = value;
+  });
+  new Set([...Object.keys(a.months), ...Object.keys(b.months)]).forEach(month => {
+    const value = (a.months[month] || 0) - (b.months[month] || 0);
+    if (Math.abs(value) > 1e-6) months[month] = value;
+  });
+  return { counts, months };
+}
+
+function isEmpty(delta) {
+  return Object.keys(delta.counts).length === 0 && Object.keys(delta.months).length === 0;
+}
+
+function addInto(total, part) {
+  Object.entries(part.counts).forEach(([field, value]) => {
+    total.counts[field] = (total.counts[field] || 0) + value;
+  });
+  Object.entries(part.months).forEach(([month, value]) => {
+    total.months[month] = (total.months[month] || 0) + value;
+  });
+  return total;
+}
+
+class DashboardCounters {
+  constructor() {
+    this.instanceId = crypto.randomBytes(6).toString('hex');
+    this.reconcileTimer = null;
+  }
+
+  shardRef(index) {
+    return db.collection(COUNTERS_COLLECTION).doc(`shard_${index}`);
+  }
+
+  shardRefs() {
+    return Array.from({ length: SHARD_COUNT }, (_, i) => this.shardRef(i));
+  }
+
+  /**
+   * Whether an update with these fields can move a counter
+   */
+  touches(kind, updateData) {
+    return COUNTED_FIELDS[kind].some(field => updateData[field] !== undefined);
+  }
+
+  /**
+   * Apply a write to the counters. before/after are the document data, or
+   * null for a create/delete. Never throws: a lost update is drift that the
+   * reconciler corrects.
+   */
+  async recordChange(kind, before, after) {
+    return this.recordChanges(kind, [[before, after]]);
+  }
+
+  /**
+   * Apply many writes as one counter update; changes are [before, after] pairs
+   */
+  async recordChanges(kind, changes) {
+    if (kind === 'leads') {
+      await marketingRollups.recordChanges(changes);
+    }
+    try {
+      const after = { counts: {}, months: {} };
+      const before = { counts: {}, months: {} };
+      changes.forEach(([beforeData, afterData]) => {
+        addInto(after, contribution(kind, afterData));
+        addInto(before, contribution(kind, beforeData));
+      });
+      const delta = difference(after, before);
+      if (isEmpty(delta)) return;
+      await this.applyDelta(delta, Math.floor(Math.random() * SHARD_COUNT));
+    } catch (error) {
+      console.error(`❌ Dashboard counter update failed (${kind}):`, error.message);
+    }
+  }
+
+  async applyDelta(delta, shard) {
+    const update = {};
+    Object.entries(delta.counts).forEach(([field, value]) => {
+      update[field] = FieldValue.increment(value);
+    });
+    if (Object.keys(delta.months).length > 0) {
+      update.revenueByMonth = {};
+      Object.entries(delta.months).forEach(([month, value]) => {
+        update.revenueByMonth[month] = FieldValue.increment(value);
+      });
+    }
+    await this.shardRef(shard).set(update, { merge: true });
+  }
+
+  sumShards(shardDocs) {
+    const total = { counts: {}, months: {} };
+    shardDocs.forEach(doc => {
+      if (!doc.exists) return;
+      const data = doc.data();
+      COUNTERS.forEach(field => {
+        if (data[field] !== undefined) total.counts[field] = (total.counts[field] || 0) + data[field];
+      });
+      addInto(total, { counts: {}, months: data.revenueByMonth || {} });
+    });
+    return total;
+  }
+
+  toStats(total, now = new Date()) {
+    const stats = {};
+    COUNTERS.forEach(field => {
+      stats[field] = total.counts[field] || 0;
+    });
+    return {
+      totalLeads: stats.totalLeads,
+      activeDeals: stats.activeDeals,
+      totalInventory: stats.totalInventory,
+      totalInventoryValue: stats.totalInventoryValue,
+      pendingOrders: stats.pendingOrders,
+      totalReceivables: stats.totalReceivables,
+      thisMonthRevenue: total.months[monthKey(now)] || 0,
+      totalRevenue: stats.totalRevenue,
+      currency: 'INR' // Always report in INR
+    };
+  }
+
+  /**
+   * Dashboard stats from the counter shards. The first call seeds the
+   * counters from the collections.
+   */
+  async getStats() {
+    const [metaDoc, ...shardDocs] = await db.getAll(
+      db.collection(COUNTERS_COLLECTION).doc(META_DOC),
+      ...this.shardRefs()
+    );
+
+    if (!metaDoc.exists) {
+      const result = await this.reconcile();
+      // Another instance is seeding them; answer from the collections meanwhile
+      return this.toStats(result ? result.actual : await this.computeFromCollections());
+    }
+
+    return this.toStats(this.sumShards(shardDocs));
+  }
+
+  /**
+   * Counter totals recomputed from the four collections
+   */
+  async computeFromCollections() {
+    const kinds = {
+      leads: collections.leads,
+      inventory: collections.inventory,
+      orders: collections.orders,
+      receivables: collections.receivables
+    };
+    const snapshots = await Promise.all(Object.values(kinds).map(name => db.collection(name).get()));
+
+    const total = { counts: {}, months: {} };
+    Object.keys(kinds).forEach((kind, i) => {
+      snapshots[i].forEach(doc => addInto(total, contribution(kind, doc.data())));
+    });
+    return total;
+  }
+
+  async acquireLease() {
+    const leaseRef = db.collection(COUNTERS_COLLECTION).doc(LEASE_DOC);
+    return db.runTransaction(async transaction => {
+      const lease = await transaction.get(leaseRef);
+      if (lease.exists && lease.data().expiresAt > Date.now() && lease.data().owner !== this.instanceId) {
+        return false;
+      }
+      transaction.set(leaseRef, { owner: this.instanceId, expiresAt: Date.now() + LEASE_MS });
+      return true;
+    });
+  }
+
+  async releaseLease() {
+    const leaseRef = db.collection(COUNTERS_COLLECTION).doc(LEASE_DOC);
+    await db.runTransaction(async transaction => {
+      const lease = await transaction.get(leaseRef);
+      if (lease.exists && lease.data().owner === this.instanceId) {
+        transaction.set(leaseRef, { owner: null, expiresAt: 0 });
+      }
+    });
+  }
+
+  /**
+   * Recompute the totals and add the drift to a shard. Returns null if
+   * another instance holds the lease. Writes that land between the scan and
+   * the shard read can be corrected twice; the next run evens that out.
+   */
+  async reconcile() {
+    if (!(await this.acquireLease())) {
+      console.log('⏭️ Dashboard counters are being reconciled by another instance');
+      return null;
+    }
+
+    const startTime = Date.now();
+    try {
+      const actual = await this.computeFromCollections();
+      const shardDocs = await db.getAll(...this.shardRefs());
+      const drift = difference(actual, this.sumShards(shardDocs));
+
+      if (!isEmpty(drift)) {
+        await this.applyDelta(drift, 0);
+      }
+
+      const result = {
+        reconciledAt: new Date().toISOString(),
+        processingTimeMs: Date.now() - startTime,
+        drift
+      };
+      await db.collection(COUNTERS_COLLECTION).doc(META_DOC).set(result);
+
+      const driftFields = [...Object.keys(drift.counts), ...Object.keys(drift.months).map(m => `revenue ${m}`)];
+      console.log(`✅ Dashboard counters reconciled in ${result.processingTimeMs}ms` +
+        (driftFields.length ? `, corrected ${driftFields.join(', ')}` : ', no drift'));
+      return { ...result, actual };
+    } finally {
+      await this.releaseLease().catch(error => console.error('❌ Failed to release counter lease:', error.message));
+    }
+  }
+
+  startReconciler(intervalMs) {
+    if (this.reconcileTimer) return;
+    this.reconcileTimer = setInterval(() => {
+      this.reconcile().catch(error => console.error('❌ Dashboard counter reconcile failed:', error.message));
+    }, intervalMs);
+    this.reconcileTimer.unref();
+  }
+
+  stopReconciler() {
+    clearInterval(this.reconcileTimer);
+    this.reconcileTimer = null;
+  }
+}
+
+module.exports = new DashboardCounters();
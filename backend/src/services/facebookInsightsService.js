@@ -1,16 +1,156 @@
 // backend/src/services/facebookInsightsService.js
 const fetch = require('node-fetch');
+const { db } = require('../config/db');
+const { getISTDateString } = require('../utils/dateHelpers');
+
+/**
+ * Facebook Insights Service
+ * Campaign, ad set and platform (Facebook / Instagram) insights for the
+ * marketing dashboard.
+ *
+ * Ranges given as whole days (YYYY-MM-DD) are assembled from per-day
+ * segments: the Graph API is asked only for days no segment holds, with
+ * time_increment=1, and the days are summed. A day that has closed (before
+ * today in the ad account's IST day, plus SETTLE_HOURS for late
+ * attribution) no longer changes, so its segment is kept for good, in
+ * memory and in crm_facebook_insights_days. Today's segment is refetched
+ * after OPEN_DAY_TTL_MS. Requests that need a day another request is
+ * already fetching wait for that fetch.
+ *
+ * Reach counts unique people, so it can't be summed over days: campaign
+ * and ad set reach comes from one call for the whole range (reach only),
+ * cached for cacheExpiry, and CPP is derived from it. CTR and CPM are
+ * derived from the summed daily figures. Ranges that aren't whole days (or
+ * no range at all) are cached whole for cacheExpiry, as before.
+ *
+ * META_GRAPH_API_URL points the service at a stub Graph API
+ * (see test-facebook-insights-cache.js); FACEBOOK_INSIGHTS_STORE=memory
+ * keeps closed days out of Firestore.
+ */
+
+const DAYS_COLLECTION = 'crm_facebook_insights_days';
+const STORE = process.env.FACEBOOK_INSIGHTS_STORE || 'firestore';
+const OPEN_DAY_TTL_MS = parseInt(process.env.FACEBOOK_INSIGHTS_OPEN_DAY_TTL_MS || String(10 * 60 * 1000));
+const SETTLE_HOURS = parseFloat(process.env.FACEBOOK_INSIGHTS_SETTLE_HOURS || '6');
+const CONNECTION_TTL_MS = 15 * 60 * 1000;
+const CONNECTION_FAILURE_TTL_MS = 60 * 1000;
+const MAX_SPAN_DAYS = 31;
+const MAX_MEMORY_SEGMENTS = 5000;
+const PAGE_LIMIT = 500;
+const DAY_MS = 24 * 60 * 60 * 1000;
+const DAY_PATTERN = /^\d{4}-\d{2}-\d{2}$/;
+
+// What each kind of insight asks the Graph API for, and how a row is keyed.
+// Kinds with reach ask for it only for a whole range, never by day.
+const KINDS = {
+  campaigns: {
+    fields: 'campaign_name,campaign_id,impressions,clicks,spend',
+    params: 'level=campaign',
+    reach: 'campaign_name',
+    keyOf: insight => insight.campaign_name,
+    identity: insight => ({ id: insight.campaign_id, name: insight.campaign_name })
+  },
+  adsets: {
+    fields: 'adset_name,adset_id,campaign_name,campaign_id,impressions,clicks,spend',
+    params: 'level=adset',
+    reach: 'adset_name',
+    keyOf: insight => insight.adset_name,
+    identity: insight => ({
+      id: insight.adset_id,
+      name: insight.adset_name,
+      campaign_id: insight.campaign_id,
+      campaign_name: insight.campaign_name
+    })
+  },
+  source: {
+    fields: 'impressions,clicks,spend',
+    params: 'breakdowns=publisher_platform',
+    reach: null,
+    keyOf: insight => insight.publisher_platform,
+    identity: () => ({})
+  }
+};
+
+function isDay(value) {
+  return typeof value === 'string' && DAY_PATTERN.test(value);
+}
+
+function addDays(day, count) {
+  return new Date(Date.parse(`${day}T00:00:00Z`) + count * DAY_MS).toISOString().split('T')[0];
+}
+
+function daysBetween(from, to) {
+  const days = [];
+  for (let day = from; day <= to; day = addDays(day, 1)) days.push(day);
+  return days;
+}
+
+/**
+ * Sunday that starts the week of a day, as the marketing time series keys weeks
+ */
+function weekStart(day) {
+  return addDays(day, -new Date(`${day}T00:00:00Z`).getUTCDay());
+}
+
+/**
+ * Sum per-day segments ({ key: figures }) into one. Reach isn't additive,
+ * so it is left out (segments stored before it was fetched by range may
+ * still carry a daily reach).
+ */
+function sumSegments(segments) {
+  const total = {};
+  segments.forEach(segment => {
+    Object.entries(segment).forEach(([key, { reach, ...figures }]) => {
+      if (!total[key]) total[key] = { ...figures, impressions: 0, clicks: 0, spend: 0 };
+      total[key].impressions += figures.impressions;
+      total[key].clicks += figures.clicks;
+      total[key].spend += figures.spend;
+    });
+  });
+  return total;
+}
+
+function bySource(segment) {
+  const sourceInsights = {
+    'Facebook': { impressions: 0, clicks: 0, spend: 0 },
+    'Instagram': { impressions: 0, clicks: 0, spend: 0 }
+  };
+  [['facebook', 'Facebook'], ['instagram', 'Instagram']].forEach(([platform, source]) => {
+    if (segment[platform]) {
+      sourceInsights[source].impressions = segment[platform].impressions;
+      sourceInsights[source].clicks = segment[platform].clicks;
+      sourceInsights[source].spend = segment[platform].spend;
+    }
+  });
+  return sourceInsights;
+}
 
 class FacebookInsightsService {
   constructor() {
     this.accessToken = process.env.META_PAGE_ACCESS_TOKEN;
     this.appId = process.env.FACEBOOK_APP_ID;
-    this.baseUrl = 'https://graph.facebook.com/v18.0';
-    
+    this.baseUrl = process.env.META_GRAPH_API_URL || 'https://graph.facebook.com/v18.0';
+    this.adAccountId = process.env.META_AD_ACCOUNT_ID || 'act_8731185783571850';
+
     // Cache for storing insights data
     this.cache = new Map();
     this.cacheExpiry = 30 * 60 * 1000; // 30 minutes
-    
+
+    // Per-day segments: `${kind}|${scope}|${day}` -> { entries, fetchedAt, closed }
+    this.segments = new Map();
+    // Days being fetched, same key -> promise of the fetch
+    this.pendingDays = new Map();
+    this.inflight = new Map();
+    this.connection = null;
+    this.stats = {
+      graphCalls: 0,
+      segmentHits: 0,
+      storedHits: 0,
+      daysFetched: 0,
+      coalesced: 0,
+      connectionTests: 0
+    };
+
     console.log('🔵 Facebook Insights Service initialized');
     console.log('🔑 Access token present:', !!this.accessToken);
     console.log('📱 App ID:', this.appId);
@@ -27,107 +167,350 @@ class FacebookInsightsService {
     return Date.now() - cacheEntry.timestamp < this.cacheExpiry;
   }
 
-  // Test Facebook API connection
-  async testConnection() {
+  /**
+   * Share one in-flight promise between identical concurrent calls
+   */
+  coalesce(key, fn) {
+    if (this.inflight.has(key)) {
+      this.stats.coalesced++;
+      return this.inflight.get(key);
+    }
+    const promise = fn().finally(() => this.inflight.delete(key));
+    this.inflight.set(key, promise);
+    return promise;
+  }
+
+  // Test Facebook API connection. The result is reused for CONNECTION_TTL_MS
+  // (CONNECTION_FAILURE_TTL_MS after a failure) unless force is set
+  async testConnection({ force = false } = {}) {
+    if (!force && this.connection) {
+      const ttl = this.connection.result.success ? CONNECTION_TTL_MS : CONNECTION_FAILURE_TTL_MS;
+      if (Date.now() - this.connection.testedAt < ttl) return this.connection.result;
+    }
+
+    return this.coalesce('connection', async () => {
+      const result = await this.runConnectionTest();
+      this.connection = { result, testedAt: Date.now() };
+      return result;
+    });
+  }
+
+  async runConnectionTest() {
     try {
       console.log('🧪 Testing Facebook API connection...');
-      
+      this.stats.connectionTests++;
+
       const response = await fetch(
         `${this.baseUrl}/me?fields=id,name&access_token=${this.accessToken}`
       );
-      
+
       const data = await response.json();
-      
+
       if (!response.ok) {
         console.error('❌ Facebook API test failed:', data);
         return { success: false, error: data.error };
       }
-      
+
       console.log('✅ Facebook API connection successful:', data);
       return { success: true, data };
-      
+
     } catch (error) {
       console.error('❌ Facebook API connection error:', error);
       return { success: false, error: error.message };
     }
   }
 
-  // Get ad account ID from user
+  // Get ad account ID (META_AD_ACCOUNT_ID, or the account that has campaigns)
   async getAdAccountId() {
-    try {
-      console.log('🔍 Fetching ad account ID...');
-      
-      // For now, use the specific ad account that has campaigns
-      // This is a temporary fix - in production, you'd want to make this configurable
-      const AD_ACCOUNT_WITH_CAMPAIGNS = 'act_8731185783571850';
-      
-      console.log(`✅ Using ad account with campaigns: ${AD_ACCOUNT_WITH_CAMPAIGNS}`);
-      return AD_ACCOUNT_WITH_CAMPAIGNS;
-      
-    } catch (error) {
-      console.error('❌ Error getting ad account:', error);
-      throw error;
+    return this.adAccountId;
+  }
+
+  /**
+   * GET an insights URL, following paging.next; returns all rows
+   */
+  async fetchInsightRows(url) {
+    const rows = [];
+    let next = `${url}&access_token=${this.accessToken}`;
+    while (next) {
+      this.stats.graphCalls++;
+      const response = await fetch(next);
+      if (!response.ok) {
+        const error = await response.json();
+        throw new Error(`Facebook API Error: ${JSON.stringify(error)}`);
+      }
+      const data = await response.json();
+      if (data.data) rows.push(...data.data);
+      next = data.paging && data.paging.next;
     }
+    return rows;
   }
 
-  // Get insights for all campaigns
-  async getCampaignInsights(dateFrom, dateTo) {
-    const cacheKey = this.getCacheKey({ type: 'campaigns', dateFrom, dateTo });
+  /**
+   * Figures for one insight row, keyed as KINDS[kind] keys them
+   */
+  toFigures(kind, insight) {
+    return {
+      ...KINDS[kind].identity(insight),
+      impressions: parseInt(insight.impressions || 0),
+      clicks: parseInt(insight.clicks || 0),
+      spend: parseFloat(insight.spend || 0)
+    };
+  }
+
+  /**
+   * Insights rows for a whole range in one call (no per-day breakdown)
+   */
+  async fetchRangeRows(query, dateFrom, dateTo, campaignId) {
+    const adAccountId = await this.getAdAccountId();
+    let url = `${this.baseUrl}/${adAccountId}/insights?${query}&limit=${PAGE_LIMIT}`;
+    if (dateFrom && dateTo) {
+      url += `&time_range={'since':'${dateFrom}','until':'${dateTo}'}`;
+    }
+    if (campaignId) {
+      url += `&filtering=[{'field':'campaign_id','operator':'IN','value':['${campaignId}']}]`;
+    }
+    return this.fetchInsightRows(url);
+  }
+
+  /**
+   * Insights for a range that isn't whole days, reach included
+   */
+  async fetchRange(kind, dateFrom, dateTo, campaignId) {
+    const { fields, params, reach } = KINDS[kind];
+    const rows = await this.fetchRangeRows(`fields=${fields}${reach ? ',reach' : ''}&${params}`, dateFrom, dateTo, campaignId);
+    const totals = {};
+    rows.forEach(insight => {
+      totals[KINDS[kind].keyOf(insight)] = {
+        ...this.toFigures(kind, insight),
+        ...(reach ? { reach: parseInt(insight.reach || 0) } : {})
+      };
+    });
+    return totals;
+  }
+
+  /**
+   * Reach per campaign or ad set over a whole range, from one call cached
+   * for cacheExpiry
+   */
+  async getRangeReach(kind, dateFrom, dateTo, campaignId) {
+    const cacheKey = this.getCacheKey({ type: `${kind}-reach`, dateFrom, dateTo, campaignId });
     const cachedData = this.cache.get(cacheKey);
-    
     if (this.isCacheValid(cachedData)) {
-      console.log('📊 Returning cached campaign insights');
       return cachedData.data;
     }
+    return this.coalesce(cacheKey, async () => {
+      const { params, reach: keyField } = KINDS[kind];
+      const rows = await this.fetchRangeRows(`fields=${keyField},reach&${params}`, dateFrom, dateTo, campaignId);
+      const data = {};
+      rows.forEach(insight => {
+        data[insight[keyField]] = parseInt(insight.reach || 0);
+      });
+      this.cache.set(cacheKey, { data, timestamp: Date.now() });
+      return data;
+    });
+  }
+
+  /**
+   * Fetch days since..until with one segment per day and store them
+   */
+  async fetchSpan(kind, scope, since, until) {
+    const adAccountId = await this.getAdAccountId();
+    let url = `${this.baseUrl}/${adAccountId}/insights?fields=${KINDS[kind].fields}&${KINDS[kind].params}&time_increment=1&limit=${PAGE_LIMIT}` +
+      `&time_range={'since':'${since}','until':'${until}'}`;
+    if (scope !== 'all') {
+      url += `&filtering=[{'field':'campaign_id','operator':'IN','value':['${scope}']}]`;
+    }
+
+    console.log(`🚀 Fetching ${kind} insights by day: ${since} to ${until}${scope !== 'all' ? ` (campaign ${scope})` : ''}`);
+    const rows = await this.fetchInsightRows(url);
+
+    // Days without delivery have no rows; they are stored empty
+    const byDay = {};
+    daysBetween(since, until).forEach(day => {
+      byDay[day] = [];
+    });
+    rows.forEach(insight => {
+      if (byDay[insight.date_start]) {
+        byDay[insight.date_start].push({ [KINDS[kind].keyOf(insight)]: this.toFigures(kind, insight) });
+      }
+    });
+
+    const fetchedAt = Date.now();
+    const closedDays = [];
+    Object.entries(byDay).forEach(([day, segments]) => {
+      const segment = { entries: sumSegments(segments), fetchedAt, closed: this.isClosed(day) };
+      this.remember(`${kind}|${scope}|${day}`, segment);
+      if (segment.closed) closedDays.push([day, segment]);
+    });
+    this.stats.daysFetched += Object.keys(byDay).length;
+    await this.storeClosedDays(kind, scope, closedDays);
+  }
+
+  /**
+   * Whether a day's figures are final: it ended SETTLE_HOURS or more ago
+   * (IST, the ad account's day)
+   */
+  isClosed(day) {
+    return day < getISTDateString(new Date(Date.now() - SETTLE_HOURS * 60 * 60 * 1000));
+  }
+
+  remember(key, segment) {
+    this.segments.delete(key);
+    this.segments.set(key, segment);
+    while (this.segments.size > MAX_MEMORY_SEGMENTS) {
+      this.segments.delete(this.segments.keys().next().value);
+    }
+  }
+
+  storedRef(kind, scope, day) {
+    return db.collection(DAYS_COLLECTION).doc(`${kind}_${scope}_${day}`);
+  }
 
+  async loadStoredDays(kind, scope, days) {
+    if (STORE !== 'firestore' || days.length === 0) return;
     try {
-      console.log('🚀 Fetching campaign insights...', { dateFrom, dateTo });
-      
-      const adAccountId = await this.getAdAccountId();
-      
-      let url = `${this.baseUrl}/${adAccountId}/insights?fields=campaign_name,campaign_id,impressions,reach,clicks,spend,ctr&level=campaign`;
-      
-      if (dateFrom && dateTo) {
-        url += `&time_range={'since':'${dateFrom}','until':'${dateTo}'}`;
+      const docs = await db.getAll(...days.map(day => this.storedRef(kind, scope, day)));
+      docs.forEach((doc, index) => {
+        if (!doc.exists) return;
+        const data = doc.data();
+        this.remember(`${kind}|${scope}|${days[index]}`, { entries: data.entries, fetchedAt: data.fetchedAt, closed: true });
+        this.stats.storedHits++;
+      });
+    } catch (error) {
+      // Fetch them from Facebook instead
+      console.error('❌ Failed to read stored insight days:', error.message);
+    }
+  }
+
+  async storeClosedDays(kind, scope, closedDays) {
+    if (STORE !== 'firestore' || closedDays.length === 0) return;
+    try {
+      for (let i = 0; i < closedDays.length; i += 500) {
+        const batch = db.batch();
+        closedDays.slice(i, i + 500).forEach(([day, segment]) => {
+          batch.set(this.storedRef(kind, scope, day), {
+            kind,
+            scope,
+            day,
+            entries: segment.entries,
+            fetchedAt: segment.fetchedAt
+          });
+        });
+        await batch.commit();
       }
-      
-      const response = await fetch(`${url}&access_token=${this.accessToken}`);
-      
-      if (!response.ok) {
-        const error = await response.json();
-        console.error('❌ Campaign insights error:', error);
-        throw new Error(`Facebook API Error: ${JSON.stringify(error)}`);
+    } catch (error) {
+      // They stay in memory; another instance will fetch them again
+      console.error('❌ Failed to store insight days:', error.message);
+    }
+  }
+
+  /**
+   * Per-day segments for dateFrom..dateTo, fetching only the days no
+   * segment (or fetch in flight) covers. Days after today are empty.
+   */
+  async getDaySegments(kind, dateFrom, dateTo, campaignId = null) {
+    const scope = campaignId || 'all';
+    const today = getISTDateString(new Date());
+    const days = daysBetween(dateFrom, dateTo > today ? today : dateTo);
+    const keyOf = day => `${kind}|${scope}|${day}`;
+    const isFresh = segment => segment && (segment.closed || Date.now() - segment.fetchedAt < OPEN_DAY_TTL_MS);
+
+    let missing = days.filter(day => !isFresh(this.segments.get(keyOf(day))));
+    this.stats.segmentHits += days.length - missing.length;
+    await this.loadStoredDays(kind, scope, missing.filter(day => this.isClosed(day) && !this.pendingDays.has(keyOf(day))));
+    missing = missing.filter(day => !isFresh(this.segments.get(keyOf(day))));
+
+    const waits = new Set();
+    const toFetch = [];
+    missing.forEach(day => {
+      if (this.pendingDays.has(keyOf(day))) {
+        this.stats.coalesced++;
+        waits.add(this.pendingDays.get(keyOf(day)));
+      } else {
+        toFetch.push(day);
       }
-      
-      const data = await response.json();
-      console.log(`📊 Found ${data.data?.length || 0} campaigns with insights`);
-      
-      // Process the data
-      const campaigns = {};
-      if (data.data) {
-        data.data.forEach(insight => {
-          campaigns[insight.campaign_name] = {
-            id: insight.campaign_id,
-            name: insight.campaign_name,
-            impressions: parseInt(insight.impressions || 0),
-            reach: parseInt(insight.reach || 0),
-            clicks: parseInt(insight.clicks || 0),
-            spend: parseFloat(insight.spend || 0),
-            ctr: parseFloat(insight.ctr || 0)
-          };
-          console.log(`✅ Campaign: ${insight.campaign_name} - ${insight.impressions} impressions`);
+    });
+
+    // Contiguous runs of missing days, at most MAX_SPAN_DAYS each
+    const spans = [];
+    toFetch.forEach(day => {
+      const span = spans[spans.length - 1];
+      if (span && addDays(span.until, 1) === day && span.days.length < MAX_SPAN_DAYS) {
+        span.until = day;
+        span.days.push(day);
+      } else {
+        spans.push({ since: day, until: day, days: [day] });
+      }
+    });
+    spans.forEach(span => {
+      const fetching = this.fetchSpan(kind, scope, span.since, span.until)
+        .finally(() => span.days.forEach(day => this.pendingDays.delete(keyOf(day))));
+      span.days.forEach(day => this.pendingDays.set(keyOf(day), fetching));
+      waits.add(fetching);
+    });
+    await Promise.all(waits);
+
+    return days.map(day => {
+      const segment = this.segments.get(keyOf(day));
+      if (!segment) throw new Error(`Facebook insights for ${day} could not be fetched`);
+      return { day, entries: segment.entries };
+    });
+  }
+
+  /**
+   * Summed insights for a range: from day segments (plus range reach) when
+   * it is whole days, otherwise one range call cached for cacheExpiry
+   */
+  async getRangeTotals(kind, dateFrom, dateTo, campaignId = null) {
+    if (isDay(dateFrom) && isDay(dateTo) && dateFrom <= dateTo) {
+      const [segments, reach] = await Promise.all([
+        this.getDaySegments(kind, dateFrom, dateTo, campaignId),
+        KINDS[kind].reach ? this.getRangeReach(kind, dateFrom, dateTo, campaignId) : null
+      ]);
+      const totals = sumSegments(segments.map(segment => segment.entries));
+      if (reach) {
+        Object.entries(totals).forEach(([key, figures]) => {
+          figures.reach = reach[key] || 0;
         });
       }
-      
-      // Cache the results
-      this.cache.set(cacheKey, {
-        data: campaigns,
-        timestamp: Date.now()
+      return totals;
+    }
+
+    const cacheKey = this.getCacheKey({ type: kind, dateFrom, dateTo, campaignId });
+    const cachedData = this.cache.get(cacheKey);
+    if (this.isCacheValid(cachedData)) {
+      return cachedData.data;
+    }
+    return this.coalesce(cacheKey, async () => {
+      const data = await this.fetchRange(kind, dateFrom, dateTo, campaignId);
+      this.cache.set(cacheKey, { data, timestamp: Date.now() });
+      return data;
+    });
+  }
+
+  // Get insights for all campaigns
+  async getCampaignInsights(dateFrom, dateTo) {
+    try {
+      console.log('🚀 Getting campaign insights...', { dateFrom, dateTo });
+      const totals = await this.getRangeTotals('campaigns', dateFrom, dateTo);
+
+      // Process the data
+      const campaigns = {};
+      Object.entries(totals).forEach(([name, insight]) => {
+        campaigns[name] = {
+          id: insight.id,
+          name: insight.name,
+          impressions: insight.impressions,
+          reach: insight.reach,
+          clicks: insight.clicks,
+          spend: insight.spend,
+          ctr: insight.impressions > 0 ? (insight.clicks / insight.impressions) * 100 : 0
+        };
       });
-      
-      console.log(`✅ Fetched insights for ${Object.keys(campaigns).length} campaigns`);
+
+      console.log(`✅ Insights for ${Object.keys(campaigns).length} campaigns`);
       return campaigns;
-      
+
     } catch (error) {
       console.error('❌ Error fetching campaign insights:', error);
       throw error;
@@ -136,181 +519,67 @@ class FacebookInsightsService {
 
   // Get insights for all ad sets
   async getAdSetInsights(dateFrom, dateTo, campaignId = null) {
-    const cacheKey = this.getCacheKey({ type: 'adsets', dateFrom, dateTo, campaignId });
-    const cachedData = this.cache.get(cacheKey);
-    
-    if (this.isCacheValid(cachedData)) {
-      console.log('📊 Returning cached ad set insights');
-      return cachedData.data;
-    }
-
     try {
-      console.log('🚀 Fetching ad set insights...', { dateFrom, dateTo, campaignId });
-      
-      const adAccountId = await this.getAdAccountId();
-      
-      let url = `${this.baseUrl}/${adAccountId}/insights?fields=adset_name,adset_id,campaign_name,campaign_id,impressions,reach,clicks,spend,ctr,cpm,cpp&level=adset`;
-      
-      if (dateFrom && dateTo) {
-        url += `&time_range={'since':'${dateFrom}','until':'${dateTo}'}`;
-      }
-      
-      if (campaignId) {
-        url += `&filtering=[{'field':'campaign_id','operator':'IN','value':['${campaignId}']}]`;
-      }
-      
-      const response = await fetch(`${url}&access_token=${this.accessToken}`);
-      
-      if (!response.ok) {
-        const error = await response.json();
-        console.error('❌ Ad set insights error:', error);
-        throw new Error(`Facebook API Error: ${JSON.stringify(error)}`);
-      }
-      
-      const data = await response.json();
-      console.log(`📊 Found ${data.data?.length || 0} ad sets with insights`);
-      
+      console.log('🚀 Getting ad set insights...', { dateFrom, dateTo, campaignId });
+      const totals = await this.getRangeTotals('adsets', dateFrom, dateTo, campaignId);
+
       // Process the data
       const adSets = {};
-      if (data.data) {
-        data.data.forEach(insight => {
-          adSets[insight.adset_name] = {
-            id: insight.adset_id,
-            name: insight.adset_name,
-            campaign_id: insight.campaign_id,
-            campaign_name: insight.campaign_name,
-            impressions: parseInt(insight.impressions || 0),
-            reach: parseInt(insight.reach || 0),
-            clicks: parseInt(insight.clicks || 0),
-            spend: parseFloat(insight.spend || 0),
-            ctr: parseFloat(insight.ctr || 0),
-            cpm: parseFloat(insight.cpm || 0),
-            cpp: parseFloat(insight.cpp || 0)
-          };
-          console.log(`✅ Ad Set: ${insight.adset_name} - ${insight.impressions} impressions, ₹${insight.spend} spend`);
-        });
-      }
-      
-      // Cache the results
-      this.cache.set(cacheKey, {
-        data: adSets,
-        timestamp: Date.now()
+      Object.entries(totals).forEach(([name, insight]) => {
+        adSets[name] = {
+          id: insight.id,
+          name: insight.name,
+          campaign_id: insight.campaign_id,
+          campaign_name: insight.campaign_name,
+          impressions: insight.impressions,
+          reach: insight.reach,
+          clicks: insight.clicks,
+          spend: insight.spend,
+          ctr: insight.impressions > 0 ? (insight.clicks / insight.impressions) * 100 : 0,
+          cpm: insight.impressions > 0 ? (insight.spend / insight.impressions) * 1000 : 0,
+          cpp: insight.reach > 0 ? (insight.spend / insight.reach) * 1000 : 0
+        };
       });
-      
-      console.log(`✅ Fetched insights for ${Object.keys(adSets).length} ad sets`);
+
+      console.log(`✅ Insights for ${Object.keys(adSets).length} ad sets`);
       return adSets;
-      
+
     } catch (error) {
       console.error('❌ Error fetching ad set insights:', error);
       throw error;
     }
   }
 
-  // Get aggregated insights by source (Facebook vs Instagram)
+  // Get aggregated insights by source (Facebook vs Instagram), impressions only
   async getInsightsBySource(dateFrom, dateTo) {
-    const cacheKey = this.getCacheKey({ type: 'source', dateFrom, dateTo });
-    const cachedData = this.cache.get(cacheKey);
-    
-    if (this.isCacheValid(cachedData)) {
-      console.log('📊 Returning cached source insights');
-      return cachedData.data;
-    }
+    const sourceInsights = await this.getFullSourceInsights(dateFrom, dateTo);
 
-    try {
-      console.log('🚀 Fetching insights by source...', { dateFrom, dateTo });
-      
-      const adAccountId = await this.getAdAccountId();
-      
-      let url = `${this.baseUrl}/${adAccountId}/insights?fields=impressions,clicks,spend&breakdowns=publisher_platform`;
-      
-      if (dateFrom && dateTo) {
-        url += `&time_range={'since':'${dateFrom}','until':'${dateTo}'}`;
-      }
-      
-      const response = await fetch(`${url}&access_token=${this.accessToken}`);
-      
-      if (!response.ok) {
-        const error = await response.json();
-        console.error('❌ Source insights error:', error);
-        throw new Error(`Facebook API Error: ${JSON.stringify(error)}`);
-      }
-      
-      const data = await response.json();
-      console.log('📊 Source insights raw data:', data);
-      
-      // Process the data
-      const sourceInsights = {
-        'Facebook': { impressions: 0, clicks: 0, spend: 0 },
-        'Instagram': { impressions: 0, clicks: 0, spend: 0 }
-      };
-      
-      if (data.data) {
-        data.data.forEach(insight => {
-          const platform = insight.publisher_platform;
-          if (platform === 'facebook') {
-            sourceInsights['Facebook'].impressions += parseInt(insight.impressions || 0);
-            sourceInsights['Facebook'].clicks += parseInt(insight.clicks || 0);
-            sourceInsights['Facebook'].spend += parseFloat(insight.spend || 0);
-          } else if (platform === 'instagram') {
-            sourceInsights['Instagram'].impressions += parseInt(insight.impressions || 0);
-            sourceInsights['Instagram'].clicks += parseInt(insight.clicks || 0);
-            sourceInsights['Instagram'].spend += parseFloat(insight.spend || 0);
-          }
-        });
-      }
-      
-      // For backward compatibility, also return just impressions
-      const impressionsOnly = {
-        'Facebook': sourceInsights['Facebook'].impressions,
-        'Instagram': sourceInsights['Instagram'].impressions
-      };
-      
-      // Cache the results
-      this.cache.set(cacheKey, {
-        data: impressionsOnly,
-        fullData: sourceInsights,
-        timestamp: Date.now()
-      });
-      
-      console.log('✅ Fetched insights by source:', sourceInsights);
-      return impressionsOnly;
-      
-    } catch (error) {
-      console.error('❌ Error fetching source insights:', error);
-      // Return zeros instead of throwing
-      return { 'Facebook': 0, 'Instagram': 0 };
-    }
+    // For backward compatibility, also return just impressions
+    return {
+      'Facebook': sourceInsights['Facebook'].impressions,
+      'Instagram': sourceInsights['Instagram'].impressions
+    };
   }
 
   // Get full source insights including spend and clicks
   async getFullSourceInsights(dateFrom, dateTo) {
-    const cacheKey = this.getCacheKey({ type: 'source', dateFrom, dateTo });
-    const cachedData = this.cache.get(cacheKey);
-    
-    if (this.isCacheValid(cachedData) && cachedData.fullData) {
-      console.log('📊 Returning cached full source insights');
-      return cachedData.fullData;
+    try {
+      return bySource(await this.getRangeTotals('source', dateFrom, dateTo));
+    } catch (error) {
+      console.error('❌ Error fetching source insights:', error);
+      // Return zeros instead of throwing
+      return bySource({});
     }
-    
-    // If not cached, fetch it
-    await this.getInsightsBySource(dateFrom, dateTo);
-    
-    // Now get from cache
-    const newCachedData = this.cache.get(cacheKey);
-    return newCachedData?.fullData || {
-      'Facebook': { impressions: 0, clicks: 0, spend: 0 },
-      'Instagram': { impressions: 0, clicks: 0, spend: 0 }
-    };
   }
 
   // Get insights for specific ad sets by their IDs
   async getSpecificAdSetInsights(adSetNames, dateFrom, dateTo) {
     try {
       console.log('🔍 Getting insights for specific ad sets:', adSetNames);
-      
+
       // First, get all ad sets to find matching IDs
       const allAdSets = await this.getAdSetInsights(dateFrom, dateTo);
-      
+
       const matchingInsights = {};
       adSetNames.forEach(name => {
         // Try exact match first
@@ -322,7 +591,7 @@ class FacebookInsightsService {
           let found = false;
           Object.keys(allAdSets).forEach(adSetName => {
             if (!found && (
-              adSetName.toLowerCase().includes(name.toLowerCase()) || 
+              adSetName.toLowerCase().includes(name.toLowerCase()) ||
               name.toLowerCase().includes(adSetName.toLowerCase())
             )) {
               matchingInsights[name] = allAdSets[adSetName].impressions;
@@ -330,16 +599,16 @@ class FacebookInsightsService {
               found = true;
             }
           });
-          
+
           if (!found) {
             console.log(`⚠️ No match found for ad set: ${name}`);
             matchingInsights[name] = 0;
           }
         }
       });
-      
+
       return matchingInsights;
-      
+
     } catch (error) {
       console.error('❌ Error fetching specific ad set insights:', error);
       // Return zeros for all requested ad sets
@@ -349,96 +618,74 @@ class FacebookInsightsService {
     }
   }
 
-  // Get time-series insights for charting
+  // Get time-series insights for charting: Facebook / Instagram figures per
+  // day, or per week starting Sunday
   async getTimeSeriesInsights(dateFrom, dateTo, granularity = 'daily') {
+    const timeSeriesData = {};
+    if (!isDay(dateFrom) || !isDay(dateTo) || dateFrom > dateTo) {
+      return timeSeriesData;
+    }
+    const bucketOf = day => (granularity === 'weekly' ? weekStart(day) : day);
+    daysBetween(dateFrom, dateTo).forEach(day => {
+      timeSeriesData[bucketOf(day)] = bySource({});
+    });
+
     try {
       console.log('📊 Getting time-series insights:', { dateFrom, dateTo, granularity });
-      
-      // Get aggregated insights for the period
-      const sourceInsights = await this.getFullSourceInsights(dateFrom, dateTo);
-      
-      // Create date range
-      const startDate = new Date(dateFrom);
-      const endDate = new Date(dateTo);
-      const currentDate = new Date(startDate);
-      const timeSeriesData = {};
-      
-      // Calculate number of days in the period
-      const daysDiff = Math.ceil((endDate - startDate) / (1000 * 60 * 60 * 24)) + 1;
-      
-      // Get daily averages from total data
-      const fbDailyAvg = {
-        impressions: sourceInsights.Facebook ? Math.round(sourceInsights.Facebook.impressions / daysDiff) : 0,
-        clicks: sourceInsights.Facebook ? Math.round(sourceInsights.Facebook.clicks / daysDiff) : 0,
-        spend: sourceInsights.Facebook ? (sourceInsights.Facebook.spend / daysDiff).toFixed(2) : 0
-      };
-      
-      const igDailyAvg = {
-        impressions: sourceInsights.Instagram ? Math.round(sourceInsights.Instagram.impressions / daysDiff) : 0,
-        clicks: sourceInsights.Instagram ? Math.round(sourceInsights.Instagram.clicks / daysDiff) : 0,
-        spend: sourceInsights.Instagram ? (sourceInsights.Instagram.spend / daysDiff).toFixed(2) : 0
-      };
-      
-      // Fill time series with averaged data (with some variation)
-      while (currentDate <= endDate) {
-        const dateKey = currentDate.toISOString().split('T')[0];
-        
-        // Add some random variation to make it look more realistic (±20%)
-        const fbVariation = 0.8 + Math.random() * 0.4;
-        const igVariation = 0.8 + Math.random() * 0.4;
-        
-        timeSeriesData[dateKey] = {
-          Facebook: {
-            impressions: Math.round(fbDailyAvg.impressions * fbVariation),
-            clicks: Math.round(fbDailyAvg.clicks * fbVariation),
-            spend: parseFloat((fbDailyAvg.spend * fbVariation).toFixed(2))
-          },
-          Instagram: {
-            impressions: Math.round(igDailyAvg.impressions * igVariation),
-            clicks: Math.round(igDailyAvg.clicks * igVariation),
-            spend: parseFloat((igDailyAvg.spend * igVariation).toFixed(2))
-          }
-        };
-        
-        // Move to next day/week
-        if (granularity === 'weekly') {
-          currentDate.setDate(currentDate.getDate() + 7);
-        } else {
-          currentDate.setDate(currentDate.getDate() + 1);
-        }
-      }
-      
-      return timeSeriesData;
-      
+      const segments = await this.getDaySegments('source', dateFrom, dateTo);
+      segments.forEach(({ day, entries }) => {
+        const bucket = timeSeriesData[bucketOf(day)];
+        const daily = bySource(entries);
+        ['Facebook', 'Instagram'].forEach(source => {
+          bucket[source].impressions += daily[source].impressions;
+          bucket[source].clicks += daily[source].clicks;
+          bucket[source].spend = parseFloat((bucket[source].spend + daily[source].spend).toFixed(2));
+        });
+      });
     } catch (error) {
+      // Zeros for the period
       console.error('❌ Error getting time-series insights:', error);
-      // Return empty structure with zeros
-      const timeSeriesData = {};
-      const currentDate = new Date(dateFrom);
-      const endDate = new Date(dateTo);
-      
-      while (currentDate <= endDate) {
-        const dateKey = currentDate.toISOString().split('T')[0];
-        timeSeriesData[dateKey] = {
-          Facebook: { impressions: 0, clicks: 0, spend: 0 },
-          Instagram: { impressions: 0, clicks: 0, spend: 0 }
-        };
-        
-        if (granularity === 'weekly') {
-          currentDate.setDate(currentDate.getDate() + 7);
-        } else {
-          currentDate.setDate(currentDate.getDate() + 1);
-        }
-      }
-      
-      return timeSeriesData;
     }
+    return timeSeriesData;
   }
 
-  // Clear cache
-  clearCache() {
+  // Clear cache. Closed days stored in Firestore are kept unless stored is
+  // set, since they don't change
+  async clearCache({ stored = false } = {}) {
     this.cache.clear();
-    console.log('🧹 Facebook insights cache cleared');
+    this.segments.clear();
+    this.connection = null;
+    if (stored && STORE === 'firestore') {
+      let snapshot;
+      do {
+        snapshot = await db.collection(DAYS_COLLECTION).limit(500).get();
+        if (snapshot.empty) break;
+        const batch = db.batch();
+        snapshot.docs.forEach(doc => batch.delete(doc.ref));
+        await batch.commit();
+      } while (snapshot.size === 500);
+    }
+    console.log(`🧹 Facebook insights cache cleared${stored ? ' (including stored days)' : ''}`);
+  }
+
+  status() {
+    let closed = 0;
+    this.segments.forEach(segment => {
+      if (segment.closed) closed++;
+    });
+    return {
+      store: STORE,
+      segments: this.segments.size,
+      closedSegments: closed,
+      openSegments: this.segments.size - closed,
+      rangeEntries: this.cache.size,
+      fetching: this.inflight.size + new Set(this.pendingDays.values()).size,
+      openDayTtlMinutes: OPEN_DAY_TTL_MS / 60000,
+      connection: this.connection
+        ? { success: this.connection.result.success, testedAt: new Date(this.connection.testedAt).toISOString() }
+        : null,
+      ...this.stats
+    };
   }
 }
 
@@ -0,0 +1,221 @@
+const fs = require('fs');
+const path = require('path');
+const firestoreTracker = require('./firestoreTracker');
+
+/**
+ * Firestore Profiler
+ * Opt-in (FIRESTORE_PROFILER=warn or error) checks on the calls counted by
+ * firestoreTracker, each attributed to its route and the source line that
+ * made it:
+ * - unbounded reads: a query with no where() and no limit() on a
+ *   collection firestore-sizes.json lists at SCAN_LIMIT documents or more,
+ *   or that returned that many
+ * - N+1: one source line running the same query or document read
+ *   N_PLUS_ONE_MIN times or more in a request, typically a lookup per row
+ *   inside a loop
+ * - read budgets: a route that declared readBudget(n) (middleware/
+ *   instrumentation) reading more than n documents. In error mode the call
+ *   that crosses the budget fails, so tests and staging catch it.
+ *
+ * Each finding is logged once, and everything is summarised by route in
+ * a JSON report (FIRESTORE_PROFILE_FILE, default firestore-profile.json)
+ * rewritten a second after activity and on exit. The profiler works the
+ * same against the emulator (FIRESTORE_EMULATOR_HOST), so a test run can
+ * read the report afterwards.
+ */
+
+const MODE = process.env.FIRESTORE_PROFILER || 'off';
+const REPORT_FILE = path.resolve(process.env.FIRESTORE_PROFILE_FILE || 'firestore-profile.json');
+const SIZES_FILE = process.env.FIRESTORE_SIZES_FILE || path.resolve(__dirname, '../../firestore-sizes.json');
+const SCAN_LIMIT = parseInt(process.env.FIRESTORE_PROFILER_SCAN_LIMIT || '1000');
+const N_PLUS_ONE_MIN = parseInt(process.env.FIRESTORE_PROFILER_N_PLUS_ONE || '10');
+// Applies to routes that don't declare one; 0 for none
+const DEFAULT_READ_BUDGET = parseInt(process.env.FIRESTORE_READ_BUDGET || '0');
+const REPORT_DELAY_MS = 1000;
+
+// Calls that read, and so can repeat per row
+const READ_OPS = ['query', 'count', 'doc', 'transaction'];
+
+class ReadBudgetExceededError extends Error {
+  constructor(route, budget, reads) {
+    super(`Read budget exceeded on ${route}: ${reads} documents read, budget ${budget}`);
+    this.name = 'ReadBudgetExceededError';
+    this.code = 'READ_BUDGET_EXCEEDED';
+  }
+}
+
+function loadCollectionSizes() {
+  try {
+    const config = JSON.parse(fs.readFileSync(SIZES_FILE, 'utf8'));
+    return config.collection_sizes || {};
+  } catch (error) {
+    console.warn(`⚠️ Firestore profiler: no collection sizes from ${SIZES_FILE} (${error.message})`);
+    return {};
+  }
+}
+
+class FirestoreProfiler {
+  constructor() {
+    this.started = false;
+    this.collectionSizes = {};
+    this.routes = new Map();
+    this.findings = new Map();
+    this.reportTimer = null;
+  }
+
+  get enabled() {
+    return MODE === 'warn' || MODE === 'error';
+  }
+
+  start() {
+    if (this.started || !this.enabled) return;
+    this.started = true;
+    this.collectionSizes = loadCollectionSizes();
+
+    firestoreTracker.observe({
+      call: (context, call) => this.onCall(context, call),
+      finish: context => this.onFinish(context)
+    });
+    process.on('exit', () => this.writeReport());
+    console.log(`🔬 Firestore profiler on (${MODE}), reporting to ${REPORT_FILE}`);
+  }
+
+  budgetFor(context) {
+    return context.readBudget || DEFAULT_READ_BUDGET;
+  }
+
+  onCall(context, call) {
+    if (call.op === 'write') return;
+
+    let unbounded = null;
+    if (call.op === 'query' && call.target) {
+      const shape = firestoreTracker.shapeOf(call.target);
+      const collectionSize = this.collectionSizes[shape.collection] || 0;
+      if (firestoreTracker.unbounded(shape) && (collectionSize >= SCAN_LIMIT || call.reads >= SCAN_LIMIT)) {
+        unbounded = { collectionSize, reads: call.reads };
+      }
+    }
+
+    if (context === firestoreTracker.background) {
+      if (unbounded) this.addFinding('unbounded', 'background', call, unbounded);
+      return;
+    }
+
+    if (READ_OPS.includes(call.op)) {
+      if (!context.profile) context.profile = new Map();
+      const key = `${call.site}|${call.op} ${call.shape}`;
+      let entry = context.profile.get(key);
+      if (!entry) {
+        entry = { site: call.site, op: call.op, shape: call.shape, count: 0, reads: 0, unbounded: null };
+        context.profile.set(key, entry);
+      }
+      entry.count++;
+      entry.reads += call.reads || 0;
+      if (unbounded) entry.unbounded = unbounded;
+    }
+
+    const budget = this.budgetFor(context);
+    if (MODE === 'error' && budget && context.reads > budget && !context.budgetRaised) {
+      context.budgetRaised = true;
+      throw new ReadBudgetExceededError(context.budgetRoute || context.request, budget, context.reads);
+    }
+  }
+
+  onFinish(context) {
+    const route = `${context.method} ${context.route}`;
+    const stats = this.routes.get(route) || { requests: 0, reads: 0, maxReads: 0, writes: 0, budget: null, overBudget: 0 };
+    stats.requests++;
+    stats.reads += context.reads;
+    stats.maxReads = Math.max(stats.maxReads, context.reads);
+    stats.writes += context.writes;
+
+    const budget = this.budgetFor(context);
+    if (budget) {
+      stats.budget = budget;
+      if (context.reads > budget) {
+        stats.overBudget++;
+        this.addFinding('budget', route, {}, { budget, reads: context.reads });
+      }
+    }
+    this.routes.set(route, stats);
+
+    (context.profile || new Map()).forEach(entry => {
+      if (entry.unbounded) {
+        this.addFinding('unbounded', route, entry, entry.unbounded);
+      }
+      if (entry.count >= N_PLUS_ONE_MIN) {
+        this.addFinding('n+1', route, entry, { calls: entry.count, reads: entry.reads });
+      }
+    });
+    this.scheduleReport();
+  }
+
+  /**
+   * Record a finding; the first occurrence of each is logged
+   */
+  addFinding(type, route, call, figures) {
+    const key = [type, route, call.site, call.op, call.shape].join('|');
+    let finding = this.findings.get(key);
+    if (!finding) {
+      finding = {
+        type,
+        route,
+        site: call.site || null,
+        op: call.op || null,
+        shape: call.shape || null,
+        occurrences: 0,
+        firstSeen: new Date().toISOString()
+      };
+      this.findings.set(key, finding);
+      console.warn(`🔬 Firestore ${type} on ${route}${call.site ? ` at ${call.site}` : ''}: ` +
+        `${call.shape ? `${call.op} ${call.shape}, ` : ''}${Object.entries(figures).map(([name, value]) => `${name} ${value}`).join(', ')}`);
+    }
+    finding.occurrences++;
+    finding.lastSeen = new Date().toISOString();
+    Object.entries(figures).forEach(([name, value]) => {
+      // Limits are kept as they are, measurements as their worst case
+      const field = name === 'budget' || name === 'collectionSize' ? name : `max${name[0].toUpperCase()}${name.slice(1)}`;
+      finding[field] = Math.max(finding[field] || 0, value);
+    });
+    this.scheduleReport();
+  }
+
+  scheduleReport() {
+    if (this.reportTimer) return;
+    this.reportTimer = setTimeout(() => {
+      this.reportTimer = null;
+      this.writeReport();
+    }, REPORT_DELAY_MS);
+    this.reportTimer.unref();
+  }
+
+  report() {
+    return {
+      generatedAt: new Date().toISOString(),
+      mode: MODE,
+      thresholds: { scanLimit: SCAN_LIMIT, nPlusOne: N_PLUS_ONE_MIN, defaultReadBudget: DEFAULT_READ_BUDGET || null },
+      routes: Object.fromEntries(this.routes),
+      background: {
+        reads: firestoreTracker.background.reads,
+        writes: firestoreTracker.background.writes
+      },
+      findings: [...this.findings.values()]
+    };
+  }
+
+  writeReport() {
+    if (!this.started) return;
+    try {
+      // Written in one go so a reader never sees half a report
+      fs.writeFileSync(`${REPORT_FILE}.tmp`, JSON.stringify(this.report(), null, 2));
+      fs.renameSync(`${REPORT_FILE}.tmp`, REPORT_FILE);
+    } catch (error) {
+      console.error('❌ Failed to write Firestore profile:', error.message);
+    }
+  }
+}
+
+const firestoreProfiler = new FirestoreProfiler();
+
+module.exports = firestoreProfiler;
+module.exports.ReadBudgetExceededError = ReadBudgetExceededError;
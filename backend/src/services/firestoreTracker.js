@@ -0,0 +1,348 @@
+const path = require('path');
+const { AsyncLocalStorage } = require('async_hooks');
+const {
+  Firestore,
+  Query,
+  AggregateQuery,
+  DocumentReference,
+  WriteBatch,
+  Transaction
+} = require('@google-cloud/firestore');
+
+/**
+ * Firestore Tracker
+ * Counts the documents every request reads and writes, and the calls
+ * behind them grouped by shape ("crm_leads where status == orderBy
+ * created_ts limit"), for the request metrics in middleware/instrumentation.
+ *
+ * instrument() patches the client's Query, AggregateQuery, Firestore,
+ * Transaction and WriteBatch prototypes once, so the shared db from
+ * config/db and every query built from it are covered without changing
+ * call sites. Calls are charged to the context of the request that made
+ * them (AsyncLocalStorage); calls outside a request, snapshot listeners and
+ * work resumed from callbacks that drop the async context go to a shared
+ * background context.
+ *
+ * Reads are counted as billed: a query returns at least one, getAll one
+ * per reference, a count() one per 1000 matches. Writes are counted when
+ * they are added to a batch, transaction or single-document write.
+ *
+ * An observer (services/firestoreProfiler) can be attached with observe():
+ * it then sees every call with the source line that made it, and every
+ * finished request.
+ */
+
+const storage = new AsyncLocalStorage();
+
+// Query -> { collection, parts }, carried along as queries are refined
+const shapes = new WeakMap();
+// Batch -> collections written, to label its commit
+const batchCollections = new WeakMap();
+
+// Set while a patched method runs, so client methods built on other
+// patched methods (doc.get() on getAll(), for example) count once
+let inTrackedCall = false;
+let instrumented = false;
+let observer = null;
+
+const SRC_DIR = path.resolve(__dirname, '..');
+
+function newContext(route = null) {
+  return { route, reads: 0, writes: 0, calls: 0, ms: 0, shapes: new Map() };
+}
+
+const background = newContext('background');
+// Every call since start, by op and shape
+const totals = new Map();
+
+function fieldName(field) {
+  if (typeof field === 'string') return field;
+  if (field && field.formattedName) return field.formattedName;
+  return String(field);
+}
+
+function shapeOf(query) {
+  const shape = shapes.get(query);
+  if (shape) return shape;
+  const collection = query.id || (query._queryOptions && query._queryOptions.collectionId) || '?';
+  return { collection, parts: [] };
+}
+
+function describe(shape) {
+  return [shape.collection, ...shape.parts].join(' ');
+}
+
+/**
+ * Add one call to a context and to the running totals by shape
+ */
+function recordTo(context, op, shape, { reads = 0, writes = 0, ms = 0 }) {
+  context.reads += reads;
+  context.writes += writes;
+  // Staged writes reach Firestore in their commit
+  if (op !== 'write') context.calls++;
+  context.ms += ms;
+
+  const key = `${op} ${shape}`;
+  let entry = context.shapes.get(key);
+  if (!entry) {
+    entry = { op, shape, count: 0, reads: 0, writes: 0, ms: 0 };
+    context.shapes.set(key, entry);
+  }
+  entry.count++;
+  entry.reads += reads;
+  entry.writes += writes;
+  entry.ms += ms;
+
+  let total = totals.get(key);
+  if (!total) {
+    total = { op, shape, count: 0, reads: 0, writes: 0, ms: 0 };
+    totals.set(key, total);
+  }
+  total.count++;
+  total.reads += reads;
+  total.writes += writes;
+  total.ms += ms;
+}
+
+function record(op, shape, figures, details = {}) {
+  const context = storage.getStore() || background;
+  recordTo(context, op, shape, figures);
+  // May throw, failing the call (read budgets in error mode)
+  if (observer && observer.call) {
+    observer.call(context, { op, shape, ...figures, ...details });
+  }
+}
+
+/**
+ * First frame in our own source below the Firestore call:
+ * "services/leadMappingService.js:301 (LeadMappingService.checkIfLeadExists)"
+ */
+function callSite() {
+  const holder = {};
+  const stackTraceLimit = Error.stackTraceLimit;
+  Error.stackTraceLimit = 30;
+  Error.captureStackTrace(holder, callSite);
+  Error.stackTraceLimit = stackTraceLimit;
+
+  const frame = holder.stack.split('\n').slice(1).find(line =>
+    line.includes(SRC_DIR) && !line.includes(__filename) && !line.includes('node_modules')
+  );
+  if (!frame) return 'unknown';
+  const match = frame.match(/at (?:async )?(?:(\S+) \()?([^()\s]+):(\d+):\d+\)?$/);
+  if (!match) return frame.trim();
+  const file = path.relative(SRC_DIR, match[2]);
+  return match[1] ? `${file}:${match[3]} (${match[1]})` : `${file}:${match[3]}`;
+}
+
+function elapsedMs(startTime) {
+  return Number(process.hrtime.bigint() - startTime) / 1e6;
+}
+
+/**
+ * Replace a prototype method with one that times the call and records
+ * what measure(result, args) returns for it
+ */
+function trackCall(proto, method, op, describeCall, measure) {
+  const original = proto[method];
+  if (typeof original !== 'function') return;
+  proto[method] = function (...args) {
+    if (inTrackedCall) return original.apply(this, args);
+    const startTime = process.hrtime.bigint();
+    const shape = describeCall(this, args);
+    const details = observer ? { site: callSite(), target: this } : {};
+    let result;
+    inTrackedCall = true;
+    try {
+      result = original.apply(this, args);
+    } finally {
+      inTrackedCall = false;
+    }
+    return Promise.resolve(result).then(
+      value => {
+        record(op, shape, { ...measure(value, args), ms: elapsedMs(startTime) }, details);
+        return value;
+      },
+      error => {
+        record(op, shape, { ms: elapsedMs(startTime) }, details);
+        throw error;
+      }
+    );
+  };
+}
+
+/**
+ * Replace a query builder method with one that passes the shape on to the
+ * query it returns
+ */
+function trackShape(proto, method, part) {
+  const original = proto[method];
+  if (typeof original !== 'function') return;
+  proto[method] = function (...args) {
+    const query = original.apply(this, args);
+    const shape = shapeOf(this);
+    const next = part(args);
+    const parts = next && !shape.parts.includes(next) ? [...shape.parts, next] : shape.parts;
+    shapes.set(query, { collection: shape.collection, parts });
+    return query;
+  };
+}
+
+function trackWrite(proto, method) {
+  const original = proto[method];
+  if (typeof original !== 'function') return;
+  proto[method] = function (documentRef, ...args) {
+    const result = original.call(this, documentRef, ...args);
+    const collection = documentRef && documentRef.parent ? documentRef.parent.id : '?';
+    record('write', `${collection} ${method}`, { writes: 1 });
+    if (!batchCollections.has(this)) batchCollections.set(this, new Set());
+    batchCollections.get(this).add(collection);
+    return result;
+  };
+}
+
+function trackListener(proto, describeListener) {
+  const original = proto.onSnapshot;
+  if (typeof original !== 'function') return;
+  proto.onSnapshot = function (onNext, ...args) {
+    if (typeof onNext !== 'function') return original.call(this, onNext, ...args);
+    const shape = describeListener(this);
+    return original.call(this, snapshot => {
+      // Listeners outlive the request that may have started them
+      const changes = typeof snapshot.docChanges === 'function' ? snapshot.docChanges().length : 1;
+      recordTo(background, 'listen', shape, { reads: changes });
+      return onNext(snapshot);
+    }, ...args);
+  };
+}
+
+/**
+ * Patch the Firestore client classes (once) so calls made through db are
+ * counted
+ */
+function instrument(db) {
+  if (instrumented) return db;
+  instrumented = true;
+
+  ['where', 'orderBy', 'limit', 'limitToLast', 'offset', 'select',
+    'startAt', 'startAfter', 'endAt', 'endBefore'].forEach(method => {
+    trackShape(Query.prototype, method, args => {
+      switch (method) {
+        case 'where':
+          return typeof args[0] === 'string' || args.length > 1
+            ? `where ${fieldName(args[0])} ${args[1]}`
+            : 'where filter';
+        case 'orderBy':
+          return `orderBy ${fieldName(args[0])}${args[1] === 'desc' ? ' desc' : ''}`;
+        case 'startAt':
+        case 'startAfter':
+        case 'endAt':
+        case 'endBefore':
+          return 'cursor';
+        default:
+          return method;
+      }
+    });
+  });
+
+  const originalCount = Query.prototype.count;
+  if (typeof originalCount === 'function') {
+    Query.prototype.count = function (...args) {
+      const aggregate = originalCount.apply(this, args);
+      shapes.set(aggregate, shapeOf(this));
+      return aggregate;
+    };
+  }
+
+  trackCall(Query.prototype, 'get', 'query', query => describe(shapeOf(query)), snapshot => ({
+    reads: Math.max(1, snapshot.size)
+  }));
+
+  if (AggregateQuery) {
+    trackCall(AggregateQuery.prototype, 'get', 'count', aggregate => describe(shapeOf(aggregate)), snapshot => {
+      const data = snapshot && typeof snapshot.data === 'function' ? snapshot.data() : {};
+      return { reads: Math.max(1, Math.ceil((data.count || 0) / 1000)) };
+    });
+  }
+
+  const describeRefs = refs => {
+    const collections = [...new Set(refs.filter(ref => ref && ref.parent).map(ref => ref.parent.id))];
+    return `${collections.join(',') || '?'} ${refs.length === 1 ? 'doc' : 'getAll'}`;
+  };
+  const refsOf = args => args.filter(arg => arg instanceof DocumentReference);
+
+  trackCall(Firestore.prototype, 'getAll', 'doc', (firestore, args) => describeRefs(refsOf(args)), (docs, args) => ({
+    reads: refsOf(args).length
+  }));
+  trackCall(DocumentReference.prototype, 'get', 'doc', ref => describeRefs([ref]), () => ({ reads: 1 }));
+
+  trackCall(Transaction.prototype, 'get', 'transaction', (transaction, [target]) => (
+    target instanceof DocumentReference ? describeRefs([target]) : describe(shapeOf(target))
+  ), result => ({ reads: result && typeof result.size === 'number' ? Math.max(1, result.size) : 1 }));
+  trackCall(Transaction.prototype, 'getAll', 'transaction', (transaction, args) => describeRefs(refsOf(args)), (docs, args) => ({
+    reads: refsOf(args).length
+  }));
+
+  ['set', 'update', 'delete', 'create'].forEach(method => trackWrite(WriteBatch.prototype, method));
+  trackCall(WriteBatch.prototype, 'commit', 'commit', batch => (
+    [...(batchCollections.get(batch) || [])].sort().join(',') || 'empty'
+  ), () => ({}));
+
+  trackListener(Query.prototype, query => describe(shapeOf(query)));
+  trackListener(DocumentReference.prototype, ref => describeRefs([ref]));
+
+  console.log('📏 Firestore call tracking enabled');
+  return db;
+}
+
+/**
+ * Run fn with a fresh request context; calls it makes are charged there
+ */
+function runWithContext(route, fn) {
+  const context = newContext(route);
+  return storage.run(context, () => fn(context));
+}
+
+function currentContext() {
+  return storage.getStore() || null;
+}
+
+/**
+ * Tell the observer a request has finished
+ */
+function finish(context) {
+  if (observer && observer.finish) observer.finish(context);
+}
+
+/**
+ * Attach an observer: { call(context, call), finish(context) }
+ */
+function observe(nextObserver) {
+  observer = nextObserver;
+}
+
+function unbounded(shape) {
+  return !shape.parts.some(part => part === 'limit' || part === 'limitToLast' || part.startsWith('where '));
+}
+
+/**
+ * A context's calls, most expensive first (by time, then reads)
+ */
+function topCalls(context, limit = 5) {
+  return [...context.shapes.values()]
+    .sort((a, b) => b.ms - a.ms || b.reads - a.reads)
+    .slice(0, limit)
+    .map(entry => ({ ...entry, ms: Math.round(entry.ms * 10) / 10 }));
+}
+
+module.exports = {
+  instrument,
+  runWithContext,
+  currentContext,
+  finish,
+  observe,
+  shapeOf,
+  unbounded,
+  topCalls,
+  background,
+  totals
+};
@@ -0,0 +1,261 @@
+const { db, collections } = require('../config/db');
+
+/**
+ * Inventory Index
+ * crm_inventory held in memory, keyed by id, by Meta form ID and by event
+ * name, so webhook leads, website lead mapping and the bulk uploads resolve
+ * inventory without reading Firestore.
+ *
+ * Built from the first snapshot of an onSnapshot listener on crm_inventory
+ * and kept current from its change events, like the lead search index.
+ * Callers check `ready` and fall back to their Firestore queries while it
+ * isn't. Form IDs that match no inventory are counted in misses rather than
+ * investigated with a scan.
+ */
+
+const RETRY_DELAY_MS = 5000;
+const MAX_RETRY_DELAY_MS = 5 * 60 * 1000;
+const MAX_TRACKED_MISSES = 100;
+
+function eventKey(eventName) {
+  return String(eventName).trim().toLowerCase();
+}
+
+/**
+ * Copy of an inventory document that callers can modify; categories are
+ * the part they edit
+ */
+function copyOf(id, data) {
+  const copy = { id, ...data };
+  if (Array.isArray(data.categories)) {
+    copy.categories = data.categories.map(category => ({ ...category }));
+  }
+  return copy;
+}
+
+function addPosting(map, key, id) {
+  if (!map.has(key)) map.set(key, []);
+  const ids = map.get(key);
+  if (!ids.includes(id)) ids.push(id);
+}
+
+function removePosting(map, key, id) {
+  const ids = map.get(key);
+  if (!ids) return;
+  const remaining = ids.filter(existing => existing !== id);
+  if (remaining.length > 0) map.set(key, remaining);
+  else map.delete(key);
+}
+
+class InventoryIndex {
+  constructor({ firestore = db, collection = collections.inventory } = {}) {
+    this.firestore = firestore;
+    this.collection = collection;
+    this.reset();
+    this.ready = false;
+    this.unsubscribe = null;
+    this.startPromise = null;
+    this.retryDelay = RETRY_DELAY_MS;
+    this.missedFormIds = new Map();  // form id -> times missed
+    this.stats = { builtAt: null, buildMs: 0, changes: 0, lookups: 0, formIdMisses: 0, errors: 0 };
+  }
+
+  reset() {
+    this.items = new Map();       // id -> document data
+    this.byFormId = new Map();    // form id -> [id]
+    this.byEventName = new Map(); // lowercased event name -> [id]
+  }
+
+  get size() {
+    return this.items.size;
+  }
+
+  /**
+   * Subscribe to crm_inventory; resolves once the initial snapshot is indexed
+   */
+  start() {
+    if (this.startPromise) return this.startPromise;
+
+    this.startPromise = new Promise((resolve) => {
+      const subscribe = () => {
+        const startTime = Date.now();
+        let first = true;
+        this.unsubscribe = this.firestore.collection(this.collection).onSnapshot(snapshot => {
+          if (first) {
+            // A fresh listener replays every document as 'added'
+            this.reset();
+          }
+          snapshot.docChanges().forEach(change => {
+            if (change.type === 'removed') {
+              this.remove(change.doc.id);
+            } else {
+              this.upsert(change.doc.id, change.doc.data());
+            }
+          });
+          if (first) {
+            first = false;
+            this.ready = true;
+            this.retryDelay = RETRY_DELAY_MS;
+            this.stats.builtAt = new Date().toISOString();
+            this.stats.buildMs = Date.now() - startTime;
+            console.log(`📦 Inventory index built: ${this.size} items, ${this.byFormId.size} form IDs in ${this.stats.buildMs}ms`);
+            resolve(this);
+          } else {
+            this.stats.changes += snapshot.docChanges().length;
+          }
+        }, error => {
+          // Listener is dead; callers use Firestore until it is back
+          console.error('❌ Inventory index listener failed:', error.message);
+          this.ready = false;
+          this.stats.errors++;
+          this.unsubscribe = null;
+          setTimeout(subscribe, this.retryDelay);
+          this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY_MS);
+        });
+      };
+      subscribe();
+    });
+    return this.startPromise;
+  }
+
+  stop() {
+    if (this.unsubscribe) this.unsubscribe();
+    this.unsubscribe = null;
+    this.startPromise = null;
+    this.ready = false;
+  }
+
+  upsert(id, data) {
+    this.remove(id);
+    this.items.set(id, data);
+    if (Array.isArray(data.form_ids)) {
+      data.form_ids.forEach(formId => {
+        if (formId) addPosting(this.byFormId, String(formId).trim(), id);
+      });
+    }
+    if (data.event_name) {
+      addPosting(this.byEventName, eventKey(data.event_name), id);
+    }
+  }
+
+  remove(id) {
+    const data = this.items.get(id);
+    if (!data) return;
+    if (Array.isArray(data.form_ids)) {
+      data.form_ids.forEach(formId => {
+        if (formId) removePosting(this.byFormId, String(formId).trim(), id);
+      });
+    }
+    if (data.event_name) {
+      removePosting(this.byEventName, eventKey(data.event_name), id);
+    }
+    this.items.delete(id);
+  }
+
+  get(id) {
+    this.stats.lookups++;
+    const data = this.items.get(id);
+    return data ? copyOf(id, data) : null;
+  }
+
+  /**
+   * Inventory for a Meta lead form, in the shape getInventoryByFormId
+   * returns (inventory_id, category_of_ticket), or null
+   */
+  findByFormId(formId) {
+    this.stats.lookups++;
+    const key = String(formId).trim();
+    const ids = this.byFormId.get(key);
+    if (!ids) {
+      this.recordMiss(key);
+      return null;
+    }
+
+    const id = ids[0];
+    const data = this.items.get(id);
+    // Handle both old single category and new multi-category format
+    let categoryName = 'General';
+    if (data.categories && data.categories.length > 0) {
+      categoryName = data.categories[0].name;
+    } else if (data.category_of_ticket) {
+      categoryName = data.category_of_ticket;
+    }
+    return {
+      inventory_id: id,
+      event_name: data.event_name,
+      category_of_ticket: categoryName,
+      ...copyOf(id, data)
+    };
+  }
+
+  /**
+   * Count a form ID no inventory is linked to; the most recent
+   * MAX_TRACKED_MISSES are kept with their counts for status()
+   */
+  recordMiss(formId) {
+    const key = String(formId).trim();
+    const count = (this.missedFormIds.get(key) || 0) + 1;
+    this.stats.formIdMisses++;
+    this.missedFormIds.delete(key);
+    this.missedFormIds.set(key, count);
+    if (this.missedFormIds.size > MAX_TRACKED_MISSES) {
+      this.missedFormIds.delete(this.missedFormIds.keys().next().value);
+    }
+  }
+
+  /**
+   * First inventory item whose event name is exactly eventName, skipping
+   * soft-deleted items unless includeDeleted
+   */
+  findByEventName(eventName, { includeDeleted = false } = {}) {
+    this.stats.lookups++;
+    if (!eventName) return null;
+    const ids = this.byEventName.get(eventKey(eventName)) || [];
+    const id = ids.find(candidate => {
+      const data = this.items.get(candidate);
+      return data.event_name === eventName && (includeDeleted || data.isDeleted !== true);
+    });
+    return id ? copyOf(id, this.items.get(id)) : null;
+  }
+
+  /**
+   * Exact event name match first, then either name containing the other,
+   * as website lead mapping has always matched
+   */
+  matchEventName(eventName) {
+    this.stats.lookups++;
+    if (!eventName) return null;
+    const wanted = eventKey(eventName);
+    const exact = this.byEventName.get(wanted);
+    if (exact) return copyOf(exact[0], this.items.get(exact[0]));
+
+    for (const [id, data] of this.items) {
+      if (!data.event_name) continue;
+      const name = eventKey(data.event_name);
+      if (name.includes(wanted) || wanted.includes(name)) {
+        return copyOf(id, data);
+      }
+    }
+    return null;
+  }
+
+  all() {
+    return Array.from(this.items, ([id, data]) => copyOf(id, data));
+  }
+
+  status() {
+    return {
+      ready: this.ready,
+      items: this.size,
+      formIds: this.byFormId.size,
+      eventNames: this.byEventName.size,
+      missedFormIds: Object.fromEntries(this.missedFormIds),
+      ...this.stats
+    };
+  }
+}
+
+const inventoryIndex = new InventoryIndex();
+
+module.exports = inventoryIndex;
+module.exports.InventoryIndex = InventoryIndex;
@@ -0,0 +1,566 @@
+const fs = require('fs');
+const { pipeline } = require('stream');
+const csv = require('csv-parser');
+const XLSX = require('xlsx');
+const { db, collections } = require('../config/db');
+const { convertToIST, parseImportDate } = require('../utils/dateHelpers');
+const Lead = require('../models/Lead');
+const AssignmentRule = require('../models/AssignmentRule');
+const dashboardCounters = require('./dashboardCounters');
+const { normalizePhone } = require('./leadSearchIndex');
+
+/**
+ * Lead Import Service
+ * Background jobs for POST /api/upload/leads/csv.
+ *
+ * Rows are read from the uploaded file on disk as a stream (CSV) or sheet
+ * range by range (XLSX, whose reader has to load the workbook) and handled
+ * CHUNK_SIZE at a time:
+ * - rows are mapped and validated
+ * - auto-assignment runs against one getActive() rule list per job, with
+ *   round robin indexes saved once per chunk
+ * - client detection looks up every phone in the chunk at once, plus the
+ *   leads already imported by this job
+ * - leads are written in one batch per chunk, with up to WRITE_CONCURRENCY
+ *   batches in flight while the next chunk is prepared
+ *
+ * Progress and the final result are kept on the job document in
+ * crm_import_jobs, so any instance can answer the progress endpoint. The job
+ * keeps running after the HTTP response; on Cloud Run that needs CPU to stay
+ * allocated outside requests.
+ */
+
+const JOBS_COLLECTION = 'crm_import_jobs';
+const CHUNK_SIZE = 500; // Firestore batch limit
+const WRITE_CONCURRENCY = parseInt(process.env.LEAD_IMPORT_WRITE_CONCURRENCY || '4');
+const MAX_STORED_ERRORS = 100;
+const MAX_REPORTED_LEADS = 100;
+const MAX_CLIENT_DETECTION_RESULTS = 10;
+const STALLED_MS = 5 * 60 * 1000;
+
+// Same header cleanup as the preview parser
+function csvRows(filePath) {
+  const parser = csv({
+    mapHeaders: ({ header }) => header.trim().toLowerCase().replace(/\s+/g, '_'),
+    skipEmptyLines: true,
+    skipLinesWithError: false
+  });
+  // pipeline() destroys the parser on a read error, which ends the iteration with it
+  pipeline(fs.createReadStream(filePath), parser, () => {});
+  return parser;
+}
+
+// Header names as sheet_to_json derives them: blanks become __EMPTY, repeats get _1, _2...
+function sheetHeaders(worksheet, range) {
+  const [row = []] = XLSX.utils.sheet_to_json(worksheet, {
+    header: 1,
+    raw: false,
+    defval: '',
+    range: { s: range.s, e: { r: range.s.r, c: range.e.c } }
+  });
+  const seen = {};
+  const headers = [];
+  for (let c = 0; c <= range.e.c - range.s.c; c++) {
+    let name = String(row[c] === undefined ? '' : row[c]).trim() || '__EMPTY';
+    if (seen[name] !== undefined) {
+      seen[name]++;
+      name = `${name}_${seen[name]}`;
+    } else {
+      seen[name] = 0;
+    }
+    headers.push(name);
+  }
+  return headers;
+}
+
+function* xlsxRows(filePath) {
+  const workbook = XLSX.readFile(filePath, {
+    cellDates: true,
+    cellNF: true,
+    cellText: false
+  });
+  const worksheet = workbook.Sheets[workbook.SheetNames[0]];
+  if (!worksheet || !worksheet['!ref']) return;
+
+  const range = XLSX.utils.decode_range(worksheet['!ref']);
+  const headers = sheetHeaders(worksheet, range);
+
+  // Convert one chunk of rows at a time instead of the whole sheet
+  for (let r = range.s.r + 1; r <= range.e.r; r += CHUNK_SIZE) {
+    const rows = XLSX.utils.sheet_to_json(worksheet, {
+      header: headers,
+      raw: false,
+      dateNF: 'yyyy-mm-dd',
+      defval: '', // Default value for empty cells
+      range: { s: { r, c: range.s.c }, e: { r: Math.min(r + CHUNK_SIZE - 1, range.e.r), c: range.e.c } }
+    });
+    yield* rows;
+  }
+}
+
+function readRows(filePath, fileName) {
+  const name = fileName.toLowerCase();
+  if (name.endsWith('.csv')) return csvRows(filePath);
+  if (name.endsWith('.xlsx') || name.endsWith('.xls')) return xlsxRows(filePath);
+  throw new Error('Unsupported file format');
+}
+
+/**
+ * Lead fields for an uploaded row; accepts the snake_case CSV headers and
+ * the title-case Excel template headers
+ */
+function mapRow(row, uploadedBy, now) {
+  // Get the assigned_to value and handle empty/invalid assignments
+  const assignedToValue = String(row.assigned_to || row['Assigned To'] || '');
+  const unassigned = assignedToValue.trim() === '' || assignedToValue === '0';
+
+  const rawDateValue = row.date_of_enquiry ||
+                      row['Date of Enquiry'] ||
+                      row['Date of enquiry'] ||
+                      row['DATE OF ENQUIRY'] ||
+                      row['enquiry_date'] ||
+                      row['Enquiry Date'];
+
+  return {
+    name: row.name || row.Name || row.NAME || '',
+    email: row.email || row.Email || row.EMAIL || '',
+    phone: String(row.phone || row.Phone || row.PHONE || ''),
+    company: row.company || row.Company || row.COMPANY || '',
+    business_type: row.business_type || row['Business Type'] || 'B2C',
+    source: row.source || row.Source || 'Bulk Upload',
+    date_of_enquiry: parseImportDate(rawDateValue),
+    first_touch_base_done_by: row.first_touch_base_done_by ||
+                             row['First Touch Base Done By'] || 'Bulk Import',
+    city_of_residence: row.city_of_residence ||
+                      row['City of Residence'] || '',
+    country_of_residence: row.country_of_residence ||
+                         row['Country of Residence'] || 'India',
+    lead_for_event: row.lead_for_event || row['Lead for Event'] || '',
+    number_of_people: parseInt(row.number_of_people ||
+                             row['Number of People'] || '1'),
+    has_valid_passport: row.has_valid_passport ||
+                       row['Has Valid Passport'] || 'Not Sure',
+    visa_available: row.visa_available || row['Visa Available'] || 'Not Sure',
+    attended_sporting_event_before: row.attended_sporting_event_before ||
+                                   row['Attended Sporting Event Before'] || 'Not Sure',
+    annual_income_bracket: row.annual_income_bracket ||
+                          row['Annual Income Bracket'] || '',
+    potential_value: parseFloat(row.potential_value ||
+                               row['Potential Value'] || '0'),
+    status: unassigned ? 'unassigned' : 'assigned',
+    assigned_to: unassigned ? '' : assignedToValue,
+    last_quoted_price: parseFloat(row.last_quoted_price ||
+                                 row['Last Quoted Price'] || '0'),
+    notes: row.notes || row.Notes || row.NOTES || '',
+
+    // Bulk upload metadata
+    bulk_upload: true,
+    bulk_upload_date: now,
+    bulk_upload_user: uploadedBy,
+    created_date: now,
+    updated_date: now
+  };
+}
+
+function validate(leadData) {
+  if (!leadData.name || !leadData.email || !leadData.phone) {
+    return 'Missing required fields (name, email, or phone)';
+  }
+  if (leadData.assigned_to && !leadData.assigned_to.includes('@')) {
+    return 'Assigned To must be a valid email address';
+  }
+  return null;
+}
+
+// Key for matching rows of this job to each other by phone
+function phoneKey(phone) {
+  return normalizePhone(phone) || String(phone);
+}
+
+class LeadImportService {
+  constructor() {
+    this.running = new Map(); // jobId -> completion promise, for jobs on this instance
+  }
+
+  jobRef(jobId) {
+    return db.collection(JOBS_COLLECTION).doc(jobId);
+  }
+
+  /**
+   * Create a job for an uploaded file and start it. The file is deleted when
+   * the job ends. Returns { id, done } where done resolves to the result.
+   */
+  async start({ filePath, fileName, uploadedBy }) {
+    const ref = db.collection(JOBS_COLLECTION).doc();
+    const now = new Date().toISOString();
+    await ref.set({
+      type: 'leads',
+      status: 'running',
+      fileName,
+      uploadedBy,
+      createdAt: now,
+      updatedAt: now,
+      rowsRead: 0,
+      successCount: 0,
+      errorCount: 0
+    });
+
+    const done = this.run(ref, { filePath, fileName, uploadedBy })
+      .finally(() => {
+        this.running.delete(ref.id);
+        fs.unlink(filePath, () => {});
+      });
+    // Failures are recorded on the job document
+    done.catch(() => {});
+    this.running.set(ref.id, done);
+
+    console.log(`📥 Lead import job ${ref.id} started for ${fileName} by ${uploadedBy}`);
+    return { id: ref.id, done };
+  }
+
+  /**
+   * The job's result if it completes within timeoutMs, otherwise null
+   */
+  async waitFor(job, timeoutMs) {
+    let timer;
+    const timeout = new Promise(resolve => {
+      timer = setTimeout(() => resolve(null), timeoutMs);
+    });
+    try {
+      return await Promise.race([job.done, timeout]);
+    } finally {
+      clearTimeout(timer);
+    }
+  }
+
+  async getJob(jobId) {
+    const doc = await this.jobRef(jobId).get();
+    if (!doc.exists) return null;
+    const job = { id: doc.id, ...doc.data() };
+    // A running job that stopped reporting lost its instance
+    job.stalled = job.status === 'running' && !this.running.has(jobId) &&
+      Date.now() - new Date(job.updatedAt).getTime() > STALLED_MS;
+    return job;
+  }
+
+  async run(ref, { filePath, fileName, uploadedBy }) {
+    const startTime = Date.now();
+    const job = {
+      ref,
+      uploadedBy,
+      rules: [],
+      changedRules: new Set(),
+      importedByPhone: new Map(), // phone key -> leads created by this job
+      pendingWrites: new Set(),
+      rowsRead: 0,
+      successCount: 0,
+      errorCount: 0,
+      autoAssignmentCount: 0,
+      clientDetectionCount: 0,
+      clientAssignmentCount: 0,
+      manuallyAssignedCount: 0,
+      unassignedCount: 0,
+      errors: [],
+      uploadedLeads: [],
+      clientDetectionResults: []
+    };
+
+    try {
+      try {
+        job.rules = await AssignmentRule.getActive();
+      } catch (error) {
+        // Continue with lead creation even if auto-assignment is unavailable
+        console.error('❌ Lead import: could not load assignment rules:', error.message);
+      }
+
+      let chunk = [];
+      let rowNumber = 1; // Header row
+      for await (const row of readRows(filePath, fileName)) {
+        rowNumber++;
+        chunk.push({ row, rowNumber });
+        if (chunk.length >= CHUNK_SIZE) {
+          await this.processChunk(job, chunk);
+          chunk = [];
+        }
+      }
+      if (chunk.length > 0) {
+        await this.processChunk(job, chunk);
+      }
+      await Promise.all(job.pendingWrites);
+      await this.saveRuleIndexes(job);
+
+      const result = this.buildResult(job, fileName, ref.id);
+      await ref.update({
+        status: 'completed',
+        ...this.progress(job),
+        finishedAt: new Date().toISOString(),
+        processingTimeMs: Date.now() - startTime,
+        result
+      });
+
+      console.log(`📊 Lead import job ${ref.id} completed in ${Date.now() - startTime}ms: ` +
+        `${job.successCount} successful, ${job.errorCount} failed`);
+      console.log(`🔍 Smart client detection: ${job.clientDetectionCount} existing clients found`);
+      console.log(`🎯 Auto-assignments: ${job.autoAssignmentCount} rules applied`);
+      console.log(`📞 Client-based assignments: ${job.clientAssignmentCount} applied`);
+      return result;
+    } catch (error) {
+      console.error(`❌ Lead import job ${ref.id} failed:`, error);
+      await Promise.allSettled(job.pendingWrites);
+      await ref.update({
+        status: 'failed',
+        error: error.message,
+        ...this.progress(job),
+        finishedAt: new Date().toISOString()
+      }).catch(updateError => console.error('❌ Failed to record import failure:', updateError.message));
+      throw error;
+    }
+  }
+
+  addError(job, rowNumber, error, data) {
+    job.errorCount++;
+    if (job.errors.length < MAX_STORED_ERRORS) {
+      job.errors.push({ row: rowNumber, error, data });
+    }
+  }
+
+  async processChunk(job, chunk) {
+    const now = convertToIST(new Date());
+    job.rowsRead += chunk.length;
+
+    // 1. Map and validate
+    const rows = [];
+    chunk.forEach(({ row, rowNumber }) => {
+      try {
+        const leadData = mapRow(row, job.uploadedBy, now);
+        const error = validate(leadData);
+        if (error) {
+          this.addError(job, rowNumber, error, leadData);
+        } else {
+          rows.push({ rowNumber, leadData, flags: {} });
+        }
+      } catch (error) {
+        this.addError(job, rowNumber, error.message, row);
+      }
+    });
+
+    // 2. Auto-assignment for rows without an assignee (before client detection)
+    rows.forEach(({ leadData, flags }) => {
+      if (leadData.assigned_to) return;
+      const match = AssignmentRule.matchRules(leadData, job.rules);
+      if (match) {
+        const { assignment } = match;
+        leadData.assigned_to = assignment.assigned_to;
+        leadData.assignment_rule_used = assignment.rule_matched;
+        leadData.assignment_reason = assignment.assignment_reason;
+        leadData.auto_assigned = assignment.auto_assigned;
+        leadData.assignment_rule_id = assignment.rule_id;
+        leadData.status = 'assigned';
+        flags.autoAssigned = true;
+        job.changedRules.add(match.rule);
+      }
+    });
+
+    // 3. Smart client detection: one lookup for every phone in the chunk
+    let existingByPhone = new Map();
+    try {
+      existingByPhone = await Lead.findLeadsByPhones(rows.map(r => r.leadData.phone));
+    } catch (error) {
+      // Non-critical: import the chunk without client detection
+      console.log('⚠️ Lead import: smart client detection failed for chunk:', error.message);
+    }
+
+    // 4. Build the batch
+    const batch = db.batch();
+    const written = [];
+    rows.forEach(({ rowNumber, leadData, flags }) => {
+      const key = phoneKey(leadData.phone);
+      // Leads from earlier chunks may already be visible in Firestore
+      const existing = existingByPhone.get(leadData.phone) || [];
+      const existingIds = new Set(existing.map(lead => lead.id));
+      const clientLeads = [
+        ...existing,
+        ...(job.importedByPhone.get(key) || []).filter(lead => !existingIds.has(lead.id))
+      ];
+      let clientDetectionResult = null;
+
+      if (clientLeads.length > 0) {
+        const clientInfo = Lead.summarizeClient(clientLeads, leadData.phone);
+        flags.clientDetected = true;
+        clientDetectionResult = {
+          phone: leadData.phone,
+          client_id: clientInfo.client_id,
+          total_existing_leads: clientInfo.total_leads,
+          primary_assigned_to: clientInfo.primary_assigned_to,
+          existing_events: clientInfo.events || [],
+          first_contact: clientInfo.first_contact
+        };
+
+        const originalAssignment = leadData.assigned_to;
+        if (clientInfo.primary_assigned_to && (!originalAssignment || leadData.auto_assigned)) {
+          // Override auto-assignment with client's preferred assignee
+          leadData.assigned_to = clientInfo.primary_assigned_to;
+          leadData.status = 'assigned';
+          leadData.assignment_reason = `Smart client detection: Previous leads assigned to ${clientInfo.primary_assigned_to}`;
+          leadData.auto_assigned = false; // This is client-based, not rule-based
+          flags.clientAssigned = true;
+        } else if (originalAssignment && originalAssignment !== clientInfo.primary_assigned_to) {
+          leadData.manual_assignment_override = true;
+        }
+
+        leadData.client_id = clientInfo.client_id;
+        leadData.is_primary_lead = false; // Bulk uploads are typically not primary
+        leadData.client_total_leads = clientInfo.total_leads + 1;
+        const existingEvents = clientInfo.events || [];
+        const newEvent = leadData.lead_for_event;
+        leadData.client_events = newEvent && !existingEvents.includes(newEvent)
+          ? [...existingEvents, newEvent]
+          : existingEvents;
+        leadData.client_first_contact = clientInfo.first_contact;
+        leadData.client_last_activity = now;
+      } else {
+        // New client - the first lead for this phone is primary
+        leadData.is_primary_lead = true;
+        leadData.client_total_leads = 1;
+        if (leadData.lead_for_event) {
+          leadData.client_events = [leadData.lead_for_event];
+        }
+        leadData.client_first_contact = leadData.date_of_enquiry || now;
+      }
+
+      const ref = db.collection(collections.leads).doc();
+      const data = new Lead(leadData).toFirestore();
+      batch.set(ref, data);
+      written.push({ rowNumber, id: ref.id, data, flags, clientDetectionResult });
+
+      // Later rows with this phone see it as an existing client
+      if (!job.importedByPhone.has(key)) job.importedByPhone.set(key, []);
+      job.importedByPhone.get(key).push({
+        id: ref.id,
+        client_id: data.client_id,
+        is_primary_lead: data.is_primary_lead,
+        assigned_to: data.assigned_to,
+        lead_for_event: data.lead_for_event,
+        potential_value: data.potential_value,
+        created_date: data.created_date,
+        name: data.name,
+        email: data.email
+      });
+    });
+
+    await this.saveRuleIndexes(job);
+
+    // 5. Commit, keeping at most WRITE_CONCURRENCY batches in flight
+    if (written.length > 0) {
+      while (job.pendingWrites.size >= WRITE_CONCURRENCY) {
+        await Promise.race(job.pendingWrites);
+      }
+      const write = batch.commit()
+        .then(() => this.recordWritten(job, written))
+        .catch(error => {
+          console.error(`❌ Lead import: batch of ${written.length} leads failed:`, error.message);
+          written.forEach(({ rowNumber, data }) => this.addError(job, rowNumber, `Write failed: ${error.message}`, data));
+        })
+        .finally(() => job.pendingWrites.delete(write));
+      job.pendingWrites.add(write);
+    }
+
+    await job.ref.update(this.progress(job));
+    console.log(`📥 Lead import ${job.ref.id}: ${job.rowsRead} rows read, ` +
+      `${job.successCount} saved, ${job.errorCount} failed`);
+  }
+
+  async recordWritten(job, written) {
+    written.forEach(({ rowNumber, id, data, flags, clientDetectionResult }) => {
+      job.successCount++;
+      if (flags.autoAssigned) job.autoAssignmentCount++;
+      if (flags.clientDetected) job.clientDetectionCount++;
+      if (flags.clientAssigned) job.clientAssignmentCount++;
+      if (!data.assigned_to) job.unassignedCount++;
+      else if (!data.auto_assigned && !flags.clientDetected) job.manuallyAssignedCount++;
+
+      if (job.uploadedLeads.length < MAX_REPORTED_LEADS) {
+        job.uploadedLeads.push({
+          id,
+          name: data.name,
+          email: data.email,
+          phone: data.phone,
+          company: data.company,
+          source: data.source,
+          date_of_enquiry: data.date_of_enquiry,
+          status: data.status,
+          assigned_to: data.assigned_to,
+          business_type: data.business_type,
+          auto_assigned: data.auto_assigned || false,
+          assignment_reason: data.assignment_reason || '',
+          client_detected: !!clientDetectionResult,
+          client_id: data.client_id || null,
+          is_primary_lead: data.is_primary_lead || false
+        });
+      }
+      if (clientDetectionResult && job.clientDetectionResults.length < MAX_CLIENT_DETECTION_RESULTS) {
+        job.clientDetectionResults.push({
+          row: rowNumber,
+          lead_name: data.name,
+          ...clientDetectionResult,
+          assigned_to_from_detection: data.assigned_to
+        });
+      }
+    });
+    await dashboardCounters.recordChanges('leads', written.map(({ data }) => [null, data]));
+  }
+
+  // Round robin positions advanced by this job's assignments
+  async saveRuleIndexes(job) {
+    const rules = [...job.changedRules];
+    job.changedRules.clear();
+    await Promise.all(rules.map(rule =>
+      AssignmentRule.updateLastAssignmentIndex(rule.id, rule.last_assignment_index)));
+  }
+
+  progress(job) {
+    return {
+      updatedAt: new Date().toISOString(),
+      rowsRead: job.rowsRead,
+      successCount: job.successCount,
+      errorCount: job.errorCount,
+      autoAssignmentCount: job.autoAssignmentCount,
+      clientDetectionCount: job.clientDetectionCount,
+      clientAssignmentCount: job.clientAssignmentCount,
+      errors: job.errors.slice(0, MAX_STORED_ERRORS)
+    };
+  }
+
+  /**
+   * Response in the shape the synchronous upload returned. uploadedLeads is
+   * capped at MAX_REPORTED_LEADS.
+   */
+  buildResult(job, fileName, jobId) {
+    return {
+      success: true,
+      message: `Import completed. ${job.successCount} leads imported successfully, ${job.errorCount} failed.`,
+      totalProcessed: job.rowsRead,
+      successCount: job.successCount,
+      errorCount: job.errorCount,
+      autoAssignmentCount: job.autoAssignmentCount,
+      clientDetectionCount: job.clientDetectionCount,
+      clientAssignmentCount: job.clientAssignmentCount,
+      uploadedLeads: job.uploadedLeads,
+      clientDetectionResults: job.clientDetectionResults,
+      errors: job.errors.slice(0, 10), // Limit error reporting
+      summary: {
+        new_clients: job.successCount - job.clientDetectionCount,
+        existing_clients: job.clientDetectionCount,
+        auto_assigned: job.autoAssignmentCount,
+        client_assigned: job.clientAssignmentCount,
+        manually_assigned: job.manuallyAssignedCount,
+        unassigned: job.unassignedCount
+      },
+      uploadSessionId: `upload_${Date.now()}_${job.uploadedBy}`,
+      fileName,
+      jobId
+    };
+  }
+}
+
+module.exports = new LeadImportService();
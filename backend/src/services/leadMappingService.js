@@ -1,7 +1,8 @@
 // backend/src/services/leadMappingService.js
 
 const { db, collections } = require('../config/db');
-const { convertToIST } = require('../utils/dateHelpers');
+const { convertToIST, leadTimestamps } = require('../utils/dateHelpers');
+const inventoryIndex = require('./inventoryIndex');
 
 class LeadMappingService {
   constructor() {
@@ -52,12 +53,18 @@ class LeadMappingService {
 
   // Get inventory by ID
   async getInventoryById(inventoryId) {
+    if (inventoryIndex.ready) {
+      return inventoryIndex.get(inventoryId) || undefined;
+    }
     const inventory = await this.getInventoryItems();
     return inventory.find(item => item.id === inventoryId);
   }
 
   // Find matching inventory item by event name
   async findInventoryByEventName(tourName) {
+    if (inventoryIndex.ready) {
+      return inventoryIndex.matchEventName(tourName) || undefined;
+    }
     const inventory = await this.getInventoryItems();
     
     // Try exact match first
@@ -193,6 +200,8 @@ async mapWebsiteLeadToCRM(websiteLead, importedBy) {
     crmLead.notes += `\n⚠️ No matching inventory found for tour: ${websiteLead.tours}`;
   }
 
+  Object.assign(crmLead, leadTimestamps(crmLead));
+
   // Log the final mapped lead
   console.log(`✅ Mapped lead ${websiteLead.id} with event_name: "${crmLead.event_name}"`);
 
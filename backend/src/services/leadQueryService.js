@@ -0,0 +1,186 @@
+const crypto = require('crypto');
+const { FieldPath } = require('@google-cloud/firestore');
+const { db, collections } = require('../config/db');
+const leadTimestampMigration = require('./leadTimestampMigration');
+
+/**
+ * Lead Query Service
+ * Index-backed pages for /api/leads/paginated: filters become where clauses,
+ * sort_by/sort_order become orderBy, later pages come from opaque startAfter
+ * cursors and totals from count() aggregates. Page 1 of a filtered view costs
+ * `limit` document reads plus one aggregate read per 1000 matches.
+ *
+ * Composite indexes for every filter x sort combination are in
+ * backend/firestore.indexes.json (Firestore merges them for multi-filter views).
+ *
+ * created_date and date_of_enquiry sorts order by the numeric created_ts and
+ * enquiry_ts, so they are only served here once leadTimestampMigration has
+ * backfilled them. The date fields themselves mix ISO strings and Timestamps
+ * (webhook leads), which Firestore orders by type first, so until then, and
+ * for updated_date (written directly by many routes), sorts stay on the
+ * full-scan path.
+ *
+ * Note: orderBy skips documents that lack the sort field, so leads without
+ * it only show up in the full-scan fallback.
+ */
+
+// Query param -> lead field
+const FILTER_FIELDS = {
+  status: 'status',
+  source: 'source',
+  business_type: 'business_type',
+  event: 'lead_for_event',
+  assigned_to: 'assigned_to'
+};
+
+// Sorts the index can serve, through their numeric copies, with the same
+// ordering as the in-memory sort. name/company/potential_value are compared
+// lowercased or parsed there, so they stay on the fallback path
+const SORT_FIELDS = ['created_date', 'date_of_enquiry'];
+
+// Firestore limit on values in an `in` filter
+const MAX_IN_VALUES = 30;
+
+class LeadQueryService {
+  /**
+   * Why a request can't be served by an indexed query, or null if it can
+   */
+  async unsupportedReason(params) {
+    if (params.search) {
+      return 'search';
+    }
+    if (!SORT_FIELDS.includes(params.sort_by)) {
+      return `sort_by=${params.sort_by}`;
+    }
+    if (!(await leadTimestampMigration.numericField(params.sort_by))) {
+      return `sort_by=${params.sort_by} before timestamp backfill`;
+    }
+    if (params.assigned_to === 'unassigned') {
+      // Has to match missing, null and '' alike
+      return 'assigned_to=unassigned';
+    }
+    if (this.statusValues(params.status).length > MAX_IN_VALUES) {
+      return 'too many statuses';
+    }
+    return null;
+  }
+
+  statusValues(status) {
+    if (!status || status === 'all') {
+      return [];
+    }
+    return status.split(',').map(s => s.trim()).filter(Boolean);
+  }
+
+  /**
+   * Filtered, ordered query plus a signature identifying the view. sortField
+   * is the field actually ordered by: sort_by's numeric copy
+   */
+  buildQuery(params, sortField) {
+    let query = db.collection(collections.leads);
+    const applied = {};
+
+    Object.entries(FILTER_FIELDS).forEach(([param, field]) => {
+      const value = params[param];
+      if (!value || value === 'all') {
+        return;
+      }
+      if (param === 'status') {
+        const statuses = this.statusValues(value);
+        query = statuses.length === 1
+          ? query.where(field, '==', statuses[0])
+          : query.where(field, 'in', statuses);
+        applied[field] = statuses;
+      } else {
+        query = query.where(field, '==', value);
+        applied[field] = value;
+      }
+    });
+
+    const direction = params.sort_order === 'asc' ? 'asc' : 'desc';
+    // Document id breaks ties so cursors are stable between equal sort values
+    query = query
+      .orderBy(sortField, direction)
+      .orderBy(FieldPath.documentId(), direction);
+
+    const signature = crypto.createHash('sha1')
+      .update(JSON.stringify([applied, sortField, direction]))
+      .digest('hex')
+      .slice(0, 12);
+
+    return { query, signature };
+  }
+
+  encodeCursor(doc, sortField, signature) {
+    return Buffer.from(JSON.stringify({ s: signature, v: doc.get(sortField), id: doc.id })).toString('base64url');
+  }
+
+  /**
+   * startAfter() arguments for a cursor, or null if it is malformed or was
+   * issued for a different filter/sort combination
+   */
+  decodeCursor(cursor, signature) {
+    try {
+      const { s, v, id } = JSON.parse(Buffer.from(cursor, 'base64url').toString('utf8'));
+      if (s !== signature || typeof id !== 'string') {
+        return null;
+      }
+      return [v, id];
+    } catch (error) {
+      return null;
+    }
+  }
+
+  /**
+   * One page of leads: { leads, pagination }
+   */
+  async fetchPage(params) {
+    const startTime = Date.now();
+    const { page, limit, cursor } = params;
+    // unsupportedReason() has checked the numeric field is ready
+    const sortField = await leadTimestampMigration.numericField(params.sort_by);
+    const { query, signature } = this.buildQuery(params, sortField);
+
+    let pageQuery = query;
+    const after = cursor ? this.decodeCursor(cursor, signature) : null;
+    if (cursor && !after) {
+      console.warn('⚠️ Ignoring lead cursor from a different view, paging by offset');
+    }
+    if (after) {
+      pageQuery = pageQuery.startAfter(...after);
+    } else if (page > 1) {
+      // Skipped documents are still billed; clients should follow nextCursor
+      pageQuery = pageQuery.offset((page - 1) * limit);
+    }
+
+    // One extra document tells us whether there is a next page
+    const [snapshot, countSnapshot] = await Promise.all([
+      pageQuery.limit(limit + 1).get(),
+      query.count().get()
+    ]);
+
+    const docs = snapshot.docs.slice(0, limit);
+    const hasNext = snapshot.docs.length > limit;
+    const total = countSnapshot.data().count;
+    const totalPages = Math.ceil(total / limit);
+
+    console.log(`✅ Indexed lead page ${page}: ${docs.length} of ${total} leads, ` +
+      `${snapshot.docs.length} reads + count, ${Date.now() - startTime}ms`);
+
+    return {
+      leads: docs.map(doc => ({ id: doc.id, ...doc.data() })),
+      pagination: {
+        page,
+        limit,
+        total,
+        totalPages,
+        hasNext,
+        hasPrev: page > 1,
+        nextCursor: hasNext ? this.encodeCursor(docs[docs.length - 1], sortField, signature) : null,
+        mode: 'query'
+      }
+    };
+  }
+}
+
+module.exports = new LeadQueryService();
@@ -0,0 +1,345 @@
+const { db, collections } = require('../config/db');
+
+/**
+ * Lead Search Index
+ * In-memory index over every lead's name, email, phone, company and
+ * lead_for_event, so search and phone lookups don't scan crm_leads:
+ *
+ * - queries of three or more characters go through trigram postings and are
+ *   then confirmed as substrings, like the old in-memory filter
+ * - shorter queries match word prefixes
+ * - phone numbers are normalized to E.164 and looked up exactly
+ *
+ * The index is built from the first snapshot of an onSnapshot listener on
+ * crm_leads and kept current from its change events. Results are ranked IDs
+ * plus the few fields needed to filter and sort, so callers fetch only the
+ * documents on the page they return.
+ *
+ * Pass a Firestore instance and collection name to run it against the
+ * emulator (FIRESTORE_EMULATOR_HOST); see test-lead-search-index.js.
+ */
+
+const DEFAULT_COUNTRY_CODE = process.env.DEFAULT_PHONE_COUNTRY_CODE || '91';
+const TEXT_FIELDS = ['name', 'email', 'company', 'lead_for_event'];
+const SORT_KEYS = ['created_date', 'date_of_enquiry', 'updated_date', 'name', 'company', 'potential_value'];
+const RETRY_DELAY_MS = 5000;
+const MAX_RETRY_DELAY_MS = 5 * 60 * 1000;
+
+/**
+ * E.164 form of a phone number, assuming DEFAULT_COUNTRY_CODE for local
+ * numbers; null if there are too few digits to be a phone number
+ */
+function normalizePhone(phone) {
+  if (phone === undefined || phone === null) return null;
+  const raw = String(phone).trim();
+  let digits = raw.replace(/\D/g, '');
+  if (digits.length < 6) return null;
+
+  if (raw.startsWith('+')) return `+${digits}`;
+  if (digits.startsWith('00')) return `+${digits.slice(2)}`;
+  if (digits.length === 11 && digits.startsWith('0')) digits = digits.slice(1);
+  if (digits.length === 10) return `+${DEFAULT_COUNTRY_CODE}${digits}`;
+  if (digits.length === 10 + DEFAULT_COUNTRY_CODE.length && digits.startsWith(DEFAULT_COUNTRY_CODE)) {
+    return `+${digits}`;
+  }
+  return `+${digits}`;
+}
+
+function trigrams(text) {
+  const grams = new Set();
+  for (let i = 0; i + 3 <= text.length; i++) {
+    grams.add(text.slice(i, i + 3));
+  }
+  return grams;
+}
+
+function words(text) {
+  return text.split(/[^a-z0-9]+/).filter(Boolean);
+}
+
+function toMillis(value) {
+  if (!value) return 0;
+  if (typeof value === 'object' && value._seconds) {
+    return value._seconds * 1000 + (value._nanoseconds || 0) / 1000000;
+  }
+  if (typeof value.toMillis === 'function') return value.toMillis();
+  const time = new Date(value).getTime();
+  return isNaN(time) ? 0 : time;
+}
+
+function addPosting(map, key, id) {
+  let ids = map.get(key);
+  if (!ids) {
+    ids = new Set();
+    map.set(key, ids);
+  }
+  ids.add(id);
+}
+
+function removePosting(map, key, id) {
+  const ids = map.get(key);
+  if (ids) {
+    ids.delete(id);
+    if (ids.size === 0) map.delete(key);
+  }
+}
+
+class LeadSearchIndex {
+  constructor({ firestore = db, collection = collections.leads } = {}) {
+    this.firestore = firestore;
+    this.collection = collection;
+    this.reset();
+    this.ready = false;
+    this.unsubscribe = null;
+    this.startPromise = null;
+    this.retryDelay = RETRY_DELAY_MS;
+    this.stats = { builtAt: null, buildMs: 0, changes: 0, searches: 0, errors: 0 };
+  }
+
+  reset() {
+    this.entries = new Map();   // id -> compact entry
+    this.grams = new Map();     // trigram -> Set(id)
+    this.prefixes = new Map();  // 1-2 character word prefix -> Set(id)
+    this.phones = new Map();    // E.164 -> Set(id)
+  }
+
+  get size() {
+    return this.entries.size;
+  }
+
+  /**
+   * Subscribe to crm_leads; resolves once the initial snapshot is indexed
+   */
+  start() {
+    if (this.startPromise) return this.startPromise;
+
+    this.startPromise = new Promise((resolve) => {
+      const subscribe = () => {
+        const startTime = Date.now();
+        let first = true;
+        this.unsubscribe = this.firestore.collection(this.collection).onSnapshot(snapshot => {
+          if (first) {
+            // A fresh listener replays every document as 'added'
+            this.reset();
+          }
+          snapshot.docChanges().forEach(change => {
+            if (change.type === 'removed') {
+              this.remove(change.doc.id);
+            } else {
+              this.upsert(change.doc.id, change.doc.data());
+            }
+          });
+          if (first) {
+            first = false;
+            this.ready = true;
+            this.retryDelay = RETRY_DELAY_MS;
+            this.stats.builtAt = new Date().toISOString();
+            this.stats.buildMs = Date.now() - startTime;
+            console.log(`🔎 Lead search index built: ${this.size} leads in ${this.stats.buildMs}ms`);
+            resolve(this);
+          } else {
+            this.stats.changes += snapshot.docChanges().length;
+          }
+        }, error => {
+          // Listener is dead; serve from Firestore until it is back
+          console.error('❌ Lead search index listener failed:', error.message);
+          this.ready = false;
+          this.stats.errors++;
+          this.unsubscribe = null;
+          setTimeout(subscribe, this.retryDelay);
+          this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY_MS);
+        });
+      };
+      subscribe();
+    });
+    return this.startPromise;
+  }
+
+  stop() {
+    if (this.unsubscribe) this.unsubscribe();
+    this.unsubscribe = null;
+    this.startPromise = null;
+    this.ready = false;
+  }
+
+  upsert(id, lead) {
+    this.remove(id);
+
+    const texts = TEXT_FIELDS.map(field => (lead[field] ? String(lead[field]).toLowerCase() : ''));
+    const phone = lead.phone ? String(lead.phone) : '';
+    const e164 = normalizePhone(phone);
+    const entry = {
+      texts,
+      phone,
+      e164,
+      status: lead.status || '',
+      source: lead.source || '',
+      business_type: lead.business_type || '',
+      lead_for_event: lead.lead_for_event || '',
+      assigned_to: lead.assigned_to || '',
+      sort: {
+        created_date: toMillis(lead.created_date),
+        date_of_enquiry: toMillis(lead.date_of_enquiry),
+        updated_date: toMillis(lead.updated_date),
+        name: texts[0],
+        company: texts[2],
+        potential_value: parseFloat(lead.potential_value) || 0
+      }
+    };
+    this.entries.set(id, entry);
+
+    const keys = this.keysFor(entry);
+    keys.grams.forEach(gram => addPosting(this.grams, gram, id));
+    keys.prefixes.forEach(prefix => addPosting(this.prefixes, prefix, id));
+    if (e164) addPosting(this.phones, e164, id);
+  }
+
+  remove(id) {
+    const entry = this.entries.get(id);
+    if (!entry) return;
+    const keys = this.keysFor(entry);
+    keys.grams.forEach(gram => removePosting(this.grams, gram, id));
+    keys.prefixes.forEach(prefix => removePosting(this.prefixes, prefix, id));
+    if (entry.e164) removePosting(this.phones, entry.e164, id);
+    this.entries.delete(id);
+  }
+
+  keysFor(entry) {
+    const grams = new Set();
+    const prefixes = new Set();
+    const digits = entry.phone.replace(/\D/g, '');
+    [...entry.texts, entry.phone, digits].forEach(text => {
+      trigrams(text).forEach(gram => grams.add(gram));
+      words(text).forEach(word => {
+        prefixes.add(word.slice(0, 1));
+        if (word.length > 1) prefixes.add(word.slice(0, 2));
+      });
+    });
+    return { grams, prefixes };
+  }
+
+  /**
+   * Lead ids for a phone number in any common format
+   */
+  findByPhone(phone) {
+    const e164 = normalizePhone(phone);
+    return e164 && this.phones.has(e164) ? [...this.phones.get(e164)] : [];
+  }
+
+  /**
+   * Relevance of an entry for a query; 0 if it does not match
+   */
+  score(entry, query, phoneQuery) {
+    let score = 0;
+    entry.texts.forEach((text, i) => {
+      if (!text) return;
+      const weight = i === 0 ? 2 : 1; // name counts double
+      if (text === query) score += 100 * weight;
+      else if (text.startsWith(query) || words(text).some(w => w.startsWith(query))) score += 10 * weight;
+      else if (query.length >= 3 && text.includes(query)) score += weight;
+    });
+    if (phoneQuery) {
+      if (entry.e164 && entry.e164 === phoneQuery.e164) score += 200;
+      else if (entry.phone.includes(phoneQuery.raw) ||
+               (phoneQuery.digits.length >= 3 && entry.phone.replace(/\D/g, '').includes(phoneQuery.digits))) {
+        score += 5;
+      }
+    }
+    return score;
+  }
+
+  candidates(query, phoneQuery) {
+    if (phoneQuery && phoneQuery.e164 && this.phones.has(phoneQuery.e164)) {
+      return new Set(this.phones.get(phoneQuery.e164));
+    }
+    const keys = query.length >= 3 ? [...trigrams(query)] : [query];
+    const postings = query.length >= 3 ? this.grams : this.prefixes;
+    let result = null;
+    for (const key of keys) {
+      const ids = postings.get(key);
+      if (!ids) {
+        result = new Set();
+        break;
+      }
+      if (result === null) {
+        result = new Set(ids);
+      } else {
+        result.forEach(id => { if (!ids.has(id)) result.delete(id); });
+      }
+    }
+    // A phone query also matches on its bare digits
+    if (phoneQuery && phoneQuery.digits.length >= 3 && phoneQuery.digits !== query) {
+      this.candidates(phoneQuery.digits, null).forEach(id => result.add(id));
+    }
+    return result || new Set();
+  }
+
+  matchesFilters(entry, filters) {
+    if (filters.status && filters.status.length && !filters.status.includes(entry.status)) return false;
+    if (filters.source && entry.source !== filters.source) return false;
+    if (filters.business_type && entry.business_type !== filters.business_type) return false;
+    if (filters.event && entry.lead_for_event !== filters.event) return false;
+    if (filters.assigned_to) {
+      if (filters.assigned_to === 'unassigned' ? entry.assigned_to : entry.assigned_to !== filters.assigned_to) {
+        return false;
+      }
+    }
+    return true;
+  }
+
+  /**
+   * Ranked lead ids matching `search` and the filters.
+   * sortBy 'relevance' orders by score; a sort field from SORT_KEYS orders
+   * by that field, best match first among equal values.
+   */
+  search(search, { filters = {}, sortBy = 'relevance', sortOrder = 'desc' } = {}) {
+    const startTime = Date.now();
+    const query = String(search || '').trim().toLowerCase();
+    if (!query) return [];
+
+    const digits = query.replace(/\D/g, '');
+    const phoneQuery = /^[\d\s\-+().]+$/.test(query) && digits.length >= 3
+      ? { raw: String(search).trim(), digits, e164: normalizePhone(query) }
+      : null;
+
+    const results = [];
+    this.candidates(query, phoneQuery).forEach(id => {
+      const entry = this.entries.get(id);
+      if (!entry || !this.matchesFilters(entry, filters)) return;
+      const score = this.score(entry, query, phoneQuery);
+      if (score > 0) results.push({ id, score, entry });
+    });
+
+    const direction = sortOrder === 'asc' ? 1 : -1;
+    // Unknown sort fields fall back to created_date, like the paginated route
+    const key = sortBy === 'relevance' ? null : (SORT_KEYS.includes(sortBy) ? sortBy : 'created_date');
+    results.sort((a, b) => {
+      if (key) {
+        const av = a.entry.sort[key];
+        const bv = b.entry.sort[key];
+        if (av !== bv) return av > bv ? direction : -direction;
+      }
+      return b.score - a.score;
+    });
+
+    this.stats.searches++;
+    this.stats.lastSearchMs = Date.now() - startTime;
+    return results.map(r => r.id);
+  }
+
+  status() {
+    return {
+      ready: this.ready,
+      leads: this.size,
+      trigrams: this.grams.size,
+      phones: this.phones.size,
+      ...this.stats
+    };
+  }
+}
+
+const leadSearchIndex = new LeadSearchIndex();
+
+module.exports = leadSearchIndex;
+module.exports.LeadSearchIndex = LeadSearchIndex;
+module.exports.normalizePhone = normalizePhone;
@@ -0,0 +1,184 @@
+const { FieldPath, FieldValue } = require('@google-cloud/firestore');
+const { db, collections } = require('../config/db');
+const { LEAD_TIMESTAMP_FIELDS, leadTimestamps } = require('../utils/dateHelpers');
+
+/**
+ * Lead Timestamp Migration
+ * Backfills created_ts, enquiry_ts and updated_ts (epoch milliseconds) on
+ * existing leads, so sorts and date ranges can use one numeric field instead
+ * of created_date/date_of_enquiry, which hold ISO strings on most leads and
+ * Firestore Timestamps on webhook ones. Leads without a created_date get
+ * one, from date_of_enquiry or now, as the old fix-missing-created-dates
+ * script did.
+ *
+ * Leads are walked by document id PAGE_SIZE at a time and only the ones
+ * whose numeric fields are missing or disagree with their dates are
+ * written. The cursor is saved after every page, so a run that is stopped
+ * (or limited with maxPages) carries on from there next time. A finished
+ * pass records completedAt; the next run starts a new pass, which also
+ * corrects leads whose dates were changed by code that doesn't write the
+ * numeric fields.
+ *
+ * Until a pass has completed, numericField() returns null and queries keep
+ * using the date fields.
+ */
+
+const STATE_COLLECTION = 'crm_migrations';
+const STATE_DOC = 'lead_timestamps';
+const PAGE_SIZE = 500;
+const READY_CHECK_MS = 60 * 1000;
+
+// Date fields queries may swap for their numeric copy. updated_date is
+// written directly by many routes, so updated_ts is kept but not queried
+const QUERY_FIELDS = ['created_date', 'date_of_enquiry'];
+
+const SELECTED_FIELDS = [...Object.keys(LEAD_TIMESTAMP_FIELDS), ...Object.values(LEAD_TIMESTAMP_FIELDS)];
+
+/**
+ * Update that brings a lead's numeric timestamps in line with its dates,
+ * or null when it already is
+ */
+function fixFor(lead, now) {
+  const fix = {};
+  if (!lead.created_date) {
+    fix.created_date = lead.date_of_enquiry || now;
+    fix.updated_date = now;
+    fix.updated_by = 'system_fix_script';
+  }
+  const expected = leadTimestamps({ ...lead, ...fix });
+  Object.entries(expected).forEach(([field, value]) => {
+    if (lead[field] !== value) fix[field] = value;
+  });
+  return Object.keys(fix).length > 0 ? fix : null;
+}
+
+class LeadTimestampMigration {
+  constructor() {
+    this.complete = false;
+    this.completeCheckedAt = 0;
+    this.running = null;
+    this.lastRun = null;
+  }
+
+  stateRef() {
+    return db.collection(STATE_COLLECTION).doc(STATE_DOC);
+  }
+
+  /**
+   * Whether a full pass has completed, re-checked at most every
+   * READY_CHECK_MS until it has
+   */
+  async isComplete() {
+    if (this.complete || Date.now() - this.completeCheckedAt < READY_CHECK_MS) return this.complete;
+    this.completeCheckedAt = Date.now();
+    try {
+      const state = await this.stateRef().get();
+      this.complete = state.exists && !!state.data().completedAt;
+    } catch (error) {
+      console.error('❌ Failed to read lead timestamp migration state:', error.message);
+    }
+    return this.complete;
+  }
+
+  /**
+   * Numeric field to sort or range-filter on in place of a lead date field,
+   * or null to keep using the date field
+   */
+  async numericField(dateField) {
+    if (process.env.LEAD_NUMERIC_TIMESTAMPS === 'off') return null;
+    if (!QUERY_FIELDS.includes(dateField)) return null;
+    return (await this.isComplete()) ? LEAD_TIMESTAMP_FIELDS[dateField] : null;
+  }
+
+  /**
+   * Walk leads from the saved cursor, fixing their numeric timestamps, for
+   * at most maxPages pages. restart begins a new pass from the first lead.
+   * Concurrent calls share one run.
+   */
+  async run({ restart = false, maxPages = Infinity } = {}) {
+    if (!this.running) {
+      this.running = this.migrate({ restart, maxPages }).finally(() => {
+        this.running = null;
+      });
+    }
+    return this.running;
+  }
+
+  async migrate({ restart, maxPages }) {
+    const startTime = Date.now();
+    const state = await this.stateRef().get();
+    let cursor = restart || !state.exists ? null : state.data().cursor || null;
+    if (!cursor) {
+      await this.stateRef().set({ passStartedAt: new Date().toISOString(), passScanned: 0, passUpdated: 0 }, { merge: true });
+    }
+
+    const query = db.collection(collections.leads)
+      .select(...SELECTED_FIELDS)
+      .orderBy(FieldPath.documentId())
+      .limit(PAGE_SIZE);
+
+    let scanned = 0;
+    let updated = 0;
+    let pages = 0;
+    let done = false;
+    while (pages < maxPages) {
+      const snapshot = await (cursor ? query.startAfter(cursor) : query).get();
+      pages++;
+
+      const now = new Date().toISOString();
+      const batch = db.batch();
+      let writes = 0;
+      snapshot.forEach(doc => {
+        const fix = fixFor(doc.data(), now);
+        if (!fix) return;
+        batch.update(doc.ref, fix);
+        writes++;
+      });
+      if (writes > 0) await batch.commit();
+
+      scanned += snapshot.size;
+      updated += writes;
+      done = snapshot.size < PAGE_SIZE;
+      cursor = done ? null : snapshot.docs[snapshot.docs.length - 1].id;
+
+      await this.stateRef().set({
+        cursor,
+        passScanned: FieldValue.increment(snapshot.size),
+        passUpdated: FieldValue.increment(writes),
+        updatedAt: now,
+        ...(done ? { completedAt: now } : {})
+      }, { merge: true });
+      console.log(`🕒 Lead timestamps: page ${pages}, ${scanned} leads scanned, ${updated} updated`);
+      if (done) break;
+    }
+
+    if (done) {
+      this.complete = true;
+    }
+    this.lastRun = {
+      scanned,
+      updated,
+      pages,
+      done,
+      cursor,
+      processingTimeMs: Date.now() - startTime,
+      at: new Date().toISOString()
+    };
+    console.log(`✅ Lead timestamp migration ${done ? 'pass complete' : 'paused'}: ${scanned} leads scanned, ${updated} updated in ${this.lastRun.processingTimeMs}ms`);
+    return this.lastRun;
+  }
+
+  status() {
+    return {
+      complete: this.complete,
+      enabled: process.env.LEAD_NUMERIC_TIMESTAMPS !== 'off',
+      running: !!this.running,
+      lastRun: this.lastRun
+    };
+  }
+}
+
+const leadTimestampMigration = new LeadTimestampMigration();
+
+module.exports = leadTimestampMigration;
+module.exports.fixFor = fixFor;
@@ -0,0 +1,401 @@
+const crypto = require('crypto');
+const { FieldValue, FieldPath } = require('@google-cloud/firestore');
+const { db, collections } = require('../config/db');
+const { formatDateForQuery, getISTDateString, toEpochMs } = require('../utils/dateHelpers');
+const leadTimestampMigration = require('./leadTimestampMigration');
+
+/**
+ * Marketing Rollups
+ * Lead counts per IST day x source x event x ad set behind GET
+ * /api/marketing/performance and /performance-timeseries, so a date range
+ * reads one small document per day and combination instead of every lead
+ * enquired in it.
+ *
+ * A rollup holds the lead fields the marketing filters look at as they are
+ * on the lead (lead_for_event and event_name, ad_set and adset_name), the
+ * number of leads and their count by status. Touch-based, qualified,
+ * converted and junk counts are derived from the statuses when read, so
+ * they always follow the current status lists.
+ *
+ * Lead writes reach recordChanges() through dashboardCounters, which every
+ * lead write path already reports to. A write moves one lead from the
+ * rollup (and status) it was in to the one it is in now. rebuild()
+ * recomputes rollups from the leads, for all history or a range of days;
+ * the routes read leads directly until a full rebuild has completed.
+ *
+ * reconcile() is a full rebuild guarded by a lease document, so updates
+ * that were lost or raced a rebuild don't stay wrong. It runs on a timer in
+ * every instance, but only the one holding the lease does the work.
+ */
+
+const ROLLUPS_COLLECTION = 'crm_marketing_rollups';
+const META_DOC = 'meta';
+const LEASE_DOC = 'reconcile_lease';
+const LEASE_MS = 30 * 60 * 1000;
+const NO_DAY = 'none';
+const NO_STATUS = 'none';
+const PAGE_SIZE = 1000;
+const BATCH_SIZE = 500;
+const READY_CHECK_MS = 60 * 1000;
+const DAY_PATTERN = /^\d{4}-\d{2}-\d{2}$/;
+
+// Lead fields a rollup is keyed by, besides the day
+const DIMENSIONS = ['source', 'lead_for_event', 'event_name', 'ad_set', 'adset_name'];
+const LEAD_FIELDS = ['date_of_enquiry', 'status', ...DIMENSIONS];
+
+const TOUCH_BASED_STATUSES = [
+  'contacted', 'attempt_1', 'attempt_2', 'attempt_3',
+  'qualified', 'unqualified', 'junk', 'warm', 'hot', 'cold',
+  'interested', 'not_interested', 'on_hold', 'dropped',
+  'converted', 'invoiced', 'payment_received', 'payment_post_service',
+  'pickup_later', 'quote_requested', 'quote_received'
+];
+const QUALIFIED_STATUSES = ['qualified', 'hot', 'warm', 'cold', 'pickup_later',
+  'quote_requested', 'quote_received', 'converted', 'invoiced',
+  'payment_received', 'payment_post_service', 'dropped'];
+const CONVERTED_STATUSES = ['converted', 'invoiced', 'payment_received', 'payment_post_service'];
+
+function dayOf(lead) {
+  return (lead.date_of_enquiry && getISTDateString(lead.date_of_enquiry)) || NO_DAY;
+}
+
+function dimensionsOf(lead) {
+  const dimensions = {};
+  DIMENSIONS.forEach(field => {
+    dimensions[field] = lead[field] === undefined ? null : lead[field];
+  });
+  return dimensions;
+}
+
+function rollupId(day, dimensions) {
+  const hash = crypto.createHash('sha1')
+    .update(JSON.stringify(DIMENSIONS.map(field => dimensions[field])))
+    .digest('hex')
+    .slice(0, 16);
+  return `${day}_${hash}`;
+}
+
+/**
+ * Lead counts in the shape the routes count with: touchBased,
+ * notTouchBased, qualified, junk, dropped and converted
+ */
+function summarize(statuses) {
+  const summary = { touchBased: 0, notTouchBased: 0, qualified: 0, junk: 0, dropped: 0, converted: 0 };
+  Object.entries(statuses).forEach(([status, count]) => {
+    if (!TOUCH_BASED_STATUSES.includes(status)) {
+      summary.notTouchBased += count;
+      return;
+    }
+    summary.touchBased += count;
+    if (QUALIFIED_STATUSES.includes(status)) summary.qualified += count;
+    if (status === 'junk') summary.junk += count;
+    if (status === 'dropped') summary.dropped += count;
+    if (CONVERTED_STATUSES.includes(status)) summary.converted += count;
+  });
+  return summary;
+}
+
+/**
+ * Rollup rows for a list of leads, keyed by rollup id
+ */
+function aggregate(leads, rows = new Map()) {
+  leads.forEach(lead => {
+    const day = dayOf(lead);
+    const dimensions = dimensionsOf(lead);
+    const id = rollupId(day, dimensions);
+    if (!rows.has(id)) rows.set(id, { day, ...dimensions, leads: 0, statuses: {} });
+    const row = rows.get(id);
+    const status = lead.status || NO_STATUS;
+    row.leads++;
+    row.statuses[status] = (row.statuses[status] || 0) + 1;
+  });
+  return rows;
+}
+
+function isDayOrEmpty(value) {
+  return !value || DAY_PATTERN.test(value);
+}
+
+/**
+ * Lead query limited to enquiries between dateFrom and dateTo, on the
+ * numeric enquiry_ts once it has been backfilled. Returns the field used.
+ */
+async function whereEnquired(query, dateFrom, dateTo) {
+  const start = dateFrom ? formatDateForQuery(dateFrom, 'start') : null;
+  const end = dateTo ? formatDateForQuery(dateTo, 'end') : null;
+  const numericField = await leadTimestampMigration.numericField('date_of_enquiry');
+  const numeric = numericField && [start, end].every(bound => !bound || toEpochMs(bound) !== null);
+
+  const field = numeric ? numericField : 'date_of_enquiry';
+  const value = bound => (numeric ? toEpochMs(bound) : bound);
+  if (start) query = query.where(field, '>=', value(start));
+  if (end) query = query.where(field, '<=', value(end));
+  return { query, field };
+}
+
+class MarketingRollups {
+  constructor() {
+    this.instanceId = crypto.randomBytes(6).toString('hex');
+    this.reconcileTimer = null;
+    this.ready = false;
+    this.readyCheckedAt = 0;
+    this.stats = { applied: 0, failed: 0, servedFromRollups: 0, servedFromLeads: 0 };
+  }
+
+  collection() {
+    return db.collection(ROLLUPS_COLLECTION);
+  }
+
+  /**
+   * Apply lead writes to the rollups; changes are [before, after] pairs of
+   * lead data, null for a create/delete. Never throws: a lost update is
+   * corrected by the next rebuild.
+   */
+  async recordChanges(changes) {
+    try {
+      const deltas = new Map();
+      const add = (lead, sign) => {
+        if (!lead) return;
+        const day = dayOf(lead);
+        const dimensions = dimensionsOf(lead);
+        const id = rollupId(day, dimensions);
+        if (!deltas.has(id)) deltas.set(id, { day, dimensions, leads: 0, statuses: {} });
+        const delta = deltas.get(id);
+        const status = lead.status || NO_STATUS;
+        delta.leads += sign;
+        delta.statuses[status] = (delta.statuses[status] || 0) + sign;
+      };
+      changes.forEach(([before, after]) => {
+        add(before, -1);
+        add(after, 1);
+      });
+
+      const writes = [];
+      deltas.forEach((delta, id) => {
+        const statuses = {};
+        Object.entries(delta.statuses).forEach(([status, count]) => {
+          if (count !== 0) statuses[status] = FieldValue.increment(count);
+        });
+        if (delta.leads === 0 && Object.keys(statuses).length === 0) return;
+        writes.push([this.collection().doc(id), {
+          day: delta.day,
+          ...delta.dimensions,
+          leads: FieldValue.increment(delta.leads),
+          statuses,
+          updated_at: new Date().toISOString()
+        }]);
+      });
+
+      for (let i = 0; i < writes.length; i += BATCH_SIZE) {
+        const batch = db.batch();
+        writes.slice(i, i + BATCH_SIZE).forEach(([ref, data]) => batch.set(ref, data, { merge: true }));
+        await batch.commit();
+      }
+      this.stats.applied += writes.length;
+    } catch (error) {
+      this.stats.failed++;
+      console.error('❌ Marketing rollup update failed:', error.message);
+    }
+  }
+
+  /**
+   * Whether a full rebuild has completed, re-checked at most every
+   * READY_CHECK_MS until it has
+   */
+  async isReady() {
+    if (this.ready || Date.now() - this.readyCheckedAt < READY_CHECK_MS) return this.ready;
+    this.readyCheckedAt = Date.now();
+    try {
+      const meta = await this.collection().doc(META_DOC).get();
+      this.ready = meta.exists && !!meta.data().rebuiltAt;
+    } catch (error) {
+      console.error('❌ Failed to read marketing rollup state:', error.message);
+    }
+    return this.ready;
+  }
+
+  /**
+   * Rollup rows for leads enquired between date_from and date_to (IST days,
+   * YYYY-MM-DD, either may be empty), or null when the rollups can't answer:
+   * not built yet, turned off, or a bound that isn't a whole day
+   */
+  async rowsForRange(dateFrom, dateTo) {
+    if (process.env.MARKETING_ROLLUPS === 'off') return null;
+    if (!isDayOrEmpty(dateFrom) || !isDayOrEmpty(dateTo)) return null;
+    if (!(await this.isReady())) return null;
+
+    let query = this.collection();
+    if (dateFrom) query = query.where('day', '>=', dateFrom);
+    if (dateTo) query = query.where('day', '<=', dateTo);
+    if (!dateFrom && !dateTo) query = query.where('day', '>=', '');
+
+    const snapshot = await query.get();
+    const rows = [];
+    snapshot.forEach(doc => {
+      const row = doc.data();
+      // Leads without an enquiry date only count when no range is asked for
+      if ((dateFrom || dateTo) && row.day === NO_DAY) return;
+      if (!(row.leads > 0)) return;
+      rows.push(row);
+    });
+    this.stats.servedFromRollups++;
+    return rows;
+  }
+
+  /**
+   * Leads enquired in a range, as the routes queried them before rollups
+   */
+  async leadsForRange(dateFrom, dateTo, fields = null) {
+    let { query } = await whereEnquired(db.collection(collections.leads), dateFrom, dateTo);
+    if (fields) query = query.select(...fields);
+
+    const snapshot = await query.get();
+    const leads = [];
+    snapshot.forEach(doc => {
+      leads.push({ id: doc.id, ...doc.data() });
+    });
+    this.stats.servedFromLeads++;
+    return leads;
+  }
+
+  /**
+   * Recompute rollups from the leads: every day, or the IST days from..to.
+   * Rollups in scope that no lead falls into any more are deleted. Leads
+   * written while it runs may be counted as they were when read, so run it
+   * when the CRM is quiet; recent days can be rebuilt again cheaply.
+   */
+  async rebuild({ from = null, to = null } = {}) {
+    const startTime = Date.now();
+    const ranged = !!(from || to);
+    if (!isDayOrEmpty(from) || !isDayOrEmpty(to)) {
+      throw new Error('from and to must be dates (YYYY-MM-DD)');
+    }
+
+    // enquiry_ts is read so ranged pages can start after a document ordered by it
+    let leadQuery = db.collection(collections.leads).select(...LEAD_FIELDS, 'enquiry_ts');
+    let rollupQuery = this.collection().where('day', '>=', from || '');
+    if (ranged) {
+      const enquired = await whereEnquired(leadQuery, from, to);
+      if (to) rollupQuery = rollupQuery.where('day', '<=', to);
+      leadQuery = enquired.query.orderBy(enquired.field);
+    } else {
+      leadQuery = leadQuery.orderBy(FieldPath.documentId());
+    }
+    leadQuery = leadQuery.limit(PAGE_SIZE);
+
+    const rows = new Map();
+    let leadCount = 0;
+    let lastDoc = null;
+    while (true) {
+      const snapshot = await (lastDoc ? leadQuery.startAfter(lastDoc) : leadQuery).get();
+      if (snapshot.empty) break;
+      aggregate(snapshot.docs.map(doc => doc.data()), rows);
+      leadCount += snapshot.size;
+      if (snapshot.size < PAGE_SIZE) break;
+      lastDoc = snapshot.docs[snapshot.docs.length - 1];
+    }
+    if (ranged) {
+      // Only whole days in range are replaced; that leaves out undated leads,
+      // which the range query can't see, and dates stored in other formats
+      // that sort into the range
+      rows.forEach((row, id) => {
+        if (row.day === NO_DAY || (from && row.day < from) || (to && row.day > to)) rows.delete(id);
+      });
+    }
+
+    const existing = await rollupQuery.select('day').get();
+    const stale = existing.docs.filter(doc => !rows.has(doc.id) && !(ranged && doc.data().day === NO_DAY));
+
+    const updatedAt = new Date().toISOString();
+    const writes = [
+      ...stale.map(doc => batch => batch.delete(doc.ref)),
+      ...Array.from(rows, ([id, row]) => batch => batch.set(this.collection().doc(id), { ...row, updated_at: updatedAt }))
+    ];
+    for (let i = 0; i < writes.length; i += BATCH_SIZE) {
+      const batch = db.batch();
+      writes.slice(i, i + BATCH_SIZE).forEach(write => write(batch));
+      await batch.commit();
+    }
+
+    const result = {
+      from,
+      to,
+      leads: leadCount,
+      rollups: rows.size,
+      deleted: stale.length,
+      processingTimeMs: Date.now() - startTime
+    };
+    await this.collection().doc(META_DOC).set(ranged
+      ? { lastRangeRebuild: { ...result, at: updatedAt } }
+      : { rebuiltAt: updatedAt, lastRebuild: result }, { merge: true });
+    if (!ranged) this.ready = true;
+
+    console.log(`📈 Marketing rollups rebuilt${ranged ? ` for ${from || '…'} to ${to || '…'}` : ''}: ${leadCount} leads into ${rows.size} rollups, ${stale.length} removed in ${result.processingTimeMs}ms`);
+    return result;
+  }
+
+  async acquireLease() {
+    const leaseRef = this.collection().doc(LEASE_DOC);
+    return db.runTransaction(async transaction => {
+      const lease = await transaction.get(leaseRef);
+      if (lease.exists && lease.data().expiresAt > Date.now() && lease.data().owner !== this.instanceId) {
+        return false;
+      }
+      transaction.set(leaseRef, { owner: this.instanceId, expiresAt: Date.now() + LEASE_MS });
+      return true;
+    });
+  }
+
+  async releaseLease() {
+    const leaseRef = this.collection().doc(LEASE_DOC);
+    await db.runTransaction(async transaction => {
+      const lease = await transaction.get(leaseRef);
+      if (lease.exists && lease.data().owner === this.instanceId) {
+        transaction.set(leaseRef, { owner: null, expiresAt: 0 });
+      }
+    });
+  }
+
+  /**
+   * Full rebuild, unless another instance holds the lease (returns null)
+   */
+  async reconcile() {
+    if (!(await this.acquireLease())) {
+      console.log('⏭️ Marketing rollups are being rebuilt by another instance');
+      return null;
+    }
+    try {
+      return await this.rebuild();
+    } finally {
+      await this.releaseLease().catch(error => console.error('❌ Failed to release rollup lease:', error.message));
+    }
+  }
+
+  startReconciler(intervalMs) {
+    if (this.reconcileTimer) return;
+    this.reconcileTimer = setInterval(() => {
+      this.reconcile().catch(error => console.error('❌ Marketing rollup reconcile failed:', error.message));
+    }, intervalMs);
+    this.reconcileTimer.unref();
+  }
+
+  stopReconciler() {
+    clearInterval(this.reconcileTimer);
+    this.reconcileTimer = null;
+  }
+
+  status() {
+    return {
+      ready: this.ready,
+      enabled: process.env.MARKETING_ROLLUPS !== 'off',
+      ...this.stats
+    };
+  }
+}
+
+const marketingRollups = new MarketingRollups();
+
+module.exports = marketingRollups;
+module.exports.aggregate = aggregate;
+module.exports.summarize = summarize;
+module.exports.TOUCH_BASED_STATUSES = TOUCH_BASED_STATUSES;
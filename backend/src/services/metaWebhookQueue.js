@@ -0,0 +1,267 @@
+const { db } = require('../config/db');
+
+/**
+ * Meta Webhook Queue
+ * Durable work queue behind POST /webhooks/meta-leads when
+ * META_WEBHOOK_MODE=queue. The route verifies the signature, enqueue()s each
+ * leadgen event and answers Meta straight away; the Graph fetch, lead write,
+ * assignment and notifications run later in drain().
+ *
+ * Each event is one document in crm_meta_webhook_queue keyed by leadgen_id,
+ * written with create(), so a delivery Meta retries is recognised and
+ * dropped. Documents move pending -> processing -> done, or back to pending
+ * with an exponential backoff after a failure, and to failed after
+ * MAX_ATTEMPTS. Claiming an item is a transaction that pushes available_at
+ * out by LEASE_MS, so an item held by an instance that died is picked up
+ * again once the lease runs out.
+ *
+ * drain() runs after every enqueue, on a timer (startWorker) and from
+ * POST /api/cron/drain-meta-webhooks, since Cloud Run may throttle the CPU
+ * once the response has gone out.
+ */
+
+const QUEUE_COLLECTION = 'crm_meta_webhook_queue';
+const CONCURRENCY = parseInt(process.env.META_WEBHOOK_CONCURRENCY || '4');
+const MAX_ATTEMPTS = parseInt(process.env.META_WEBHOOK_MAX_ATTEMPTS || '6');
+const BACKOFF_BASE_MS = 5 * 1000;
+const BACKOFF_MAX_MS = 15 * 60 * 1000;
+const LEASE_MS = 2 * 60 * 1000;
+const CLAIM_BATCH = CONCURRENCY * 5;
+const LAG_SAMPLES = 200;
+
+// Firestore error code for create() on an existing document
+const ALREADY_EXISTS = 6;
+
+function backoffMs(attempts) {
+  const delay = Math.min(BACKOFF_BASE_MS * Math.pow(2, attempts - 1), BACKOFF_MAX_MS);
+  // Up to 20% jitter so retries from one spike don't land together
+  return Math.round(delay * (1 + Math.random() * 0.2));
+}
+
+function percentile(sorted, p) {
+  if (sorted.length === 0) return null;
+  return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))];
+}
+
+class MetaWebhookQueue {
+  constructor() {
+    this.handler = null;
+    this.draining = null;
+    this.drainAgain = false;
+    this.workerTimer = null;
+    this.lags = [];
+    this.stats = {
+      enqueued: 0,
+      duplicates: 0,
+      processed: 0,
+      retried: 0,
+      failed: 0,
+      claimConflicts: 0,
+      lastDrainAt: null
+    };
+  }
+
+  collection() {
+    return db.collection(QUEUE_COLLECTION);
+  }
+
+  /**
+   * The function that processes one event: handler(event, { attempts })
+   * resolving to the lead id
+   */
+  setHandler(handler) {
+    this.handler = handler;
+  }
+
+  /**
+   * Persist leadgen events. Returns { enqueued, duplicates }; throws if an
+   * event could not be stored, so the caller can let Meta retry.
+   */
+  async enqueue(events) {
+    const now = Date.now();
+    const results = await Promise.all(events.map(async event => {
+      const id = String(event.leadgen_id);
+      try {
+        await this.collection().doc(id).create({
+          leadgen_id: id,
+          page_id: event.page_id || null,
+          form_id: event.form_id || null,
+          event,
+          status: 'pending',
+          attempts: 0,
+          received_at: now,
+          available_at: now,
+          created_date: new Date(now).toISOString()
+        });
+        return 'enqueued';
+      } catch (error) {
+        if (error.code === ALREADY_EXISTS) return 'duplicate';
+        throw error;
+      }
+    }));
+
+    const enqueued = results.filter(result => result === 'enqueued').length;
+    const duplicates = results.length - enqueued;
+    this.stats.enqueued += enqueued;
+    this.stats.duplicates += duplicates;
+    if (duplicates > 0) {
+      console.log(`♻️ Meta webhook: ${duplicates} redelivered leadgen event(s) ignored`);
+    }
+    return { enqueued, duplicates };
+  }
+
+  /**
+   * Take an item for LEASE_MS. Returns its data, or null if another worker
+   * got there first or it's no longer due.
+   */
+  async claim(ref) {
+    return db.runTransaction(async transaction => {
+      const doc = await transaction.get(ref);
+      if (!doc.exists) return null;
+      const item = doc.data();
+      const now = Date.now();
+      if (!['pending', 'processing'].includes(item.status) || item.available_at > now) return null;
+
+      const claimed = {
+        status: 'processing',
+        attempts: (item.attempts || 0) + 1,
+        available_at: now + LEASE_MS,
+        started_at: now
+      };
+      transaction.update(ref, claimed);
+      return { ...item, ...claimed };
+    });
+  }
+
+  async processItem(ref) {
+    const item = await this.claim(ref);
+    if (!item) {
+      this.stats.claimConflicts++;
+      return;
+    }
+
+    try {
+      const leadId = await this.handler(item.event, { attempts: item.attempts });
+      const now = Date.now();
+      await ref.update({
+        status: 'done',
+        lead_id: leadId || null,
+        processed_at: now,
+        lag_ms: now - item.received_at,
+        last_error: null
+      });
+      this.stats.processed++;
+      this.lags.push(now - item.received_at);
+      if (this.lags.length > LAG_SAMPLES) this.lags.shift();
+    } catch (error) {
+      const giveUp = item.attempts >= MAX_ATTEMPTS;
+      const delay = backoffMs(item.attempts);
+      console.error(`❌ Meta webhook: leadgen ${item.leadgen_id} failed (attempt ${item.attempts}/${MAX_ATTEMPTS})` +
+        (giveUp ? ', giving up' : `, retrying in ${Math.round(delay / 1000)}s`) + ':', error.message);
+      await ref.update({
+        status: giveUp ? 'failed' : 'pending',
+        available_at: giveUp ? Number.MAX_SAFE_INTEGER : Date.now() + delay,
+        last_error: error.message,
+        failed_at: Date.now()
+      }).catch(updateError => console.error('❌ Meta webhook: failed to record error:', updateError.message));
+      if (giveUp) this.stats.failed++;
+      else this.stats.retried++;
+    }
+  }
+
+  /**
+   * Process due items, CONCURRENCY at a time, until none are left. Calls
+   * while a drain is running make it go round once more instead of starting
+   * a second one.
+   */
+  async drain() {
+    if (!this.handler) return;
+    if (this.draining) {
+      this.drainAgain = true;
+      return this.draining;
+    }
+
+    this.draining = (async () => {
+      do {
+        this.drainAgain = false;
+        let snapshot;
+        do {
+          snapshot = await this.collection()
+            .where('status', 'in', ['pending', 'processing'])
+            .where('available_at', '<=', Date.now())
+            .orderBy('available_at')
+            .limit(CLAIM_BATCH)
+            .get();
+
+          const refs = snapshot.docs.map(doc => doc.ref);
+          const workers = Array.from({ length: Math.min(CONCURRENCY, refs.length) }, async () => {
+            while (refs.length > 0) {
+              await this.processItem(refs.shift());
+            }
+          });
+          await Promise.all(workers);
+        } while (snapshot.size === CLAIM_BATCH);
+      } while (this.drainAgain);
+      this.stats.lastDrainAt = new Date().toISOString();
+    })()
+      .catch(error => console.error('❌ Meta webhook queue drain failed:', error.message))
+      .finally(() => {
+        this.draining = null;
+      });
+
+    return this.draining;
+  }
+
+  startWorker(intervalMs) {
+    if (this.workerTimer) return;
+    this.workerTimer = setInterval(() => this.drain(), intervalMs);
+    this.workerTimer.unref();
+    // Pick up whatever an earlier instance left behind
+    this.drain();
+  }
+
+  stopWorker() {
+    clearInterval(this.workerTimer);
+    this.workerTimer = null;
+  }
+
+  /**
+   * Queue depth by status, age of the oldest due item and the processing
+   * lag (receipt to lead saved) over the last LAG_SAMPLES events
+   */
+  async status() {
+    const [pending, processing, failed, oldest] = await Promise.all([
+      this.collection().where('status', '==', 'pending').count().get(),
+      this.collection().where('status', '==', 'processing').count().get(),
+      this.collection().where('status', '==', 'failed').count().get(),
+      this.collection()
+        .where('status', 'in', ['pending', 'processing'])
+        .where('available_at', '<=', Date.now())
+        .orderBy('available_at')
+        .limit(1)
+        .get()
+    ]);
+
+    const lags = [...this.lags].sort((a, b) => a - b);
+    return {
+      depth: {
+        pending: pending.data().count,
+        processing: processing.data().count,
+        failed: failed.data().count
+      },
+      oldestDueSeconds: oldest.empty ? 0 : Math.round((Date.now() - oldest.docs[0].data().received_at) / 1000),
+      lagMs: {
+        samples: lags.length,
+        p50: percentile(lags, 0.5),
+        p95: percentile(lags, 0.95),
+        max: lags.length ? lags[lags.length - 1] : null
+      },
+      draining: !!this.draining,
+      concurrency: CONCURRENCY,
+      maxAttempts: MAX_ATTEMPTS,
+      ...this.stats
+    };
+  }
+}
+
+module.exports = new MetaWebhookQueue();
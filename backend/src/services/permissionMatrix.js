@@ -0,0 +1,129 @@
+const { db, collections } = require('../config/db');
+const { DEFAULT_ROLES } = require('../config/roles');
+
+/**
+ * Permission Matrix
+ * The role -> permission table from crm_roles, compiled to a Set of
+ * 'module.action' strings per role so checkPermission is a lookup.
+ *
+ * Kept current by an onSnapshot listener on crm_roles (a handful of
+ * documents, so every change recompiles the whole table). Until the first
+ * snapshot arrives, load() reads the collection once so early requests are
+ * still checked against the stored roles. Built-in roles that crm_roles
+ * doesn't define keep their DEFAULT_ROLES grants.
+ */
+
+const RETRY_DELAY_MS = 5000;
+const MAX_RETRY_DELAY_MS = 5 * 60 * 1000;
+
+function grantsOf(permissions) {
+  const granted = new Set();
+  Object.entries(permissions || {}).forEach(([module, actions]) => {
+    Object.entries(actions || {}).forEach(([action, allowed]) => {
+      if (allowed === true) granted.add(`${module}.${action}`);
+    });
+  });
+  return granted;
+}
+
+function compile(docs) {
+  const roles = new Map();
+  DEFAULT_ROLES.forEach(role => roles.set(role.name, grantsOf(role.permissions)));
+  docs.forEach(doc => {
+    const role = doc.data();
+    // Roles are keyed by name; documents created by /initialize use it as id
+    roles.set(role.name || doc.id, grantsOf(role.permissions));
+  });
+  return roles;
+}
+
+class PermissionMatrix {
+  constructor({ firestore = db, collection = collections.roles } = {}) {
+    this.firestore = firestore;
+    this.collection = collection;
+    this.roles = new Map();
+    this.ready = false;
+    this.unsubscribe = null;
+    this.loadPromise = null;
+    this.retryDelay = RETRY_DELAY_MS;
+    this.stats = { compiledAt: null, compiles: 0, errors: 0 };
+  }
+
+  apply(docs, source) {
+    this.roles = compile(docs);
+    this.ready = true;
+    this.stats.compiledAt = new Date().toISOString();
+    this.stats.compiles++;
+    console.log(`🔐 Permission matrix compiled from ${source}: ${this.roles.size} roles`);
+  }
+
+  /**
+   * Subscribe to crm_roles
+   */
+  start() {
+    if (this.unsubscribe) return;
+    this.unsubscribe = this.firestore.collection(this.collection).onSnapshot(snapshot => {
+      this.retryDelay = RETRY_DELAY_MS;
+      this.apply(snapshot.docs, 'listener');
+    }, error => {
+      // Keep the last compiled matrix; it is only stale until the listener is back
+      console.error('❌ Permission matrix listener failed:', error.message);
+      this.stats.errors++;
+      this.unsubscribe = null;
+      setTimeout(() => this.start(), this.retryDelay);
+      this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY_MS);
+    });
+  }
+
+  stop() {
+    if (this.unsubscribe) this.unsubscribe();
+    this.unsubscribe = null;
+  }
+
+  /**
+   * Make sure a matrix is available: starts the listener and, the first
+   * time, reads the roles directly rather than waiting for it
+   */
+  async load() {
+    this.start();
+    if (this.ready) return;
+    if (!this.loadPromise) {
+      this.loadPromise = this.firestore.collection(this.collection).get()
+        .then(snapshot => {
+          if (!this.ready) this.apply(snapshot.docs, 'read');
+        })
+        .finally(() => {
+          this.loadPromise = null;
+        });
+    }
+    await this.loadPromise;
+  }
+
+  /**
+   * Whether the role grants any of the 'module.action' keys; null if the
+   * role is neither in crm_roles nor a built-in role
+   */
+  allows(role, keys) {
+    const granted = this.roles.get(role);
+    if (!granted) return null;
+    return keys.some(key => granted.has(key));
+  }
+
+  status() {
+    const roles = {};
+    this.roles.forEach((granted, role) => {
+      roles[role] = granted.size;
+    });
+    return {
+      ready: this.ready,
+      listening: !!this.unsubscribe,
+      roles,
+      ...this.stats
+    };
+  }
+}
+
+const permissionMatrix = new PermissionMatrix();
+
+module.exports = permissionMatrix;
+module.exports.PermissionMatrix = PermissionMatrix;
@@ -0,0 +1,271 @@
+const { db, collections } = require('../config/db');
+const salesPerformanceCache = require('./salesPerformanceCache');
+
+/**
+ * Sales Margin Service
+ * Margin per salesperson for GET /api/finance/sales-margins: selling price
+ * of each order that has allocations, less the buying price of those
+ * allocations.
+ *
+ * Orders, allocations and inventory are read once and indexed (orders by
+ * salesperson key, allocations by order, inventory by id and event name), so
+ * each user costs a few map lookups however many orders and staff there
+ * are. Matching is the same as the per-user filters this replaces,
+ * including which inventory item wins when several match.
+ *
+ * The result is held in the 'margins' namespace of salesPerformanceCache,
+ * which is invalidated with every sales performance bump. Allocation,
+ * inventory and user writes, and order updates touching fields only margins
+ * use (touchesOrder), bump it directly.
+ */
+
+const CACHE_NAMESPACE = 'margins';
+const CACHE_KEY = 'all';
+
+const ORDER_FIELDS = [
+  'sales_person', 'sales_person_email', 'assigned_to', 'order_number', 'lead_id',
+  'event_name', 'payment_currency', 'total_amount', 'inr_equivalent'
+];
+const ALLOCATION_FIELDS = [
+  'isDeleted', 'order_ids', 'lead_id', 'inventory_event', 'inventory_id',
+  'category_name', 'category_section', 'tickets_allocated'
+];
+const INVENTORY_FIELDS = [
+  'isDeleted', 'event_name', 'categories', 'buying_price_inr', 'buying_price',
+  'price_currency', 'exchange_rate'
+];
+const USER_FIELDS = ['isDeleted', 'role', 'name', 'email'];
+
+function addTo(map, key, value) {
+  if (!map.has(key)) map.set(key, []);
+  map.get(key).push(value);
+}
+
+/**
+ * Keys an order is filed under; a user's orders are those under
+ * userKeys(user). Tagged by field so a name can't match an id.
+ */
+function orderKeys(order) {
+  return [
+    `person:${order.sales_person}`,
+    `email:${order.sales_person_email}`,
+    `assigned:${order.assigned_to}`
+  ];
+}
+
+function userKeys(user) {
+  return [
+    `person:${user.name}`,
+    `person:${user.email}`,
+    `email:${user.email}`,
+    `assigned:${user.id}`
+  ];
+}
+
+function toINR(price, inventoryItem) {
+  if (inventoryItem.price_currency && inventoryItem.price_currency !== 'INR' && inventoryItem.exchange_rate) {
+    return price * parseFloat(inventoryItem.exchange_rate);
+  }
+  return price;
+}
+
+/**
+ * Per-ticket buying price in INR: the allocation's category, falling back
+ * to the inventory-level price
+ */
+function buyingPricePerTicket(allocation, inventoryItem) {
+  let buyingPrice = 0;
+
+  if (allocation.category_name && inventoryItem.categories) {
+    const category = inventoryItem.categories.find(cat =>
+      cat.name === allocation.category_name &&
+      (!allocation.category_section || cat.section === allocation.category_section)
+    );
+    if (category) {
+      if (category.buying_price_inr) {
+        buyingPrice = parseFloat(category.buying_price_inr);
+      } else if (category.buying_price) {
+        buyingPrice = toINR(parseFloat(category.buying_price), inventoryItem);
+      }
+    }
+  }
+
+  if (buyingPrice === 0) {
+    if (inventoryItem.buying_price_inr) {
+      buyingPrice = parseFloat(inventoryItem.buying_price_inr);
+    } else if (inventoryItem.buying_price) {
+      buyingPrice = toINR(parseFloat(inventoryItem.buying_price), inventoryItem);
+    }
+  }
+
+  return buyingPrice;
+}
+
+/**
+ * Margins for every user in one pass over orders, allocations and
+ * inventory. Inputs are arrays of { id, ...data }, deleted documents and
+ * viewers already removed.
+ */
+function computeSalesMargins({ orders, allocations, inventory, users }) {
+  // Inventory: first item in list order by id and by event name, as find() did
+  const inventoryById = new Map();
+  const inventoryByEvent = new Map();
+  inventory.forEach((item, seq) => {
+    if (!inventoryById.has(item.id)) inventoryById.set(item.id, seq);
+    if (!inventoryByEvent.has(item.event_name)) inventoryByEvent.set(item.event_name, seq);
+  });
+
+  // Allocations by order id / order number, and by lead then event. Map
+  // keys compare like ===, so missing values match missing values as before.
+  const allocationsByOrderRef = new Map();
+  const allocationsByLead = new Map();
+  allocations.forEach((allocation, seq) => {
+    if (allocation.order_ids) {
+      new Set(allocation.order_ids).forEach(ref => addTo(allocationsByOrderRef, ref, seq));
+    }
+    if (!allocationsByLead.has(allocation.lead_id)) allocationsByLead.set(allocation.lead_id, new Map());
+    addTo(allocationsByLead.get(allocation.lead_id), allocation.inventory_event, seq);
+  });
+
+  // Figures per order, computed once however many users share it
+  const orderFigures = orders.map(order => {
+    const matched = new Set([
+      ...(allocationsByOrderRef.get(order.id) || []),
+      ...(allocationsByOrderRef.get(order.order_number) || []),
+      ...((allocationsByLead.get(order.lead_id) || new Map()).get(order.event_name) || [])
+    ]);
+    if (matched.size === 0) return null;
+
+    let buyingPrice = 0;
+    [...matched].sort((a, b) => a - b).forEach(seq => {
+      const allocation = allocations[seq];
+      const byId = inventoryById.get(allocation.inventory_id);
+      const byEvent = inventoryByEvent.get(allocation.inventory_event);
+      const itemSeq = byId === undefined ? byEvent : byEvent === undefined ? byId : Math.min(byId, byEvent);
+      if (itemSeq === undefined) return;
+      buyingPrice += (allocation.tickets_allocated || 0) * buyingPricePerTicket(allocation, inventory[itemSeq]);
+    });
+
+    const sellingPrice = order.payment_currency === 'INR'
+      ? parseFloat(order.total_amount || 0)
+      : parseFloat(order.inr_equivalent || 0);
+    return { sellingPrice, buyingPrice };
+  });
+
+  const ordersByKey = new Map();
+  orders.forEach((order, seq) => {
+    new Set(orderKeys(order)).forEach(key => addTo(ordersByKey, key, seq));
+  });
+
+  return users.map(user => {
+    const userOrders = new Set();
+    new Set(userKeys(user)).forEach(key => {
+      (ordersByKey.get(key) || []).forEach(seq => userOrders.add(seq));
+    });
+
+    let totalSellingPrice = 0;
+    let totalBuyingPrice = 0;
+    let processedOrders = 0;
+    [...userOrders].sort((a, b) => a - b).forEach(seq => {
+      const figures = orderFigures[seq];
+      if (!figures) return;
+      totalSellingPrice += figures.sellingPrice;
+      totalBuyingPrice += figures.buyingPrice;
+      processedOrders++;
+    });
+
+    const margin = totalSellingPrice - totalBuyingPrice;
+    const marginPercentage = totalSellingPrice > 0 ? (margin / totalSellingPrice * 100) : 0;
+
+    return {
+      userId: user.id,
+      userName: user.name,
+      totalOrders: userOrders.size,
+      processedOrders,
+      totalSellingPrice,
+      totalBuyingPrice,
+      margin,
+      marginPercentage: Math.round(marginPercentage * 100) / 100
+    };
+  });
+}
+
+async function readCollection(collectionName, fields, keep = () => true) {
+  const snapshot = await db.collection(collectionName).select(...fields).get();
+  const docs = [];
+  snapshot.forEach(doc => {
+    const data = doc.data();
+    if (keep(data)) docs.push({ id: doc.id, ...data });
+  });
+  return docs;
+}
+
+class SalesMarginService {
+  constructor() {
+    this.computing = null;
+  }
+
+  async compute() {
+    const startTime = Date.now();
+    const [orders, allocations, inventory, users] = await Promise.all([
+      // No filtering, to match sales performance
+      readCollection(collections.orders, ORDER_FIELDS),
+      readCollection(collections.allocations, ALLOCATION_FIELDS, data => data.isDeleted !== true),
+      readCollection(collections.inventory, INVENTORY_FIELDS, data => data.isDeleted !== true),
+      readCollection(collections.users, USER_FIELDS, data => data.isDeleted !== true && data.role !== 'viewer')
+    ]);
+
+    const salesMargins = computeSalesMargins({ orders, allocations, inventory, users });
+    console.log(`💰 Sales margins calculated for ${users.length} users across ${orders.length} orders in ${Date.now() - startTime}ms`);
+    return salesMargins;
+  }
+
+  /**
+   * Margins for every user: { data, cached, ageMs }. Concurrent misses share
+   * one computation; refresh skips the cache.
+   */
+  async getSalesMargins({ refresh = false } = {}) {
+    const cached = await salesPerformanceCache.get(CACHE_NAMESPACE, CACHE_KEY, { bypass: refresh });
+    if (cached.hit) {
+      return { data: cached.value, cached: true, ageMs: cached.ageMs };
+    }
+
+    if (!this.computing) {
+      this.computing = this.compute()
+        .then(data => {
+          salesPerformanceCache.set(CACHE_NAMESPACE, CACHE_KEY, data, cached.version);
+          return data;
+        })
+        .finally(() => {
+          this.computing = null;
+        });
+    }
+    const data = await this.computing;
+    return { data, cached: false, ageMs: 0 };
+  }
+
+  /**
+   * Whether an order update can change margins
+   */
+  touchesOrder(updateData) {
+    return ORDER_FIELDS.some(field => updateData[field] !== undefined);
+  }
+
+  /**
+   * Whether a user update can change who margins are reported for
+   */
+  touchesUser(updateData) {
+    return USER_FIELDS.some(field => updateData[field] !== undefined);
+  }
+
+  /**
+   * Drop cached margins on every instance after an allocation, inventory,
+   * order or user change
+   */
+  async invalidate(reason) {
+    await salesPerformanceCache.bump([CACHE_NAMESPACE], reason);
+  }
+}
+
+module.exports = new SalesMarginService();
+module.exports.computeSalesMargins = computeSalesMargins;
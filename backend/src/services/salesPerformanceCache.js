@@ -0,0 +1,241 @@
+const { FieldValue } = require('@google-cloud/firestore');
+const { db } = require('../config/db');
+const { periodsContaining } = require('../utils/salesPeriods');
+
+/**
+ * Sales Performance Cache
+ * Computed sales-performance (keyed by period), retail-tracker (keyed by
+ * date range) and sales-margin results, held per instance in LRU maps with
+ * a TTL per namespace.
+ *
+ * Instances agree on freshness through version counters in one Firestore
+ * document: a namespace version ('sales') and per-key versions
+ * ('sales:current_fy'). An entry is served only while the versions it was
+ * computed under are current. Each instance re-reads the document at most
+ * once per VERSION_CHECK_MS, on demand rather than from a listener, since
+ * Cloud Run throttles CPU between requests. Writes that change the inputs
+ * call bump() / invalidateOrders(), which increment the counters for every
+ * instance. A namespace that follows another ('margins' follows 'sales') is
+ * bumped along with any of its keys.
+ */
+
+const VERSIONS_COLLECTION = 'crm_cache_versions';
+const VERSIONS_DOC = 'sales_performance';
+const VERSION_CHECK_MS = parseInt(process.env.SALES_CACHE_VERSION_CHECK_MS || '10000');
+
+const NAMESPACES = {
+  sales: { ttlMs: 6 * 60 * 60 * 1000, maxEntries: 20 },  // 6 hours, one entry per period
+  retail: { ttlMs: 1 * 60 * 60 * 1000, maxEntries: 10 },  // 1 hour, one entry per date range
+  // 1 hour; allocation and inventory edits don't bump 'sales', so also bumped directly
+  margins: { ttlMs: 1 * 60 * 60 * 1000, maxEntries: 1, follows: 'sales' }
+};
+
+// Order fields the sales performance figures are computed from
+const ORDER_FIELDS = [
+  'event_date', 'sales_person', 'sales_person_email', 'payment_currency', 'exchange_rate',
+  'base_amount', 'total_amount', 'buying_price_inclusions', 'allocation_ids', 'order_number'
+];
+
+function emptyStats() {
+  return { hits: 0, misses: 0, expired: 0, invalidated: 0, bypassed: 0, evictions: 0 };
+}
+
+class SalesPerformanceCache {
+  constructor() {
+    this.entries = {};
+    this.stats = {};
+    Object.keys(NAMESPACES).forEach(namespace => {
+      this.entries[namespace] = new Map();
+      this.stats[namespace] = emptyStats();
+    });
+    this.versions = {};
+    this.versionsCheckedAt = 0;
+    this.versionsPromise = null;
+    this.bumps = 0;
+    this.versionErrors = 0;
+  }
+
+  versionsRef() {
+    return db.collection(VERSIONS_COLLECTION).doc(VERSIONS_DOC);
+  }
+
+  /**
+   * Re-read the shared versions if the last check is older than
+   * VERSION_CHECK_MS. Concurrent callers share one read; if it fails the
+   * last known versions stay in use.
+   */
+  async refreshVersions() {
+    if (Date.now() - this.versionsCheckedAt < VERSION_CHECK_MS) return;
+    if (!this.versionsPromise) {
+      this.versionsPromise = this.versionsRef().get()
+        .then(doc => {
+          this.versions = (doc.exists && doc.data().versions) || {};
+          this.versionsCheckedAt = Date.now();
+        })
+        .catch(error => {
+          this.versionErrors++;
+          console.error('❌ Failed to read sales performance cache versions:', error.message);
+        })
+        .finally(() => {
+          this.versionsPromise = null;
+        });
+    }
+    await this.versionsPromise;
+  }
+
+  versionOf(namespace, key) {
+    return `${this.versions[namespace] || 0}.${this.versions[`${namespace}:${key}`] || 0}`;
+  }
+
+  /**
+   * Look up a cached result: { hit, value, ageMs, version }. Pass the
+   * returned version to set() so a result computed while a bump landed is
+   * not served as current. bypass skips the lookup (force refresh).
+   */
+  async get(namespace, key, { bypass = false } = {}) {
+    await this.refreshVersions();
+    const version = this.versionOf(namespace, key);
+    const entries = this.entries[namespace];
+    const stats = this.stats[namespace];
+
+    if (bypass) {
+      stats.bypassed++;
+      return { hit: false, version };
+    }
+
+    const entry = entries.get(key);
+    if (!entry) {
+      stats.misses++;
+      return { hit: false, version };
+    }
+    if (entry.version !== version) {
+      entries.delete(key);
+      stats.invalidated++;
+      stats.misses++;
+      return { hit: false, version };
+    }
+    const ageMs = Date.now() - entry.storedAt;
+    if (ageMs >= NAMESPACES[namespace].ttlMs) {
+      entries.delete(key);
+      stats.expired++;
+      stats.misses++;
+      return { hit: false, version };
+    }
+
+    // Most recently used goes to the end
+    entries.delete(key);
+    entries.set(key, entry);
+    stats.hits++;
+    return { hit: true, value: entry.value, ageMs, version };
+  }
+
+  set(namespace, key, value, version) {
+    const entries = this.entries[namespace];
+    entries.delete(key);
+    entries.set(key, { value, version, storedAt: Date.now() });
+
+    while (entries.size > NAMESPACES[namespace].maxEntries) {
+      entries.delete(entries.keys().next().value);
+      this.stats[namespace].evictions++;
+    }
+  }
+
+  /**
+   * Invalidate cached results on every instance. keys are namespaces
+   * ('sales') or single entries ('sales:current_fy'). Never throws: a failed
+   * bump only leaves other instances on the TTL.
+   */
+  async bump(keys, reason) {
+    if (keys.length === 0) return;
+    keys = [...keys];
+    Object.entries(NAMESPACES).forEach(([namespace, config]) => {
+      if (!config.follows || keys.includes(namespace)) return;
+      if (keys.some(key => key === config.follows || key.startsWith(`${config.follows}:`))) {
+        keys.push(namespace);
+      }
+    });
+    keys.forEach(key => {
+      this.versions[key] = (this.versions[key] || 0) + 1;
+    });
+    this.bumps++;
+
+    try {
+      const versions = {};
+      keys.forEach(key => {
+        versions[key] = FieldValue.increment(1);
+      });
+      await this.versionsRef().set({
+        versions,
+        updatedAt: new Date().toISOString(),
+        lastReason: reason
+      }, { merge: true });
+      // Re-read on the next lookup, in case a read in flight predates the bump
+      this.versionsCheckedAt = 0;
+      console.log(`🧹 Sales performance cache invalidated (${reason}): ${keys.join(', ')}`);
+    } catch (error) {
+      this.versionErrors++;
+      console.error('❌ Failed to bump sales performance cache versions:', error.message);
+    }
+  }
+
+  /**
+   * Whether an order update can change sales performance figures
+   */
+  touchesOrder(updateData) {
+    return ORDER_FIELDS.some(field => updateData[field] !== undefined);
+  }
+
+  /**
+   * Invalidate the sales periods that order writes fall into. changes are
+   * [before, after] pairs of order data, null for a create/delete.
+   */
+  async invalidateOrders(changes, reason = 'order update') {
+    const keys = new Set();
+    let unknownDate = false;
+    changes.forEach(pair => {
+      pair.filter(Boolean).forEach(order => {
+        const periods = order.event_date ? periodsContaining(order.event_date) : ['lifetime'];
+        if (periods) {
+          periods.forEach(period => keys.add(`sales:${period}`));
+        } else {
+          unknownDate = true;
+        }
+      });
+    });
+    // Can't tell which periods an unparseable event_date matches
+    await this.bump(unknownDate ? ['sales'] : [...keys], reason);
+  }
+
+  clear() {
+    Object.keys(NAMESPACES).forEach(namespace => this.entries[namespace].clear());
+  }
+
+  status() {
+    const namespaces = {};
+    Object.entries(NAMESPACES).forEach(([namespace, config]) => {
+      const stats = this.stats[namespace];
+      const lookups = stats.hits + stats.misses;
+      namespaces[namespace] = {
+        ttlMinutes: config.ttlMs / 60000,
+        maxEntries: config.maxEntries,
+        entries: Array.from(this.entries[namespace].entries()).map(([key, entry]) => ({
+          key,
+          ageMinutes: Math.round((Date.now() - entry.storedAt) / 60000),
+          current: entry.version === this.versionOf(namespace, key)
+        })),
+        ...stats,
+        hitRate: lookups > 0 ? Math.round((stats.hits / lookups) * 1000) / 10 : null
+      };
+    });
+    return {
+      namespaces,
+      versions: this.versions,
+      versionsCheckedAt: this.versionsCheckedAt ? new Date(this.versionsCheckedAt).toISOString() : null,
+      versionCheckSeconds: VERSION_CHECK_MS / 1000,
+      bumps: this.bumps,
+      versionErrors: this.versionErrors
+    };
+  }
+}
+
+module.exports = new SalesPerformanceCache();
@@ -1,88 +1,72 @@
+const { Timestamp } = require('@google-cloud/firestore');
 const { db, collections } = require('../config/db');
 const { convertToIST } = require('../utils/dateHelpers');
+const {
+  PERIODS,
+  emptyAggregates,
+  contributionFor,
+  applyContribution,
+  withMargin,
+  buildStats,
+  diffStats
+} = require('./statsContributions');
 
 /**
  * Stats Aggregation Service
  * Calculates and stores all performance metrics in a single collection
  * Used by: Financials, Sales Performance, Marketing Performance
+ *
+ * Modes (aggregateAllStats({ mode })):
+ * - full: reads every source collection and recomputes from scratch
+ * - incremental: reads only documents created or updated since the last run
+ *   and folds their contribution deltas (see statsContributions.js) into
+ *   the aggregates stored in crm_performance_stats/incremental
+ * - rebuild: recomputes the incremental aggregates and contribution records
+ *   from scratch; incremental runs fall back to it when needed
  */
 
+// Collections folded in incrementally. Allocations come before orders so
+// orders see the buying price of this run's allocation changes
+const INCREMENTAL_SOURCES = {
+  allocations: collections.allocations,
+  orders: collections.orders,
+  leads: collections.leads,
+  receivables: collections.receivables,
+  payables: collections.payables
+};
+
+const STATE_VERSION = 1;
+const CONTRIBUTIONS_COLLECTION = 'crm_stats_contributions';
+// Re-read changes this far behind the watermark to allow for clock skew
+// between app instances; folding a document twice is harmless
+const WATERMARK_OVERLAP_MS = 5 * 60 * 1000;
+// Writes that skip updated_date are invisible to incremental runs, so the
+// aggregates are rebuilt from scratch at least this often
+const FULL_REBUILD_MS = (parseFloat(process.env.STATS_FULL_REBUILD_HOURS) || 24) * 60 * 60 * 1000;
+const BATCH_SIZE = 500;
+
 class StatsAggregationService {
   constructor() {
     this.statsCollection = 'crm_performance_stats';
+    this.stateDocId = 'incremental';
   }
 
   /**
-   * Main aggregation function - calculates all stats
+   * Main aggregation function - calculates and stores all stats
    */
-  async aggregateAllStats() {
+  async aggregateAllStats({ mode = 'full' } = {}) {
+    if (mode === 'incremental') {
+      return this.aggregateIncrementalStats();
+    }
+    if (mode === 'rebuild') {
+      return this.rebuildIncrementalState('requested');
+    }
+
     console.log('🔄 Starting stats aggregation...');
     const startTime = Date.now();
-    
-    try {
-      // Get all required data
-      const [
-        ordersSnapshot,
-        leadsSnapshot,
-        allocationsSnapshot,
-        inventorySnapshot,
-        usersSnapshot,
-        salesMembersSnapshot,
-        retailMembersSnapshot,
-        receivablesSnapshot,
-        payablesSnapshot
-      ] = await Promise.all([
-        db.collection(collections.orders).get(),
-        db.collection(collections.leads).get(),
-        db.collection(collections.allocations).get(),
-        db.collection(collections.inventory).get(),
-        db.collection('crm_users').get(),
-        db.collection('sales_performance_members').get(),
-        db.collection('retail_tracker_members').get(),
-        db.collection(collections.receivables).get(),
-        db.collection(collections.payables).get()
-      ]);
 
-      console.log(`📊 Loaded data: ${ordersSnapshot.size} orders, ${leadsSnapshot.size} leads, ${allocationsSnapshot.size} allocations`);
-
-      // Process data
-      const stats = {
-        timestamp: new Date().toISOString(),
-        lastUpdated: convertToIST(new Date()),
-        
-        // Global financials
-        financials: await this.calculateFinancials(ordersSnapshot, receivablesSnapshot, payablesSnapshot, allocationsSnapshot),
-        
-        // Sales performance by user
-        salesPerformance: await this.calculateSalesPerformance(
-          ordersSnapshot, 
-          leadsSnapshot, 
-          allocationsSnapshot, 
-          usersSnapshot, 
-          salesMembersSnapshot
-        ),
-        
-        // Retail tracker stats
-        retailTracker: await this.calculateRetailTracker(
-          leadsSnapshot, 
-          usersSnapshot, 
-          retailMembersSnapshot
-        ),
-        
-        // Marketing performance
-        marketingPerformance: await this.calculateMarketingPerformance(leadsSnapshot),
-        
-        // Metadata
-        metadata: {
-          processingTimeMs: Date.now() - startTime,
-          dataSourceCounts: {
-            orders: ordersSnapshot.size,
-            leads: leadsSnapshot.size,
-            allocations: allocationsSnapshot.size,
-            users: usersSnapshot.size
-          }
-        }
-      };
+    try {
+      const stats = await this.calculateAllStats();
 
       // Store aggregated stats
       await this.storeStats(stats);
@@ -96,6 +80,400 @@ class StatsAggregationService {
     }
   }
 
+  /**
+   * Full recomputation from every source collection, without storing
+   */
+  async calculateAllStats() {
+    const startTime = Date.now();
+
+    // Get all required data
+    const [
+      ordersSnapshot,
+      leadsSnapshot,
+      allocationsSnapshot,
+      usersSnapshot,
+      salesMembersSnapshot,
+      retailMembersSnapshot,
+      receivablesSnapshot,
+      payablesSnapshot
+    ] = await Promise.all([
+      db.collection(collections.orders).get(),
+      db.collection(collections.leads).get(),
+      db.collection(collections.allocations).get(),
+      db.collection('crm_users').get(),
+      db.collection('sales_performance_members').get(),
+      db.collection('retail_tracker_members').get(),
+      db.collection(collections.receivables).get(),
+      db.collection(collections.payables).get()
+    ]);
+
+    console.log(`📊 Loaded data: ${ordersSnapshot.size} orders, ${leadsSnapshot.size} leads, ${allocationsSnapshot.size} allocations`);
+
+    // Process data
+    const stats = {
+      timestamp: new Date().toISOString(),
+      lastUpdated: convertToIST(new Date()),
+      
+      // Global financials
+      financials: await this.calculateFinancials(ordersSnapshot, receivablesSnapshot, payablesSnapshot, allocationsSnapshot),
+      
+      // Sales performance by user
+      salesPerformance: await this.calculateSalesPerformance(
+        ordersSnapshot, 
+        leadsSnapshot, 
+        allocationsSnapshot, 
+        usersSnapshot, 
+        salesMembersSnapshot
+      ),
+      
+      // Retail tracker stats
+      retailTracker: await this.calculateRetailTracker(
+        leadsSnapshot, 
+        usersSnapshot, 
+        retailMembersSnapshot
+      ),
+      
+      // Marketing performance
+      marketingPerformance: await this.calculateMarketingPerformance(leadsSnapshot),
+      
+      // Metadata
+      metadata: {
+        mode: 'full',
+        processingTimeMs: Date.now() - startTime,
+        dataSourceCounts: {
+          orders: ordersSnapshot.size,
+          leads: leadsSnapshot.size,
+          allocations: allocationsSnapshot.size,
+          users: usersSnapshot.size
+        }
+      }
+    };
+
+    return stats;
+  }
+
+  /**
+   * Incremental aggregation: reads the documents created or updated since
+   * the last run, subtracts their previous contribution and adds the new
+   * one. Falls back to rebuildIncrementalState() when there is no state
+   * yet, the last rebuild is older than STATS_FULL_REBUILD_HOURS, or a
+   * source collection's size doesn't match the documents accounted for
+   * (deletes don't show up in a date query, nor do documents without dates).
+   */
+  async aggregateIncrementalStats() {
+    console.log('🔄 Starting incremental stats aggregation...');
+    const startTime = Date.now();
+    const runStartedAt = new Date(startTime).toISOString();
+
+    try {
+      const stateDoc = await db.collection(this.statsCollection).doc(this.stateDocId).get();
+      const state = stateDoc.exists ? stateDoc.data() : null;
+
+      let rebuildReason = null;
+      if (!state || !state.aggregates) {
+        rebuildReason = 'no incremental state';
+      } else if (state.version !== STATE_VERSION) {
+        rebuildReason = `state version ${state.version} is out of date`;
+      } else if (startTime - new Date(state.rebuiltAt).getTime() > FULL_REBUILD_MS) {
+        rebuildReason = 'scheduled full rebuild';
+      }
+      if (rebuildReason) {
+        return this.rebuildIncrementalState(rebuildReason);
+      }
+
+      const since = new Date(new Date(state.watermark).getTime() - WATERMARK_OVERLAP_MS).toISOString();
+      const kinds = Object.keys(INCREMENTAL_SOURCES);
+      const [changedList, countList] = await Promise.all([
+        Promise.all(kinds.map(kind => this.getChangedDocs(INCREMENTAL_SOURCES[kind], since))),
+        Promise.all(kinds.map(kind => db.collection(INCREMENTAL_SOURCES[kind]).count().get()))
+      ]);
+      const changed = {};
+      const liveCounts = {};
+      kinds.forEach((kind, i) => {
+        changed[kind] = changedList[i];
+        liveCounts[kind] = countList[i].data().count;
+      });
+
+      const previous = await this.getContributions(state.generation,
+        kinds.flatMap(kind => [...changed[kind].keys()].map(id => this.contributionKey(kind, id))));
+
+      const aggregates = JSON.parse(state.aggregates);
+      const records = new Map();
+      const created = {};
+      const changes = {};
+      const touchedOrderIds = new Set();
+
+      for (const kind of kinds) {
+        created[kind] = 0;
+        changes[kind] = changed[kind].size;
+
+        if (kind === 'orders') {
+          // Orders whose allocations changed but which didn't change themselves
+          const orderIds = [...touchedOrderIds].filter(id => !changed.orders.has(id));
+          const orderRecords = await this.getContributions(state.generation,
+            orderIds.map(id => this.contributionKey('orders', id)));
+          orderRecords.forEach((record, key) => {
+            const orderId = key.slice('orders_'.length);
+            const next = withMargin(record, aggregates.allocationBuying[orderId]);
+            applyContribution('orders', aggregates, record, -1);
+            applyContribution('orders', aggregates, next, 1);
+            records.set(key, next);
+          });
+          changes.repricedOrders = orderRecords.size;
+        }
+
+        changed[kind].forEach((data, id) => {
+          const key = this.contributionKey(kind, id);
+          const old = previous.get(key);
+          const next = contributionFor(kind, id, data, aggregates);
+          if (old) {
+            applyContribution(kind, aggregates, old, -1);
+          } else {
+            created[kind]++;
+          }
+          applyContribution(kind, aggregates, next, 1);
+          records.set(key, next);
+
+          if (kind === 'allocations') {
+            [...(old ? old.orderIds : []), ...next.orderIds].forEach(orderId => touchedOrderIds.add(orderId));
+          }
+        });
+      }
+
+      // Any mismatch is rebuilt: a surplus (documents without dates) left in
+      // place would otherwise hide later deletes from this check
+      const counts = {};
+      const drifted = [];
+      kinds.forEach(kind => {
+        counts[kind] = state.counts[kind] + created[kind];
+        if (liveCounts[kind] !== counts[kind]) {
+          drifted.push(`${kind} ${liveCounts[kind] < counts[kind] ? '-' : '+'}${Math.abs(liveCounts[kind] - counts[kind])}`);
+        }
+      });
+      if (drifted.length > 0) {
+        return this.rebuildIncrementalState(`document counts drifted (${drifted.join(', ')})`);
+      }
+
+      await this.writeContributions(records, state.generation);
+      await db.collection(this.statsCollection).doc(this.stateDocId).set({
+        ...state,
+        watermark: runStartedAt,
+        lastRunAt: runStartedAt,
+        counts,
+        aggregates: JSON.stringify(aggregates)
+      });
+
+      const stats = await this.buildStatsFromAggregates(aggregates, {
+        mode: 'incremental',
+        startTime,
+        counts,
+        changes
+      });
+      await this.storeStats(stats);
+
+      const changeSummary = kinds.map(kind => `${changes[kind]} ${kind}`).join(', ');
+      console.log(`✅ Incremental stats aggregation completed in ${Date.now() - startTime}ms (${changeSummary} changed)`);
+      return stats;
+
+    } catch (error) {
+      console.error('❌ Incremental stats aggregation error:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Recompute the incremental aggregates and every contribution record from
+   * the full source collections, then store stats from them
+   */
+  async rebuildIncrementalState(reason) {
+    console.log(`🔄 Rebuilding incremental stats state (${reason})...`);
+    const startTime = Date.now();
+    const runStartedAt = new Date(startTime).toISOString();
+    const stateRef = db.collection(this.statsCollection).doc(this.stateDocId);
+
+    try {
+      // Contribution records are rewritten under a new generation; until the
+      // new state is stored, incremental runs must rebuild rather than mix them
+      await stateRef.set({ version: STATE_VERSION, rebuildingSince: runStartedAt });
+
+      const kinds = Object.keys(INCREMENTAL_SOURCES);
+      const snapshots = await Promise.all(kinds.map(kind => db.collection(INCREMENTAL_SOURCES[kind]).get()));
+
+      const generation = String(startTime);
+      const aggregates = emptyAggregates();
+      const records = new Map();
+      const counts = {};
+
+      kinds.forEach((kind, i) => {
+        counts[kind] = snapshots[i].size;
+        snapshots[i].forEach(doc => {
+          const record = contributionFor(kind, doc.id, doc.data(), aggregates);
+          applyContribution(kind, aggregates, record, 1);
+          records.set(this.contributionKey(kind, doc.id), record);
+        });
+      });
+
+      await this.writeContributions(records, generation);
+      await stateRef.set({
+        version: STATE_VERSION,
+        generation,
+        watermark: runStartedAt,
+        rebuiltAt: runStartedAt,
+        rebuildReason: reason,
+        lastRunAt: runStartedAt,
+        counts,
+        // One string rather than nested maps: the per-order and per-campaign
+        // keys would otherwise run into the per-document index entry limit
+        aggregates: JSON.stringify(aggregates)
+      });
+
+      const stats = await this.buildStatsFromAggregates(aggregates, {
+        mode: 'rebuild',
+        startTime,
+        counts,
+        rebuildReason: reason
+      });
+      await this.storeStats(stats);
+
+      console.log(`✅ Incremental stats state rebuilt in ${Date.now() - startTime}ms (${records.size} contribution records)`);
+      return stats;
+
+    } catch (error) {
+      console.error('❌ Stats rebuild error:', error);
+      throw error;
+    }
+  }
+
+  /**
+   * Run an incremental aggregation, recompute everything from scratch and
+   * diff the two. Differences mean a writer skipped updated_date or the
+   * rules in statsContributions.js drifted from the calculate* methods.
+   */
+  async verifyIncrementalStats() {
+    const incremental = await this.aggregateIncrementalStats();
+    const full = await this.calculateAllStats();
+
+    const differences = [];
+    ['financials', 'salesPerformance', 'retailTracker', 'marketingPerformance'].forEach(section => {
+      diffStats(full[section], incremental[section], section, differences);
+    });
+
+    if (differences.length === 0) {
+      console.log('✅ Incremental stats match a full rebuild');
+    } else {
+      console.warn(`⚠️ Incremental stats differ from a full rebuild in ${differences.length} places`);
+      differences.slice(0, 20).forEach(diff => console.warn(`   ${diff.path}: full=${diff.expected} incremental=${diff.actual}`));
+    }
+
+    return {
+      ok: differences.length === 0,
+      incrementalMode: incremental.metadata.mode,
+      differenceCount: differences.length,
+      differences: differences.slice(0, 100),
+      checkedAt: new Date().toISOString()
+    };
+  }
+
+  contributionKey(kind, id) {
+    return `${kind}_${id}`;
+  }
+
+  /**
+   * Documents created or updated after `since`, as a Map of id -> data.
+   * Dates are mostly ISO strings, but some writers store Timestamps
+   * (webhook leads, serverTimestamp() allocations) and Firestore only
+   * compares values of the same type, so each field is queried both ways.
+   * Documents without either field are only picked up by a rebuild.
+   */
+  async getChangedDocs(collection, since) {
+    const bounds = [since, Timestamp.fromDate(new Date(since))];
+    const snapshots = await Promise.all(['updated_date', 'created_date'].flatMap(field =>
+      bounds.map(bound => db.collection(collection).where(field, '>', bound).get())
+    ));
+    const docs = new Map();
+    snapshots.forEach(snapshot => snapshot.docs.forEach(doc => docs.set(doc.id, doc.data())));
+    return docs;
+  }
+
+  /**
+   * Contribution records of the current generation, as a Map of key -> record
+   */
+  async getContributions(generation, keys) {
+    const records = new Map();
+    for (let i = 0; i < keys.length; i += BATCH_SIZE) {
+      const refs = keys.slice(i, i + BATCH_SIZE).map(key => db.collection(CONTRIBUTIONS_COLLECTION).doc(key));
+      const docs = await db.getAll(...refs);
+      docs.forEach(doc => {
+        if (doc.exists && doc.data().generation === generation) {
+          records.set(doc.id, doc.data().record);
+        }
+      });
+    }
+    return records;
+  }
+
+  async writeContributions(records, generation) {
+    const entries = [...records.entries()];
+    for (let i = 0; i < entries.length; i += BATCH_SIZE) {
+      const batch = db.batch();
+      entries.slice(i, i + BATCH_SIZE).forEach(([key, record]) => {
+        batch.set(db.collection(CONTRIBUTIONS_COLLECTION).doc(key), { generation, record });
+      });
+      await batch.commit();
+    }
+  }
+
+  /**
+   * Stats document from the incremental aggregates plus the small team
+   * collections, which are read in full every run
+   */
+  async buildStatsFromAggregates(aggregates, { mode, startTime, counts, ...extra }) {
+    const [usersSnapshot, salesMembersSnapshot, retailMembersSnapshot, targetsSnapshot] = await Promise.all([
+      db.collection('crm_users').get(),
+      db.collection('sales_performance_members').get(),
+      db.collection('retail_tracker_members').get(),
+      db.collection('sales_targets').get()
+    ]);
+
+    const targets = new Map();
+    targetsSnapshot.forEach(doc => {
+      // Convert from rupees to crores for display
+      targets.set(doc.id, doc.data().target / 10000000);
+    });
+
+    const now = new Date();
+    const dateRanges = {};
+    PERIODS.forEach(period => {
+      dateRanges[period] = this.getDateRange(period);
+    });
+
+    const stats = buildStats(aggregates, {
+      users: usersSnapshot.docs.map(doc => ({ id: doc.id, name: doc.data().name, email: doc.data().email })),
+      salesMemberIds: new Set(salesMembersSnapshot.docs.map(doc => doc.id)),
+      retailMemberIds: new Set(retailMembersSnapshot.docs.map(doc => doc.id)),
+      targets,
+      dateRanges,
+      now
+    });
+
+    return {
+      timestamp: now.toISOString(),
+      lastUpdated: convertToIST(now),
+      ...stats,
+      metadata: {
+        mode,
+        processingTimeMs: Date.now() - startTime,
+        dataSourceCounts: {
+          orders: counts.orders,
+          leads: counts.leads,
+          allocations: counts.allocations,
+          users: usersSnapshot.size
+        },
+        ...extra
+      }
+    };
+  }
+
   /**
    * Calculate financial metrics for different periods
    */
@@ -0,0 +1,417 @@
+/**
+ * Stats Contributions
+ * What each order, lead, allocation, receivable and payable adds to the
+ * aggregated performance stats, for the incremental mode of
+ * StatsAggregationService. A changed document is folded in by subtracting
+ * its previous contribution record and adding the new one.
+ *
+ * Order totals are bucketed by exact event_date timestamp and lead totals by
+ * assignee, source and campaign. The period views (current month, FY, ...)
+ * and the sales/retail team views are derived from the buckets in
+ * buildStats(), so nothing stored here depends on today's date or on team
+ * membership.
+ *
+ * The rules mirror the calculate* methods of StatsAggregationService (the
+ * full rebuild); keep the two in step. verifyIncrementalStats() diffs them.
+ */
+
+const PERIODS = ['lifetime', 'current_fy', 'current_month', 'last_month'];
+
+const INACTIVE_ORDER_STATUSES = ['cancelled', 'rejected', 'refunded'];
+
+const TOUCH_BASED_STATUSES = [
+  'contacted', 'attempt_1', 'attempt_2', 'attempt_3',
+  'qualified', 'unqualified', 'junk', 'warm', 'hot', 'cold',
+  'interested', 'not_interested', 'on_hold', 'dropped',
+  'converted', 'invoiced', 'payment_received', 'payment_post_service',
+  'pickup_later', 'quote_requested', 'quote_received'
+];
+
+const RETAIL_QUALIFIED_STATUSES = [
+  'qualified', 'hot', 'warm', 'cold', 'pickup_later', 'quote_requested',
+  'quote_received', 'converted', 'invoiced', 'payment_received',
+  'payment_post_service', 'dropped'
+];
+
+const RETAIL_CONVERTED_STATUSES = ['converted', 'invoiced', 'payment_received', 'payment_post_service'];
+const MARKETING_QUALIFIED_STATUSES = ['qualified', 'hot', 'warm', 'cold'];
+const MARKETING_CONVERTED_STATUSES = ['converted', 'invoiced', 'payment_received'];
+
+// Relative tolerance when diffing float totals summed in a different order
+const DIFF_TOLERANCE = 1e-6;
+
+/**
+ * parseFloat with the full rebuild's defaults; NaN counts as 0 so one bad
+ * field can't poison the stored totals
+ */
+function toNumber(value, fallback = 0) {
+  const number = parseFloat(value || fallback);
+  return isNaN(number) ? 0 : number;
+}
+
+// ---------------------------------------------------------------------------
+// Contribution records
+// ---------------------------------------------------------------------------
+
+function allocationContribution(allocation) {
+  // Same ids, with the same repeats, as allocationsByOrderId in the full rebuild
+  const orderIds = [
+    allocation.order_id,
+    allocation.order_number,
+    ...(allocation.order_ids || [])
+  ].filter(id => typeof id === 'string' && id);
+
+  return {
+    orderIds,
+    buying: toNumber(allocation.total_buying_price)
+  };
+}
+
+function orderEventKey(order) {
+  if (!order.event_date) return 'none';
+  const time = new Date(order.event_date).getTime();
+  return isNaN(time) ? 'invalid' : String(time);
+}
+
+/**
+ * allocationBuying is the summed total_buying_price of the allocations
+ * naming this order
+ */
+function orderContribution(order, allocationBuying = 0) {
+  const sales = order.payment_currency === 'INR'
+    ? toNumber(order.base_amount || order.total_amount)
+    : toNumber(order.base_amount) * toNumber(order.exchange_rate, 1);
+  const salesPerson = order.sales_person || order.sales_person_email;
+
+  return withMargin({
+    eventKey: orderEventKey(order),
+    salesPerson: typeof salesPerson === 'string' && salesPerson ? salesPerson : null,
+    sales,
+    inclusions: toNumber(order.buying_price_inclusions),
+    active: INACTIVE_ORDER_STATUSES.includes(order.status) ? 0 : sales
+  }, allocationBuying);
+}
+
+function withMargin(record, allocationBuying = 0) {
+  return { ...record, margin: record.sales - (allocationBuying + record.inclusions) };
+}
+
+function leadContribution(lead) {
+  const status = (lead.status || '').toLowerCase();
+  const temperature = (lead.temperature || '').toLowerCase();
+  const potentialValue = toNumber(lead.potential_value);
+  const quoted = status === 'quote_requested' || status === 'quote_received';
+
+  const inPipeline = ['hot', 'warm', 'cold'].includes(status) ||
+    (quoted && ['hot', 'warm', 'cold'].includes(temperature));
+  const hotWarm = ['hot', 'warm'].includes(status) ||
+    (quoted && ['hot', 'warm'].includes(temperature));
+  const touchBased = TOUCH_BASED_STATUSES.includes(lead.status);
+  const marketingQualified = MARKETING_QUALIFIED_STATUSES.includes(lead.status);
+
+  return {
+    assignee: typeof lead.assigned_to === 'string' && lead.assigned_to ? lead.assigned_to : null,
+    team: {
+      retailPipeline: inPipeline && lead.business_type !== 'B2B' ? potentialValue : 0,
+      corporatePipeline: inPipeline && lead.business_type === 'B2B' ? potentialValue : 0,
+      assigned: 1,
+      touchbased: touchBased ? 1 : 0,
+      qualified: RETAIL_QUALIFIED_STATUSES.includes(lead.status) ? 1 : 0,
+      hotWarm: hotWarm ? 1 : 0,
+      converted: RETAIL_CONVERTED_STATUSES.includes(lead.status) ? 1 : 0,
+      notTouchbased: touchBased ? 0 : 1
+    },
+    source: String(lead.source || 'Unknown'),
+    campaign: String(lead.campaign_name || 'Direct'),
+    marketing: {
+      total: 1,
+      qualified: marketingQualified ? 1 : 0,
+      converted: MARKETING_CONVERTED_STATUSES.includes(lead.status) ? 1 : 0,
+      pipeline: marketingQualified ? potentialValue : 0
+    }
+  };
+}
+
+function amountContribution(doc) {
+  return { amount: toNumber(doc.amount) };
+}
+
+// ---------------------------------------------------------------------------
+// Aggregates
+// ---------------------------------------------------------------------------
+
+function emptyAggregates() {
+  return {
+    orders: {},               // eventKey -> { sales, margin, active, count }
+    ordersBySalesPerson: {},  // sales_person -> eventKey -> { sales, margin, count }
+    allocationBuying: {},     // order id -> summed allocation buying price
+    receivables: 0,
+    payables: 0,
+    team: {},                 // assigned_to -> lead counts and pipeline
+    sources: {},              // source -> { total, qualified, converted, pipeline }
+    campaigns: {}             // campaign -> { total, qualified, converted, pipeline }
+  };
+}
+
+/**
+ * Add (sign 1) or subtract (sign -1) values into map[key]; the bucket is
+ * dropped once its count field reaches 0, as the full rebuild would never
+ * have created it
+ */
+function addValues(map, key, values, sign, countField) {
+  const bucket = map[key] || (map[key] = {});
+  Object.keys(values).forEach(field => {
+    bucket[field] = (bucket[field] || 0) + sign * values[field];
+  });
+  if (bucket[countField] <= 0) {
+    delete map[key];
+  }
+}
+
+function applyAllocation(aggregates, record, sign) {
+  record.orderIds.forEach(orderId => {
+    const total = (aggregates.allocationBuying[orderId] || 0) + sign * record.buying;
+    if (Math.abs(total) < 1e-9) {
+      delete aggregates.allocationBuying[orderId];
+    } else {
+      aggregates.allocationBuying[orderId] = total;
+    }
+  });
+}
+
+function applyOrder(aggregates, record, sign) {
+  addValues(aggregates.orders, record.eventKey, {
+    sales: record.sales,
+    margin: record.margin,
+    active: record.active,
+    count: 1
+  }, sign, 'count');
+
+  if (record.salesPerson) {
+    const buckets = aggregates.ordersBySalesPerson[record.salesPerson] || {};
+    addValues(buckets, record.eventKey, {
+      sales: record.sales,
+      margin: record.margin,
+      count: 1
+    }, sign, 'count');
+    if (Object.keys(buckets).length > 0) {
+      aggregates.ordersBySalesPerson[record.salesPerson] = buckets;
+    } else {
+      delete aggregates.ordersBySalesPerson[record.salesPerson];
+    }
+  }
+}
+
+function applyLead(aggregates, record, sign) {
+  if (record.assignee) {
+    addValues(aggregates.team, record.assignee, record.team, sign, 'assigned');
+  }
+  addValues(aggregates.sources, record.source, record.marketing, sign, 'total');
+  addValues(aggregates.campaigns, record.campaign, record.marketing, sign, 'total');
+}
+
+/**
+ * Contribution record for a document of the given kind
+ */
+function contributionFor(kind, id, data, aggregates) {
+  switch (kind) {
+    case 'allocations':
+      return allocationContribution(data);
+    case 'orders':
+      return orderContribution(data, aggregates.allocationBuying[id]);
+    case 'leads':
+      return leadContribution(data);
+    default:
+      return amountContribution(data);
+  }
+}
+
+function applyContribution(kind, aggregates, record, sign) {
+  switch (kind) {
+    case 'allocations':
+      return applyAllocation(aggregates, record, sign);
+    case 'orders':
+      return applyOrder(aggregates, record, sign);
+    case 'leads':
+      return applyLead(aggregates, record, sign);
+    default:
+      aggregates[kind] += sign * record.amount;
+  }
+}
+
+// ---------------------------------------------------------------------------
+// Stats
+// ---------------------------------------------------------------------------
+
+function inRange(eventKey, range) {
+  if (!range.startDate) return true; // lifetime
+  if (eventKey === 'none' || eventKey === 'invalid') return false;
+  const time = Number(eventKey);
+  return time >= range.startDate.getTime() && (!range.endDate || time <= range.endDate.getTime());
+}
+
+function emptyTeamMetrics() {
+  return {
+    retailPipeline: 0,
+    corporatePipeline: 0,
+    assigned: 0,
+    touchbased: 0,
+    qualified: 0,
+    hotWarm: 0,
+    converted: 0,
+    notTouchbased: 0
+  };
+}
+
+/**
+ * Stats in the shape of the full rebuild from the aggregates.
+ * users: [{ id, name, email }] in crm_users order; targets: Map of user id
+ * to target in crores; dateRanges: period -> getDateRange(period)
+ */
+function buildStats(aggregates, { users, salesMemberIds, retailMemberIds, targets, dateRanges, now = new Date() }) {
+  const today = new Date(now);
+  today.setHours(0, 0, 0, 0);
+
+  const financials = {};
+  PERIODS.forEach(period => {
+    let totalSales = 0;
+    let totalMargin = 0;
+    let activeSales = 0;
+    let orderCount = 0;
+
+    Object.entries(aggregates.orders).forEach(([eventKey, bucket]) => {
+      if (!inRange(eventKey, dateRanges[period])) return;
+      totalSales += bucket.sales;
+      totalMargin += bucket.margin;
+      orderCount += bucket.count;
+      if (eventKey === 'none' || (eventKey !== 'invalid' && Number(eventKey) >= today.getTime())) {
+        activeSales += bucket.active;
+      }
+    });
+
+    financials[period] = {
+      totalSales,
+      activeSales,
+      totalReceivables: aggregates.receivables,
+      totalPayables: aggregates.payables,
+      totalMargin,
+      marginPercentage: totalSales > 0 ? (totalMargin / totalSales * 100) : 0,
+      orderCount
+    };
+  });
+
+  const salesPerformance = {};
+  users.filter(user => salesMemberIds.has(user.id)).forEach(user => {
+    const team = aggregates.team[user.email] || emptyTeamMetrics();
+    // sales_person holds either the email or the display name
+    const bucketSets = [];
+    if (typeof user.email === 'string' && user.email.includes('@')) {
+      bucketSets.push(aggregates.ordersBySalesPerson[user.email] || {});
+    }
+    if (typeof user.name === 'string' && !user.name.includes('@')) {
+      bucketSets.push(aggregates.ordersBySalesPerson[user.name] || {});
+    }
+
+    const periods = {};
+    PERIODS.forEach(period => {
+      let totalSales = 0;
+      let totalMargin = 0;
+      let actualizedSales = 0;
+      let actualizedMargin = 0;
+      let orderCount = 0;
+
+      bucketSets.forEach(buckets => {
+        Object.entries(buckets).forEach(([eventKey, bucket]) => {
+          if (!inRange(eventKey, dateRanges[period])) return;
+          totalSales += bucket.sales;
+          totalMargin += bucket.margin;
+          orderCount += bucket.count;
+          if (eventKey !== 'none' && eventKey !== 'invalid' && Number(eventKey) < now.getTime()) {
+            actualizedSales += bucket.sales;
+            actualizedMargin += bucket.margin;
+          }
+        });
+      });
+
+      periods[period] = {
+        totalSales,
+        actualizedSales,
+        totalMargin,
+        actualizedMargin,
+        marginPercentage: totalSales > 0 ? (totalMargin / totalSales * 100) : 0,
+        actualizedMarginPercentage: actualizedSales > 0 ? (actualizedMargin / actualizedSales * 100) : 0,
+        retailPipeline: team.retailPipeline,
+        corporatePipeline: team.corporatePipeline,
+        overallPipeline: team.retailPipeline + team.corporatePipeline,
+        orderCount
+      };
+    });
+
+    salesPerformance[user.email] = {
+      id: user.id,
+      name: user.name,
+      email: user.email,
+      target: targets.get(user.id) || 0,
+      periods
+    };
+  });
+
+  const retailTracker = {};
+  users.filter(user => retailMemberIds.has(user.id)).forEach(user => {
+    const team = aggregates.team[user.email] || emptyTeamMetrics();
+    retailTracker[user.email] = {
+      id: user.id,
+      name: user.name,
+      email: user.email,
+      assigned: team.assigned,
+      touchbased: team.touchbased,
+      qualified: team.qualified,
+      hotWarm: team.hotWarm,
+      converted: team.converted,
+      notTouchbased: team.notTouchbased
+    };
+  });
+
+  const copyBuckets = buckets => Object.fromEntries(
+    Object.entries(buckets).map(([key, bucket]) => [key, { ...bucket }])
+  );
+
+  return {
+    financials,
+    salesPerformance,
+    retailTracker,
+    marketingPerformance: {
+      sources: copyBuckets(aggregates.sources),
+      campaigns: copyBuckets(aggregates.campaigns)
+    }
+  };
+}
+
+/**
+ * Paths where two stats objects disagree, e.g.
+ * { path: 'financials.lifetime.totalSales', expected, actual }
+ */
+function diffStats(expected, actual, path = '', differences = []) {
+  if (typeof expected === 'number' && typeof actual === 'number') {
+    const scale = Math.max(1, Math.abs(expected), Math.abs(actual));
+    if (!(Math.abs(expected - actual) <= scale * DIFF_TOLERANCE)) {
+      differences.push({ path, expected, actual });
+    }
+  } else if (expected && actual && typeof expected === 'object' && typeof actual === 'object') {
+    const keys = new Set([...Object.keys(expected), ...Object.keys(actual)]);
+    keys.forEach(key => diffStats(expected[key], actual[key], path ? `${path}.${key}` : key, differences));
+  } else if (expected !== actual) {
+    differences.push({ path, expected, actual });
+  }
+  return differences;
+}
+
+module.exports = {
+  PERIODS,
+  emptyAggregates,
+  contributionFor,
+  applyContribution,
+  withMargin,
+  buildStats,
+  diffStats
+};
@@ -0,0 +1,40 @@
+const { Transform } = require('stream');
+
+/**
+ * Object-mode Transform that turns rows into CSV lines, for responses that
+ * are written while they are still being computed. fields use json2csv's
+ * { label, value } shape and the output matches its defaults: labels and
+ * strings are double-quoted, numbers and booleans are written as is.
+ */
+
+function formatCsvValue(value) {
+  if (value === undefined || value === null) return '';
+  if (typeof value === 'number' || typeof value === 'boolean') return String(value);
+  const text = typeof value === 'object' ? JSON.stringify(value) : String(value);
+  return `"${text.replace(/"/g, '""')}"`;
+}
+
+function createCsvTransform(fields) {
+  let headerWritten = false;
+  return new Transform({
+    writableObjectMode: true,
+    transform(row, encoding, callback) {
+      let chunk = '';
+      if (!headerWritten) {
+        chunk += fields.map(field => formatCsvValue(field.label)).join(',');
+        headerWritten = true;
+      }
+      chunk += '\n' + fields.map(field => formatCsvValue(row[field.value])).join(',');
+      callback(null, chunk);
+    },
+    flush(callback) {
+      // An empty export still gets its header line
+      if (!headerWritten) {
+        this.push(fields.map(field => formatCsvValue(field.label)).join(','));
+      }
+      callback();
+    }
+  });
+}
+
+module.exports = { createCsvTransform, formatCsvValue };
@@ -145,10 +145,132 @@ function displayInIST(utcDate) {
   });
 }
 
+/**
+ * Parse a date cell from an uploaded CSV/Excel file into an IST-aware
+ * timestamp. Handles YYYY-MM-DD, DD/MM/YY(YY), DD-MM-YYYY, ISO strings,
+ * Date objects and Excel serial numbers; anything else becomes now.
+ * Called for every row of an import, so it doesn't log.
+ * @param {string|number|Date} dateValue - Cell value
+ * @returns {string} ISO string in UTC
+ */
+function parseImportDate(dateValue) {
+  if (!dateValue || dateValue === '' || dateValue === null || dateValue === undefined) {
+    return convertToIST(new Date());
+  }
+
+  // DD/MM/YY format
+  if (typeof dateValue === 'string' && dateValue.match(/^\d{1,2}\/\d{1,2}\/\d{2}$/)) {
+    const [day, month, year] = dateValue.split('/');
+    const fullYear = year.length === 2 ? '20' + year : year;
+    const isoDate = `${fullYear}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`;
+    return convertToIST(isoDate);
+  }
+  
+  // Already a Date object
+  if (dateValue instanceof Date) {
+    return convertToIST(dateValue);
+  }
+  
+  if (typeof dateValue === 'string') {
+    const trimmedValue = dateValue.trim();
+    
+    if (trimmedValue === '') {
+      return convertToIST(new Date());
+    }
+    
+    // YYYY-MM-DD format (most common CSV format)
+    if (trimmedValue.match(/^\d{4}-\d{2}-\d{2}$/)) {
+      return convertToIST(trimmedValue);
+    }
+    
+    // DD/MM/YYYY format
+    if (trimmedValue.match(/^\d{1,2}\/\d{1,2}\/\d{4}$/)) {
+      const [day, month, year] = trimmedValue.split('/');
+      return convertToIST(`${year}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`);
+    }
+    
+    // DD-MM-YYYY format
+    if (trimmedValue.match(/^\d{1,2}-\d{1,2}-\d{4}$/)) {
+      const [day, month, year] = trimmedValue.split('-');
+      return convertToIST(`${year}-${month.padStart(2, '0')}-${day.padStart(2, '0')}`);
+    }
+    
+    // ISO format with time
+    if (trimmedValue.includes('T') || trimmedValue.includes('Z')) {
+      return convertToIST(trimmedValue);
+    }
+    
+    // General Date parsing as fallback
+    const parsed = new Date(trimmedValue);
+    if (!isNaN(parsed.getTime())) {
+      return convertToIST(parsed);
+    }
+  }
+  
+  // Excel serial date (days since 1900-01-01)
+  if (typeof dateValue === 'number' && dateValue > 0) {
+    const excelEpoch = new Date(1900, 0, 1);
+    const msPerDay = 24 * 60 * 60 * 1000;
+    return convertToIST(new Date(excelEpoch.getTime() + (dateValue - 2) * msPerDay));
+  }
+  
+  // Default to current IST date if parsing fails
+  return convertToIST(new Date());
+}
+
+/**
+ * Epoch milliseconds for a stored date: ISO string, Date, Firestore Timestamp
+ * (or its serialized {_seconds, _nanoseconds} form) or a number
+ * @param {*} value - Date value as stored on a document
+ * @returns {number|null} Milliseconds since epoch, null if missing or invalid
+ */
+function toEpochMs(value) {
+  if (value === null || value === undefined || value === '') return null;
+  if (typeof value === 'number') return isFinite(value) ? value : null;
+  if (value instanceof Date) return isNaN(value.getTime()) ? null : value.getTime();
+  if (typeof value === 'object') {
+    if (typeof value.toMillis === 'function') return value.toMillis();
+    const seconds = value._seconds !== undefined ? value._seconds : value.seconds;
+    const nanoseconds = value._nanoseconds !== undefined ? value._nanoseconds : value.nanoseconds;
+    if (typeof seconds === 'number') return seconds * 1000 + Math.floor((nanoseconds || 0) / 1000000);
+    return null;
+  }
+  const ms = new Date(value).getTime();
+  return isNaN(ms) ? null : ms;
+}
+
+// Lead date field -> numeric copy used for sorting and range queries
+const LEAD_TIMESTAMP_FIELDS = {
+  created_date: 'created_ts',
+  date_of_enquiry: 'enquiry_ts',
+  updated_date: 'updated_ts'
+};
+
+/**
+ * Numeric timestamp fields for lead data. A whole lead gets all of them, 0
+ * for a missing or unreadable date (where the in-memory sort puts it); with
+ * partial, only the date fields present in an update are converted.
+ * @param {Object} data - Lead document or update
+ * @param {Object} options - { partial }
+ * @returns {Object} { created_ts, enquiry_ts, updated_ts } or a subset
+ */
+function leadTimestamps(data, { partial = false } = {}) {
+  const timestamps = {};
+  Object.entries(LEAD_TIMESTAMP_FIELDS).forEach(([dateField, tsField]) => {
+    if (partial && data[dateField] === undefined) return;
+    timestamps[tsField] = toEpochMs(data[dateField]) || 0;
+  });
+  return timestamps;
+}
+
 module.exports = {
   convertToIST,
   formatDateForQuery,
   getISTDateString,
   isOnISTDate,
-  displayInIST
+  displayInIST,
+  parseImportDate,
+  toEpochMs,
+  LEAD_TIMESTAMP_FIELDS,
+  leadTimestamps
 };
\ No newline at end of file
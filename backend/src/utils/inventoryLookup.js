@@ -1,4 +1,7 @@
-// Lookup inventory item by Facebook form ID
+const inventoryIndex = require('../services/inventoryIndex');
+
+// Lookup inventory item by Facebook form ID. Served from the in-memory
+// inventory index once it is built, from Firestore until then
 async function getInventoryByFormId(db, formId) {
   try {
     console.log(`🔍 Looking up inventory for form ID: ${formId}`);
@@ -7,6 +10,16 @@ async function getInventoryByFormId(db, formId) {
       console.log('❌ No form ID provided');
       return null;
     }
+
+    if (inventoryIndex.ready) {
+      const inventory = inventoryIndex.findByFormId(formId);
+      if (inventory) {
+        console.log('🎫 Found matching inventory:', inventory.event_name);
+      } else {
+        console.log(`❌ No inventory found for form ID: ${formId}`);
+      }
+      return inventory;
+    }
     
     // Query inventory where form_ids array contains this formId
     const inventorySnapshot = await db.collection('crm_inventory')
@@ -36,21 +49,7 @@ async function getInventoryByFormId(db, formId) {
       };
     } else {
       console.log(`❌ No inventory found for form ID: ${formId}`);
-      
-      // Debug: List all inventories with form_ids
-      const allInventories = await db.collection('crm_inventory').get();
-      let foundAny = false;
-      allInventories.forEach(doc => {
-        const data = doc.data();
-        if (data.form_ids && data.form_ids.length > 0) {
-          console.log(`📦 Inventory "${data.event_name}" (${doc.id}) has form_ids:`, data.form_ids);
-          foundAny = true;
-        }
-      });
-      
-      if (!foundAny) {
-        console.log('⚠️ No inventories have any form_ids set!');
-      }
+      inventoryIndex.recordMiss(formId);
     }
     
     return null;
@@ -0,0 +1,93 @@
+/**
+ * Sales performance reporting periods.
+ * Orders count towards a period by event_date; open-ended periods run to now.
+ */
+
+// Every period getDateRange() knows; anything else is treated as lifetime
+const SALES_PERIODS = [
+  'lifetime', 'current_fy', 'previous_fy', 'current_quarter', 'previous_quarter',
+  'last_3_months', 'last_6_months', 'current_month', 'last_month'
+];
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+// Helper function to get date range based on period
+function getDateRange(period) {
+  const now = new Date();
+  let startDate = null;
+  let endDate = null;
+  
+  switch(period) {
+    case 'current_fy':
+      // Indian FY: April 1 to March 31
+      const currentMonth = now.getMonth();
+      const currentYear = now.getFullYear();
+      const fyYear = currentMonth >= 3 ? currentYear : currentYear - 1;
+      startDate = new Date(fyYear, 3, 1); // April 1
+      break;
+      
+    case 'previous_fy':
+      const prevMonth = now.getMonth();
+      const prevYear = now.getFullYear();
+      const prevFyYear = prevMonth >= 3 ? prevYear - 1 : prevYear - 2;
+      startDate = new Date(prevFyYear, 3, 1);
+      endDate = new Date(prevFyYear + 1, 2, 31); // March 31
+      break;
+      
+    case 'current_quarter':
+      const quarter = Math.floor(now.getMonth() / 3);
+      startDate = new Date(now.getFullYear(), quarter * 3, 1);
+      break;
+      
+    case 'previous_quarter':
+      const prevQuarter = Math.floor(now.getMonth() / 3) - 1;
+      const year = prevQuarter < 0 ? now.getFullYear() - 1 : now.getFullYear();
+      const actualQuarter = prevQuarter < 0 ? 3 : prevQuarter;
+      startDate = new Date(year, actualQuarter * 3, 1);
+      endDate = new Date(year, (actualQuarter + 1) * 3, 0);
+      break;
+      
+    case 'last_3_months':
+      startDate = new Date();
+      startDate.setMonth(startDate.getMonth() - 3);
+      break;
+      
+    case 'last_6_months':
+      startDate = new Date();
+      startDate.setMonth(startDate.getMonth() - 6);
+      break;
+      
+    case 'current_month':
+      startDate = new Date(now.getFullYear(), now.getMonth(), 1);
+      break;
+      
+    case 'last_month':
+      startDate = new Date(now.getFullYear(), now.getMonth() - 1, 1);
+      endDate = new Date(now.getFullYear(), now.getMonth(), 0); // Last day of previous month
+      break;
+      
+    case 'lifetime':
+    default:
+      return { startDate: null, endDate: null };
+  }
+  
+  return { startDate, endDate: endDate || now };
+}
+
+/**
+ * Periods whose range contains an order event date. Ranges are widened by a
+ * day on each side so IST/UTC differences never leave a period out.
+ * Returns null when the date can't be parsed.
+ */
+function periodsContaining(eventDate) {
+  const time = new Date(eventDate).getTime();
+  if (isNaN(time)) return null;
+
+  return SALES_PERIODS.filter(period => {
+    const { startDate, endDate } = getDateRange(period);
+    if (!startDate) return true;
+    return time >= startDate.getTime() - DAY_MS && time <= endDate.getTime() + DAY_MS;
+  });
+}
+
+module.exports = { SALES_PERIODS, getDateRange, periodsContaining };
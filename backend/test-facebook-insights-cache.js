@@ -0,0 +1,159 @@
+// Checks the per-day Facebook Insights cache against a stub Graph API, so
+// nothing touches Facebook or Firestore:
+//
+//   node test-facebook-insights-cache.js
+//
+// The stub serves deterministic figures per day, campaign, ad set and
+// platform and counts the calls it gets. The test asks for overlapping and
+// concurrent ranges and checks that the totals match the stub, that only
+// missing days are fetched and that reach comes from the whole range.
+const http = require('http');
+const assert = require('assert');
+
+const STUB_PORT = parseInt(process.env.STUB_GRAPH_PORT || '9098');
+const OPEN_DAY_TTL_MS = 300;
+
+process.env.META_GRAPH_API_URL = `http://localhost:${STUB_PORT}`;
+process.env.META_PAGE_ACCESS_TOKEN = 'stub';
+process.env.FACEBOOK_INSIGHTS_STORE = 'memory';
+process.env.FACEBOOK_INSIGHTS_OPEN_DAY_TTL_MS = String(OPEN_DAY_TTL_MS);
+process.env.FACEBOOK_INSIGHTS_SETTLE_HOURS = '0';
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+const CAMPAIGNS = ['IPL Leads', 'F1 Leads'];
+const ADSETS = ['IPL Mumbai', 'IPL Delhi', 'F1 Abu Dhabi'];
+const PLATFORMS = ['facebook', 'instagram', 'audience_network'];
+const calls = { me: 0, insights: 0, daysServed: 0, reach: 0 };
+
+function istDay(offsetDays = 0) {
+  const ist = new Date(Date.now() + 5.5 * 60 * 60 * 1000 + offsetDays * DAY_MS);
+  return ist.toISOString().split('T')[0];
+}
+
+function addDays(day, count) {
+  return new Date(Date.parse(`${day}T00:00:00Z`) + count * DAY_MS).toISOString().split('T')[0];
+}
+
+// Figures for one row on one day; today's change between calls
+let openDayBoost = 0;
+function figures(day, name) {
+  const seed = [...`${day}${name}`].reduce((sum, ch) => sum + ch.charCodeAt(0), 0);
+  const boost = day === istDay() ? openDayBoost : 0;
+  return { impressions: 1000 + seed % 500 + boost, reach: 400 + seed % 200, clicks: 10 + seed % 40, spend: (50 + seed % 30) / 2 };
+}
+
+// Unique people reached over a range: less than the sum of its days
+function rangeReach(since, until, name) {
+  const seed = [...`${since}${until}${name}`].reduce((sum, ch) => sum + ch.charCodeAt(0), 0);
+  return 400 + seed % 200;
+}
+
+function rowsFor(params, day) {
+  if (params.breakdowns === 'publisher_platform') {
+    return PLATFORMS.map(platform => ({ publisher_platform: platform, ...figures(day, platform) }));
+  }
+  if (params.level === 'campaign') {
+    return CAMPAIGNS.map((name, i) => ({ campaign_name: name, campaign_id: `c${i}`, ...figures(day, name) }));
+  }
+  return ADSETS.map((name, i) => ({ adset_name: name, adset_id: `a${i}`, campaign_id: `c${i ? 1 : 0}`, campaign_name: CAMPAIGNS[i ? 1 : 0], ...figures(day, name) }));
+}
+
+function startStubGraph() {
+  return new Promise(resolve => {
+    const server = http.createServer((req, res) => {
+      const url = new URL(req.url, `http://localhost:${STUB_PORT}`);
+      const params = Object.fromEntries(url.searchParams);
+      res.setHeader('Content-Type', 'application/json');
+      if (url.pathname === '/me') {
+        calls.me++;
+        return res.end(JSON.stringify({ id: 'stub', name: 'Stub User' }));
+      }
+      calls.insights++;
+      const range = JSON.parse(params.time_range.replace(/'/g, '"'));
+      if (params.fields.endsWith(',reach')) {
+        assert.strictEqual(params.time_increment, undefined, 'reach is fetched for the whole range');
+        calls.reach++;
+        const key = params.fields.split(',')[0];
+        const rows = rowsFor(params, range.since).map(row => ({ [key]: row[key], reach: rangeReach(range.since, range.until, row[key]) }));
+        return res.end(JSON.stringify({ data: rows }));
+      }
+      assert.strictEqual(params.time_increment, '1', 'ranges of whole days are fetched by day');
+      assert.ok(!params.fields.split(',').includes('reach'), 'reach is not fetched by day');
+      // Two rows a page, to exercise paging
+      const offset = parseInt(params.offset || '0');
+      const rows = [];
+      for (let day = range.since; day <= range.until; day = addDays(day, 1)) {
+        if (offset === 0) calls.daysServed++;
+        rowsFor(params, day).forEach(row => rows.push({ ...row, date_start: day, date_stop: day }));
+      }
+      const next = offset + 2 < rows.length ? `${url.origin}${url.pathname}?${new URLSearchParams({ ...params, offset: offset + 2 })}` : undefined;
+      setTimeout(() => res.end(JSON.stringify({ data: rows.slice(offset, offset + 2), paging: next ? { next } : undefined })), 20);
+    });
+    server.listen(STUB_PORT, () => resolve(server));
+  });
+}
+
+function expectedSource(from, to, platform) {
+  let impressions = 0;
+  for (let day = from; day <= to; day = addDays(day, 1)) impressions += figures(day, platform).impressions;
+  return impressions;
+}
+
+async function run() {
+  const server = await startStubGraph();
+  const insights = require('./src/services/facebookInsightsService');
+  const from = istDay(-20);
+  const today = istDay();
+
+  // 1. Connection is tested once, not per request
+  await Promise.all([insights.testConnection(), insights.testConnection()]);
+  await insights.testConnection();
+  assert.strictEqual(calls.me, 1);
+
+  // 2. A range matches the stub's totals
+  const first = await insights.getInsightsBySource(from, addDays(from, 9));
+  assert.strictEqual(first.Facebook, expectedSource(from, addDays(from, 9), 'facebook'));
+  assert.strictEqual(first.Instagram, expectedSource(from, addDays(from, 9), 'instagram'));
+  assert.strictEqual(calls.daysServed, 10);
+
+  // 3. An overlapping range fetches only its new days
+  const second = await insights.getFullSourceInsights(addDays(from, 5), addDays(from, 14));
+  assert.strictEqual(second.Facebook.impressions, expectedSource(addDays(from, 5), addDays(from, 14), 'facebook'));
+  assert.strictEqual(calls.daysServed, 15);
+
+  // 4. Identical concurrent requests share one fetch
+  const before = calls.daysServed;
+  const adSets = await Promise.all(Array.from({ length: 5 }, () => insights.getAdSetInsights(from, addDays(from, 6))));
+  assert.strictEqual(calls.daysServed - before, 7);
+  assert.strictEqual(calls.reach, 1);
+
+  // 4b. Reach is the range's, not the sum of daily reach, and CPP follows it
+  const mumbai = adSets[0]['IPL Mumbai'];
+  assert.strictEqual(mumbai.reach, rangeReach(from, addDays(from, 6), 'IPL Mumbai'));
+  assert.strictEqual(mumbai.cpp, (mumbai.spend / mumbai.reach) * 1000);
+
+  // 5. Today is refetched once OPEN_DAY_TTL_MS has passed; closed days never are
+  const throughToday = await insights.getInsightsBySource(from, today);
+  assert.strictEqual(throughToday.Facebook, expectedSource(from, today, 'facebook'));
+  const served = calls.daysServed;
+  await insights.getInsightsBySource(from, today);
+  assert.strictEqual(calls.daysServed, served, 'fresh open day is served from the cache');
+  openDayBoost = 1000;
+  await new Promise(resolve => setTimeout(resolve, OPEN_DAY_TTL_MS + 50));
+  const refreshed = await insights.getInsightsBySource(from, today);
+  assert.strictEqual(calls.daysServed, served + 1, 'only the open day is refetched');
+  assert.strictEqual(refreshed.Facebook, expectedSource(from, today, 'facebook'));
+
+  // 6. Time series uses the same days
+  const series = await insights.getTimeSeriesInsights(addDays(from, 2), addDays(from, 4));
+  assert.deepStrictEqual(Object.keys(series), [addDays(from, 2), addDays(from, 3), addDays(from, 4)]);
+  assert.strictEqual(series[addDays(from, 3)].Instagram.impressions, figures(addDays(from, 3), 'instagram').impressions);
+
+  console.log('✅ Facebook insights cache behaves:', { stubCalls: calls, cache: insights.status() });
+  server.close();
+}
+
+run().catch(error => {
+  console.error('❌ Test failed:', error);
+  process.exit(1);
+});
@@ -0,0 +1,69 @@
+// Test script for the in-memory lead search index
+// Runs against the Firestore emulator:
+//   FIRESTORE_EMULATOR_HOST=localhost:8080 node test-lead-search-index.js
+const assert = require('assert');
+const { Firestore } = require('@google-cloud/firestore');
+const { LeadSearchIndex, normalizePhone } = require('./src/services/leadSearchIndex');
+
+const wait = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+async function testLeadSearchIndex() {
+  if (!process.env.FIRESTORE_EMULATOR_HOST) {
+    console.error('❌ Set FIRESTORE_EMULATOR_HOST to run this against the emulator');
+    process.exit(1);
+  }
+
+  const firestore = new Firestore({ projectId: 'demo-lead-search' });
+  const collection = `test_leads_${Date.now()}`;
+  const ref = firestore.collection(collection);
+
+  console.log('Seeding leads...\n');
+  await Promise.all([
+    ref.doc('a').set({ name: 'Rahul Sharma', email: 'rahul@example.com', phone: '+91 98765 43210', status: 'qualified', created_date: '2025-07-01T10:00:00Z' }),
+    ref.doc('b').set({ name: 'Priya Rahulkar', email: 'priya@example.com', phone: '09876500000', status: 'unassigned', created_date: '2025-07-02T10:00:00Z' }),
+    ref.doc('c').set({ name: 'John Smith', company: 'Sharma Travels', phone: '020 7946 0958', status: 'qualified', created_date: '2025-07-03T10:00:00Z' })
+  ]);
+
+  const index = new LeadSearchIndex({ firestore, collection });
+  try {
+    await index.start();
+    assert.strictEqual(index.size, 3);
+
+    // Substring and prefix search
+    assert.deepStrictEqual(index.search('rahul', { sortBy: 'relevance' }), ['a', 'b']);
+    assert.deepStrictEqual(index.search('sharma', { sortBy: 'created_date', sortOrder: 'desc' }), ['c', 'a']);
+    assert.deepStrictEqual(index.search('jo'), ['c']);
+    assert.deepStrictEqual(index.search('sharma', { filters: { status: ['qualified'] } }).sort(), ['a', 'c']);
+    console.log('✅ Search');
+
+    // Phone numbers in different formats
+    assert.strictEqual(normalizePhone('098765 43210'), '+919876543210');
+    assert.deepStrictEqual(index.findByPhone('9876543210'), ['a']);
+    assert.deepStrictEqual(index.findByPhone('+91-98765-43210'), ['a']);
+    assert.deepStrictEqual(index.search('98765 43210'), ['a']);
+    console.log('✅ Phone lookup');
+
+    // Listener keeps the index current
+    await ref.doc('a').update({ name: 'Rohit Verma', phone: '9000000000' });
+    await ref.doc('b').delete();
+    await wait(1000);
+    assert.deepStrictEqual(index.search('rahul'), []);
+    assert.deepStrictEqual(index.findByPhone('9876543210'), []);
+    assert.deepStrictEqual(index.findByPhone('+919000000000'), ['a']);
+    assert.strictEqual(index.size, 2);
+    console.log('✅ Updates and deletes');
+
+    console.log('\nIndex status:', index.status());
+  } finally {
+    index.stop();
+    const snapshot = await ref.get();
+    await Promise.all(snapshot.docs.map(doc => doc.ref.delete()));
+  }
+}
+
+testLeadSearchIndex()
+  .then(() => process.exit(0))
+  .catch(error => {
+    console.error('❌ Test failed:', error);
+    process.exit(1);
+  });
@@ -0,0 +1,125 @@
+// Load test for the queued Meta webhook (META_WEBHOOK_MODE=queue) against the
+// Firestore emulator and a stub Graph API, so nothing touches production.
+//
+//   gcloud emulators firestore start --host-port=localhost:8085
+//   node test-webhook-queue.js --stub-only          # stub Graph API on :9099
+//   FIRESTORE_EMULATOR_HOST=localhost:8085 GOOGLE_CLOUD_PROJECT=demo-crm \
+//     META_WEBHOOK_MODE=queue META_GRAPH_API_URL=http://localhost:9099 \
+//     META_PAGE_ACCESS_TOKEN=stub META_APP_SECRET=stub-secret npm start
+//   FIRESTORE_EMULATOR_HOST=localhost:8085 GOOGLE_CLOUD_PROJECT=demo-crm \
+//     META_APP_SECRET=stub-secret node test-webhook-queue.js
+//
+// Sends LEADS events (each delivered twice, like Meta retries during a spike),
+// reports acknowledgement latency, then waits for the queue to drain.
+const http = require('http');
+const crypto = require('crypto');
+const fetch = require('node-fetch');
+
+const WEBHOOK_URL = process.env.WEBHOOK_URL || 'http://localhost:8080/webhooks/meta-leads';
+const APP_SECRET = process.env.META_APP_SECRET || 'stub-secret';
+const STUB_PORT = parseInt(process.env.STUB_GRAPH_PORT || '9099');
+const STUB_LATENCY_MS = parseInt(process.env.STUB_GRAPH_LATENCY_MS || '800');
+const LEADS = parseInt(process.env.LEADS || '200');
+const RUN_ID = Date.now();
+
+// Stub Graph API: answers lead lookups after STUB_LATENCY_MS
+function startStubGraph() {
+  return new Promise(resolve => {
+    const server = http.createServer((req, res) => {
+      const id = req.url.split('?')[0].split('/').pop();
+      setTimeout(() => {
+        res.setHeader('Content-Type', 'application/json');
+        res.end(JSON.stringify({
+          id,
+          created_time: new Date().toISOString(),
+          form_id: 'stub-form',
+          campaign_id: 'stub-campaign',
+          campaign_name: 'Stub Campaign',
+          platform: 'ig',
+          field_data: [
+            { name: 'full_name', values: [`Queue Test ${id}`] },
+            { name: 'email', values: [`${id}@example.com`] },
+            { name: 'phone_number', values: [`+9190000${id.slice(-5)}`] }
+          ]
+        }));
+      }, STUB_LATENCY_MS);
+    });
+    server.listen(STUB_PORT, () => {
+      console.log(`🧪 Stub Graph API on http://localhost:${STUB_PORT}`);
+      resolve(server);
+    });
+  });
+}
+
+async function sendWebhook(leadgenId) {
+  const payload = JSON.stringify({
+    entry: [{
+      id: 'stub-page',
+      time: Math.floor(Date.now() / 1000),
+      changes: [{
+        field: 'leadgen',
+        value: { leadgen_id: leadgenId, page_id: 'stub-page', form_id: 'stub-form', created_time: Math.floor(Date.now() / 1000) }
+      }]
+    }]
+  });
+  const signature = `sha256=${crypto.createHmac('sha256', APP_SECRET).update(payload).digest('hex')}`;
+
+  const start = Date.now();
+  const response = await fetch(WEBHOOK_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'X-Hub-Signature-256': signature },
+    body: payload
+  });
+  return { status: response.status, ms: Date.now() - start };
+}
+
+async function run() {
+  if (process.argv.includes('--stub-only')) {
+    await startStubGraph();
+    return;
+  }
+
+  const { db } = require('./src/config/db');
+  const ids = Array.from({ length: LEADS }, (_, i) => `${RUN_ID}${String(i).padStart(5, '0')}`);
+
+  console.log(`📨 Sending ${LEADS} leadgen events, each twice...`);
+  const results = await Promise.all([...ids, ...ids].map(sendWebhook));
+  const latencies = results.map(r => r.ms).sort((a, b) => a - b);
+  console.log('✅ Acknowledged:', {
+    statuses: results.reduce((acc, r) => ({ ...acc, [r.status]: (acc[r.status] || 0) + 1 }), {}),
+    p50Ms: latencies[Math.floor(latencies.length * 0.5)],
+    p95Ms: latencies[Math.floor(latencies.length * 0.95)],
+    maxMs: latencies[latencies.length - 1]
+  });
+
+  const deadline = Date.now() + 5 * 60 * 1000;
+  while (Date.now() < deadline) {
+    const docs = await db.getAll(...ids.map(id => db.collection('crm_meta_webhook_queue').doc(id)));
+    const byStatus = {};
+    docs.forEach(doc => {
+      const status = doc.exists ? doc.data().status : 'missing';
+      byStatus[status] = (byStatus[status] || 0) + 1;
+    });
+    console.log('⏳ Queue:', byStatus);
+    if ((byStatus.done || 0) + (byStatus.failed || 0) === ids.length) {
+      const lags = docs.filter(doc => doc.data().lag_ms !== undefined).map(doc => doc.data().lag_ms).sort((a, b) => a - b);
+      const leads = await db.collection('crm_leads').where('campaign_id', '==', 'stub-campaign').get();
+      const runLeads = leads.docs.filter(doc => String(doc.data().meta_lead_id).startsWith(String(RUN_ID)));
+      console.log('🏁 Drained:', {
+        lagP50Ms: lags[Math.floor(lags.length * 0.5)],
+        lagP95Ms: lags[Math.floor(lags.length * 0.95)],
+        leadsCreated: runLeads.length,
+        duplicates: runLeads.length - new Set(runLeads.map(doc => doc.data().meta_lead_id)).size
+      });
+      return;
+    }
+    await new Promise(resolve => setTimeout(resolve, 2000));
+  }
+  console.error('❌ Queue did not drain within 5 minutes');
+  process.exit(1);
+}
+
+run().catch(error => {
+  console.error('❌ Test failed:', error);
+  process.exit(1);
+});
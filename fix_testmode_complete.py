@@ -1,7 +1,8 @@
 import re
 
-with open('frontend/public/index.html', 'r') as f:
-    content = f.read()
+from patchkit import Patch, PatchEngine
+
+TARGET = 'frontend/public/index.html'
 
 # Fix 1: Fix the testMode state declaration syntax error
 # Current broken code has console.log inside useState callback
@@ -10,16 +11,12 @@ fixed_testmode = """const [testMode, setTestMode] = useState(() => {
         return localStorage.getItem('testMode') === 'true';
     });"""
 
-content = re.sub(broken_pattern, fixed_testmode, content, flags=re.DOTALL)
-
 # Fix 2: Remove the orphaned console.log statements
-content = re.sub(r"console\.log\('Test mode state:', testMode\);\s*console\.log\('Current user:', currentUser\);\s*console\.log\('Is super admin:', currentUser\?\.role === 'super_admin'\);", "", content)
+orphaned_logs_pattern = r"console\.log\('Test mode state:', testMode\);\s*console\.log\('Current user:', currentUser\);\s*console\.log\('Is super admin:', currentUser\?\.role === 'super_admin'\);"
 
 # Fix 3: Add proper test mode logging after state declarations
-# Find where to add the logging effect
 auth_effect_pattern = r'(// Persist authentication state\s*useEffect\(\(\) => \{)'
-if re.search(auth_effect_pattern, content):
-    test_mode_effect = """
+test_mode_effect = """
     // Test mode logging
     useEffect(() => {
         console.log('Test mode state:', testMode);
@@ -28,19 +25,12 @@ if re.search(auth_effect_pattern, content):
     }, [testMode, currentUser]);
 
     """
-    content = re.sub(auth_effect_pattern, test_mode_effect + r'\1', content)
 
 # Fix 4: Ensure test mode toggle is visible
-# The toggle already exists in the code but let's make sure it's properly placed
-# Check if the test mode toggle UI exists
-if 'Toggle Test Mode' in content:
-    print("✓ Test mode toggle UI already exists")
-else:
-    print("⚠ Test mode toggle UI missing - adding it")
-    # Add test mode toggle in header after dark mode toggle
-    darkmode_toggle_pattern = r'(\)\s*\)\s*\)\s*\),?\s*)(React\.createElement\(\'main\')'
-    
-    test_toggle_ui = """React.createElement('div', {
+# Add test mode toggle in header after dark mode toggle, unless it already exists
+darkmode_toggle_pattern = r'(\)\s*\)\s*\)\s*\),?\s*)(React\.createElement\(\'main\')'
+
+test_toggle_ui = """React.createElement('div', {
                     style: {
                         display: currentUser?.role === 'super_admin' ? 'flex' : 'none',
                         alignItems: 'center',
@@ -74,11 +64,15 @@ else:
                 ),
             ),
             """
-    
-    content = re.sub(darkmode_toggle_pattern, r'\1' + test_toggle_ui + r'\2', content)
 
-# Write the fixed content
-with open('frontend/public/index.html', 'w') as f:
-    f.write(content)
+PATCHES = [
+    Patch('testmode-state-syntax', broken_pattern, fixed_testmode, flags=re.DOTALL),
+    Patch('remove-orphaned-testmode-logs', orphaned_logs_pattern, ''),
+    Patch('testmode-logging-effect', auth_effect_pattern, test_mode_effect + r'\1'),
+    Patch('testmode-toggle-ui', darkmode_toggle_pattern, r'\1' + test_toggle_ui + r'\2',
+          unless='Toggle Test Mode'),
+]
 
-print("✅ Frontend fixes applied")
+if __name__ == '__main__':
+    PatchEngine(TARGET).register(*PATCHES).run()
+    print("✅ Frontend fixes applied")
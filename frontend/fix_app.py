@@ -1,22 +1,15 @@
 #!/usr/bin/env python3
+import os
 import re
+import sys
 
-with open('index.html', 'r') as f:
-    content = f.read()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from patchkit import Patch, PatchEngine
 
-# Find the script tag content
-script_match = re.search(r'<script>\s*const { useState, useEffect } = React;(.*?)</script>', content, re.DOTALL)
+TARGET = 'index.html'
 
-if script_match:
-    script_content = script_match.group(1)
-    
-    # Check if App function exists
-    if 'const App = () => {' not in script_content:
-        print("App function not found! This is the issue.")
-        
-        # Find where to add it (after all the constants/states)
-        # Let's add a simple App function for testing
-        test_app = '''
+# Temporary test App, added before ReactDOM.render when App is missing
+test_app = '''
 // Temporary test App
 const App = () => {
     return React.createElement('div', null, 
@@ -26,12 +19,27 @@ const App = () => {
 };
 
 '''
-        # Add before ReactDOM.render
-        content = content.replace('ReactDOM.render(', test_app + 'ReactDOM.render(')
-        
-        with open('index.html', 'w') as f:
-            f.write(content)
-        print("Added test App function")
-    else:
+
+
+def ensure_app_function(content):
+    # Find the script tag content
+    script_match = re.search(r'<script>\s*const { useState, useEffect } = React;(.*?)</script>', content, re.DOTALL)
+    if not script_match:
+        return None
+
+    # Check if App function exists
+    if 'const App = () => {' in script_match.group(1):
         print("App function found at:", content.find('const App = () => {'))
+        return None
+
+    print("App function not found! This is the issue.")
+    print("Added test App function")
+    return content.replace('ReactDOM.render(', test_app + 'ReactDOM.render(')
+
+
+PATCHES = [
+    Patch('ensure-app-function', func=ensure_app_function),
+]
 
+if __name__ == '__main__':
+    PatchEngine(TARGET).register(*PATCHES).run()
@@ -2,6 +2,105 @@
 // Main Content Router Component - Enhanced with Tab Overlay Fix
 // Complete router functionality with all tabs, permission checks, and complex roles management
 
+// Lazy tab bundles: tabs listed in window.TAB_BUNDLES (constants/tab-bundles.js)
+// are not loaded by index.html. Their scripts are fetched on first navigation,
+// or as soon as the user hovers over the tab. A 'tab-bundle-loaded' event
+// ({ detail: { group } }) is dispatched once a group's scripts have run
+window.tabBundleLoader = (function() {
+    const groups = {}; // group -> { status: 'loading' | 'loaded' | 'error', promise, error }
+
+    function groupFor(tab) {
+        return window.TAB_BUNDLES && window.TAB_BUNDLES.tabs[tab];
+    }
+
+    function loadScript(src) {
+        return new Promise((resolve, reject) => {
+            const script = document.createElement('script');
+            script.src = src;
+            script.async = false;
+            script.onload = resolve;
+            script.onerror = () => reject(new Error(`Failed to load ${src}`));
+            document.head.appendChild(script);
+        });
+    }
+
+    function load(tab) {
+        const group = groupFor(tab);
+        if (!group) {
+            return Promise.resolve();
+        }
+        if (!groups[group] || groups[group].status === 'error') {
+            const entry = { status: 'loading' };
+            const started = performance.now();
+            entry.promise = window.TAB_BUNDLES.groups[group]
+                .reduce((chain, src) => chain.then(() => loadScript(src)), Promise.resolve())
+                .then(() => {
+                    entry.status = 'loaded';
+                    console.log(`📦 Loaded ${group} bundle in ${Math.round(performance.now() - started)}ms`);
+                    // Lets the shell patch what the bundle defines before the tab renders
+                    window.dispatchEvent(new CustomEvent('tab-bundle-loaded', { detail: { group } }));
+                })
+                .catch(error => {
+                    entry.status = 'error';
+                    entry.error = error;
+                    console.error(`❌ Could not load ${group} bundle:`, error);
+                    throw error;
+                });
+            groups[group] = entry;
+        }
+        return groups[group].promise;
+    }
+
+    function status(tab) {
+        const group = groupFor(tab);
+        if (!group) {
+            return 'loaded';
+        }
+        return groups[group] ? groups[group].status : 'idle';
+    }
+
+    // Shown in place of the tab until its bundle has run, then renders it
+    function LazyTab({ tab, render }) {
+        const [state, setState] = React.useState(status(tab));
+
+        const start = () => {
+            setState('loading');
+            load(tab).then(() => setState('loaded'), () => setState('error'));
+        };
+
+        React.useEffect(() => {
+            if (status(tab) !== 'loaded') {
+                start();
+            }
+        }, [tab]);
+
+        if (state === 'loaded') {
+            return render();
+        }
+        if (state === 'error') {
+            return React.createElement('div', { className: 'text-center py-12' },
+                React.createElement('p', { className: 'text-red-500 text-lg mb-4' },
+                    'Could not load this tab. Check your connection and try again.'),
+                React.createElement('button', {
+                    className: 'bg-blue-600 text-white px-4 py-2 rounded hover:bg-blue-700',
+                    onClick: start
+                }, 'Retry')
+            );
+        }
+        return React.createElement(window.MobileLoadingState, { message: 'Loading...' });
+    }
+
+    function gate(tab, render) {
+        return status(tab) === 'loaded' ? render() : React.createElement(LazyTab, { tab, render });
+    }
+
+    return { load, status, gate };
+})();
+
+window.prefetchTab = function(tab) {
+    window.tabBundleLoader.load(tab).catch(() => {});
+};
+
 // The renderContent function that SimplifiedApp calls
 window.renderContent = () => {
     // Check if tab is loading and show loader
@@ -33,7 +132,7 @@ window.renderContent = () => {
             height: '100%',
             overflow: 'auto'
         }
-    }, (() => {
+    }, window.tabBundleLoader.gate(window.activeTab, () => {
         // Add this check in your renderContent function where other forms are rendered
         if (window.appState?.currentForm === 'proforma_invoice' && window.appState?.showPaymentForm) {
             return window.renderProformaInvoiceForm();
@@ -414,7 +513,7 @@ window.renderContent = () => {
             default:
                 return window.renderDashboardContent();
         }
-    })()));
+    })));
 };
 
 // Enhanced tab cleanup function
@@ -192,6 +192,41 @@ window.testInventoryModal = function() {
 
 // ===== CSV UPLOAD MODAL COMPONENT =====
 
+// ===== LEAD IMPORT JOBS =====
+
+// Large lead imports answer 202 with a job id; poll until the job finishes
+// and return its result in the usual upload response shape
+window.waitForLeadImport = async function(result, onProgress) {
+  if (!result || !result.jobId || result.status !== 'running') {
+    return result;
+  }
+
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, 2000));
+
+    const response = await fetch(`${window.API_CONFIG.API_URL}/upload/leads/csv/jobs/${result.jobId}`, {
+      headers: {
+        'Authorization': window.authToken ? 'Bearer ' + window.authToken : undefined
+      }
+    });
+    const job = await response.json();
+
+    if (!response.ok) {
+      throw new Error(job.error || 'Failed to check import progress');
+    }
+    if (job.status === 'completed') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Import failed');
+    }
+    if (job.stalled) {
+      throw new Error(`Import stopped after ${job.rowsRead} rows (${job.successCount} imported); check the leads list before retrying`);
+    }
+    onProgress && onProgress(job);
+  }
+};
+
 window.CSVUploadModal = ({ isOpen, onClose, type }) => {
   const [file, setFile] = React.useState(null);
   const [uploading, setUploading] = React.useState(false);
@@ -287,9 +322,12 @@ window.CSVUploadModal = ({ isOpen, onClose, type }) => {
         body: formData
       });
 
-      const result = await response.json();
+      let result = await response.json();
       
       if (response.ok) {
+        if (type === 'leads') {
+          result = await window.waitForLeadImport(result);
+        }
         setUploadResult(result);
 
         if (result.clientDetectionResults && result.clientDetectionResults.length > 0) {
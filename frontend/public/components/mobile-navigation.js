@@ -67,7 +67,8 @@ window.MobileBottomNavigation = function() {
       React.createElement('div', {
         key: item.id,
         className: `mobile-nav-item ${activeTab === item.id ? 'active' : ''} touchable`,
-        onClick: () => handleNavClick(item.id)
+        onClick: () => handleNavClick(item.id),
+        onTouchStart: () => window.prefetchTab && window.prefetchTab(item.id)
       },
         React.createElement('span', { className: 'mobile-nav-icon' }, item.icon),
         React.createElement('span', { className: 'mobile-nav-label' }, item.label)
@@ -350,7 +351,8 @@ window.MobileMoreMenu = function() {
             React.createElement('div', {
               key: item.id,
               className: 'mobile-list-item touchable',
-              onClick: () => handleItemClick(item)
+              onClick: () => handleItemClick(item),
+              onTouchStart: () => item.id && window.prefetchTab && window.prefetchTab(item.id)
             },
               React.createElement('span', { 
                 className: 'text-xl mr-3'
@@ -2028,9 +2028,12 @@ window.openEventForm = handlers.openEventForm || ((event = null) => {
           body: formData
         });
         
-        const result = await response.json();
+        let result = await response.json();
         
         if (response.ok) {
+          if (window.waitForLeadImport) {
+            result = await window.waitForLeadImport(result);
+          }
           console.log("✅ Upload successful:", result);
           
           if (result.clientDetectionResults && result.clientDetectionResults.length > 0) {
@@ -3071,6 +3074,7 @@ window.renderSportsCalendarContent = window.renderSportsCalendarContent || (() =
                   state.setActiveTab(item.id); 
                   if(item.id === 'leads') state.setViewMode('leads'); 
                 },
+                onMouseEnter: () => window.prefetchTab && window.prefetchTab(item.id),
                 className: 'w-full flex items-center px-4 py-2 text-sm rounded-md transition-colors ' + 
                   (state.activeTab === item.id 
                     ? 'bg-blue-50 border-r-2 border-blue-600 text-blue-600' 
@@ -3151,7 +3155,7 @@ const AssignmentRulesTab = React.useMemo(() => {
     React.createElement('div', { className: 'text-center py-12' },
       React.createElement('p', { className: 'text-red-500 text-lg' }, 'Access Denied: You do not have permission to manage assignment rules.')
     );
-}, [state.user]);
+}, [state.user, window.AssignmentRulesManager]);
 
 // ✅ Expose AssignmentRulesTab to window with debugging
 window.AssignmentRulesTab = AssignmentRulesTab;
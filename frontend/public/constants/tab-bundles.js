@@ -0,0 +1,29 @@
+// Tab Bundles - tabs whose code is loaded on first navigation instead of at page load
+// The shell (login, dashboard, leads and the tabs the rest of the app calls into)
+// stays in index.html. content-router.js loads a group's scripts, in order, the
+// first time one of its tabs is opened or hovered. The production build
+// (python -m patchkit.bundler) swaps each file list for the group's hashed bundle.
+// Keep this a plain JSON object so the build can read and rewrite it.
+window.TAB_BUNDLES = {
+  "tabs": {
+    "finance": "financials",
+    "financials": "financials",
+    "sales-performance": "sales-performance",
+    "marketing-performance": "marketing-performance",
+    "stadiums": "stadiums",
+    "sports-calendar": "sports-calendar",
+    "reminders": "reminders",
+    "assignment-rules": "assignment-rules",
+    "changePassword": "change-password"
+  },
+  "groups": {
+    "financials": ["components/financials.js"],
+    "sales-performance": ["components/sales-performance.js"],
+    "marketing-performance": ["components/marketing-performance-clean-backend.js"],
+    "stadiums": ["components/stadiums.js"],
+    "sports-calendar": ["components/sports-calendar.js"],
+    "reminders": ["components/reminders.js"],
+    "assignment-rules": ["components/assignment-rules.js"],
+    "change-password": ["components/change-password.js"]
+  }
+};
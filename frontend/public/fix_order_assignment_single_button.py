@@ -1,4 +1,9 @@
+import os
 import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from patchkit.jsindex import JSIndex
 
 with open('index.html', 'r') as f:
     content = f.read()
@@ -50,23 +55,10 @@ if 'const [selectedOrderForAssignment, setSelectedOrderForAssignment] = useState
 
 # Add the order assignment modal function if not present
 if 'const renderOrderAssignmentModal = ()' not in content:
-    # Find a good place to add it (after renderOrderDetailModal)
-    insert_pattern = r"(const renderOrderDetailModal = \(\) => \{[^}]+\};\s*\n)"
-    insert_pos = content.find('const renderOrderDetailModal = ()')
-    if insert_pos > 0:
-        # Find the end of this function
-        brace_count = 0
-        start_pos = content.find('{', insert_pos)
-        pos = start_pos
-        while pos < len(content) and brace_count >= 0:
-            if content[pos] == '{':
-                brace_count += 1
-            elif content[pos] == '}':
-                brace_count -= 1
-            pos += 1
-            if brace_count == 0:
-                break
-        
+    # Add it right after renderOrderDetailModal, using the span index so braces
+    # inside strings and template literals don't throw the count off
+    index = JSIndex(content)
+    if index.function('renderOrderDetailModal'):
         # Insert the new function after renderOrderDetailModal
         modal_function = """
 
@@ -117,7 +109,8 @@ const renderOrderAssignmentModal = () => {
     );
 };
 """
-        content = content[:pos] + modal_function + content[pos:]
+        index.insert_after_function('renderOrderDetailModal', modal_function)
+        content = index.text
         print("✓ Added renderOrderAssignmentModal function")
 
 # Update assignOrderToService to accept email instead of name
@@ -22,8 +22,12 @@ window.isTokenExpired = function() {
   }
 };
 
-// Handle authentication errors
-window.handleAuthError = function(status) {
+// Handle authentication errors. A 403 with code PERMISSION_DENIED means the
+// role lacks a permission, not that the session expired, so it doesn't log out
+window.handleAuthError = function(status, code) {
+  if (code === 'PERMISSION_DENIED') {
+    return false;
+  }
   if (status === 401 || status === 403) {
     // Clear auth data
     localStorage.removeItem('crm_auth_token');
@@ -56,6 +60,17 @@ window.handleAuthError = function(status) {
   return false;
 };
 
+// Error code from a 403 response body, leaving the body readable
+window.getErrorCode = async function(response) {
+  if (response.status !== 403) return null;
+  try {
+    const errorData = await response.clone().json();
+    return errorData.code || null;
+  } catch (e) {
+    return null;
+  }
+};
+
 // Main API helper function - Single source of truth
 window.apiCall = async function(endpoint, options = {}) {
   // Skip token expiry check for auth endpoints (login, register, etc.)
@@ -89,7 +104,7 @@ window.apiCall = async function(endpoint, options = {}) {
     const response = await fetch(`${window.API_CONFIG.API_URL}${endpoint}`, config);
     
     // Handle auth errors
-    if (window.handleAuthError(response.status)) {
+    if (window.handleAuthError(response.status, await window.getErrorCode(response))) {
       throw new Error(`Authentication error: ${response.status}`);
     }
     
@@ -146,7 +161,7 @@ window.uploadFileToGCS = async function(file, documentType = 'general') {
     });
     
     // Handle auth errors
-    if (window.handleAuthError(response.status)) {
+    if (window.handleAuthError(response.status, await window.getErrorCode(response))) {
       throw new Error(`Authentication error: ${response.status}`);
     }
     
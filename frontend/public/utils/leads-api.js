@@ -9,6 +9,11 @@ window.LeadsAPI = {
   filterOptionsCacheTime: null,
   CACHE_DURATION: 5 * 60 * 1000, // 5 minutes
 
+  // Cursors the backend returned for the next page, per page number, for
+  // the filter/sort combination in cursorView
+  pageCursors: {},
+  cursorView: null,
+
   // Store current filter values directly to avoid async state issues
   currentFilters: {
     search: '',
@@ -64,6 +69,19 @@ window.LeadsAPI = {
         }
       });
 
+      // Follow the cursor for this page when we have one for the same view
+      const page = parseInt(queryParams.get('page')) || 1;
+      const viewParams = new URLSearchParams(queryParams);
+      viewParams.delete('page');
+      const view = viewParams.toString();
+      if (view !== this.cursorView) {
+        this.cursorView = view;
+        this.pageCursors = {};
+      }
+      if (this.pageCursors[page]) {
+        queryParams.append('cursor', this.pageCursors[page]);
+      }
+
       window.log.info('🔍 Fetching with filters:', {
         page: queryParams.get('page'),
         source: this.currentFilters.source,
@@ -87,6 +105,9 @@ window.LeadsAPI = {
 
         // Update pagination info
         const paginationData = response.pagination || {};
+        if (paginationData.nextCursor) {
+          this.pageCursors[page + 1] = paginationData.nextCursor;
+        }
         const fullPagination = {
           page: paginationData.page || parseInt(queryParams.get('page')) || 1,
           totalPages: paginationData.totalPages || paginationData.total_pages || 1,
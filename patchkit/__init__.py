@@ -0,0 +1,9 @@
+"""Shared tooling for the index.html / route fixer scripts."""
+
+from .anchors import AnchoredMatcher, Automaton, contains_all, literal_anchor
+from .engine import Patch, PatchEngine, PatchResult, format_report
+from .jsindex import JSIndex, JSIndexError, Span
+
+__all__ = ['AnchoredMatcher', 'Automaton', 'contains_all', 'literal_anchor',
+           'Patch', 'PatchEngine', 'PatchResult', 'format_report',
+           'JSIndex', 'JSIndexError', 'Span']
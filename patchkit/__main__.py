@@ -0,0 +1,37 @@
+"""Run several fixer scripts' patches against one file in a single pass.
+
+    python -m patchkit frontend/public/index.html \\
+        fix_testmode_complete.py add_testmode_features_clean.py verify_fix_testmode.py
+
+Each script must expose a module-level ``PATCHES`` list.
+"""
+import argparse
+import os
+
+from .engine import PatchEngine, load_script
+
+
+def load_patches(script_path):
+    name = os.path.splitext(os.path.basename(script_path))[0]
+    module = load_script(script_path)
+    if not hasattr(module, 'PATCHES'):
+        raise SystemExit(f"❌ {script_path} does not define PATCHES")
+    return name, module.PATCHES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m patchkit')
+    parser.add_argument('target', help='file to patch, e.g. frontend/public/index.html')
+    parser.add_argument('scripts', nargs='+', help='fixer scripts, applied in the order given')
+    parser.add_argument('--dry-run', action='store_true', help='report without writing')
+    args = parser.parse_args(argv)
+
+    engine = PatchEngine(args.target)
+    for script in args.scripts:
+        name, patches = load_patches(script)
+        engine.register(*patches, source=name)
+    engine.run(dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
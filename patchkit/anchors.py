@@ -0,0 +1,225 @@
+"""Anchor-first matching for the patch scripts.
+
+Patterns like ``activeTab === 'leads'[^{]*?{[^}]*?React\\.createElement...``
+run with re.DOTALL over the whole bundle, so every failed attempt can
+backtrack across hundreds of kilobytes, and a miss is silent. Here each
+pattern is reduced to its longest mandatory literal (the anchor). All anchors
+are found together with one Aho-Corasick pass, and the full regex is only
+tried in a bounded window around each anchor hit, against a time budget.
+
+The budget is best-effort: it is checked between searches, and a single
+search can't be interrupted once started. What bounds one search is its
+window (``before + anchor + after`` characters), so a pattern can overrun
+the budget by at most one window's worth of backtracking. Patterns without
+an anchor search the whole text and are only checked between matches.
+"""
+import re
+import time
+from collections import deque
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+DEFAULT_WINDOW = 4096
+DEFAULT_BUDGET = 0.05
+
+
+class Automaton:
+    """Aho-Corasick automaton over a fixed set of literal strings."""
+
+    def __init__(self, words):
+        self.words = sorted(set(w for w in words if w))
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for word in self.words:
+            state = 0
+            for ch in word:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(word)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+        # While sitting in the root state, jump straight to the next character
+        # that can start any word instead of stepping one character at a time
+        first_chars = ''.join(sorted(self.goto[0]))
+        self._root_skip = re.compile('[' + re.escape(first_chars) + ']') if first_chars else None
+
+    def finditer(self, text, start=0, end=None):
+        """Yield (offset, word) for every occurrence, in order of end offset."""
+        end = len(text) if end is None else end
+        if self._root_skip is None:
+            return
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        i = start
+        while i < end:
+            if state == 0:
+                m = self._root_skip.search(text, i, end)
+                if m is None:
+                    return
+                i = m.start()
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in output[state]:
+                yield i + 1 - len(word), word
+            i += 1
+
+    def scan(self, text):
+        """Map each word to the sorted list of offsets where it occurs."""
+        hits = {word: [] for word in self.words}
+        for offset, word in self.finditer(text):
+            hits[word].append(offset)
+        for offsets in hits.values():
+            offsets.sort()
+        return hits
+
+
+def contains_all(text, markers):
+    """Check many literal markers with a single scan: {marker: bool}."""
+    found = set(word for _, word in Automaton(markers).finditer(text))
+    return {marker: marker in found for marker in markers}
+
+
+def _flatten(parsed):
+    """Top-level items of a parsed regex with plain groups inlined."""
+    for op, av in parsed:
+        if op is sre_parse.SUBPATTERN:
+            group_flags = av[1] | av[2]
+            if not group_flags:
+                yield from _flatten(av[-1])
+                continue
+        yield op, av
+
+
+def literal_anchor(pattern, flags=0):
+    """Longest literal that every match of ``pattern`` must contain.
+
+    Returns None when there is no usable anchor (case-insensitive patterns,
+    or nothing but alternations and character classes).
+    """
+    if flags & re.IGNORECASE:
+        return None
+    parsed = sre_parse.parse(pattern, flags)
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    best = current = ''
+    for op, av in _flatten(parsed):
+        if op is sre_parse.LITERAL:
+            current += chr(av)
+            if len(current) > len(best):
+                best = current
+        else:
+            current = ''
+    return best or None
+
+
+class AnchoredMatcher:
+    """A regex that is only tried in a window around its anchor hits.
+
+    ``status`` after each call is one of ``matched``, ``no-anchor`` (the
+    anchor never occurs), ``no-match`` (anchor found but the structure around
+    it did not match) or ``over-budget`` (gave up once ``budget`` seconds had
+    passed; best-effort, see the module docstring).
+    """
+
+    def __init__(self, pattern, flags=0, anchor=None, before=DEFAULT_WINDOW,
+                 after=DEFAULT_WINDOW, budget=DEFAULT_BUDGET):
+        self.regex = re.compile(pattern, flags)
+        self.anchor = anchor or literal_anchor(pattern, flags)
+        self.before = before
+        self.after = after
+        self.budget = budget
+        self.status = None
+        self.elapsed = 0.0
+
+    def _hits(self, text, hits):
+        if hits is not None:
+            return hits
+        found = []
+        pos = text.find(self.anchor)
+        while pos != -1:
+            found.append(pos)
+            pos = text.find(self.anchor, pos + 1)
+        return found
+
+    def finditer(self, text, hits=None):
+        """Yield non-overlapping matches, each containing an anchor hit."""
+        started = time.perf_counter()
+        self.status = 'no-match'
+        try:
+            if self.anchor is None:
+                # No literal to anchor on; plain regex search
+                for m in self.regex.finditer(text):
+                    self.status = 'matched'
+                    yield m
+                    if self.budget and time.perf_counter() - started > self.budget:
+                        self.status = 'over-budget'
+                        return
+                return
+            hits = self._hits(text, hits)
+            if not hits:
+                self.status = 'no-anchor'
+            last_end = 0
+            anchor_len = len(self.anchor)
+            for hit in hits:
+                if hit < last_end:
+                    continue
+                # Between searches only; each search is bounded by its window
+                if self.budget and time.perf_counter() - started > self.budget:
+                    self.status = 'over-budget'
+                    return
+                m = self.regex.search(text, max(last_end, hit - self.before),
+                                      min(len(text), hit + anchor_len + self.after))
+                if m and m.start() <= hit and m.end() >= hit + anchor_len:
+                    self.status = 'matched'
+                    last_end = max(m.end(), hit + 1)
+                    yield m
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+    def search(self, text, hits=None):
+        matches = self.finditer(text, hits)
+        try:
+            return next(matches, None)
+        finally:
+            matches.close()
+
+    def subn(self, repl, text, count=0, hits=None):
+        """re.subn equivalent restricted to anchored matches."""
+        parts = []
+        pos = 0
+        n = 0
+        matches = self.finditer(text, hits)
+        for m in matches:
+            parts.append(text[pos:m.start()])
+            parts.append(repl(m) if callable(repl) else m.expand(repl))
+            pos = m.end()
+            n += 1
+            if count and n >= count:
+                break
+        matches.close()
+        if not n:
+            return text, 0
+        parts.append(text[pos:])
+        return ''.join(parts), n
@@ -0,0 +1,210 @@
+"""Parallel, manifest-backed patcher for backend route modules.
+
+Fixer scripts declare a ``PATCH_SET``: a named, versioned list of patches,
+each tied to the route files it applies to. The batch runner applies one or
+more patch sets to every module under ``backend/src/routes`` through a
+process pool and records a manifest of what it left behind. On the next run,
+a file whose size, mtime and content hash match the manifest, under the same
+patch-set versions, is skipped without being read into the patch engine.
+
+    python -m patchkit.batch update_routes_delete.py update_leads_delete.py
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .engine import Patch, PatchEngine, load_script
+from .jsindex import JSIndex, JSIndexError
+
+DEFAULT_ROOT = 'backend/src/routes'
+MANIFEST_NAME = '.patchkit-manifest.json'
+
+
+class PatchSet:
+    """Named, versioned group of patches, each bound to a file glob."""
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+        self.entries = []
+
+    def add(self, files, *patches):
+        for patch in patches:
+            if not patch.source:
+                patch.source = self.name
+            self.entries.append((files, patch))
+        return self
+
+    def patches_for(self, filename):
+        return [patch for files, patch in self.entries if fnmatch.fnmatch(filename, files)]
+
+    @property
+    def fingerprint(self):
+        return f"{self.name}@{self.version}"
+
+
+def before_exports(name, text, unless=None):
+    """Patch that inserts ``text`` right before ``module.exports``.
+
+    Files without an export get the text appended followed by
+    ``module.exports = router;``.
+    """
+    def insert(content):
+        try:
+            return JSIndex(content, html=False).insert_before_exports(text).text
+        except JSIndexError:
+            return content + '\n' + text + '\nmodule.exports = router;'
+    return Patch(name, func=insert, unless=unless)
+
+
+def load_patch_set(script_path):
+    module = load_script(script_path)
+    if not hasattr(module, 'PATCH_SET'):
+        raise SystemExit(f"❌ {script_path} does not define PATCH_SET")
+    return module.PATCH_SET
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# Worker side: each pool process loads the patch sets once
+
+_worker_sets = None
+
+
+def _init_worker(scripts):
+    global _worker_sets
+    _worker_sets = [load_patch_set(script) for script in scripts]
+
+
+def _patch_file(path, dry_run):
+    started = time.perf_counter()
+    filename = os.path.basename(path)
+    try:
+        engine = PatchEngine(path)
+        for patch_set in _worker_sets:
+            engine.register(*patch_set.patches_for(filename))
+        if not engine.patches:
+            return {'file': path, 'status': 'no-patches', 'applied': [],
+                    'elapsed': time.perf_counter() - started}
+        results = engine.run(dry_run=dry_run, report=False)
+        applied = [r.name for r in results if r.status == 'applied']
+        return {'file': path, 'status': 'patched' if applied else 'clean', 'applied': applied,
+                'elapsed': time.perf_counter() - started}
+    except Exception as e:
+        return {'file': path, 'status': 'error', 'applied': [], 'error': str(e),
+                'elapsed': time.perf_counter() - started}
+
+
+class BatchPatcher:
+    def __init__(self, scripts, root=DEFAULT_ROOT, pattern='*.js', manifest=None, workers=None):
+        self.scripts = [os.path.abspath(s) for s in scripts]
+        self.root = root
+        self.pattern = pattern
+        self.manifest_path = manifest or os.path.join(root, MANIFEST_NAME)
+        self.workers = workers
+        self.patch_sets = [load_patch_set(script) for script in self.scripts]
+        self.fingerprint = ','.join(sorted(ps.fingerprint for ps in self.patch_sets))
+
+    def files(self):
+        return sorted(os.path.join(self.root, name) for name in os.listdir(self.root)
+                      if fnmatch.fnmatch(name, self.pattern)
+                      and os.path.isfile(os.path.join(self.root, name)))
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load_manifest(self):
+        """File entries recorded by the last run of this exact patch-set combination."""
+        return self._read_manifest().get('runs', {}).get(self.fingerprint, {})
+
+    def save_manifest(self, entries):
+        manifest = self._read_manifest()
+        manifest.setdefault('runs', {})[self.fingerprint] = entries
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def _unchanged(self, path, entry, stat):
+        if not entry:
+            return False
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        return entry['size'] == stat.st_size and entry['hash'] == file_hash(path)
+
+    def run(self, dry_run=False, force=False):
+        started = time.perf_counter()
+        previous = {} if force else self.load_manifest()
+        results = []
+        pending = []
+        for path in self.files():
+            name = os.path.basename(path)
+            if self._unchanged(path, previous.get(name), os.stat(path)):
+                results.append({'file': path, 'status': 'skipped', 'applied': [], 'elapsed': 0.0})
+            else:
+                pending.append(path)
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.scripts,)) as pool:
+                results.extend(pool.map(_patch_file, pending, [dry_run] * len(pending)))
+
+        if not dry_run:
+            entries = dict(previous)
+            for result in results:
+                name = os.path.basename(result['file'])
+                if result['status'] == 'error':
+                    entries.pop(name, None)
+                elif result['status'] != 'skipped':
+                    stat = os.stat(result['file'])
+                    entries[name] = {'hash': file_hash(result['file']), 'size': stat.st_size,
+                                     'mtime_ns': stat.st_mtime_ns}
+            self.save_manifest(entries)
+
+        results.sort(key=lambda r: r['file'])
+        print(format_summary(results, time.perf_counter() - started, dry_run))
+        return results
+
+
+def format_summary(results, total, dry_run=False):
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    lines = [f"\nRoute patch summary ({len(results)} files, {total * 1000:.1f} ms total)"]
+    for result in results:
+        if result['status'] == 'skipped':
+            continue
+        detail = ', '.join(result['applied']) or result.get('error', '')
+        lines.append(f"  {result['elapsed'] * 1000:8.2f} ms  {result['status']:<10} "
+                     f"{os.path.basename(result['file'])}{'  ' + detail if detail else ''}")
+    lines.append('  ' + ', '.join(f"{n} {status}" for status, n in sorted(counts.items())))
+    if dry_run:
+        lines.append("  Dry run - nothing written")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m patchkit.batch')
+    parser.add_argument('scripts', nargs='+', help='scripts that define PATCH_SET')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='route directory')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='ignore the manifest')
+    parser.add_argument('--dry-run', action='store_true', help='report without writing')
+    args = parser.parse_args(argv)
+    BatchPatcher(args.scripts, root=args.root, workers=args.workers).run(
+        dry_run=args.dry_run, force=args.force)
+
+
+if __name__ == '__main__':
+    main()
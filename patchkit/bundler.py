@@ -0,0 +1,607 @@
+"""Bundle and minify the frontend scripts referenced by index.html.
+
+index.html pulls in well over a hundred ``<script src>`` tags from
+``components/``, ``constants/`` and ``utils/``. The build reads the page,
+works out which component files are referenced and which are dead (stale
+``.bak``/``.broken`` copies, unused modules), and replaces every run of
+consecutive local scripts with one content-hashed bundle:
+
+* classic scripts are grouped only while nothing else (an inline or CDN
+  script) sits between them, so execution order is unchanged;
+* ``defer`` scripts all run after parsing in document order, so they share
+  one bundle sequence placed at the first deferred tag;
+* a file that does not tokenize cleanly, or that redeclares a top-level
+  ``const``/``let``/``class`` of an earlier file in the bundle, starts a new
+  bundle instead, so a broken file cannot take its neighbours down with it.
+
+Tabs listed in ``constants/tab-bundles.js`` are not in index.html at all;
+content-router.js loads them on first navigation. Each of those groups gets
+its own ``tab-<group>`` bundle and the copy of the manifest that goes into
+the app bundle is rewritten to point at it.
+
+Minification is deliberately conservative: comments, indentation, blank
+lines and ``console.log(...)`` calls go, line breaks stay (no reliance on
+ASI rewriting). Bundles are cached by the hashes of their inputs, so a
+rebuild only minifies the bundles whose files changed:
+
+    python -m patchkit.bundler --public frontend/public --out frontend/dist
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from .jsindex import _REGEX_KEYWORDS, _REGEX_PRECEDERS, _TEMPLATE_SPECIAL, _previous_word, \
+    _skip_regex, _skip_string, scan
+
+DEFAULT_PUBLIC = 'frontend/public'
+DEFAULT_OUT = 'frontend/dist'
+DEFAULT_MAX_BYTES = 256 * 1024
+MANIFEST_NAME = '.bundle-manifest.json'
+MINIFIER_VERSION = 1
+BUNDLE_DIR = 'js'
+LOCAL_DIRS = ('components', 'constants', 'utils')
+TAB_MANIFEST = 'constants/tab-bundles.js'
+STALE_SUFFIX = re.compile(r'(\.bak\d*|\.broken|\.backup[-\w]*|\.orig|~)$|[-_.]backup\.js$')
+SKIP_COPY = re.compile(r'(\.py|\.pyc|\.sh)$|(^|/)(__pycache__|\.[^/]+)(/|$)')
+
+_SCRIPT_TAG = re.compile(r'<script\b([^>]*)>\s*</script\s*>', re.IGNORECASE)
+_HTML_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_ATTR = re.compile(r'([\w-]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+_CONSOLE_LOG = r'(?<![\w$.])console\s*\.\s*log\s*\('
+_LITERAL = re.compile(r'[\'"`/]')
+_LITERAL_OR_CONSOLE = re.compile(r'[\'"`/]|' + _CONSOLE_LOG)
+_BALANCED = {
+    ('{', '}'): re.compile(r'[\'"`/{}]'),
+    ('(', ')'): re.compile(r'[\'"`/()]'),
+}
+_DECLARATION = re.compile(r'[{}()\[\]]|(?<![\w$.])(const|let|class|var|function)\s+([A-Za-z_$][\w$]*)')
+_LEXICAL = ('const', 'let', 'class')
+_TAB_BUNDLES = re.compile(r'(window\.TAB_BUNDLES\s*=\s*)(\{.*\})(\s*;)', re.DOTALL)
+
+
+# Tokenizing: code runs are separated by strings, templates, regexes,
+# comments and (optionally) console.log calls
+
+def _regex_allowed(text, j):
+    k = j - 1
+    while k >= 0 and text[k] in ' \t\r\n':
+        k -= 1
+    prev = text[k] if k >= 0 else ''
+    return prev == '' or prev in _REGEX_PRECEDERS or prev == '}' or \
+        _previous_word(text, k + 1) in _REGEX_KEYWORDS
+
+
+def _literal_end(text, j, end):
+    """(kind, end offset) of the literal or comment at ``j``; kind None for division."""
+    c = text[j]
+    if c in '\'"':
+        return 'string', _skip_string(text, j, end, c)
+    if c == '`':
+        return 'template', _skip_template(text, j, end)
+    nxt = text[j + 1:j + 2]
+    if nxt == '/':
+        newline = text.find('\n', j, end)
+        return 'comment', end if newline == -1 else newline
+    if nxt == '*':
+        close = text.find('*/', j + 2, end)
+        return 'comment', end if close == -1 else close + 2
+    if _regex_allowed(text, j):
+        stop = _skip_regex(text, j, end)
+        if stop:
+            return 'regex', stop
+    return None, j + 1
+
+
+def _skip_balanced(text, i, end, opener, closer):
+    """Offset just past the ``closer`` that balances an already-open ``opener``."""
+    pattern = _BALANCED[opener, closer]
+    depth = 0
+    while i < end:
+        m = pattern.search(text, i, end)
+        if m is None:
+            return end
+        j = m.start()
+        c = text[j]
+        if c == opener:
+            depth += 1
+            i = j + 1
+        elif c == closer:
+            if depth == 0:
+                return j + 1
+            depth -= 1
+            i = j + 1
+        else:
+            i = _literal_end(text, j, end)[1]
+    return end
+
+
+def _skip_template(text, j, end):
+    i = j + 1
+    while i < end:
+        m = _TEMPLATE_SPECIAL.search(text, i, end)
+        if m is None:
+            return end
+        if m.group(0) == '`':
+            return m.end()
+        if m.group(0) == '${':
+            i = _skip_balanced(text, m.end(), end, '{', '}')
+        else:
+            i = m.end()
+    return end
+
+
+def tokens(text, strip_console=False):
+    """Yield (kind, start, end) covering ``text``.
+
+    Kinds: ``code``, ``string``, ``template``, ``regex``, ``comment`` and,
+    with ``strip_console``, ``console`` for a whole ``console.log(...)`` call.
+    """
+    pattern = _LITERAL_OR_CONSOLE if strip_console else _LITERAL
+    end = len(text)
+    i = code_start = 0
+    while i < end:
+        m = pattern.search(text, i)
+        if m is None:
+            break
+        j = m.start()
+        if text[j] == 'c':
+            kind, stop = 'console', _skip_balanced(text, m.end(), end, '(', ')')
+        else:
+            kind, stop = _literal_end(text, j, end)
+        if kind is None:
+            i = stop
+            continue
+        if j > code_start:
+            yield 'code', code_start, j
+        yield kind, j, stop
+        i = code_start = stop
+    if code_start < end:
+        yield 'code', code_start, end
+
+
+def _squeeze(code):
+    code = re.sub(r'[ \t\r\f\v]+', ' ', code)
+    return re.sub(r' ?\n[\s]*', '\n', code)
+
+
+def minify(text, strip_console=True):
+    """Drop comments, console.log calls and redundant whitespace, keeping line breaks."""
+    out = []
+    pending = []
+    for kind, start, end in tokens(text, strip_console):
+        if kind == 'code':
+            pending.append(text[start:end])
+        elif kind == 'comment':
+            pending.append('\n' if '\n' in text[start:end] else ' ')
+        elif kind == 'console':
+            pending.append('void 0')
+        else:
+            out.append(_squeeze(''.join(pending)))
+            out.append(text[start:end])
+            pending = []
+    out.append(_squeeze(''.join(pending)))
+    return ''.join(out).strip() + '\n'
+
+
+def top_level_declarations(text):
+    """{name: keyword} for bindings declared at the top level of a script."""
+    names = {}
+    depth = 0
+    for kind, start, end in tokens(text):
+        if kind != 'code':
+            continue
+        for m in _DECLARATION.finditer(text, start, end):
+            c = m.group(0)
+            if c in '{([':
+                depth += 1
+            elif c in '})]':
+                depth -= 1
+            elif depth == 0:
+                names.setdefault(m.group(2), m.group(1))
+    return names
+
+
+# index.html
+
+class ScriptTag:
+    def __init__(self, start, end, attrs):
+        self.start = start
+        self.end = end
+        self.attrs = attrs
+        src = attrs.get('src') or ''
+        self.src = src
+        self.path = src.split('?', 1)[0].split('#', 1)[0]
+
+    @property
+    def local(self):
+        return bool(self.src) and not re.match(r'^(\w+:)?//', self.src) and \
+            self.attrs.get('type', 'text/javascript') in ('text/javascript', 'application/javascript') \
+            and 'async' not in self.attrs
+
+    @property
+    def mode(self):
+        return 'defer' if 'defer' in self.attrs else 'classic'
+
+
+def parse_scripts(html):
+    """Every <script> tag outside HTML comments, in document order.
+
+    Inline scripts are included (with an empty src) since they break runs of
+    classic scripts.
+    """
+    comments = [(m.start(), m.end()) for m in _HTML_COMMENT.finditer(html)]
+    tags = []
+    for m in re.finditer(r'<script\b([^>]*)>', html, re.IGNORECASE):
+        if any(s <= m.start() < e for s, e in comments):
+            continue
+        attrs = {}
+        for a in _ATTR.finditer(m.group(1)):
+            value = next((v for v in a.group(2, 3, 4) if v is not None), '')
+            attrs[a.group(1).lower()] = value
+        close = _SCRIPT_TAG.match(html, m.start())
+        tags.append(ScriptTag(m.start(), close.end() if close else m.end(), attrs))
+    return tags
+
+
+def load_tab_manifest(public):
+    """The ``window.TAB_BUNDLES`` object from constants/tab-bundles.js, or None."""
+    try:
+        with open(os.path.join(public, TAB_MANIFEST), 'r') as f:
+            m = _TAB_BUNDLES.search(f.read())
+    except OSError:
+        return None
+    if m is None:
+        raise SystemExit(f"❌ {TAB_MANIFEST} does not assign window.TAB_BUNDLES")
+    try:
+        return json.loads(m.group(2))
+    except ValueError as e:
+        raise SystemExit(f"❌ {TAB_MANIFEST} is not plain JSON: {e}")
+
+
+def rewrite_tab_manifest(source, groups):
+    """Point each group in the manifest source at its built bundle."""
+    m = _TAB_BUNDLES.search(source)
+    manifest = json.loads(m.group(2))
+    manifest['groups'].update(groups)
+    return source[:m.start(2)] + json.dumps(manifest, indent=2) + source[m.end(2):]
+
+
+def _referenced(public, pages):
+    referenced = set()
+    manifest = load_tab_manifest(public)
+    for scripts in (manifest or {}).get('groups', {}).values():
+        referenced.update(os.path.normpath(src) for src in scripts)
+    for page in pages:
+        with open(os.path.join(public, page), 'r') as f:
+            html = f.read()
+        for tag in parse_scripts(html):
+            if tag.local:
+                referenced.add(os.path.normpath(os.path.join(os.path.dirname(page), tag.path)))
+    return referenced
+
+
+def find_dead(public, pages):
+    """Files under the script directories that no page references.
+
+    Returns {relative path: 'stale' | 'unreferenced'}; stale covers backup
+    copies and anything that isn't a .js file.
+    """
+    referenced = _referenced(public, pages)
+    dead = {}
+    for directory in LOCAL_DIRS:
+        root = os.path.join(public, directory)
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            rel = os.path.join(directory, name)
+            if rel in referenced or not os.path.isfile(os.path.join(public, rel)):
+                continue
+            stale = STALE_SUFFIX.search(name) or not name.endswith('.js')
+            dead[rel] = 'stale' if stale else 'unreferenced'
+    return dead
+
+
+def _file_hash(data):
+    return hashlib.sha1(data.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class Bundler:
+    def __init__(self, public=DEFAULT_PUBLIC, out=DEFAULT_OUT, page='index.html',
+                 max_bytes=DEFAULT_MAX_BYTES, strip_console=True, check=True):
+        self.public = public
+        self.out = out
+        self.page = page
+        self.max_bytes = max_bytes
+        self.strip_console = strip_console
+        self.check = check and shutil.which('node') is not None
+        self.manifest_path = os.path.join(out, MANIFEST_NAME)
+        self.stats = {}
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return manifest if manifest.get('version') == MINIFIER_VERSION else {}
+
+    def _save_manifest(self, manifest):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def _analyze(self, path, source, cache):
+        """Per-file facts (tokenizes cleanly, top-level names), cached by content hash."""
+        digest = _file_hash(source)
+        entry = cache.get(path)
+        if entry is None or entry['hash'] != digest:
+            _, errors = scan(source)
+            entry = {'hash': digest, 'clean': not errors,
+                     'declarations': top_level_declarations(source)}
+        cache[path] = entry
+        return entry
+
+    def plan(self, tags, sources, files):
+        """Group local tags into bundles: list of (mode, [tag, ...])."""
+        groups = []
+        current = {'classic': None, 'defer': None}
+        for tag in tags:
+            if not tag.local:
+                # Anything else that executes in place ends the classic run;
+                # only another deferred script can interleave with defer ones
+                current['classic'] = None
+                if 'defer' in tag.attrs and tag.src:
+                    current['defer'] = None
+                continue
+            facts = files[tag.path]
+            group = current[tag.mode]
+            if group is not None:
+                names = group['names']
+                clash = any(kw in _LEXICAL or names[name] in _LEXICAL
+                            for name, kw in facts['declarations'].items() if name in names)
+                if (not facts['clean'] or clash
+                        or group['size'] + len(sources[tag.path]) > self.max_bytes):
+                    group = None
+            if not facts['clean']:
+                # Left as its own tag, and nothing may be bundled across it
+                groups.append((tag.mode, [tag], False))
+                current[tag.mode] = None
+                continue
+            if group is None:
+                group = {'tags': [], 'names': {}, 'size': 0}
+                groups.append((tag.mode, group['tags'], True))
+                current[tag.mode] = group
+            group['tags'].append(tag)
+            group['size'] += len(sources[tag.path])
+            for name, kw in facts['declarations'].items():
+                group['names'].setdefault(name, kw)
+        return groups
+
+    def _build_bundle(self, name, mode, tags, sources, files, previous):
+        key = _file_hash(json.dumps([MINIFIER_VERSION, self.strip_console, mode] +
+                                    [[t.path, files[t.path]['hash']] for t in tags]))
+        cached = previous.get(key)
+        if cached and os.path.exists(os.path.join(self.out, cached['file'])):
+            return key, cached, False
+        parts = []
+        for tag in tags:
+            # Leading ';' keeps one file's missing semicolon or 'use strict'
+            # prologue from bleeding into the next
+            parts.append(';\n')
+            parts.append(minify(sources[tag.path], self.strip_console))
+        code = ''.join(parts)
+        filename = f"{BUNDLE_DIR}/{name}.{_file_hash(code)[:10]}.js"
+        target = os.path.join(self.out, filename)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w') as f:
+            f.write(code)
+        entry = {'file': filename, 'inputs': [t.path for t in tags],
+                 'bytes_in': sum(len(sources[t.path]) for t in tags), 'bytes_out': len(code)}
+        if self.check:
+            result = subprocess.run(['node', '--check', target], capture_output=True, text=True)
+            if result.returncode != 0:
+                os.remove(target)
+                raise SystemExit(f"❌ {filename} does not parse:\n{result.stderr.strip()}")
+        return key, entry, True
+
+    def _copy_static(self, dead, bundled):
+        """Mirror the public dir into the output, skipping dead files and unchanged copies."""
+        copied = 0
+        for root, dirs, names in os.walk(self.public):
+            rel_root = os.path.relpath(root, self.public)
+            dirs[:] = [d for d in dirs if not SKIP_COPY.search(d + '/')]
+            for name in names:
+                rel = os.path.normpath(os.path.join(rel_root, name))
+                if rel in dead or rel in bundled or rel == self.page or SKIP_COPY.search(rel):
+                    continue
+                src = os.path.join(root, name)
+                dst = os.path.join(self.out, rel)
+                st = os.stat(src)
+                try:
+                    dt = os.stat(dst)
+                    if dt.st_size == st.st_size and dt.st_mtime_ns == st.st_mtime_ns:
+                        continue
+                except OSError:
+                    pass
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+                copied += 1
+        return copied
+
+    def _prune(self, keep):
+        """Remove bundles left over from earlier builds."""
+        root = os.path.join(self.out, BUNDLE_DIR)
+        pruned = 0
+        for name in os.listdir(root) if os.path.isdir(root) else ():
+            if f"{BUNDLE_DIR}/{name}" not in keep:
+                os.remove(os.path.join(root, name))
+                pruned += 1
+        return pruned
+
+    def run(self, dry_run=False):
+        started = time.perf_counter()
+        with open(os.path.join(self.public, self.page), 'r') as f:
+            html = f.read()
+        pages = sorted(n for n in os.listdir(self.public) if n.endswith('.html'))
+        dead = find_dead(self.public, pages)
+
+        manifest = self._load_manifest()
+        file_cache = manifest.get('files', {})
+        previous = manifest.get('bundles', {})
+        tags = parse_scripts(html)
+        sources, files = {}, {}
+        for tag in tags:
+            if tag.local and tag.path not in sources:
+                with open(os.path.join(self.public, tag.path), 'r') as f:
+                    sources[tag.path] = f.read()
+                files[tag.path] = self._analyze(tag.path, sources[tag.path], file_cache)
+
+        bundles = {}
+        replacements = []
+        built = reused = 0
+        counters = {}
+
+        # Lazy tab groups first, so the manifest can be rewritten before the
+        # bundle that contains it is built
+        lazy = {}
+        tab_manifest = load_tab_manifest(self.public) if TAB_MANIFEST in sources else None
+        for group, scripts in (tab_manifest or {}).get('groups', {}).items():
+            group_tags = [ScriptTag(-1, -1, {'src': src}) for src in scripts]
+            for tag in group_tags:
+                if tag.path not in sources:
+                    with open(os.path.join(self.public, tag.path), 'r') as f:
+                        sources[tag.path] = f.read()
+                    files[tag.path] = self._analyze(tag.path, sources[tag.path], file_cache)
+            if not all(files[tag.path]['clean'] for tag in group_tags):
+                lazy[group] = None
+                continue
+            if dry_run:
+                lazy[group] = (group_tags, None)
+                continue
+            key, entry, fresh = self._build_bundle(f"tab-{group}", 'lazy', group_tags,
+                                                   sources, files, previous)
+            bundles[key] = entry
+            built += fresh
+            reused += not fresh
+            lazy[group] = (group_tags, entry)
+        if tab_manifest and not dry_run:
+            sources[TAB_MANIFEST] = rewrite_tab_manifest(
+                sources[TAB_MANIFEST], {group: [built_group[1]['file']]
+                                        for group, built_group in lazy.items() if built_group})
+            files[TAB_MANIFEST] = self._analyze(TAB_MANIFEST, sources[TAB_MANIFEST], file_cache)
+
+        groups = self.plan(tags, sources, files)
+        for mode, group_tags, bundle in groups:
+            if not bundle:
+                continue
+            prefix = 'app' if mode == 'classic' else 'deferred'
+            counters[prefix] = counters.get(prefix, 0) + 1
+            name = f"{prefix}-{counters[prefix]}"
+            if dry_run:
+                replacements.append((mode, group_tags, None))
+                continue
+            key, entry, fresh = self._build_bundle(name, mode, group_tags, sources, files, previous)
+            bundles[key] = entry
+            built += fresh
+            reused += not fresh
+            replacements.append((mode, group_tags, entry))
+
+        bundled = {tag.path for _, group_tags, _ in replacements for tag in group_tags}
+        bundled.update(tag.path for built_group in lazy.values() if built_group
+                       for tag in built_group[0])
+        report = {
+            'scripts': len([t for t in tags if t.src]),
+            'local': len(sources),
+            'bundles': len(replacements),
+            'tabs': {group: (built_group[1] or {}).get('file', 'dry run') if built_group else None
+                     for group, built_group in lazy.items()},
+            'built': built,
+            'reused': reused,
+            'unbundled': sorted(t.path for _, g, b in groups if not b for t in g),
+            'dead': dead,
+            'bytes_in': sum(len(sources[p]) for p in bundled),
+            'bytes_out': sum(e['bytes_out'] for e in bundles.values()),
+            'shell_bytes_out': sum(e['bytes_out'] for _, _, e in replacements if e),
+        }
+        if dry_run:
+            self.stats = dict(report, elapsed=time.perf_counter() - started)
+            return self.stats
+
+        os.makedirs(self.out, exist_ok=True)
+        with open(os.path.join(self.out, self.page), 'w') as f:
+            f.write(rewrite_html(html, replacements))
+        report['copied'] = self._copy_static(dead, bundled)
+        report['pruned'] = self._prune({entry['file'] for entry in bundles.values()})
+        self._save_manifest({'version': MINIFIER_VERSION, 'files': file_cache, 'bundles': bundles})
+        self.stats = dict(report, elapsed=time.perf_counter() - started)
+        return self.stats
+
+
+def rewrite_html(html, replacements):
+    """Swap each bundle's first tag for the bundle and drop the rest."""
+    edits = []
+    for mode, group_tags, entry in replacements:
+        attr = ' defer' if mode == 'defer' else ''
+        edits.append((group_tags[0].start, group_tags[0].end,
+                      f'<script{attr} src="{entry["file"]}"></script>'))
+        for tag in group_tags[1:]:
+            # Take the tag's whole line with it when it is alone on the line
+            start = html.rfind('\n', 0, tag.start) + 1
+            newline = html.find('\n', tag.end)
+            stop = len(html) if newline == -1 else newline + 1
+            if html[start:tag.start].strip() or html[tag.end:stop].strip():
+                start, stop = tag.start, tag.end
+            edits.append((start, stop, ''))
+    parts = []
+    pos = 0
+    for start, end, text in sorted(edits):
+        parts.append(html[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(html[pos:])
+    return ''.join(parts)
+
+
+def format_report(stats):
+    lines = [f"\nFrontend bundle report ({stats['elapsed'] * 1000:.1f} ms)",
+             f"  {stats['scripts']} script tags, {stats['local']} local -> {stats['bundles']} bundles "
+             f"({stats['built']} built, {stats['reused']} reused)"]
+    if stats['bytes_out']:
+        lines.append(f"  {stats['bytes_in'] / 1024:.0f} KB -> {stats['bytes_out'] / 1024:.0f} KB, "
+                     f"{stats['shell_bytes_out'] / 1024:.0f} KB loaded with the page")
+    for group, bundle in sorted(stats['tabs'].items()):
+        lines.append(f"  tab {group}: {bundle or 'loaded unbundled (a file does not tokenize cleanly)'}")
+    for path in stats['unbundled']:
+        lines.append(f"  ⚠ {path} does not tokenize cleanly; left as its own script tag")
+    for path, reason in sorted(stats['dead'].items()):
+        lines.append(f"  ❌ dead ({reason}): {path}")
+    if 'copied' in stats:
+        lines.append(f"  {stats['copied']} static files copied, {stats['pruned']} old bundles removed")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m patchkit.bundler')
+    parser.add_argument('--public', default=DEFAULT_PUBLIC)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--page', default='index.html')
+    parser.add_argument('--max-kb', type=int, default=DEFAULT_MAX_BYTES // 1024,
+                        help='start a new bundle once a group reaches this much source')
+    parser.add_argument('--keep-console', action='store_true', help='do not strip console.log calls')
+    parser.add_argument('--no-check', action='store_true', help='skip node --check on new bundles')
+    parser.add_argument('--dry-run', action='store_true', help='report only, write nothing')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+    stats = Bundler(args.public, args.out, args.page, args.max_kb * 1024,
+                    strip_console=not args.keep_console, check=not args.no_check).run(args.dry_run)
+    print(json.dumps(stats, indent=2) if args.json else format_report(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Single-pass patch engine.
+
+Every fixer script used to open index.html itself, run its own re.sub passes
+and write the file back. Scripts now declare their edits as Patch units and
+hand them to a PatchEngine, which reads the target once, applies every patch
+in order to an in-memory buffer and writes once at the end.
+
+Patches declared with ``anchored=True`` go through patchkit.anchors: the
+engine finds every anchored patch's literal anchor in one automaton pass and
+each regex only runs near its own anchor hits, under a time budget.
+"""
+import importlib.util
+import os
+import re
+import time
+
+from .anchors import DEFAULT_BUDGET, DEFAULT_WINDOW, AnchoredMatcher, Automaton
+
+
+class Patch:
+    """One declarative edit.
+
+    Either a regex substitution (``pattern`` + ``replacement``) or a custom
+    ``func(content) -> content``. ``unless`` is a marker substring: when it is
+    already present in the buffer the patch is skipped, which keeps re-runs
+    idempotent. ``anchored=True`` matches the pattern through an
+    AnchoredMatcher instead of a whole-file regex scan.
+    """
+
+    def __init__(self, name, pattern=None, replacement=None, func=None,
+                 flags=0, count=0, unless=None, source=None, anchored=False,
+                 anchor=None, window=DEFAULT_WINDOW, budget=DEFAULT_BUDGET):
+        if func is None and pattern is None:
+            raise ValueError(f"Patch '{name}' needs either a pattern or a func")
+        self.name = name
+        self.func = func
+        self.regex = re.compile(pattern, flags) if pattern is not None else None
+        self.matcher = None
+        if anchored and pattern is not None:
+            self.matcher = AnchoredMatcher(pattern, flags, anchor=anchor, before=window,
+                                           after=window, budget=budget)
+        self.replacement = replacement
+        self.count = count
+        self.unless = unless
+        self.source = source
+
+    @classmethod
+    def insert_after(cls, name, pattern, text, **kwargs):
+        """Insert ``text`` right after the first match of ``pattern``."""
+        return cls(name, pattern, lambda m: m.group(0) + text, count=1, **kwargs)
+
+    @classmethod
+    def insert_before(cls, name, pattern, text, **kwargs):
+        """Insert ``text`` right before the first match of ``pattern``."""
+        return cls(name, pattern, lambda m: text + m.group(0), count=1, **kwargs)
+
+    @property
+    def anchor(self):
+        return self.matcher.anchor if self.matcher else None
+
+    def apply(self, content, hits=None):
+        """Return (new_content, replacements)."""
+        if self.matcher is not None:
+            return self.matcher.subn(self.replacement, content, count=self.count, hits=hits)
+        if self.regex is not None:
+            return self.regex.subn(self.replacement, content, count=self.count)
+        new_content = self.func(content)
+        if new_content is None:
+            return content, 0
+        return new_content, int(new_content != content)
+
+
+class PatchResult:
+    def __init__(self, patch, status, replacements, elapsed):
+        self.patch = patch
+        self.status = status
+        self.replacements = replacements
+        self.elapsed = elapsed
+
+    @property
+    def name(self):
+        return self.patch.name
+
+
+class PatchEngine:
+    """Load a file once, run registered patches in order, write once."""
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self.patches = []
+
+    def register(self, *patches, source=None):
+        for patch in patches:
+            if source and not patch.source:
+                patch.source = source
+            self.patches.append(patch)
+        return self
+
+    def apply_to(self, content):
+        """Apply every patch to ``content``; returns (content, results)."""
+        anchors = [p.anchor for p in self.patches if p.anchor]
+        automaton = Automaton(anchors) if anchors else None
+        hits = None
+        results = []
+        for patch in self.patches:
+            started = time.perf_counter()
+            if patch.unless and patch.unless in content:
+                status, replacements = 'skipped', 0
+            elif patch.anchor:
+                # One automaton pass serves every anchored patch until an
+                # edit invalidates the offsets
+                if hits is None:
+                    hits = automaton.scan(content)
+                content, replacements = patch.apply(content, hits[patch.anchor])
+                status = patch.matcher.status
+                if replacements and status != 'over-budget':
+                    status = 'applied'
+            else:
+                content, replacements = patch.apply(content)
+                status = 'applied' if replacements else 'no-match'
+            if replacements:
+                hits = None
+            results.append(PatchResult(patch, status, replacements,
+                                       time.perf_counter() - started))
+        return content, results
+
+    def run(self, dry_run=False, report=True):
+        started = time.perf_counter()
+        with open(self.path, 'r', encoding=self.encoding) as f:
+            original = f.read()
+        content, results = self.apply_to(original)
+        changed = content != original
+        if changed and not dry_run:
+            with open(self.path, 'w', encoding=self.encoding) as f:
+                f.write(content)
+        if report:
+            print(format_report(self.path, results, time.perf_counter() - started,
+                                changed, dry_run))
+        return results
+
+
+def format_report(path, results, total, changed, dry_run=False):
+    """Per-patch timing table, slowest patch first."""
+    lines = [f"\nPatch report for {path} ({len(results)} patches, {total * 1000:.1f} ms total)"]
+    for result in sorted(results, key=lambda r: r.elapsed, reverse=True):
+        source = f" [{result.patch.source}]" if result.patch.source else ''
+        lines.append(f"  {result.elapsed * 1000:8.2f} ms  {result.status:<11} "
+                     f"x{result.replacements:<3} {result.name}{source}")
+    over_budget = [r.name for r in results if r.status == 'over-budget']
+    if over_budget:
+        lines.append(f"  ⚠ Over time budget: {', '.join(over_budget)}")
+    no_anchor = [r.name for r in results if r.status == 'no-anchor']
+    if no_anchor:
+        lines.append(f"  ⚠ Anchor not found: {', '.join(no_anchor)}")
+    if not changed:
+        lines.append("  File unchanged")
+    elif dry_run:
+        lines.append("  Dry run - changes not written")
+    else:
+        lines.append("  ✅ Written once")
+    return '\n'.join(lines)
+
+
+def load_script(path):
+    """Import a fixer script by file path without running its __main__ block."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(f'patchkit_script_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
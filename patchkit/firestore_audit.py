@@ -0,0 +1,309 @@
+"""Static audit of Firestore reads in the backend.
+
+Every ``db.collection(...)`` read in the route, service, model and util
+modules is classified as:
+
+* ``scan``      - unbounded collection scan (``.get()`` with no where/limit)
+* ``query``     - filtered query (where/limit/cursor)
+* ``doc``       - single document get
+* ``aggregate`` - ``.count()`` aggregate
+* ``loop``      - any of the above issued inside a loop or per-item callback (N+1)
+
+Each access is attributed to the ``router.<verb>()`` handler (with its mount
+path from server.js) or the named function it sits in, and ranked by the
+estimated documents it reads per request, using collection sizes from a
+config file. The report is JSON so it can gate new full scans in review:
+
+    python -m patchkit.firestore_audit --config backend/firestore-sizes.json \\
+        --baseline backend/firestore-audit-baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+from .jsindex import JSIndex
+
+DEFAULT_SRC = 'backend/src'
+DEFAULT_DIRS = ('routes', 'services', 'models', 'utils', 'middleware')
+DEFAULT_CONFIG = {
+    'default_collection_size': 1000,
+    'filtered_fraction': 0.05,
+    'loop_iterations': 50,
+    'collection_sizes': {},
+}
+
+_COLLECTION_CALL = re.compile(r'(?<![\w$.])db\s*\.\s*collection\s*\(')
+_CHAIN_STEP = re.compile(r'\s*\.\s*([A-Za-z_$][\w$]*)\s*\(')
+_ASSIGNED_TO = re.compile(r'(?:(?:const|let|var)\s+)?([A-Za-z_$][\w$]*)\s*=\s*(?:await\s+)?$')
+_COLLECTIONS_MAP = re.compile(r'const collections = \{(.*?)\};', re.DOTALL)
+_COLLECTIONS_ENTRY = re.compile(r'(\w+)\s*:\s*[\'"]([^\'"]+)[\'"]')
+_MODULE_CONSTANT = re.compile(r'^(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*'
+                              r'([\'"][^\'"\n]+[\'"]|collections\.\w+)\s*;', re.MULTILINE)
+_MOUNT_DIRECT = re.compile(r'app\.use\(\s*[\'"]([^\'"]+)[\'"]\s*,\s*require\(\s*[\'"]\./routes/([^\'"]+)[\'"]\s*\)')
+_ROUTE_REQUIRE = re.compile(r'(?:const|let|var)\s+(\w+)\s*=\s*require\(\s*[\'"]\./routes/([^\'"]+)[\'"]\s*\)')
+_MOUNT_VAR = re.compile(r'app\.use\(\s*[\'"]([^\'"]+)[\'"]\s*,\s*(\w+)\s*\)')
+_READ_OPS = ('get', 'count')
+_WRITE_OPS = ('add', 'set', 'update', 'delete', 'create')
+_FILTER_OPS = ('where', 'limit', 'limitToLast', 'startAfter', 'startAt', 'endAt', 'endBefore')
+
+
+def _match_paren(text, open_pos):
+    """Offset just past the ``)`` matching the ``(`` at ``open_pos``."""
+    depth = 0
+    i = open_pos
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c in '\'"`':
+            i += 1
+            while i < n and text[i] != c:
+                i += 2 if text[i] == '\\' else 1
+        elif c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return n
+
+
+def parse_chain(text, pos):
+    """Method chain starting at the ``db.collection(`` call at ``pos``.
+
+    Returns (steps, end) where steps is a list of (method, args source).
+    """
+    open_pos = text.index('(', pos)
+    close = _match_paren(text, open_pos)
+    steps = [('collection', text[open_pos + 1:close - 1].strip())]
+    while True:
+        m = _CHAIN_STEP.match(text, close)
+        if m is None:
+            return steps, close
+        open_pos = m.end() - 1
+        close = _match_paren(text, open_pos)
+        steps.append((m.group(1), text[open_pos + 1:close - 1].strip()))
+
+
+def load_collections(src):
+    try:
+        with open(os.path.join(src, 'config', 'db.js'), 'r') as f:
+            m = _COLLECTIONS_MAP.search(f.read())
+    except OSError:
+        return {}
+    return dict(_COLLECTIONS_ENTRY.findall(m.group(1))) if m else {}
+
+
+def load_mounts(src):
+    """Route module name -> mount path, from server.js."""
+    try:
+        with open(os.path.join(src, 'server.js'), 'r') as f:
+            server = f.read()
+    except OSError:
+        return {}
+    mounts = {}
+    for path, module in _MOUNT_DIRECT.findall(server):
+        mounts.setdefault(module, path)
+    variables = dict(_ROUTE_REQUIRE.findall(server))
+    for path, var in _MOUNT_VAR.findall(server):
+        if var in variables:
+            module = variables[var]
+            # Prefer the /api mount when a router is mounted twice
+            if module not in mounts or (path.startswith('/api') and not mounts[module].startswith('/api')):
+                mounts[module] = path
+    return mounts
+
+
+class FirestoreAuditor:
+    def __init__(self, src=DEFAULT_SRC, dirs=DEFAULT_DIRS, config=None):
+        self.src = src
+        self.dirs = dirs
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.collections = load_collections(src)
+        self.mounts = load_mounts(src)
+
+    def files(self):
+        for directory in self.dirs:
+            root = os.path.join(self.src, directory)
+            if not os.path.isdir(root):
+                continue
+            for name in sorted(os.listdir(root)):
+                if name.endswith('.js'):
+                    yield os.path.join(root, name)
+
+    def collection_name(self, arg, constants=None):
+        """Collection a ``db.collection()`` argument names; ``constants`` are
+        the module-level ``const NAME = ...`` strings of its file."""
+        if constants and arg in constants:
+            arg = constants[arg]
+        m = re.match(r'collections\.(\w+)$', arg)
+        if m:
+            return self.collections.get(m.group(1), arg)
+        m = re.match(r'[\'"]([^\'"]+)[\'"]$', arg)
+        return m.group(1) if m else arg
+
+    def collection_size(self, name):
+        return self.config['collection_sizes'].get(name, self.config['default_collection_size'])
+
+    def _variable_usage(self, text, var, scope):
+        """Methods applied to a query variable later in the same scope."""
+        body = text[scope[0]:scope[1]]
+        methods = set(re.findall(r'\b' + re.escape(var) + r'\s*\.\s*([A-Za-z_$][\w$]*)\s*\(', body))
+        limit = re.search(r'\b' + re.escape(var) + r'\s*\.\s*limit\s*\(\s*(\d+)\s*\)', body)
+        return methods, int(limit.group(1)) if limit else None
+
+    def classify(self, text, pos, steps, scope):
+        """Return (kind, limit) or None when the chain is not a read."""
+        methods = [method for method, _ in steps]
+        limit = next((int(args) for method, args in steps if method == 'limit' and args.isdigit()), None)
+        if any(op in methods for op in _WRITE_OPS):
+            return None
+        if not any(op in methods for op in _READ_OPS):
+            # Query built up in a variable and executed later
+            assigned = _ASSIGNED_TO.search(text, max(0, pos - 80), pos)
+            if not assigned:
+                return None
+            used, var_limit = self._variable_usage(text, assigned.group(1), scope)
+            if not any(op in used for op in _READ_OPS):
+                return None
+            if 'doc' in methods:
+                return 'doc', None
+            methods = methods + sorted(used)
+            limit = limit or var_limit
+        if 'doc' in methods:
+            return 'doc', None
+        if 'count' in methods:
+            return 'aggregate', None
+        if any(op in methods for op in _FILTER_OPS):
+            return 'query', limit
+        return 'scan', None
+
+    def estimate(self, kind, collection, limit, in_loop):
+        size = self.collection_size(collection)
+        if kind == 'doc':
+            reads = 1
+        elif kind == 'aggregate':
+            reads = max(1, math.ceil(size / 1000))
+        elif kind == 'query':
+            reads = limit if limit is not None else max(1, math.ceil(size * self.config['filtered_fraction']))
+        else:
+            reads = size
+        if in_loop:
+            reads *= self.config['loop_iterations']
+        return reads
+
+    def audit_file(self, path):
+        with open(path, 'r') as f:
+            text = f.read()
+        index = JSIndex(text, html=False)
+        constants = {m.group(1): m.group(2) for m in _MODULE_CONSTANT.finditer(text)
+                     if not index.in_comment(m.start())}
+        module = os.path.splitext(os.path.basename(path))[0]
+        mount = self.mounts.get(module, '')
+        accesses = []
+        for m in _COLLECTION_CALL.finditer(text):
+            pos = m.start()
+            if index.in_comment(pos):
+                continue
+            handler = index.enclosing(pos, 'handler')
+            function = index.enclosing(pos, 'function')
+            owner = max((s for s in (handler, function) if s), key=lambda s: s.start, default=None)
+            scope = (owner.start, owner.end) if owner else (0, len(text))
+            steps, _ = parse_chain(text, m.end() - 1)
+            classified = self.classify(text, pos, steps, scope)
+            if classified is None:
+                continue
+            kind, limit = classified
+            loop = index.in_loop(pos, within=owner)
+            collection = self.collection_name(steps[0][1], constants)
+            verb, route = None, None
+            if handler:
+                verb, _, route_path = handler.name.partition(' ')
+                route = (mount + route_path).rstrip('/') if route_path != '/' else (mount or '/')
+            access = {
+                'file': os.path.relpath(path),
+                'line': text.count('\n', 0, pos) + 1,
+                'verb': verb.upper() if verb else None,
+                'route': route,
+                'function': function.name if function else None,
+                'collection': collection,
+                'kind': 'loop' if loop else kind,
+                'query': kind,
+                'limit': limit,
+                'estimated_reads': self.estimate(kind, collection, limit, loop is not None),
+                'code': text[pos:text.find('\n', pos)].strip(),
+            }
+            access['id'] = ':'.join(str(access[k] or '') for k in ('file', 'verb', 'route', 'function',
+                                                                   'collection', 'kind'))
+            accesses.append(access)
+        return accesses
+
+    def run(self):
+        accesses = []
+        for path in self.files():
+            accesses.extend(self.audit_file(path))
+        accesses.sort(key=lambda a: (-a['estimated_reads'], a['file'], a['line']))
+        summary = {}
+        for access in accesses:
+            summary[access['kind']] = summary.get(access['kind'], 0) + 1
+        return {'config': self.config, 'summary': summary, 'accesses': accesses}
+
+
+def gate(report, baseline):
+    """Full scans and N+1 accesses in ``report`` that the baseline doesn't know about."""
+    known = {a['id'] for a in baseline.get('accesses', [])}
+    return [a for a in report['accesses']
+            if a['kind'] in ('scan', 'loop') and a['id'] not in known]
+
+
+def format_table(report, top=None):
+    lines = [f"{'reads':>10}  {'kind':<9} {'verb':<6} {'route / function':<45} collection  (file:line)"]
+    for access in report['accesses'][:top]:
+        where = access['route'] or (access['function'] and f"{access['function']}()") or '-'
+        lines.append(f"{access['estimated_reads']:>10}  {access['kind']:<9} {access['verb'] or '':<6} "
+                     f"{where:<45} {access['collection']}  ({access['file']}:{access['line']})")
+    lines.append('  ' + ', '.join(f"{n} {kind}" for kind, n in sorted(report['summary'].items())))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m patchkit.firestore_audit')
+    parser.add_argument('--src', default=DEFAULT_SRC)
+    parser.add_argument('--config', help='JSON with collection_sizes and estimate settings')
+    parser.add_argument('--format', choices=('json', 'table'), default='json')
+    parser.add_argument('--top', type=int, default=None, help='only show the N most expensive accesses')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--baseline', help='fail if there are scans or N+1 reads not in this report')
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    report = FirestoreAuditor(args.src, config=config).run()
+
+    if args.format == 'json':
+        output = json.dumps(dict(report, accesses=report['accesses'][:args.top]), indent=2)
+    else:
+        output = format_table(report, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            new = gate(report, json.load(f))
+        for access in new:
+            print(f"❌ New {access['kind']} of {access['collection']} in {access['file']}:{access['line']} "
+                  f"({access['route'] or access['function']})", file=sys.stderr)
+        if new:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
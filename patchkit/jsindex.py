@@ -0,0 +1,424 @@
+"""Brace-aware span index for JavaScript sources.
+
+The fixer scripts used to find the end of a function by counting ``{``/``}``
+per line or per character, which breaks as soon as a brace shows up inside a
+string, comment or template literal. JSIndex tokenizes the source once and
+records offset spans for:
+
+* named functions (``function foo() {}``, ``const foo = async () => {}``,
+  class methods)
+* ``router.<verb>(...)`` handlers
+* ``React.createElement(...)`` calls
+* loop bodies (``for``/``while`` blocks and ``.forEach``/``.map``/... callbacks)
+* comments
+
+Inserts through the index update the spans in place instead of rescanning
+the whole file.
+"""
+import bisect
+import re
+
+ROUTER_VERBS = ('get', 'post', 'put', 'patch', 'delete')
+
+_IDENT = r'[A-Za-z_$][\w$]*'
+_FUNCTION_HEAD = re.compile(
+    r'(?:(?:const|let|var)\s+(?P<arrow>' + _IDENT + r')\s*=\s*(?:async\s*)?(?:\([^()]*\)|' + _IDENT + r')\s*=>'
+    r'|(?:const|let|var)\s+(?P<expr>' + _IDENT + r')\s*=\s*(?:async\s+)?function\s*\*?\s*[\w$]*\s*\([^()]*\)'
+    r'|(?:async\s+)?function\s*\*?\s*(?P<decl>' + _IDENT + r')\s*\([^()]*\)'
+    r'|(?<![\w$.])(?:static\s+)?(?:async\s+)?(?!(?:if|for|while|switch|catch|function|return|with)\b)'
+    r'(?P<method>' + _IDENT + r')\s*\([^()]*\))\s*$')
+_ROUTER_CALL = re.compile(r'\brouter\.(?P<verb>' + '|'.join(ROUTER_VERBS) + r')\s*$')
+_CREATE_ELEMENT = re.compile(r'\bReact\.createElement\s*$')
+_LOOP_KEYWORD = re.compile(r'\b(?P<keyword>for|while)(?:\s+await)?\s*$')
+_ITERATOR_CALL = re.compile(r'\.\s*(?P<method>forEach|map|flatMap|filter|reduce|some|every|find)\s*$')
+_FIRST_STRING = re.compile(r'\s*([\'"`])((?:\\.|(?!\1).)*)\1')
+_FIRST_ARG = re.compile(r'\s*(?:\'([^\']*)\'|"([^"]*)"|([\w$.]+))')
+_TRAILING_SEMI = re.compile(r'[ \t]*;')
+_EXPORTS = re.compile(r'^module\.exports\b', re.MULTILINE)
+_SCRIPT_OPEN = re.compile(r'<script\b(?![^>]*\bsrc\s*=)[^>]*>', re.IGNORECASE)
+_SCRIPT_CLOSE = re.compile(r'</script\s*>', re.IGNORECASE)
+
+_CODE_SPECIAL = re.compile(r'[\'"`/{}()]')
+_TEMPLATE_SPECIAL = re.compile(r'\\.|`|\$\{', re.DOTALL)
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'in', 'of', 'new', 'delete',
+                   'void', 'throw', 'else', 'do', 'yield', 'await'}
+_LOOKBEHIND = 400
+
+
+class Span:
+    """Offsets of one indexed block; ``end`` is exclusive."""
+
+    __slots__ = ('kind', 'name', 'start', 'end', 'level')
+
+    def __init__(self, kind, name, start, end, level=0):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.end = end
+        self.level = level
+
+    def __repr__(self):
+        return f"Span({self.kind}, {self.name!r}, {self.start}, {self.end}, level={self.level})"
+
+
+class JSIndexError(Exception):
+    pass
+
+
+def _previous_word(text, pos):
+    end = pos
+    while end > 0 and (text[end - 1].isalnum() or text[end - 1] in '_$'):
+        end -= 1
+    return text[end:pos]
+
+
+def _skip_string(text, pos, end, quote):
+    """Return the offset just past the string literal starting at ``pos``."""
+    i = pos + 1
+    while i < end:
+        c = text[i]
+        if c == '\\':
+            i += 2
+        elif c == quote:
+            return i + 1
+        elif c == '\n':
+            # Unterminated string; resync at the end of the line
+            return i
+        else:
+            i += 1
+    return end
+
+
+def _skip_regex(text, pos, end):
+    """Return the offset past a regex literal, or None if it is not one."""
+    i = pos + 1
+    in_class = False
+    while i < end:
+        c = text[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '\n':
+            return None
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+        elif c == '/':
+            i += 1
+            while i < end and text[i].isalpha():
+                i += 1
+            return i
+        i += 1
+    return None
+
+
+def scan(text, start=0, end=None, base_level=0):
+    """Tokenize ``text[start:end]`` as JavaScript and return (spans, errors).
+
+    Spans come back sorted by start offset. ``errors`` lists unbalanced
+    brackets and unterminated literals; a clean scan returns an empty list.
+    """
+    end = len(text) if end is None else end
+    spans = []
+    errors = []
+    # Entries: [char, offset, span or None]; '${' marks a template expression
+    stack = []
+    level = base_level
+    i = start
+    prev = ''
+    # (offset just past the closing paren of a for/while head, loop span)
+    loop_head = None
+
+    def scan_template(i):
+        # i is just past the opening backtick (or the closing } of a ${})
+        while True:
+            m = _TEMPLATE_SPECIAL.search(text, i, end)
+            if m is None:
+                errors.append(f"unterminated template literal before offset {end}")
+                return end
+            token = m.group(0)
+            if token == '`':
+                return m.end()
+            if token == '${':
+                stack.append(['${', m.start(), None])
+                return m.end()
+            i = m.end()
+
+    while i < end:
+        m = _CODE_SPECIAL.search(text, i, end)
+        if m is None:
+            break
+        j = m.start()
+        c = text[j]
+        k = j - 1
+        while k >= start and text[k] in ' \t\r\n':
+            k -= 1
+        prev = text[k] if k >= start else ''
+
+        if c in '\'"':
+            i = _skip_string(text, j, end, c)
+        elif c == '`':
+            i = scan_template(j + 1)
+        elif c == '/':
+            nxt = text[j + 1] if j + 1 < end else ''
+            if nxt == '/':
+                newline = text.find('\n', j, end)
+                i = end if newline == -1 else newline + 1
+                spans.append(Span('comment', '', j, i if newline == -1 else newline, level))
+            elif nxt == '*':
+                close = text.find('*/', j + 2, end)
+                if close == -1:
+                    errors.append(f"unterminated comment at offset {j}")
+                    i = end
+                else:
+                    i = close + 2
+                spans.append(Span('comment', '', j, i, level))
+            elif (prev == '' or prev in _REGEX_PRECEDERS or prev == '}'
+                  or _previous_word(text, k + 1) in _REGEX_KEYWORDS):
+                i = _skip_regex(text, j, end) or j + 1
+            else:
+                i = j + 1
+        elif c == '{':
+            span = None
+            if prev == ')' and loop_head and loop_head[0] == k + 1:
+                span = loop_head[1]
+            elif prev in ('>', ')'):
+                head = _FUNCTION_HEAD.search(text, max(start, j - _LOOKBEHIND), j)
+                if head:
+                    name = (head.group('arrow') or head.group('expr') or head.group('decl')
+                            or head.group('method'))
+                    span = Span('function', name, head.start(), -1, level)
+                    level += 1
+            stack.append(['{', j, span])
+            i = j + 1
+        elif c == '(':
+            span = None
+            if prev and (prev.isalnum() or prev in '_$'):
+                window = max(start, j - 64)
+                router = _ROUTER_CALL.search(text, window, j)
+                loop = _LOOP_KEYWORD.search(text, window, j)
+                iterator = _ITERATOR_CALL.search(text, window, j)
+                if loop:
+                    stack.append(['(', j, Span('loop-head', loop.group('keyword'), loop.start(), -1, level)])
+                    i = j + 1
+                    continue
+                if iterator:
+                    span = Span('loop', iterator.group('method'), iterator.start(), -1, level)
+                elif router:
+                    path = _FIRST_STRING.match(text, j + 1, end)
+                    name = f"{router.group('verb')} {path.group(2) if path else ''}".strip()
+                    span = Span('handler', name, router.start(), -1, level)
+                else:
+                    element = _CREATE_ELEMENT.search(text, window, j)
+                    if element:
+                        arg = _FIRST_ARG.match(text, j + 1, end)
+                        tag = next((g for g in arg.groups() if g is not None), '') if arg else ''
+                        span = Span('element', tag, element.start(), -1, level)
+            stack.append(['(', j, span])
+            i = j + 1
+        else:
+            opener = '{' if c == '}' else '('
+            if not stack:
+                errors.append(f"unmatched '{c}' at offset {j}")
+                i = j + 1
+                continue
+            top = stack[-1]
+            if top[0] == '${' and c == '}':
+                stack.pop()
+                i = scan_template(j + 1)
+                continue
+            if top[0] != opener:
+                errors.append(f"mismatched '{c}' at offset {j} (opened '{top[0]}' at {top[1]})")
+                i = j + 1
+                continue
+            stack.pop()
+            span = top[2]
+            close = j + 1
+            if span is not None and span.kind == 'loop-head':
+                loop_head = (close, Span('loop', span.name, span.start, -1, span.level))
+            elif span is not None:
+                if span.kind == 'function':
+                    level -= 1
+                semi = _TRAILING_SEMI.match(text, close, end)
+                span.end = semi.end() if semi and span.kind in ('function', 'handler') else close
+                spans.append(span)
+            i = close
+
+    for entry in stack:
+        errors.append(f"unclosed '{entry[0]}' at offset {entry[1]}")
+    spans.sort(key=lambda s: s.start)
+    return spans, errors
+
+
+def script_regions(text):
+    """(start, end) offsets of inline <script> bodies in an HTML document."""
+    regions = []
+    pos = 0
+    while True:
+        m = _SCRIPT_OPEN.search(text, pos)
+        if m is None:
+            return regions
+        close = _SCRIPT_CLOSE.search(text, m.end())
+        stop = close.start() if close else len(text)
+        regions.append((m.end(), stop))
+        pos = stop
+
+
+class JSIndex:
+    """Span index over a JavaScript file or the inline scripts of an HTML page."""
+
+    def __init__(self, text, html=None):
+        self.text = text
+        self.html = text.lstrip().startswith('<') if html is None else html
+        self._rebuild()
+
+    @classmethod
+    def from_file(cls, path, encoding='utf-8'):
+        with open(path, 'r', encoding=encoding) as f:
+            return cls(f.read(), html=path.endswith('.html'))
+
+    def _rebuild(self):
+        regions = script_regions(self.text) if self.html else [(0, len(self.text))]
+        self.spans = []
+        self.errors = []
+        for start, end in regions:
+            spans, errors = scan(self.text, start, end)
+            self.spans.extend(spans)
+            self.errors.extend(errors)
+        self._starts = [s.start for s in self.spans]
+        exports = list(_EXPORTS.finditer(self.text))
+        self.exports_at = exports[-1].start() if exports else None
+
+    # Lookups
+
+    def find(self, kind, name=None):
+        return [s for s in self.spans
+                if s.kind == kind and (name is None or s.name == name)]
+
+    def function(self, name):
+        matches = self.find('function', name)
+        return matches[0] if matches else None
+
+    def functions(self, top_level=False):
+        return [s for s in self.spans
+                if s.kind == 'function' and (not top_level or s.level == 0)]
+
+    def handler(self, verb, path=None):
+        for span in self.spans:
+            if span.kind != 'handler':
+                continue
+            span_verb, _, span_path = span.name.partition(' ')
+            if span_verb == verb and (path is None or span_path == path):
+                return span
+        return None
+
+    def handlers(self):
+        return self.find('handler')
+
+    def elements(self, tag=None):
+        return self.find('element', tag)
+
+    def in_comment(self, offset):
+        return self.enclosing(offset, 'comment') is not None
+
+    def in_loop(self, offset, within=None):
+        """Innermost loop around ``offset``, optionally only inside ``within``."""
+        loop = self.enclosing(offset, 'loop')
+        if loop is not None and within is not None and loop.start < within.start:
+            return None
+        return loop
+
+    def enclosing(self, offset, kind=None):
+        """Innermost span containing ``offset``."""
+        best = None
+        for span in self.spans[:bisect.bisect_right(self._starts, offset)]:
+            if span.start <= offset < span.end and (kind is None or span.kind == kind):
+                if best is None or span.start >= best.start:
+                    best = span
+        return best
+
+    def source(self, span):
+        return self.text[span.start:span.end]
+
+    # Edits
+
+    def replace(self, start, end, new_text):
+        """Replace ``text[start:end]`` and update spans incrementally.
+
+        Spans before the edit keep their offsets, spans after it shift, and
+        spans around it grow or shrink. Spans inside ``new_text`` are scanned
+        on their own and merged in. If the edit cuts through a span boundary
+        or the inserted text is not balanced, the index falls back to a full
+        rebuild.
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise JSIndexError(f"edit range {start}:{end} is outside the text")
+        _, removed_errors = scan(self.text, start, end)
+        self.text = self.text[:start] + new_text + self.text[end:]
+        delta = len(new_text) - (end - start)
+
+        added, errors = scan(new_text)
+        if errors or removed_errors:
+            self._rebuild()
+            return self
+
+        kept = []
+        for span in self.spans:
+            if span.end <= start:
+                kept.append(span)
+            elif span.start >= end:
+                span.start += delta
+                span.end += delta
+                kept.append(span)
+            elif span.start < start and end < span.end:
+                span.end += delta
+                kept.append(span)
+            elif start <= span.start and span.end <= end:
+                continue
+            else:
+                self._rebuild()
+                return self
+
+        for span in added:
+            span.start += start
+            span.end += start
+            span.level += sum(1 for s in kept
+                              if s.kind == 'function' and s.start < span.start and span.end <= s.end)
+        self.spans = sorted(kept + added, key=lambda s: s.start)
+        self._starts = [s.start for s in self.spans]
+
+        if self.exports_at is not None and self.exports_at >= end:
+            self.exports_at += delta
+        elif self.exports_at is not None and self.exports_at >= start:
+            exports = list(_EXPORTS.finditer(self.text))
+            self.exports_at = exports[-1].start() if exports else None
+        inserted_exports = list(_EXPORTS.finditer(new_text))
+        if inserted_exports and (self.exports_at is None or start + inserted_exports[-1].start() > self.exports_at):
+            self.exports_at = start + inserted_exports[-1].start()
+        return self
+
+    def insert(self, offset, new_text):
+        return self.replace(offset, offset, new_text)
+
+    def insert_after(self, span, new_text):
+        return self.insert(span.end, new_text)
+
+    def insert_after_function(self, name, new_text):
+        span = self.function(name)
+        if span is None:
+            raise JSIndexError(f"function '{name}' not found")
+        return self.insert_after(span, new_text)
+
+    def insert_after_handler(self, verb, path, new_text):
+        span = self.handler(verb, path)
+        if span is None:
+            raise JSIndexError(f"router.{verb}('{path}') not found")
+        return self.insert_after(span, new_text)
+
+    def insert_before_exports(self, new_text):
+        if self.exports_at is None:
+            raise JSIndexError("module.exports not found")
+        return self.insert(self.exports_at, new_text)
@@ -0,0 +1,130 @@
+"""Single-pass, cached line probes for diagnosing index.html.
+
+A Probe looks for a literal needle on a line, optionally confirmed by a check
+that can peek at the following ``context`` lines. ProbeRunner runs every
+probe in the same pass over the file and caches results on disk:
+
+* keyed by file hash + probe versions, so an unchanged file returns at once;
+* per chunk, so after a small edit only the chunks that changed are scanned.
+
+Chunk boundaries are content-defined (a line whose checksum hits a fixed
+residue ends a chunk), so inserting lines only disturbs the chunk around the
+edit instead of shifting every chunk after it.
+"""
+import hashlib
+import json
+import os
+import time
+import zlib
+
+CACHE_FILE = '.probe-cache.json'
+CACHE_VERSION = 1
+_BOUNDARY_MODULUS = 64
+_MIN_CHUNK_LINES = 32
+
+
+class Probe:
+    def __init__(self, name, needle, version=1, check=None, first_only=False, context=0):
+        self.name = name
+        self.needle = needle
+        self.version = version
+        self.check = check
+        self.first_only = first_only
+        self.context = context
+
+    def matches(self, lines, i):
+        if self.needle not in lines[i]:
+            return False
+        return self.check is None or self.check(lines, i)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def chunk_lines(lines):
+    """Split into (start, end) line ranges with content-defined boundaries."""
+    chunks = []
+    start = 0
+    for i, line in enumerate(lines):
+        if (i + 1 - start >= _MIN_CHUNK_LINES
+                and zlib.crc32(line.encode('utf-8', 'surrogatepass')) % _BOUNDARY_MODULUS == 0):
+            chunks.append((start, i + 1))
+            start = i + 1
+    if start < len(lines):
+        chunks.append((start, len(lines)))
+    return chunks
+
+
+class ProbeRunner:
+    def __init__(self, probes, cache_path=CACHE_FILE):
+        self.probes = probes
+        self.cache_path = cache_path
+        self.context = max((p.context for p in probes), default=0)
+        self.signature = _digest(json.dumps(
+            [CACHE_VERSION] + [[p.name, p.version] for p in probes]))
+        self.stats = {}
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, self.cache_path)
+
+    def _scan_chunk(self, lines, start, end):
+        found = {}
+        for i in range(start, end):
+            for probe in self.probes:
+                if probe.matches(lines, i):
+                    found.setdefault(probe.name, []).append(i - start)
+        return found
+
+    def run(self, path):
+        """Return {probe name: [line index, ...]} for ``path``."""
+        started = time.perf_counter()
+        with open(path, 'r') as f:
+            content = f.read()
+        file_hash = _digest(content)
+        cache = self._load_cache()
+        entry = cache.get(os.path.abspath(path))
+        if entry and entry['hash'] == file_hash and entry['signature'] == self.signature:
+            self.stats = {'cached': True, 'scanned': 0, 'reused': len(entry['chunks']),
+                          'elapsed': time.perf_counter() - started}
+            return {name: list(hits) for name, hits in entry['results'].items()}
+
+        lines = content.split('\n')
+        previous = entry['chunks'] if entry and entry['signature'] == self.signature else {}
+        chunks = {}
+        results = {probe.name: [] for probe in self.probes}
+        scanned = reused = 0
+        for start, end in chunk_lines(lines):
+            # A probe may look ahead into the next chunk, so those lines are
+            # part of the key as well
+            key = _digest('\n'.join(lines[start:end + self.context]))
+            found = previous.get(key)
+            if found is None:
+                found = self._scan_chunk(lines, start, end)
+                scanned += 1
+            else:
+                reused += 1
+            chunks[key] = found
+            for name, offsets in found.items():
+                results[name].extend(start + offset for offset in offsets)
+
+        for probe in self.probes:
+            if probe.first_only:
+                results[probe.name] = results[probe.name][:1]
+
+        cache[os.path.abspath(path)] = {'hash': file_hash, 'signature': self.signature,
+                                        'chunks': chunks, 'results': results}
+        self._save_cache(cache)
+        self.stats = {'cached': False, 'scanned': scanned, 'reused': reused,
+                      'elapsed': time.perf_counter() - started}
+        return results
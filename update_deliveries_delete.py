@@ -1,8 +1,6 @@
-with open('backend/src/routes/deliveries.js', 'r') as f:
-    content = f.read()
+from patchkit.batch import BatchPatcher, PatchSet, before_exports
 
-if 'X-Delete-All' not in content:
-    delete_route = '''
+delete_route = '''
 // DELETE all deliveries (bulk delete for test mode)
 router.delete('/', authenticateToken, async (req, res) => {
   try {
@@ -41,13 +39,9 @@ router.delete('/', authenticateToken, async (req, res) => {
 });
 
 '''
-    
-    if 'module.exports = router;' in content:
-        content = content.replace('module.exports = router;', delete_route + 'module.exports = router;')
-    
-    with open('backend/src/routes/deliveries.js', 'w') as f:
-        f.write(content)
-    
-    print("✅ Added bulk delete to deliveries.js")
-else:
-    print("Bulk delete already exists in deliveries.js")
+
+PATCH_SET = PatchSet('deliveries-bulk-delete', version=1).add(
+    'deliveries.js', before_exports('deliveries-bulk-delete', delete_route, unless='X-Delete-All'))
+
+if __name__ == '__main__':
+    BatchPatcher([__file__]).run()
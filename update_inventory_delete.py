@@ -1,16 +1,6 @@
-import re
+from patchkit.batch import BatchPatcher, PatchSet, before_exports
 
-# Read inventory.js
-with open('backend/src/routes/inventory.js', 'r') as f:
-    content = f.read()
-
-# Check if bulk delete already exists
-if 'X-Delete-All' in content:
-    print("Bulk delete already exists in inventory.js")
-else:
-    print("Adding bulk delete to inventory.js...")
-    
-    delete_route = '''
+delete_route = '''
 // DELETE all inventory (bulk delete for test mode)
 router.delete('/', authenticateToken, async (req, res) => {
   try {
@@ -57,14 +47,9 @@ router.delete('/', authenticateToken, async (req, res) => {
 });
 
 '''
-    
-    # Insert before module.exports
-    if 'module.exports = router;' in content:
-        content = content.replace('module.exports = router;', delete_route + 'module.exports = router;')
-    else:
-        content += '\n' + delete_route + '\nmodule.exports = router;'
-    
-    with open('backend/src/routes/inventory.js', 'w') as f:
-        f.write(content)
-    
-    print("✅ Added bulk delete to inventory.js")
+
+PATCH_SET = PatchSet('inventory-bulk-delete', version=1).add(
+    'inventory.js', before_exports('inventory-bulk-delete', delete_route, unless='X-Delete-All'))
+
+if __name__ == '__main__':
+    BatchPatcher([__file__]).run()
@@ -1,18 +1,6 @@
-import re
+from patchkit.batch import BatchPatcher, PatchSet, before_exports
 
-# Read leads.js
-with open('backend/src/routes/leads.js', 'r') as f:
-    content = f.read()
-
-# Check if bulk delete already exists
-if 'X-Delete-All' in content:
-    print("Bulk delete already exists in leads.js")
-else:
-    print("Adding bulk delete to leads.js...")
-    
-    # Find a good place to add the route (before the last module.exports)
-    # Add the bulk delete route
-    delete_route = '''
+delete_route = '''
 // DELETE all leads (bulk delete for test mode)
 router.delete('/', authenticateToken, async (req, res) => {
   try {
@@ -59,14 +47,9 @@ router.delete('/', authenticateToken, async (req, res) => {
 });
 
 '''
-    
-    # Insert before module.exports
-    if 'module.exports = router;' in content:
-        content = content.replace('module.exports = router;', delete_route + 'module.exports = router;')
-    else:
-        content += '\n' + delete_route + '\nmodule.exports = router;'
-    
-    with open('backend/src/routes/leads.js', 'w') as f:
-        f.write(content)
-    
-    print("✅ Added bulk delete to leads.js")
+
+PATCH_SET = PatchSet('leads-bulk-delete', version=1).add(
+    'leads.js', before_exports('leads-bulk-delete', delete_route, unless='X-Delete-All'))
+
+if __name__ == '__main__':
+    BatchPatcher([__file__]).run()
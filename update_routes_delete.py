@@ -1,19 +1,10 @@
-import os
+from patchkit.batch import BatchPatcher, PatchSet, before_exports
 
 routes = ['leads', 'inventory', 'orders']
 
-for route_name in routes:
-    file_path = f'backend/src/routes/{route_name}.js'
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            content = f.read()
-        
-        # Check if DELETE route exists
-        if 'router.delete(' not in content:
-            print(f"Adding DELETE route to {route_name}.js...")
-            
-            # Add before module.exports
-            delete_route = '''
+
+def delete_all_route(route_name):
+    delete_route = '''
 // DELETE all (test mode only)
 router.delete('/', authenticateToken, async (req, res) => {
   try {
@@ -47,14 +38,15 @@ router.delete('/', authenticateToken, async (req, res) => {
 });
 
 '''
-            # Insert before module.exports
-            if 'module.exports' in content:
-                content = content.replace('module.exports', delete_route + 'module.exports')
-                
-                with open(file_path, 'w') as f:
-                    f.write(content)
-                print(f"✅ Added DELETE route to {route_name}.js")
-        else:
-            print(f"DELETE route already exists in {route_name}.js")
+    return delete_route
+
+
+PATCH_SET = PatchSet('routes-delete-all', version=1)
+for route_name in routes:
+    # Add before module.exports, unless the file already has a DELETE route
+    PATCH_SET.add(f'{route_name}.js', before_exports(f'{route_name}-delete-all', delete_all_route(route_name),
+                                                     unless='router.delete('))
 
-print("\n✅ All routes updated!")
+if __name__ == '__main__':
+    BatchPatcher([__file__]).run()
+    print("\n✅ All routes updated!")